@@ -19,12 +19,15 @@ from typing import Dict, Any, Optional, List
 from datetime import datetime, timedelta
 import pytz
 from internal_logic.core.redis_manager import get_redis_connection
+from internal_logic.core.redis_scripts import claim_once, incr_with_expire
 import hashlib
 import hmac
 from internal_logic.services.flow_engine_router_v8 import get_message_router
 from internal_logic.services.bot_messenger import BotMessenger, checkActiveFlow
 from internal_logic.services.bot_runner import BotRunner
 from internal_logic.services.flow_engine import FlowEngine
+from internal_logic.services.flow_graph import get_compiled_flow, prepare_conditions, validate_condition
+from internal_logic.services.condition_matcher import compile_conditions, is_valid_cpf, match_text_validation
 from internal_logic.services.payment_service import PaymentService, get_payment_service
 from internal_logic.services.payment_verifier import verify_payment
 from internal_logic.services.subscription_service import activate_subscription, handle_new_chat_member
@@ -32,12 +35,17 @@ from internal_logic.services.offer_sender import cancel_downsells as cancel_sche
 from internal_logic.services import remarketing_sender
 from internal_logic.services.start_command_handler import handle_start_command as handle_start_cmd
 from internal_logic.services.callback_handler import handle_callback_query as handle_callback
+from internal_logic.services.callback_codec import encode as encode_callback
 
 logger = logging.getLogger(__name__)
 
 # Configurar logging para este módulo
 logger.setLevel(logging.INFO)
 
+# Janela da deduplicação por message_id: o Telegram só reentrega updates das últimas 24h,
+# e o filtro por created_at limita a busca às partições recentes de bot_messages
+MESSAGE_DEDUP_WINDOW = timedelta(days=1)
+
 
 # Forçar urllib3/requests a ignorar IPv6 (evita NameResolutionError com IPv6 instável)
 urllib3.util.connection.HAS_IPV6 = False
@@ -761,113 +769,6 @@ class BotManager:
         else:
             logger.warning(f"⚠️ Bot {bot_id} não está ativo no Redis para atualizar configuração")
     
-    def _bot_monitor_thread(self, bot_id: int):
-        """
-        Thread de monitoramento de um bot (simulação de atividade)
-        
-        Args:
-            bot_id: ID do bot
-        """
-        logger.info(f"Monitor do bot {bot_id} iniciado")
-
-        # Watchdog com retry/backoff: nunca encerrar por exceções transitórias
-        error_count = 0
-        max_backoff_seconds = 60
-        cycle = 0
-        
-        while True:
-            # ✅ REDIS BRAIN: Verificar se bot está ativo no Redis
-            bot_info = self.bot_state.get_bot_data(bot_id)
-            if not bot_info or bot_info.get('status') != 'running':
-                logger.info(f"Monitor do bot {bot_id} encerrado (status não-running ou removido)")
-                break
-
-            try:
-                # Heartbeat (mantém conexões em tempo real e sinaliza vivacidade)
-                from internal_logic.core.models import get_brazil_time
-                # 🔥 CRÍTICO: Blindagem UI - não deixar WebSocket afetar processamento core
-                try:
-                    if self.socketio:
-                        self.socketio.emit('bot_heartbeat', {
-                            'bot_id': bot_id,
-                            'timestamp': get_brazil_time().isoformat(),
-                            'status': 'online'
-                        }, room=f'bot_{bot_id}')
-                except Exception as ws_error:
-                    logger.debug(f"Falha não-crítica na UI (WebSocket ignorado): {ws_error}")
-                    pass  # O processamento da mensagem DEVE continuar!
-
-                # Registrar heartbeat compartilhado (Redis) para ambientes multi-worker
-                try:
-                    import redis, time as _t
-                    r = get_redis_connection()
-                    r.setex(f'bot_heartbeat:{bot_id}', 180, int(_t.time()))
-                except Exception:
-                    # Não interromper o monitor se Redis indisponível
-                    pass
-
-                # Reset de erros após sucesso
-                error_count = 0
-
-                # Intervalo padrão de monitoramento
-                time.sleep(30)
-
-                # Auto-verificação periódica do webhook (a cada ~5 min)
-                cycle += 1
-                if cycle % 10 == 0:
-                    try:
-                        # ✅ REDIS BRAIN: Buscar token do Redis
-                        bot_data = self.bot_state.get_bot_data(bot_id)
-                        token = bot_data.get('token') if bot_data else None
-                        if token:
-                            import os, requests as _rq
-                            expected_base = os.environ.get('WEBHOOK_URL', '')
-                            if expected_base:
-                                expected_url = f"{expected_base}/webhook/telegram/{bot_id}"
-                                info_url = f"https://api.telegram.org/bot{token}/getWebhookInfo"
-                                with self.messenger.telegram_http_semaphore:
-                                    resp = _rq.get(info_url, timeout=10)
-                                if resp.status_code == 200:
-                                    info = resp.json().get('result', {})
-                                    configured = info.get('url')
-                                    last_error = info.get('last_error_message')
-                                    if configured != expected_url or last_error:
-                                        logger.warning(f"🔁 Auto-fix webhook bot {bot_id}: cfg='{configured}', expected='{expected_url}', last_error='{last_error}'")
-                                        self._setup_webhook(token, bot_id)
-                                        # Se persistir 502, ativar failover polling (deleteWebhook + polling)
-                                        if last_error and '502 Bad Gateway' in str(last_error):
-                                            try:
-                                                del_url = f"https://api.telegram.org/bot{token}/deleteWebhook"
-                                                with self.messenger.telegram_http_semaphore:
-                                                    _rq.post(del_url, timeout=10)
-                                            except Exception:
-                                                pass
-                                            if self.scheduler:
-                                                job_id = f'bot_polling_{bot_id}'
-                                                self.scheduler.add_job(
-                                                    id=job_id,
-                                                    func=self._polling_cycle,
-                                                    args=[bot_id, token],
-                                                    trigger='interval',
-                                                    seconds=5,
-                                                    max_instances=1,
-                                                    replace_existing=True
-                                                )
-                                                self.polling_jobs[bot_id] = job_id
-                                            else:
-                                                threading.Thread(target=self._polling_mode, args=(bot_id, token), daemon=True).start()
-                                else:
-                                    logger.warning(f"⚠️ getWebhookInfo {resp.status_code}: {resp.text}")
-                    except Exception as ie:
-                        logger.debug(f"Webhook auto-check falhou: {ie}")
-
-            except Exception as e:
-                error_count += 1
-                backoff = min(2 ** min(error_count, 5), max_backoff_seconds)
-                logger.error(f"Erro no monitor do bot {bot_id} (tentativa {error_count}): {e}. Backoff {backoff}s")
-                time.sleep(backoff)
-                # Continua tentando até que o status seja alterado para não-running
-    
     def _setup_webhook(self, token: str, bot_id: int):
         """
         Configura webhook do Telegram
@@ -1151,16 +1052,11 @@ class BotManager:
             
             try:
                 # ✅ ISOLAMENTO: Lock com namespace do usuário
-                if redis_conn.get(lock_key):
+                # Verifica e adquire no mesmo script (expira em 20 segundos)
+                if claim_once(redis_conn, lock_key, 20) is not None:
                     logger.warning(f"⚠️ Update {update_id} já processado — ignorando duplicado (anti-duplicação)")
                     return
                 
-                # Adquirir lock (expira em 20 segundos)
-                acquired = redis_conn.set(lock_key, "1", ex=20, nx=True)
-                if not acquired:
-                    logger.warning(f"⚠️ Update {update_id} já está sendo processado — ignorando duplicado")
-                    return
-                
                 logger.debug(f"🔒 Lock adquirido para update {update_id} (user_id={user_id})")
             except Exception as e:
                 logger.error(f"❌ Erro ao verificar lock update: {e}")
@@ -1377,16 +1273,18 @@ class BotManager:
                             
                             # ✅ CRÍTICO: Verificar se mensagem já foi salva (evitar duplicação)
                             # Verificar por message_id E por texto + timestamp (fallback)
-                            existing_message = BotMessage.query.filter_by(
-                                bot_id=bot_id,
-                                telegram_user_id=telegram_user_id,
-                                message_id=telegram_msg_id_str,
-                                direction='incoming'
+                            # ✅ Telegram reentrega updates por no máximo 24h: a janela poda as partições antigas
+                            from internal_logic.core.models import get_brazil_time
+                            existing_message = BotMessage.query.filter(
+                                BotMessage.bot_id == bot_id,
+                                BotMessage.telegram_user_id == telegram_user_id,
+                                BotMessage.message_id == telegram_msg_id_str,
+                                BotMessage.direction == 'incoming',
+                                BotMessage.created_at >= get_brazil_time() - MESSAGE_DEDUP_WINDOW
                             ).first()
                             
                             # Fallback: verificar por texto similar nos últimos 5 segundos
                             if not existing_message:
-                                from internal_logic.core.models import get_brazil_time
                                 recent_window = get_brazil_time() - timedelta(seconds=5)
                                 similar_message = BotMessage.query.filter(
                                     BotMessage.bot_id == bot_id,
@@ -1427,11 +1325,12 @@ class BotManager:
                                     # ✅ QI 10000: Tratar erro de constraint única (se existir)
                                     db.session.rollback()
                                     # Verificar novamente se foi salva por outro processo
-                                    existing_check = BotMessage.query.filter_by(
-                                        bot_id=bot_id,
-                                        telegram_user_id=telegram_user_id,
-                                        message_id=telegram_msg_id_str,
-                                        direction='incoming'
+                                    existing_check = BotMessage.query.filter(
+                                        BotMessage.bot_id == bot_id,
+                                        BotMessage.telegram_user_id == telegram_user_id,
+                                        BotMessage.message_id == telegram_msg_id_str,
+                                        BotMessage.direction == 'incoming',
+                                        BotMessage.created_at >= get_brazil_time() - MESSAGE_DEDUP_WINDOW
                                     ).first()
                                     if existing_check:
                                         logger.warning(f"⛔ Mensagem já foi salva por outro processo: {telegram_msg_id_str}")
@@ -1786,9 +1685,9 @@ class BotManager:
                         if current_step_id:
                             logger.info(f"🔍 Step ativo encontrado: {current_step_id} - processando condições")
                             
-                            # Buscar step no fluxo
-                            flow_steps = config.get('flow_steps', [])
-                            current_step = self._find_step_by_id(flow_steps, current_step_id)
+                            # Buscar step no fluxo (grafo compilado: O(1))
+                            compiled_flow = get_compiled_flow(config.get('flow_steps', []))
+                            current_step = compiled_flow.get(current_step_id)
                             
                             if current_step:
                                 # ✅ QI 500: Avaliar condições do step com parâmetros completos
@@ -1798,7 +1697,8 @@ class BotManager:
                                     context={},
                                     bot_id=bot_id,
                                     telegram_user_id=telegram_user_id,
-                                    step_id=current_step_id
+                                    step_id=current_step_id,
+                                    compiled_flow=compiled_flow
                                 )
                                 
                                 if next_step_id:
@@ -1895,9 +1795,8 @@ class BotManager:
                                                 )
                                                 return
                                             
-                                            # Incrementar tentativas globais
-                                            redis_conn.incr(global_attempts_key)
-                                            redis_conn.expire(global_attempts_key, 3600)  # Expira em 1 hora
+                                            # Incrementar tentativas globais (expira em 1 hora)
+                                            incr_with_expire(redis_conn, global_attempts_key, 3600)
                                     except:
                                         pass  # Se Redis falhar, continuar (fail-open)
                                     
@@ -2033,7 +1932,7 @@ class BotManager:
                         button_text = self._format_button_text(btn['text'], price, btn.get('price_position'))
                         buttons.append({
                             'text': button_text,
-                            'callback_data': f"buy_{index}"
+                            'callback_data': encode_callback('buy', index)
                         })
                 
                 for btn in redirect_buttons:
@@ -2438,12 +2337,14 @@ class BotManager:
                                                 telegram_msg_id = result_data.get('result', {}).get('message_id')
                                                 message_id = str(telegram_msg_id) if telegram_msg_id else f"text_complete_{int(time.time())}"
 
-                                                # Verificar se já existe antes de salvar
-                                                existing = BotMessage.query.filter_by(
-                                                    bot_id=bot_user.bot_id,
-                                                    telegram_user_id=str(chat_id),
-                                                    message_id=message_id,
-                                                    direction='outgoing'
+                                                # Verificar se já existe antes de salvar (janela recente: poda de partições)
+                                                from internal_logic.core.models import get_brazil_time
+                                                existing = BotMessage.query.filter(
+                                                    BotMessage.bot_id == bot_user.bot_id,
+                                                    BotMessage.telegram_user_id == str(chat_id),
+                                                    BotMessage.message_id == message_id,
+                                                    BotMessage.direction == 'outgoing',
+                                                    BotMessage.created_at >= get_brazil_time() - MESSAGE_DEDUP_WINDOW
                                                 ).first()
 
                                                 if not existing:
@@ -2540,103 +2441,39 @@ class BotManager:
         
         # ✅ VALIDAÇÃO: Sanitiza step_id antes de buscar
         # ✅ CRÍTICO: Compara IDs como strings (pode vir como número ou string)
+        # ✅ O(1): usa o grafo compilado do fluxo (flow_graph, cache por worker)
         """
         if not step_id:
             return None
         
-        # Converter step_id para string para comparação
         step_id_str = str(step_id).strip()
         
         if not step_id_str:
             return None
         
-        if not flow_steps or not isinstance(flow_steps, list):
+        if not flow_steps or not isinstance(flow_steps, (list, str)):
             logger.warning(f"⚠️ _find_step_by_id: flow_steps inválido (tipo: {type(flow_steps)})")
             return None
         
-        for step in flow_steps:
-            if not isinstance(step, dict):
-                continue
-            
-            step_id_candidate = step.get('id')
-            if step_id_candidate is None:
-                continue
-            
-            # ✅ CRÍTICO: Comparar como strings (pode ser número ou string)
-            if str(step_id_candidate).strip() == step_id_str:
-                logger.info(f"✅ Step encontrado: id={step_id_candidate} (tipo: {type(step_id_candidate)})")
-                return step
-        
-        logger.warning(f"⚠️ Step {step_id_str} não encontrado em {len(flow_steps)} steps")
-        return None
+        compiled = get_compiled_flow(flow_steps)
+        step = compiled.get(step_id_str)
+        if step is None:
+            logger.warning(f"⚠️ Step {step_id_str} não encontrado em {len(compiled)} steps")
+        return step
     
     def _validate_condition(self, condition: Dict[str, Any]) -> tuple:
         """
-        # ✅ QI 500: Valida estrutura de uma condição
+        # ✅ QI 500: Valida estrutura de uma condição (regras em flow_graph.validate_condition)
         
         Returns:
             (is_valid: bool, error_message: str)
         """
-        if not isinstance(condition, dict):
-            return False, "Condição deve ser um objeto"
-        
-        condition_type = condition.get('type')
-        if not condition_type or not isinstance(condition_type, str):
-            return False, "Condição deve ter 'type' (string)"
-        
-        valid_types = ['text_validation', 'button_click', 'payment_status', 'time_elapsed']
-        if condition_type not in valid_types:
-            return False, f"Tipo de condição inválido: {condition_type}. Válidos: {valid_types}"
-        
-        target_step = condition.get('target_step')
-        if not target_step or not isinstance(target_step, str) or not target_step.strip():
-            return False, "Condição deve ter 'target_step' (string não vazia)"
-        
-        # Validações específicas por tipo
-        if condition_type == 'text_validation':
-            validation = condition.get('validation', 'any')
-            valid_validations = ['email', 'phone', 'cpf', 'contains', 'equals', 'any']
-            if validation not in valid_validations:
-                return False, f"Validação de texto inválida: {validation}"
-            
-            if validation in ('contains', 'equals'):
-                value = condition.get('value')
-                if not value or not isinstance(value, str):
-                    return False, f"Validação '{validation}' requer 'value' (string)"
-        
-        elif condition_type == 'button_click':
-            button_text = condition.get('button_text')
-            if not button_text or not isinstance(button_text, str):
-                return False, "Condição 'button_click' requer 'button_text' (string)"
-        
-        elif condition_type == 'payment_status':
-            status = condition.get('status', 'paid')
-            valid_statuses = ['paid', 'pending', 'failed', 'expired']
-            if status not in valid_statuses:
-                return False, f"Status de pagamento inválido: {status}"
-        
-        elif condition_type == 'time_elapsed':
-            minutes = condition.get('minutes', 5)
-            if not isinstance(minutes, (int, float)) or minutes < 1:
-                return False, "Condição 'time_elapsed' requer 'minutes' (número >= 1)"
-        
-        # Validar max_attempts se presente
-        max_attempts = condition.get('max_attempts')
-        if max_attempts is not None:
-            if not isinstance(max_attempts, int) or max_attempts < 1 or max_attempts > 100:
-                return False, "max_attempts deve ser um inteiro entre 1 e 100"
-        
-        # Validar fallback_step se presente
-        fallback_step = condition.get('fallback_step')
-        if fallback_step is not None:
-            if not isinstance(fallback_step, str) or not fallback_step.strip():
-                return False, "fallback_step deve ser uma string não vazia"
-        
-        return True, ""
+        return validate_condition(condition)
     
     def _evaluate_conditions(self, step: Dict[str, Any], user_input: str = None, 
                             context: Dict[str, Any] = None, bot_id: int = None, 
-                            telegram_user_id: str = None, step_id: str = None) -> Optional[str]:
+                            telegram_user_id: str = None, step_id: str = None,
+                            compiled_flow=None) -> Optional[str]:
         """
         # ✅ QI 500: Avalia condições do step e retorna próximo step_id
         
@@ -2651,6 +2488,7 @@ class BotManager:
             bot_id: ID do bot (para Redis)
             telegram_user_id: ID do usuário (para Redis)
             step_id: ID do step atual (para Redis)
+            compiled_flow: Grafo compilado do fluxo (condições já validadas, ordenadas e compiladas)
         
         Returns:
             step_id do próximo step ou None se nenhuma condição matchou
@@ -2662,33 +2500,31 @@ class BotManager:
         if not conditions or not isinstance(conditions, list) or len(conditions) == 0:
             return None
         
-        # ✅ VALIDAÇÃO: Filtrar condições inválidas
-        valid_conditions = []
-        for idx, condition in enumerate(conditions):
-            is_valid, error_msg = self._validate_condition(condition)
-            if not is_valid:
-                logger.error(f"❌ Condição {idx} do step {step_id} inválida: {error_msg}")
-                logger.error(f"   Condição: {condition}")
-                continue
-            valid_conditions.append(condition)
+        # ✅ VALIDAÇÃO + ORDENAÇÃO + MATCHER: pré-computados no grafo compilado; sem ele, feitos aqui
+        if compiled_flow is not None and step_id and compiled_flow.get(step_id) is step:
+            matcher = compiled_flow.matcher_for(step_id)
+        else:
+            matcher = compile_conditions(prepare_conditions(conditions, step_id), step)
+        sorted_conditions = matcher.conditions
         
-        if not valid_conditions:
+        if not sorted_conditions:
             logger.warning(f"⚠️ Nenhuma condição válida no step {step_id}")
             return None
         
-        # Ordenar por ordem (order)
-        sorted_conditions = sorted(valid_conditions, key=lambda c: c.get('order', 0))
+        # ✅ Texto/botão avaliados uma vez para todas as condições do step
+        matched_inputs = matcher.match_input(user_input)
         
-        # ✅ NOVO: Verificar max_attempts antes de avaliar
-        try:
-            import redis
-            redis_conn = get_redis_connection()
-        except:
-            redis_conn = None
+        # ✅ NOVO: Verificar max_attempts antes de avaliar (Redis só se alguma condição usa)
+        redis_conn = None
+        if matcher.tracks_attempts:
+            try:
+                redis_conn = get_redis_connection()
+            except:
+                redis_conn = None
         
-        for condition in sorted_conditions:
+        for position, condition in enumerate(sorted_conditions):
             condition_type = condition.get('type')
-            condition_id = condition.get('id', f"cond_{sorted_conditions.index(condition)}")
+            condition_id = condition.get('id', f"cond_{position}")
             
             # ✅ NOVO: Verificar max_attempts (apenas para condições de texto/button)
             if condition_type in ('text_validation', 'button_click') and redis_conn and bot_id and telegram_user_id and step_id:
@@ -2714,20 +2550,8 @@ class BotManager:
             # Avaliar condição
             matched = False
             
-            if condition_type == 'text_validation':
-                if user_input and self._match_text_validation(condition, user_input):
-                    matched = True
-                    # ✅ NOVO: Resetar tentativas quando matcha
-                    if redis_conn and bot_id and telegram_user_id and step_id:
-                        attempt_key = f"flow_attempts:{bot_id}:{telegram_user_id}:{step_id}:{condition_id}"
-                        try:
-                            redis_conn.delete(attempt_key)
-                        except:
-                            pass
-            
-            elif condition_type == 'button_click':
-                # ✅ NOVO: Passar step completo para match correto
-                if user_input and self._match_button_click(condition, user_input, step=step):
+            if condition_type in ('text_validation', 'button_click'):
+                if position in matched_inputs:
                     matched = True
                     # ✅ NOVO: Resetar tentativas quando matcha
                     if redis_conn and bot_id and telegram_user_id and step_id:
@@ -2755,8 +2579,7 @@ class BotManager:
                 if max_attempts and max_attempts > 0:
                     attempt_key = f"flow_attempts:{bot_id}:{telegram_user_id}:{step_id}:{condition_id}"
                     try:
-                        redis_conn.incr(attempt_key)
-                        redis_conn.expire(attempt_key, 3600)  # Expira em 1 hora
+                        incr_with_expire(redis_conn, attempt_key, 3600)  # Expira em 1 hora
                     except:
                         pass
         
@@ -2764,38 +2587,7 @@ class BotManager:
     
     def _match_text_validation(self, condition: Dict[str, Any], user_input: str) -> bool:
         """Valida texto do usuário baseado na condição"""
-        if not user_input or not user_input.strip():
-            return False
-        
-        validation = condition.get('validation', 'any')
-        user_input_clean = user_input.strip()
-        
-        if validation == 'email':
-            import re
-            email_pattern = r'^[\w\.-]+@[\w\.-]+\.\w+$'
-            return bool(re.match(email_pattern, user_input_clean))
-        
-        elif validation == 'phone':
-            import re
-            # Telefone brasileiro: (XX) XXXXX-XXXX ou XXXXXXXXXXX
-            phone_pattern = r'^(\+55\s?)?(\(?\d{2}\)?\s?)?\d{4,5}-?\d{4}$'
-            return bool(re.match(phone_pattern, user_input_clean))
-        
-        elif validation == 'cpf':
-            return self._validate_cpf(user_input_clean)
-        
-        elif validation == 'contains':
-            keyword = condition.get('value', '').lower()
-            return keyword in user_input_clean.lower()
-        
-        elif validation == 'equals':
-            value = condition.get('value', '').strip().lower()
-            return user_input_clean.lower() == value
-        
-        elif validation == 'any':
-            return bool(user_input_clean)
-        
-        return False
+        return match_text_validation(condition, user_input)
     
     def _match_button_click(self, condition: Dict[str, Any], callback_data: str, step: Dict[str, Any] = None) -> bool:
         """
@@ -2898,57 +2690,13 @@ class BotManager:
         """
         # ✅ QI 500: Valida CPF com dígitos verificadores
         
-        # ✅ NOVO: Validação robusta de edge cases
-        
         Args:
             cpf: CPF a ser validado (pode conter formatação)
         
         Returns:
             True se CPF é válido, False caso contrário
         """
-        import re
-        
-        # ✅ VALIDAÇÃO: Verificar se cpf é string válida
-        if not cpf or not isinstance(cpf, str):
-            return False
-        
-        # Remover formatação
-        cpf_clean = re.sub(r'\D', '', cpf)
-        
-        # ✅ VALIDAÇÃO: Verificar se tem apenas números após limpeza
-        if not cpf_clean.isdigit():
-            return False
-        
-        # Verificar tamanho
-        if len(cpf_clean) != 11:
-            return False
-        
-        cpf = cpf_clean
-        
-        # CPFs conhecidos como inválidos (todos dígitos iguais)
-        if cpf == cpf[0] * 11:
-            return False
-        
-        # Validar dígitos verificadores
-        def calculate_digit(cpf: str, weights: list) -> int:
-            """Calcula dígito verificador"""
-            total = sum(int(cpf[i]) * weights[i] for i in range(len(weights)))
-            remainder = total % 11
-            return 0 if remainder < 2 else 11 - remainder
-        
-        # Validar primeiro dígito
-        weights_1 = [10, 9, 8, 7, 6, 5, 4, 3, 2]
-        digit_1 = calculate_digit(cpf, weights_1)
-        if int(cpf[9]) != digit_1:
-            return False
-        
-        # Validar segundo dígito
-        weights_2 = [11, 10, 9, 8, 7, 6, 5, 4, 3, 2]
-        digit_2 = calculate_digit(cpf, weights_2)
-        if int(cpf[10]) != digit_2:
-            return False
-        
-        return True
+        return is_valid_cpf(cpf)
     
     def _save_payment_flow_step_id(self, payment_id: str, step_id: str) -> bool:
         """
@@ -3047,7 +2795,7 @@ class BotManager:
                             button_text = f"{btn['text']} - R$ {price:.2f}"
                             buttons.append({
                                 'text': button_text,
-                                'callback_data': f"buy_{btn_index}"
+                                'callback_data': encode_callback('buy', btn_index)
                             })
                 elif btn_type == 'redirect' and btn_index is not None:
                     if btn_index < len(redirect_buttons):
@@ -3229,7 +2977,7 @@ class BotManager:
                                     button_text = self._format_button_text(btn['text'], price, btn.get('price_position'))
                                     buttons.append({
                                         'text': button_text,
-                                        'callback_data': f"buy_{btn_index}"
+                                        'callback_data': encode_callback('buy', btn_index)
                                     })
                         elif btn_type == 'redirect' and btn_index is not None:
                             if btn_index < len(redirect_buttons):
@@ -3602,9 +3350,11 @@ class BotManager:
         
         try:
             # ✅ NOVO: Usar snapshot se disponível
+            # ✅ Grafo compilado por versão do fluxo: sem json.loads/varredura do fluxo a cada salto
             if flow_snapshot:
                 import json
-                flow_steps = json.loads(flow_snapshot.get('flow_steps', '[]'))
+                compiled_flow = get_compiled_flow(flow_snapshot.get('flow_steps', '[]'))
+                flow_steps = compiled_flow.steps_list
                 main_buttons = json.loads(flow_snapshot.get('main_buttons', '[]'))
                 redirect_buttons = json.loads(flow_snapshot.get('redirect_buttons', '[]'))
                 
@@ -3619,33 +3369,14 @@ class BotManager:
                 # Mesclar com config atual (priorizar snapshot, mas manter outros campos)
                 config = {**config, **config_from_snapshot}
             else:
-                # ✅ CRÍTICO: Parsear flow_steps se necessário (pode vir como string JSON)
-                flow_steps_raw = config.get('flow_steps', [])
-                flow_steps = []
-                if flow_steps_raw:
-                    if isinstance(flow_steps_raw, str):
-                        try:
-                            import json
-                            flow_steps = json.loads(flow_steps_raw)
-                            logger.info(f"✅ flow_steps parseado de JSON em _execute_flow_recursive: {len(flow_steps)} steps")
-                        except Exception as e:
-                            logger.error(f"❌ Erro ao parsear flow_steps em _execute_flow_recursive: {e}")
-                            flow_steps = []
-                    elif isinstance(flow_steps_raw, list):
-                        flow_steps = flow_steps_raw
-                    else:
-                        logger.error(f"❌ flow_steps tem tipo inválido em _execute_flow_recursive: {type(flow_steps_raw)}")
-                        flow_steps = []
+                # ✅ CRÍTICO: flow_steps pode vir como string JSON (JSON inválido → fluxo vazio, erro registrado)
+                compiled_flow = get_compiled_flow(config.get('flow_steps', []))
             
-            logger.info(f"🔍 Buscando step {step_id} em {len(flow_steps)} steps disponíveis")
-            logger.info(f"🔍 IDs dos steps disponíveis: {[s.get('id') for s in flow_steps if isinstance(s, dict)]}")
-            
-            step = self._find_step_by_id(flow_steps, step_id)
+            step = compiled_flow.get(step_id)
             
             if not step:
                 logger.error(f"❌ Step {step_id} não encontrado no fluxo")
-                logger.error(f"❌ flow_steps tem {len(flow_steps)} steps")
-                logger.error(f"❌ Tipos dos steps: {[type(s) for s in flow_steps]}")
+                logger.error(f"❌ flow_steps tem {len(compiled_flow)} steps (versão {compiled_flow.version})")
                 # ✅ FALLBACK: Tentar encontrar step inicial ou enviar mensagem de erro
                 self._handle_missing_step(bot_id, token, config, chat_id, telegram_user_id)
                 return
@@ -3686,7 +3417,7 @@ class BotManager:
                 # Validar que conexões apontam para steps existentes
                 if has_next:
                     next_step_id = connections.get('next')
-                    if not self._find_step_by_id(flow_steps, next_step_id):
+                    if next_step_id not in compiled_flow:
                         logger.error(f"❌ Step payment {step_id} tem conexão 'next' apontando para step inexistente: {next_step_id}")
                         error_message = "⚠️ Erro de configuração: Conexão inválida no step de pagamento. Entre em contato com o suporte."
                         self.send_telegram_message(
@@ -3698,7 +3429,7 @@ class BotManager:
                 
                 if has_pending:
                     pending_step_id = connections.get('pending')
-                    if not self._find_step_by_id(flow_steps, pending_step_id):
+                    if pending_step_id not in compiled_flow:
                         logger.error(f"❌ Step payment {step_id} tem conexão 'pending' apontando para step inexistente: {pending_step_id}")
                         error_message = "⚠️ Erro de configuração: Conexão inválida no step de pagamento. Entre em contato com o suporte."
                         self.send_telegram_message(
@@ -3790,7 +3521,7 @@ class BotManager:
                     
                     buttons = [{
                         'text': '✅ Verificar Pagamento',
-                        'callback_data': f'verify_{pix_data.get("payment_id")}'
+                        'callback_data': encode_callback('verify', pix_data.get('payment_id'))
                     }]
                     
                     self.send_telegram_message(
@@ -4026,7 +3757,7 @@ class BotManager:
                 if flow_snapshot:
                     # Usar snapshot se disponível
                     import json
-                    flow_steps = json.loads(flow_snapshot.get('flow_steps', '[]'))
+                    flow_steps = get_compiled_flow(flow_snapshot.get('flow_steps', '[]')).steps_list
                     main_buttons = json.loads(flow_snapshot.get('main_buttons', '[]'))
                     redirect_buttons = json.loads(flow_snapshot.get('redirect_buttons', '[]'))
                     
@@ -4076,7 +3807,8 @@ class BotManager:
         except Exception as e:
             logger.error(f"❌ Erro ao executar step {step_id} (assíncrono): {e}", exc_info=True)
     
-    def _reset_user_funnel(self, bot_id: int, chat_id: int, telegram_user_id: str, db_session=None):
+    def _reset_user_funnel(self, bot_id: int, chat_id: int, telegram_user_id: str, db_session=None,
+                           reset_lead: bool = True):
         """
         # ✅ QI 500: RESET ABSOLUTO DO FUNIL
         
@@ -4089,6 +3821,9 @@ class BotManager:
         
         Esta função é chamada SEMPRE que /start é recebido,
         independente de conversa ativa ou histórico.
+        
+        reset_lead=False: só o estado do Redis — o /start já resetou welcome_sent
+        e last_interaction no upsert do lead (lead_upsert), sem commit extra.
         """
         try:
             # ✅ REDIS MIGRATION: Limpar sessões de order bump no Redis
@@ -4112,6 +3847,10 @@ class BotManager:
             except Exception:
                 pass
             
+            if not reset_lead:
+                logger.info(f"✅ Funil resetado (Redis) para bot_id={bot_id}, chat_id={chat_id}")
+                return
+            
             # ✅ QI 500: RESET COMPLETO NO BANCO (ESSENCIAL)
             from flask import current_app
             from internal_logic.core.extensions import db
@@ -4343,11 +4082,11 @@ class BotManager:
             buttons = [
                 {
                     'text': accept_button_text,
-                    'callback_data': f'multi_bump_yes_{chat_id}_{current_index}_{int(total_with_this_bump*100)}'
+                    'callback_data': encode_callback('multi_bump_yes', chat_id, current_index, int(total_with_this_bump*100))
                 },
                 {
                     'text': decline_button_text,
-                    'callback_data': f'multi_bump_no_{chat_id}_{current_index}_{int(current_total*100)}'
+                    'callback_data': encode_callback('multi_bump_no', chat_id, current_index, int(current_total*100))
                 }
             ]
             
@@ -4613,7 +4352,7 @@ class BotManager:
             
             buttons = [{
                 'text': '✅ Verificar Pagamento',
-                'callback_data': f'verify_{payment_id}'
+                'callback_data': encode_callback('verify', payment_id)
             }]
             
             result = self.send_telegram_message(
@@ -4684,11 +4423,11 @@ class BotManager:
             buttons = [
                 {
                     'text': accept_button_text,
-                    'callback_data': f'downsell_bump_yes_{downsell_index}_{int(total_price*100)}'
+                    'callback_data': encode_callback('downsell_bump_yes', downsell_index, int(total_price*100))
                 },
                 {
                     'text': decline_button_text,
-                    'callback_data': f'downsell_bump_no_{downsell_index}_{int(downsell_price*100)}'
+                    'callback_data': encode_callback('downsell_bump_no', downsell_index, int(downsell_price*100))
                 }
             ]
             
@@ -4783,11 +4522,11 @@ class BotManager:
             buttons = [
                 {
                     'text': accept_button_text,
-                    'callback_data': f'bump_yes_{button_index}'  # ✅ CORREÇÃO: Apenas índice (< 15 bytes)
+                    'callback_data': encode_callback('bump_yes', button_index)
                 },
                 {
                     'text': decline_button_text,
-                    'callback_data': f'bump_no_{button_index}'  # ✅ CORREÇÃO: Apenas índice (< 15 bytes)
+                    'callback_data': encode_callback('bump_no', button_index)
                 }
             ]
             
@@ -5127,15 +4866,12 @@ class BotManager:
         try:
             from flask import current_app
             from internal_logic.core.extensions import db
-            from internal_logic.core.models import BotUser, BotMessage
+            from internal_logic.core.models import BotMessage
+            from internal_logic.services.lead_lookup import find_lead_ref
             import uuid
 
             with current_app.app_context():
-                bot_user = BotUser.query.filter_by(
-                    bot_id=bot_id,
-                    telegram_user_id=str(chat_id),
-                    archived=False
-                ).first()
+                bot_user = find_lead_ref(bot_id, chat_id, include_archived=False)
                 if not bot_user:
                     return
 
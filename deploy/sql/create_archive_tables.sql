@@ -13,6 +13,7 @@ CREATE TABLE IF NOT EXISTS bot_messages_archive (
 );
 
 ALTER TABLE bot_messages_archive ADD COLUMN IF NOT EXISTS archived_at TIMESTAMP NOT NULL DEFAULT NOW();
+ALTER TABLE bot_messages_archive ADD COLUMN IF NOT EXISTS lead_id BIGINT;
 CREATE INDEX IF NOT EXISTS idx_bot_messages_archive_archived_at
     ON bot_messages_archive (archived_at);
 CREATE INDEX IF NOT EXISTS idx_bot_messages_archive_bot_id
@@ -0,0 +1,76 @@
+"""
+Configuração Gunicorn - Camada de Ingestão de Webhooks
+GRIMBOTS v2.1.0
+
+gunicorn -c gunicorn_ingest_config.py ingest:application
+
+Diferente do app principal (1 worker eventlet por causa do BotManager em
+memória), a ingestão não guarda estado no processo: cada requisição é um
+script Lua no Redis. Por isso roda N workers síncronos pré-forkados e com
+preload_app — um GIL por núcleo em vez de um GIL para todos os webhooks.
+"""
+import multiprocessing
+import os
+from pathlib import Path
+
+# ========================================
+# PREPARAÇÃO DE DIRETÓRIOS
+# ========================================
+LOG_DIR = Path(__file__).resolve().parent / "logs"
+LOG_DIR.mkdir(parents=True, exist_ok=True)
+
+# ========================================
+# SERVER SOCKET
+# ========================================
+bind = os.environ.get("INGEST_BIND", "127.0.0.1:5001")
+backlog = 2048
+
+# ========================================
+# WORKER PROCESSES
+# ========================================
+# Trabalho por requisição é CPU curta + 1 round-trip no Redis: threads
+# cobrem a espera de rede, processos cobrem a CPU.
+workers = int(os.environ.get("INGEST_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.environ.get("INGEST_THREADS", 4))
+
+max_requests = 20000  # Restart worker após N requests (previne memory leak)
+max_requests_jitter = 2000
+timeout = 30
+keepalive = 5
+graceful_timeout = 15
+
+# ✅ Seguro aqui: o app de ingestão não abre conexões no import (pool Redis é
+# criado no primeiro request de cada worker, depois do fork)
+preload_app = True
+
+# ========================================
+# LOGGING
+# ========================================
+accesslog = None  # volume alto; erros continuam no error log
+errorlog = str(LOG_DIR / "ingest_error.log")
+loglevel = "warning"
+
+# ========================================
+# PROCESS NAMING
+# ========================================
+proc_name = "grimbots_ingest"
+pidfile = "grimbots_ingest.pid"
+
+# ========================================
+# SECURITY
+# ========================================
+limit_request_line = 4096
+limit_request_fields = 100
+limit_request_field_size = 8190
+
+
+def on_starting(server):
+    """Callback quando servidor inicia"""
+    print("="*70)
+    print(" GRIMBOTS INGEST - INICIANDO")
+    print("="*70)
+    print(f" Workers: {workers} x {threads} threads")
+    print(f" Bind: {bind}")
+    print(f" Worker Class: {worker_class}")
+    print("="*70)
@@ -0,0 +1,19 @@
+"""
+WSGI Entry Point - Camada de Ingestão de Webhooks
+Para produção com Gunicorn (gunicorn -c gunicorn_ingest_config.py ingest:application)
+
+Sem eventlet: workers síncronos pré-forkados, um por núcleo.
+"""
+
+import os
+from dotenv import load_dotenv
+# Caminho absoluto para garantir o carregamento correto em qualquer contexto
+env_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
+load_dotenv(env_path)
+
+from internal_logic.core.ingest_app import create_ingest_app
+
+application = create_ingest_app()
+
+if __name__ == "__main__":
+    application.run(port=5001)
@@ -276,42 +276,13 @@ def admin_stop_impersonate():
 @login_required
 @admin_required
 def admin_revenue():
-    """Relatório de receita do sistema"""
-    # Receita por dia (últimos 30 dias)
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    
-    daily_revenue = db.session.query(
-        func.date(Payment.paid_at).label('date'),
-        func.count(Payment.id).label('count'),
-        func.sum(Payment.amount).label('revenue')
-    ).filter(
-        Payment.status == 'paid',
-        Payment.paid_at >= thirty_days_ago
-    ).group_by(
-        func.date(Payment.paid_at)
-    ).order_by(
-        func.date(Payment.paid_at).desc()
-    ).all()
-    
-    # Top usuários por receita
-    top_users = db.session.query(
-        User.id,
-        User.username,
-        User.email,
-        func.sum(Payment.amount).label('total_revenue'),
-        func.count(Payment.id).label('total_sales')
-    ).join(Bot).join(Payment).filter(
-        Payment.status == 'paid'
-    ).group_by(
-        User.id
-    ).order_by(
-        func.sum(Payment.amount).desc()
-    ).limit(20).all()
+    """Relatório de receita do sistema (resumo diário materializado)"""
+    from internal_logic.services.admin_summary import get_daily_revenue, get_top_users
     
     return render_template(
         'admin/revenue.html',
-        daily_revenue=daily_revenue,
-        top_users=top_users
+        daily_revenue=get_daily_revenue(days=30),
+        top_users=get_top_users(limit=20)
     )
 
 
@@ -320,43 +291,35 @@ def admin_revenue():
 @admin_required
 def admin_analytics():
     """Analytics e estatísticas do sistema"""
-    # Métricas gerais
-    total_users = User.query.count()
+    from internal_logic.services.admin_summary import get_overview
+    
+    # Totais e crescimento: resumo diário materializado (uma query)
+    overview = get_overview()
+    
     active_users_7d = User.query.filter(
-        User.last_login_at >= datetime.utcnow() - timedelta(days=7)
+        User.last_login >= datetime.utcnow() - timedelta(days=7)
     ).count()
     
-    total_bots = Bot.query.count()
-    active_bots = Bot.query.filter_by(is_active=True).count()
-    
-    total_payments = Payment.query.filter_by(status='paid').count()
-    total_revenue = db.session.query(func.sum(Payment.amount)).filter(
-        Payment.status == 'paid'
-    ).scalar() or 0.0
+    total_bots, active_bots = db.session.query(
+        func.count(Bot.id),
+        func.count(Bot.id).filter(Bot.is_active == True)
+    ).one()
     
     # Crescimento (últimos 7 dias vs 7 dias anteriores)
-    last_7d_start = datetime.utcnow() - timedelta(days=7)
-    prev_7d_start = datetime.utcnow() - timedelta(days=14)
-    
-    new_users_last_7d = User.query.filter(User.created_at >= last_7d_start).count()
-    new_users_prev_7d = User.query.filter(
-        User.created_at >= prev_7d_start,
-        User.created_at < last_7d_start
-    ).count()
-    
-    user_growth = ((new_users_last_7d - new_users_prev_7d) / max(new_users_prev_7d, 1)) * 100
+    new_users_prev_7d = overview['new_users_prev_7d']
+    user_growth = ((overview['new_users_last_7d'] - new_users_prev_7d) / max(new_users_prev_7d, 1)) * 100
     
     return render_template(
         'admin/analytics.html',
         metrics={
-            'total_users': total_users,
+            'total_users': overview['total_users'],
             'active_users_7d': active_users_7d,
             'total_bots': total_bots,
-            'active_bots': active_bots,
-            'total_payments': total_payments,
-            'total_revenue': float(total_revenue),
+            'active_bots': active_bots or 0,
+            'total_payments': overview['total_payments'],
+            'total_revenue': overview['total_revenue'],
             'user_growth': round(user_growth, 2),
-            'new_users_last_7d': new_users_last_7d
+            'new_users_last_7d': overview['new_users_last_7d']
         }
     )
 
@@ -396,106 +359,27 @@ def admin_exports():
 @login_required
 @admin_required
 def admin_export_users():
-    """API para exportar usuários (CSV/JSON)"""
-    import json
-    from flask import Response
-    
-    users = User.query.all()
-    users_data = []
-    
-    for user in users:
-        users_data.append({
-            'id': user.id,
-            'username': user.username,
-            'email': user.email,
-            'full_name': user.full_name,
-            'is_active': user.is_active,
-            'is_admin': getattr(user, 'is_admin', False),
-            'created_at': user.created_at.isoformat() if user.created_at else None,
-            'last_login_at': user.last_login_at.isoformat() if user.last_login_at else None,
-            'total_revenue': float(user.total_revenue) if hasattr(user, 'total_revenue') else 0.0,
-            'total_sales': user.total_sales if hasattr(user, 'total_sales') else 0
-        })
+    """API para exportar usuários (CSV/NDJSON/JSON) em streaming"""
+    from internal_logic.services.export_stream import FORMATS, export_response, users_export
     
     format_type = request.args.get('format', 'json')
+    if format_type not in FORMATS:
+        return jsonify({'error': 'Formato inválido (csv, ndjson ou json)'}), 400
     
-    if format_type == 'csv':
-        import csv
-        import io
-        
-        output = io.StringIO()
-        writer = csv.DictWriter(output, fieldnames=users_data[0].keys() if users_data else [])
-        writer.writeheader()
-        writer.writerows(users_data)
-        
-        return Response(
-            output.getvalue(),
-            mimetype='text/csv',
-            headers={
-                'Content-Disposition': 'attachment; filename=users_export.csv'
-            }
-        )
-    else:
-        return Response(
-            json.dumps(users_data, indent=2),
-            mimetype='application/json',
-            headers={
-                'Content-Disposition': 'attachment; filename=users_export.json'
-            }
-        )
+    return export_response(users_export(), format_type, 'users_export')
 
 
 @admin_bp.route('/admin/api/export/payments')
 @login_required
 @admin_required
 def admin_export_payments():
-    """API para exportar pagamentos (CSV/JSON)"""
-    import json
-    from flask import Response
-    
-    payments = Payment.query.filter_by(status='paid').order_by(
-        Payment.paid_at.desc()
-    ).limit(10000).all()
-    
-    payments_data = []
-    for payment in payments:
-        payments_data.append({
-            'id': payment.id,
-            'payment_id': payment.payment_id,
-            'bot_id': payment.bot_id,
-            'user_id': payment.bot.user_id if payment.bot else None,
-            'customer_name': payment.customer_name,
-            'customer_email': payment.customer_email,
-            'amount': float(payment.amount),
-            'status': payment.status,
-            'gateway_type': payment.gateway_type,
-            'paid_at': payment.paid_at.isoformat() if payment.paid_at else None,
-            'product_name': payment.product_name
-        })
+    """API para exportar pagamentos pagos (CSV/NDJSON/JSON) em streaming — sem limite de linhas"""
+    from internal_logic.services.export_stream import FORMATS, export_response, payments_export
     
     format_type = request.args.get('format', 'json')
+    if format_type not in FORMATS:
+        return jsonify({'error': 'Formato inválido (csv, ndjson ou json)'}), 400
     
-    if format_type == 'csv':
-        import csv
-        import io
-        
-        output = io.StringIO()
-        writer = csv.DictWriter(output, fieldnames=payments_data[0].keys() if payments_data else [])
-        writer.writeheader()
-        writer.writerows(payments_data)
-        
-        return Response(
-            output.getvalue(),
-            mimetype='text/csv',
-            headers={
-                'Content-Disposition': 'attachment; filename=payments_export.csv'
-            }
-        )
-    else:
-        return Response(
-            json.dumps(payments_data, indent=2),
-            mimetype='application/json',
-            headers={
-                'Content-Disposition': 'attachment; filename=payments_export.json'
-            }
-        )
+    user_id = request.args.get('user_id', type=int)
+    bot_id = request.args.get('bot_id', type=int)
+    return export_response(payments_export(user_id=user_id, bot_id=bot_id), format_type, 'payments_export')
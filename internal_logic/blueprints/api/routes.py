@@ -15,7 +15,8 @@ from sqlalchemy import func, extract, and_
 
 from internal_logic.core.models import Bot, Payment, BotUser, RemarketingCampaign
 from internal_logic.core.extensions import db
-from internal_logic.core.redis_manager import get_redis_connection
+from internal_logic.services.stats_cache import get_or_compute
+from internal_logic.services.stats_service import StatsService
 
 logger = logging.getLogger(__name__)
 
@@ -36,21 +37,22 @@ def bot_stats_api(bot_id):
     API para estatísticas do bot (usada pelo frontend via AJAX)
     ARQUITETURA: Stateless (On-Demand SQL) - Nunca usa campos denormalizados
     """
-    bot = Bot.query.filter_by(id=bot_id, user_id=current_user.id).first_or_404()
+    Bot.query.filter_by(id=bot_id, user_id=current_user.id).first_or_404()
 
     # Obter período da query string
     raw_period = request.args.get('period', '30')
 
-    # Cache Redis (30s TTL) — reduz carga no DB para refreshes rápidos do frontend
-    cache_key = f"gb:stats:{bot_id}:{raw_period}"
-    try:
-        r = get_redis_connection()
-        cached = r.get(cache_key)
-        if cached:
-            return jsonify(json.loads(cached))
-    except Exception:
-        pass
+    # Cache Redis com soft-TTL (30s) + single-flight: quando expira, um único
+    # worker recalcula em background e os demais seguem servindo o valor anterior
+    response_data = get_or_compute(
+        f"gb:stats:{bot_id}:{raw_period}",
+        lambda: _compute_bot_stats(bot_id, raw_period)
+    )
+    return jsonify(response_data)
 
+
+def _compute_bot_stats(bot_id, raw_period):
+    """Monta o payload de /api/bots/<id>/stats (SQL on-demand, blocos defensivos)"""
     # Mapear labels do frontend para dias
     period_map = {'day': 1, 'today': 1, 'month': 30, '7': 7, '30': 30}
     if raw_period == 'all':
@@ -73,8 +75,6 @@ def bot_stats_api(bot_id):
 
     # Hoje e ontem para cálculos de variação
     today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    tomorrow = today + timedelta(days=1)
-    yesterday = today - timedelta(days=1)
 
     # ============================================================================
     # INICIALIZAÇÃO DOS DADOS (fallback seguro)
@@ -128,43 +128,25 @@ def bot_stats_api(bot_id):
     # ============================================================================
     # BLOCO 1: SUMMARY (Resumo Executivo) - CRÍTICO
     # ============================================================================
+    aggregates = None
     try:
-        total_sales = db.session.query(func.count(Payment.id)).filter(
-            payment_filter, Payment.status == 'paid'
-        ).scalar() or 0
-
-        total_revenue = db.session.query(func.sum(Payment.amount)).filter(
-            payment_filter, Payment.status == 'paid'
-        ).scalar() or 0.0
-
-        total_pending = db.session.query(func.count(Payment.id)).filter(
-            payment_filter, Payment.status == 'pending'
-        ).scalar() or 0
-
+        # Uma única varredura de payments (FILTER) alimenta resumo, remarketing e funis
+        aggregates = StatsService.get_dashboard_aggregates(
+            bot_id, date_filter if raw_period != 'all' else None, today
+        )
+
+        total_sales = aggregates['total_sales']
+        total_revenue = aggregates['total_revenue']
+        total_pending = aggregates['pending']
         total_checkouts = total_sales + total_pending
 
         conversion_rate = (total_sales / total_checkouts * 100) if total_checkouts > 0 else 0.0
         avg_ticket = (total_revenue / total_sales) if total_sales > 0 else 0.0
 
-        today_sales = db.session.query(func.count(Payment.id)).filter(
-            Payment.bot_id == bot_id, Payment.status == 'paid',
-            Payment.created_at >= today, Payment.created_at < tomorrow
-        ).scalar() or 0
-
-        today_revenue = db.session.query(func.sum(Payment.amount)).filter(
-            Payment.bot_id == bot_id, Payment.status == 'paid',
-            Payment.created_at >= today, Payment.created_at < tomorrow
-        ).scalar() or 0.0
-
-        yesterday_sales = db.session.query(func.count(Payment.id)).filter(
-            Payment.bot_id == bot_id, Payment.status == 'paid',
-            Payment.created_at >= yesterday, Payment.created_at < today
-        ).scalar() or 0
-
-        yesterday_revenue = db.session.query(func.sum(Payment.amount)).filter(
-            Payment.bot_id == bot_id, Payment.status == 'paid',
-            Payment.created_at >= yesterday, Payment.created_at < today
-        ).scalar() or 0.0
+        today_sales = aggregates['today_sales']
+        today_revenue = aggregates['today_revenue']
+        yesterday_sales = aggregates['yesterday_sales']
+        yesterday_revenue = aggregates['yesterday_revenue']
 
         revenue_change = ((today_revenue - yesterday_revenue) / yesterday_revenue * 100) if yesterday_revenue > 0 else 0.0
         sales_change = ((today_sales - yesterday_sales) / yesterday_sales * 100) if yesterday_sales > 0 else 0.0
@@ -192,13 +174,12 @@ def bot_stats_api(bot_id):
     # BLOCO 2: USERS (Métricas de Usuários)
     # ============================================================================
     try:
-        total_users = db.session.query(func.count(BotUser.id)).filter(
-            BotUser.bot_id == bot_id
-        ).scalar() or 0
-
-        active_users = db.session.query(func.count(BotUser.id)).filter(
-            BotUser.bot_id == bot_id, BotUser.last_interaction >= date_filter
-        ).scalar() or 0
+        total_users, active_users = db.session.query(
+            func.count(BotUser.id),
+            func.count(BotUser.id).filter(BotUser.last_interaction >= date_filter)
+        ).filter(BotUser.bot_id == bot_id).one()
+        total_users = total_users or 0
+        active_users = active_users or 0
 
         # Fallback: se não há usuários registrados, usar total_sales (não pode haver menos usuários que vendas)
         if total_users == 0 and summary.get('total_sales', 0) > 0:
@@ -223,28 +204,9 @@ def bot_stats_api(bot_id):
     # ============================================================================
     try:
         chart_days = max(7, min(days or 90, 90)) if days else 90
-        daily_sales = []
-
-        for i in range(chart_days - 1, -1, -1):
-            day_start = today - timedelta(days=i)
-            day_end = day_start + timedelta(days=1)
-
-            day_sales = db.session.query(func.count(Payment.id)).filter(
-                Payment.bot_id == bot_id, Payment.status == 'paid',
-                Payment.created_at >= day_start, Payment.created_at < day_end
-            ).scalar() or 0
-
-            day_revenue = db.session.query(func.sum(Payment.amount)).filter(
-                Payment.bot_id == bot_id, Payment.status == 'paid',
-                Payment.created_at >= day_start, Payment.created_at < day_end
-            ).scalar() or 0.0
-
-            daily_sales.append({
-                'date': day_start.strftime('%Y-%m-%d'),
-                'day': day_start.strftime('%d/%m'),
-                'sales': day_sales,
-                'revenue': float(day_revenue)
-            })
+        daily_sales = StatsService.get_daily_totals(
+            bot_id, today - timedelta(days=chart_days - 1), chart_days
+        )
 
         chart_data = daily_sales
         daily_chart = daily_sales
@@ -258,34 +220,26 @@ def bot_stats_api(bot_id):
     # BLOCO 4: REMARKETING (Estatísticas de Remarketing)
     # ============================================================================
     try:
-        total_campaigns = db.session.query(func.count(RemarketingCampaign.id)).filter(
-            RemarketingCampaign.bot_id == bot_id
-        ).scalar() or 0
-
-        active_campaigns = db.session.query(func.count(RemarketingCampaign.id)).filter(
-            RemarketingCampaign.bot_id == bot_id, RemarketingCampaign.status == 'active'
-        ).scalar() or 0
-
-        completed_campaigns = db.session.query(func.count(RemarketingCampaign.id)).filter(
-            RemarketingCampaign.bot_id == bot_id, RemarketingCampaign.status == 'completed'
-        ).scalar() or 0
-
         campaign_totals = db.session.query(
+            func.count(RemarketingCampaign.id).label('total_campaigns'),
+            func.count(RemarketingCampaign.id).filter(RemarketingCampaign.status == 'active').label('active_campaigns'),
+            func.count(RemarketingCampaign.id).filter(RemarketingCampaign.status == 'completed').label('completed_campaigns'),
             func.sum(RemarketingCampaign.total_sent).label('total_sent'),
             func.sum(RemarketingCampaign.total_clicks).label('total_clicks'),
             func.sum(RemarketingCampaign.total_sales).label('total_sales'),
             func.sum(RemarketingCampaign.revenue_generated).label('revenue_generated')
-        ).filter(RemarketingCampaign.bot_id == bot_id).first()
+        ).filter(RemarketingCampaign.bot_id == bot_id).one()
 
+        total_campaigns = campaign_totals.total_campaigns or 0
+        active_campaigns = campaign_totals.active_campaigns or 0
+        completed_campaigns = campaign_totals.completed_campaigns or 0
         total_sent = campaign_totals.total_sent or 0
         total_clicks = campaign_totals.total_clicks or 0
         campaign_sales = campaign_totals.total_sales or 0
         campaign_revenue = campaign_totals.revenue_generated or 0.0
 
-        remarketing_filter = and_(payment_filter, Payment.status == 'paid', Payment.is_remarketing == True)
-
-        payment_remarketing_sales = db.session.query(func.count(Payment.id)).filter(remarketing_filter).scalar() or 0
-        payment_remarketing_revenue = db.session.query(func.sum(Payment.amount)).filter(remarketing_filter).scalar() or 0.0
+        payment_remarketing_sales = aggregates['remarketing_sales'] if aggregates else 0
+        payment_remarketing_revenue = aggregates['remarketing_revenue'] if aggregates else 0.0
 
         final_remarketing_sales = max(payment_remarketing_sales, campaign_sales)
         final_remarketing_revenue = max(payment_remarketing_revenue, campaign_revenue)
@@ -432,29 +386,15 @@ def bot_stats_api(bot_id):
     # BLOCO 8: FUNNELS (Métricas de Funil)
     # ============================================================================
     try:
-        downsell_sales = db.session.query(func.count(Payment.id)).filter(
-            payment_filter, Payment.status == 'paid', Payment.is_downsell == True
-        ).scalar() or 0
-
-        downsell_revenue = db.session.query(func.sum(Payment.amount)).filter(
-            payment_filter, Payment.status == 'paid', Payment.is_downsell == True
-        ).scalar() or 0.0
+        if aggregates is None:
+            raise RuntimeError('agregados de payments indisponíveis')
 
-        upsell_sales = db.session.query(func.count(Payment.id)).filter(
-            payment_filter, Payment.status == 'paid', Payment.is_upsell == True
-        ).scalar() or 0
-
-        upsell_revenue = db.session.query(func.sum(Payment.amount)).filter(
-            payment_filter, Payment.status == 'paid', Payment.is_upsell == True
-        ).scalar() or 0.0
-
-        order_bump_sales = db.session.query(func.count(Payment.id)).filter(
-            payment_filter, Payment.status == 'paid', Payment.order_bump_accepted == True
-        ).scalar() or 0
-
-        order_bump_revenue = db.session.query(func.sum(Payment.amount)).filter(
-            payment_filter, Payment.status == 'paid', Payment.order_bump_accepted == True
-        ).scalar() or 0.0
+        downsell_sales = aggregates['downsell_sales']
+        downsell_revenue = aggregates['downsell_revenue']
+        upsell_sales = aggregates['upsell_sales']
+        upsell_revenue = aggregates['upsell_revenue']
+        order_bump_sales = aggregates['order_bump_sales']
+        order_bump_revenue = aggregates['order_bump_revenue']
 
         # Estimativas de exposição (shown/sent) para cálculo de taxas
         # Plano B: estimar baseado em vendas (assumindo 20-30% de conversão típica)
@@ -635,14 +575,7 @@ def bot_stats_api(bot_id):
         }
     }
 
-    # Cache no Redis (30s TTL)
-    try:
-        r = get_redis_connection()
-        r.setex(cache_key, 30, json.dumps(response_data, default=str))
-    except Exception:
-        pass
-
-    return jsonify(response_data)
+    return response_data
 
 
 # ============================================================================
@@ -675,6 +608,10 @@ def bot_analytics_v2(bot_id):
         # Buscar horários de pico
         peak_hours = StatsService.get_peak_hours(bot_id, period)
         
+        # Breakdowns por dimensão (uma query sobre analytics_daily_counts)
+        from internal_logic.services.analytics_cube import get_breakdowns
+        breakdowns = get_breakdowns(bot_id, int(period) if str(period).isdigit() else None)
+        
         # Analytics V2.0 - Dados demográficos e métricas avançadas
         analytics_v2_data = {
             # Métricas principais
@@ -686,27 +623,10 @@ def bot_analytics_v2(bot_id):
                 'avg_ticket': metrics['avg_ticket']
             },
             
-            # Dados demográficos (simulados - TODO: implementar com dados reais)
+            # Dados demográficos (cubo pré-agregado: leads/vendas por estado e cidade)
             'demographics': {
-                'age_groups': {
-                    '18-24': 15,
-                    '25-34': 35,
-                    '35-44': 28,
-                    '45-54': 15,
-                    '55+': 7
-                },
-                'gender': {
-                    'male': 45,
-                    'female': 52,
-                    'other': 3
-                },
-                'locations': {
-                    'São Paulo': 25,
-                    'Rio de Janeiro': 18,
-                    'Minas Gerais': 12,
-                    'Bahia': 8,
-                    'Outros': 37
-                }
+                'locations': breakdowns['customer_state'],
+                'cities': breakdowns['customer_city']
             },
             
             # Engajamento
@@ -719,18 +639,16 @@ def bot_analytics_v2(bot_id):
             
             # Performance por dispositivo
             'devices': {
-                'mobile': 65,
-                'desktop': 28,
-                'tablet': 7
+                'types': breakdowns['device_type'],
+                'os': breakdowns['os_type'],
+                'browsers': breakdowns['browser']
             },
             
             # Fontes de tráfego
             'traffic_sources': {
-                'direct': 35,
-                'social': 28,
-                'search': 20,
-                'referral': 12,
-                'other': 5
+                'utm_source': breakdowns['utm_source'],
+                'utm_campaign': breakdowns['utm_campaign'],
+                'campaign_code': breakdowns['campaign_code']
             },
             
             # Dados temporais para gráficos
@@ -70,6 +70,9 @@ def register():
             db.session.add(user)
             db.session.commit()
             
+            from internal_logic.services.admin_summary import record_signup
+            record_signup(user)
+            
             logger.info(f"Novo usuário cadastrado: {user.email}")
             flash('Conta criada com sucesso! Faça login.', 'success')
             return redirect(url_for('auth.login'))
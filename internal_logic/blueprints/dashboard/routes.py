@@ -13,6 +13,7 @@ from internal_logic.core.models import (
     Commission, PushSubscription, NotificationSettings, Subscription, get_brazil_time
 )
 from sqlalchemy import func, extract
+from sqlalchemy.orm import undefer_group
 from datetime import datetime, timedelta
 import logging
 import os
@@ -24,14 +25,11 @@ logger = logging.getLogger(__name__)
 # Criar Blueprint
 dashboard_bp = Blueprint('dashboard', __name__)
 
-# Cache de BotManager por user_id (evita criar BotManager + threads a cada envio de mensagem)
-_bot_manager_cache: dict = {}
+# BotManager por user_id (evita criar BotManager + threads a cada envio de mensagem)
 def _get_bot_manager(user_id: int):
-    """Retorna BotManager cacheado para o user_id (lazy singleton por worker)."""
-    if user_id not in _bot_manager_cache:
-        from bot_manager import BotManager
-        _bot_manager_cache[user_id] = BotManager(socketio=None, scheduler=None, user_id=user_id)
-    return _bot_manager_cache[user_id]
+    """Retorna BotManager cacheado para o user_id (registry por processo)."""
+    from internal_logic.core.service_registry import get_bot_manager
+    return get_bot_manager(user_id)
 
 
 # get_brazil_time é importado do models (linha 13)
@@ -590,43 +588,56 @@ def ranking():
     period = request.args.get('period', 'monthly')
     
     # ============================================================================
-    # 🔥 QUERY MENSAL - Faturamento do MÊS ATUAL (não total histórico)
+    # 🏆 RANKING PRÉ-COMPUTADO (Redis ZSET mantido por leaderboard_service)
     # ============================================================================
-    # Subquery: SUM de pagamentos 'paid' do mês atual por usuário
-    monthly_revenue_subq = db.session.query(
-        Bot.user_id.label('user_id'),
-        func.sum(Payment.amount).label('monthly_revenue'),
-        func.count(Payment.id).label('monthly_sales')
-    ).join(
-        Payment, Payment.bot_id == Bot.id
-    ).filter(
-        Payment.status == 'paid',
-        Payment.created_at >= first_day_of_month
-    ).group_by(
-        Bot.user_id
-    ).subquery()
-    
-    # Query principal: JOIN com User + filtros de admin e faturamento > 0
-    top_sellers = db.session.query(
-        User.id,
-        User.username,
-        User.full_name,
-        User.ranking_display_name,
-        User.commission_percentage,
-        User.total_revenue,  # Mantido para placas/conquistas (histórico)
-        User.total_sales,    # Mantido para placas/conquistas (histórico)
-        func.coalesce(monthly_revenue_subq.c.monthly_revenue, 0).label('monthly_revenue'),
-        func.coalesce(monthly_revenue_subq.c.monthly_sales, 0).label('monthly_sales')
-    ).outerjoin(
-        monthly_revenue_subq, monthly_revenue_subq.c.user_id == User.id
-    ).filter(
-        User.is_active == True,
-        User.is_admin == False,  # 🚫 EXCLUI ADMINISTRADORES
-        User.is_banned == False,   # 🚫 EXCLUI BANIDOS
-        monthly_revenue_subq.c.monthly_revenue > 0  # 🚫 Apenas quem vendeu no mês
-    ).order_by(
-        monthly_revenue_subq.c.monthly_revenue.desc().nullslast()
-    ).limit(100).all()
+    leaderboard = None
+    try:
+        from internal_logic.services.leaderboard_service import load_ranking
+        leaderboard = load_ranking(current_user.id, limit=100)
+    except Exception as e:
+        logger.warning(f"⚠️ [RANKING] Leaderboard Redis indisponível, usando SQL: {e}")
+
+    if leaderboard is not None:
+        top_sellers = leaderboard['sellers']
+    else:
+        # ========================================================================
+        # 🔥 FALLBACK SQL - Faturamento do MÊS ATUAL (não total histórico)
+        # ========================================================================
+        # Subquery: SUM de pagamentos 'paid' do mês atual por usuário
+        monthly_revenue_subq = db.session.query(
+            Bot.user_id.label('user_id'),
+            func.sum(Payment.amount).label('monthly_revenue'),
+            func.count(Payment.id).label('monthly_sales')
+        ).join(
+            Payment, Payment.bot_id == Bot.id
+        ).filter(
+            Payment.status == 'paid',
+            Payment.created_at >= first_day_of_month
+        ).group_by(
+            Bot.user_id
+        ).subquery()
+    
+        # Query principal: JOIN com User + filtros de admin e faturamento > 0
+        top_sellers = db.session.query(
+            User.id,
+            User.username,
+            User.full_name,
+            User.ranking_display_name,
+            User.commission_percentage,
+            User.total_revenue,  # Mantido para placas/conquistas (histórico)
+            User.total_sales,    # Mantido para placas/conquistas (histórico)
+            func.coalesce(monthly_revenue_subq.c.monthly_revenue, 0).label('monthly_revenue'),
+            func.coalesce(monthly_revenue_subq.c.monthly_sales, 0).label('monthly_sales')
+        ).outerjoin(
+            monthly_revenue_subq, monthly_revenue_subq.c.user_id == User.id
+        ).filter(
+            User.is_active == True,
+            User.is_admin == False,  # 🚫 EXCLUI ADMINISTRADORES
+            User.is_banned == False,   # 🚫 EXCLUI BANIDOS
+            monthly_revenue_subq.c.monthly_revenue > 0  # 🚫 Apenas quem vendeu no mês
+        ).order_by(
+            monthly_revenue_subq.c.monthly_revenue.desc().nullslast()
+        ).limit(100).all()
     
     # ============================================================================
     # 🏆 CONSTRUÇÃO DO RANKING DATA - Baseado no FATURAMENTO MENSAL
@@ -668,46 +679,51 @@ def ranking():
             'streak': getattr(seller, 'current_streak', 0)
         })
     
-    # Calcular posição do usuário atual (baseado no MÊS)
-    my_position_number = None
-    for idx, seller in enumerate(top_sellers):
-        if seller.id == current_user.id:
-            my_position_number = idx + 1
-            break
-    
-    # Se não está no top 100, buscar posição separadamente (baseada no mês)
-    if my_position_number is None:
-        my_monthly_revenue = db.session.query(
-            func.coalesce(func.sum(Payment.amount), 0)
-        ).join(Bot, Payment.bot_id == Bot.id).filter(
-            Bot.user_id == current_user.id,
-            Payment.status == 'paid',
-            Payment.created_at >= first_day_of_month
-        ).scalar() or 0
-        
-        if my_monthly_revenue > 0:
-            my_position_number = db.session.query(
-                func.count(db.distinct(Bot.user_id))
-            ).join(Payment).filter(
+    if leaderboard is not None:
+        # 📍 Posição via ZREVRANK (funciona também fora do top 100)
+        my_position_number = leaderboard['my_position']
+        next_user = leaderboard['neighbor_above']
+    else:
+        # Calcular posição do usuário atual (baseado no MÊS)
+        my_position_number = None
+        for idx, seller in enumerate(top_sellers):
+            if seller.id == current_user.id:
+                my_position_number = idx + 1
+                break
+    
+        # Se não está no top 100, buscar posição separadamente (baseada no mês)
+        if my_position_number is None:
+            my_monthly_revenue = db.session.query(
+                func.coalesce(func.sum(Payment.amount), 0)
+            ).join(Bot, Payment.bot_id == Bot.id).filter(
+                Bot.user_id == current_user.id,
                 Payment.status == 'paid',
-                Payment.created_at >= first_day_of_month,
-                Payment.amount > my_monthly_revenue
+                Payment.created_at >= first_day_of_month
             ).scalar() or 0
-            my_position_number += 1
-        else:
-            my_position_number = None  # Sem vendas no mês = sem posição
-    
-    # Próximo usuário acima no ranking (quanto falta para subir)
-    next_user = None
-    if my_position_number and my_position_number > 1:
-        next_seller = top_sellers[my_position_number - 2]  # -2 porque índice começa em 0
-        my_monthly = next(s['revenue'] for s in ranking_data if s['user_id'] == current_user.id)
-        next_user = {
-            'position': my_position_number - 1,
-            'name': next_seller.ranking_display_name or next_seller.username,
-            'revenue': float(next_seller.monthly_revenue or 0),
-            'gap': float(next_seller.monthly_revenue or 0) - my_monthly
-        }
+        
+            if my_monthly_revenue > 0:
+                my_position_number = db.session.query(
+                    func.count(db.distinct(Bot.user_id))
+                ).join(Payment).filter(
+                    Payment.status == 'paid',
+                    Payment.created_at >= first_day_of_month,
+                    Payment.amount > my_monthly_revenue
+                ).scalar() or 0
+                my_position_number += 1
+            else:
+                my_position_number = None  # Sem vendas no mês = sem posição
+    
+        # Próximo usuário acima no ranking (quanto falta para subir)
+        next_user = None
+        if my_position_number and my_position_number > 1:
+            next_seller = top_sellers[my_position_number - 2]  # -2 porque índice começa em 0
+            my_monthly = next(s['revenue'] for s in ranking_data if s['user_id'] == current_user.id)
+            next_user = {
+                'position': my_position_number - 1,
+                'name': next_seller.ranking_display_name or next_seller.username,
+                'revenue': float(next_seller.monthly_revenue or 0),
+                'gap': float(next_seller.monthly_revenue or 0) - my_monthly
+            }
     
     # Total de receita do usuário
     total_revenue_float = float(current_user.total_revenue or 0)
@@ -927,122 +943,84 @@ def get_chat_conversations(bot_id):
     # Parâmetros de filtro e paginação
     filter_type = request.args.get('filter', 'all')
     search_query = request.args.get('search', '').strip()
+    cursor = request.args.get('cursor') or None
     offset = request.args.get('offset', 0, type=int)
     limit = request.args.get('limit', 50, type=int)
     limit = min(limit, 200)
     
-    # Query base: BotUsers do bot
-    query = BotUser.query.filter_by(bot_id=bot_id, archived=False)
-    
-    # Aplicar filtro de busca
-    if search_query:
-        query = query.filter(
-            db.or_(
-                BotUser.first_name.ilike(f'%{search_query}%'),
-                BotUser.username.ilike(f'%{search_query}%'),
-                BotUser.telegram_user_id.ilike(f'%{search_query}%')
-            )
-        )
-    
-    # Query auxiliar para IDs de pagamento (reutilizada nos filtros)
-    def _get_payment_user_ids(bot_id, status_filter=None):
-        """Retorna lista de customer_user_id sem prefixo user_ para um bot."""
-        q = db.session.query(Payment.customer_user_id).filter(Payment.bot_id == bot_id)
-        if status_filter:
-            q = q.filter(Payment.status == status_filter)
-        rows = q.distinct().all()
-        result = []
-        for row in rows:
-            if row[0]:
-                uid = str(row[0]).replace('user_', '') if str(row[0]).startswith('user_') else str(row[0])
-                result.append(uid)
-        return result
-    
-    # Aplicar filtro de tipo
-    if filter_type == 'paid':
-        paid_ids = _get_payment_user_ids(bot_id, status_filter='paid')
-        if paid_ids:
-            query = query.filter(BotUser.telegram_user_id.in_(paid_ids))
-        else:
-            query = query.filter(BotUser.id == -1)
-    elif filter_type == 'pix_generated':
-        pix_ids = _get_payment_user_ids(bot_id)
-        if pix_ids:
-            query = query.filter(BotUser.telegram_user_id.in_(pix_ids))
-        else:
-            query = query.filter(BotUser.id == -1)
-    elif filter_type == 'only_entered':
-        payment_ids = _get_payment_user_ids(bot_id)
-        if payment_ids:
-            query = query.filter(~BotUser.telegram_user_id.in_(payment_ids))
-    
-    # Contar total (para paginação)
-    total_count = query.count()
-    
-    # Buscar conversas com paginação
-    bot_users = query.order_by(BotUser.last_interaction.desc()).offset(offset).limit(limit).all()
+    # ✅ Busca por trigramas + semi-joins de pagamento + keyset (chat_inbox_service)
+    from internal_logic.services.chat_inbox_service import search_conversations
+    page = search_conversations(
+        bot_id,
+        search_query=search_query,
+        filter_type=filter_type,
+        limit=limit,
+        cursor=cursor,
+        offset=offset,
+    )
+    bot_users = page['bot_users']
+    total_count = page['total_count']
 
     if not bot_users:
         return jsonify({'success': True, 'conversations': [], 'total': 0, 'total_count': 0})
 
-    telegram_user_id_strs = [str(u.telegram_user_id) for u in bot_users]
+    lead_ids = [int(u.telegram_user_id) for u in bot_users]
 
     # Batch 1: última mensagem por usuário (via MAX(id) - determinístico)
-    max_msg_subq = db.session.query(
-        BotMessage.telegram_user_id,
-        func.max(BotMessage.id).label('max_id')
-    ).filter(
-        BotMessage.bot_id == bot_id,
-        BotMessage.telegram_user_id.in_(telegram_user_id_strs)
-    ).group_by(BotMessage.telegram_user_id).subquery()
-
-    last_messages = db.session.query(BotMessage).join(
-        max_msg_subq,
-        db.and_(
-            BotMessage.id == max_msg_subq.c.max_id,
-            BotMessage.bot_id == bot_id
-        )
-    ).all()
-    last_msg_map = {str(m.telegram_user_id): m for m in last_messages}
+    def _last_messages(batch_lead_ids, since=None):
+        filters = [BotMessage.bot_id == bot_id, BotMessage.lead_id.in_(batch_lead_ids)]
+        if since is not None:
+            filters.append(BotMessage.created_at >= since)
+        max_msg_subq = db.session.query(
+            func.max(BotMessage.id).label('max_id')
+        ).filter(*filters).group_by(BotMessage.lead_id).subquery()
+        # Filtros repetidos no join: o planner poda as partições nos dois lados
+        return db.session.query(BotMessage).join(
+            max_msg_subq,
+            db.and_(BotMessage.id == max_msg_subq.c.max_id, *filters)
+        ).all()
+
+    # ✅ bot_messages particionada por created_at: janela recente lê só as últimas partições;
+    # leads sem mensagem no período caem na busca sem limite de data
+    last_msg_map = {m.lead_id: m for m in _last_messages(lead_ids, since=get_brazil_time() - timedelta(days=31))}
+    stale_lead_ids = [lead_id for lead_id in lead_ids if lead_id not in last_msg_map]
+    if stale_lead_ids:
+        last_msg_map.update({m.lead_id: m for m in _last_messages(stale_lead_ids)})
 
     # Batch 2: contagem de não lidas por usuário
     unread_counts = dict(
         db.session.query(
-            BotMessage.telegram_user_id,
+            BotMessage.lead_id,
             func.count(BotMessage.id)
         ).filter(
             BotMessage.bot_id == bot_id,
-            BotMessage.telegram_user_id.in_(telegram_user_id_strs),
+            BotMessage.lead_id.in_(lead_ids),
             BotMessage.direction == 'incoming',
             BotMessage.is_read == False
-        ).group_by(BotMessage.telegram_user_id).all()
+        ).group_by(BotMessage.lead_id).all()
     )
 
-    # Batch 3: dados de pagamento agregados por usuário
-    all_customer_ids = telegram_user_id_strs + [f'user_{t}' for t in telegram_user_id_strs]
+    # Batch 3: dados de pagamento agregados por usuário (lead_id cobre '123' e 'user_123')
     payments = db.session.query(
-        Payment.customer_user_id, Payment.status, Payment.amount
+        Payment.lead_id, Payment.status, Payment.amount
     ).filter(
         Payment.bot_id == bot_id,
-        Payment.customer_user_id.in_(all_customer_ids)
+        Payment.lead_id.in_(lead_ids)
     ).all()
 
     payment_data = {}
     for p in payments:
-        if not p.customer_user_id:
-            continue
-        key = p.customer_user_id.replace('user_', '') if p.customer_user_id.startswith('user_') else p.customer_user_id
-        if key not in payment_data:
-            payment_data[key] = {'has_paid': False, 'has_pix': False, 'total_spent': 0.0}
-        payment_data[key]['has_pix'] = True
+        if p.lead_id not in payment_data:
+            payment_data[p.lead_id] = {'has_paid': False, 'has_pix': False, 'total_spent': 0.0}
+        payment_data[p.lead_id]['has_pix'] = True
         if p.status == 'paid':
-            payment_data[key]['has_paid'] = True
-            payment_data[key]['total_spent'] += float(p.amount or 0)
+            payment_data[p.lead_id]['has_paid'] = True
+            payment_data[p.lead_id]['total_spent'] += float(p.amount or 0)
 
     # Enriquecer dados
     conversations = []
     for bot_user in bot_users:
-        tid = str(bot_user.telegram_user_id)
+        tid = int(bot_user.telegram_user_id)
         lm = last_msg_map.get(tid)
         ur = unread_counts.get(tid, 0)
         pd = payment_data.get(tid, {'has_paid': False, 'has_pix': False, 'total_spent': 0.0})
@@ -1070,7 +1048,9 @@ def get_chat_conversations(bot_id):
         'conversations': conversations,
         'total': len(conversations),
         'total_count': total_count,
-        'has_more': (offset + limit) < total_count
+        'total_count_estimated': page['total_count_estimated'],
+        'has_more': page['has_more'],
+        'next_cursor': page['next_cursor']
     })
 
 
@@ -1368,7 +1348,8 @@ def get_customer_profile(bot_id, telegram_user_id):
     try:
         bot = Bot.query.filter_by(id=bot_id, user_id=current_user.id).first_or_404()
 
-        bot_user = BotUser.query.filter_by(
+        # Perfil exibe tracking e demografia: carregar os grupos deferred na mesma query
+        bot_user = BotUser.query.options(undefer_group('tracking'), undefer_group('profile')).filter_by(
             bot_id=bot_id,
             telegram_user_id=telegram_user_id
         ).first()
@@ -1416,9 +1397,10 @@ def get_customer_profile(bot_id, telegram_user_id):
             'meta_pageview_sent': bot_user.meta_pageview_sent,
         }
 
+        # lead_id (BIGINT) cobre customer_user_id '123' e 'user_123' via idx_payment_bot_lead_status
         payments_query = Payment.query.filter_by(
             bot_id=bot_id,
-            customer_user_id=str(telegram_user_id)
+            lead_id=bot_user.telegram_user_id
         ).order_by(Payment.created_at.desc()).limit(10).all()
 
         payments = [{
@@ -2426,6 +2408,29 @@ def api_export_bot(bot_id):
     return jsonify({'success': True, 'export': export_data})
 
 
+@dashboard_bp.route('/api/exports/<kind>', methods=['GET'])
+@login_required
+@limiter.limit("20 per hour")
+def api_export_tenant_data(kind):
+    """Exporta pagamentos pagos ou leads dos bots do usuário (CSV/NDJSON/JSON) em streaming"""
+    from internal_logic.services.export_stream import FORMATS, export_response, leads_export, payments_export
+    
+    builders = {'payments': payments_export, 'leads': leads_export}
+    if kind not in builders:
+        abort(404)
+    
+    format_type = request.args.get('format', 'csv')
+    if format_type not in FORMATS:
+        return jsonify({'error': 'Formato inválido (csv, ndjson ou json)'}), 400
+    
+    bot_id = request.args.get('bot_id', type=int)
+    if bot_id is not None:
+        Bot.query.filter_by(id=bot_id, user_id=current_user.id).first_or_404()
+    
+    stmt = builders[kind](user_id=current_user.id, bot_id=bot_id)
+    return export_response(stmt, format_type, f'{kind}_export')
+
+
 @dashboard_bp.route('/api/bots/verify-status', methods=['POST'])
 @login_required
 @csrf.exempt
@@ -21,7 +21,7 @@ from flask import Blueprint, render_template, request, jsonify
 from internal_logic.core.extensions import db
 
 # Models (importar dos locais corretos no projeto)
-from internal_logic.core.models import Payment, BotUser, PoolBot, RedirectPool
+from internal_logic.core.models import Payment
 
 logger = logging.getLogger(__name__)
 
@@ -46,13 +46,19 @@ def delivery_page(token):
     - Matching garantido mesmo se cookies expirarem
     """
     try:
+        from internal_logic.services.delivery_cache import (
+            build_delivery_record, get_delivery_record, save_delivery_record
+        )
+
+        # CAMINHO RÁPIDO: registro pré-computado na confirmação (send_payment_delivery)
+        record = get_delivery_record(token)
+        if record is not None:
+            return _render_delivery(record)
+
         # Imports adaptados para arquitetura atual
-        from internal_logic.core.models import Payment, PoolBot, BotUser, Gateway
-        from utils.tracking_service import TrackingServiceV4 as TrackingService
+        from internal_logic.core.models import Gateway
         from internal_logic.core.models import get_brazil_time
         from gateways import GatewayFactory
-        import time
-        from datetime import datetime
         
         # VALIDAÇÃO: Buscar payment pelo delivery_token (NÃO filtrar status aqui)
         # A rota deve tratar status pendente de forma controlada e nunca disparar Purchase.
@@ -164,300 +170,18 @@ def delivery_page(token):
                 logger.error(f" [DELIVERY] Erro ao verificar status em tempo real: {verify_error}", exc_info=True)
                 return render_template('delivery_error.html', error='Pagamento ainda não confirmado. Aguarde alguns instantes e tente novamente.'), 200
         
-        # Buscar pool CORRETO (o que gerou o PageView, não o primeiro)
-        # Prioridade: 1) payment.pool_id, 2) pool_id do tracking_data, 3) primeiro pool do bot
-        pool_bot = None
-        
-        # RECUPERAR tracking_data primeiro (para identificar pool correto)
-        tracking_service = TrackingService()
-        telegram_user_id = payment.customer_user_id.replace('user_', '') if payment.customer_user_id and payment.customer_user_id.startswith('user_') else payment.customer_user_id
-        bot_user = BotUser.query.filter_by(
-            bot_id=payment.bot_id,
-            telegram_user_id=str(telegram_user_id)
-        ).first()
-        
-        # PRIORIDADE 1: payment.pool_id (determinístico, salvo na criação do payment)
-        if hasattr(payment, 'pool_id') and payment.pool_id:
-            pool_bot = PoolBot.query.filter_by(bot_id=payment.bot_id, pool_id=payment.pool_id).first()
-            if pool_bot:
-                logger.info(f" Delivery - Pool via payment.pool_id: {payment.pool_id}")
-        
-        # PRIORIDADE 2: pool_id do tracking_data (Redis)
-        if not pool_bot and bot_user and bot_user.tracking_session_id:
-            temp_tracking_data = tracking_service.recover_tracking_data(bot_user.tracking_session_id) or {}
-            pool_id_from_tracking = temp_tracking_data.get('pool_id')
-            if pool_id_from_tracking:
-                pool_bot = PoolBot.query.filter_by(bot_id=payment.bot_id, pool_id=pool_id_from_tracking).first()
-                if pool_bot:
-                    logger.info(f" Delivery - Pool via tracking_data: pool_id={pool_id_from_tracking}")
-        
-        # PRIORIDADE 3: primeiro pool do bot (fallback)
-        if not pool_bot:
-            pool_bot = PoolBot.query.filter_by(bot_id=payment.bot_id).first()
-            if pool_bot:
-                logger.warning(f" Delivery - Usando primeiro pool do bot (pool_id não encontrado): pool_id={pool_bot.pool_id}")
-        
-        if not pool_bot:
-            logger.warning(f" Payment {payment.id}: Bot sem pool — usando payment.bot como fallback")
-            pool_bot = type('_PoolFallback', (), {
-                'bot': payment.bot,
-                'pool': None,
-                'pool_id': None,
-            })()
-        
-        pool = pool_bot.pool
-        # LINK DE ACESSO: postergado para definição única antes do render_template (ver seção CORREÇÃO CRÍTICA)
-
-        # ✅ CLEAN ARCHITECTURE: 'Fio Invisível' - extrair tracking do BotUser
-        # A tabela Payment é 100% financeira - tracking vem do perfil do usuário
-        
-        # A. Buscar dados de marketing
-        fbp = getattr(bot_user, 'fbp', None) if bot_user else None
-        fbc = getattr(bot_user, 'fbc', None) if bot_user else None
-        fbclid = getattr(bot_user, 'fbclid', None) if bot_user else None
-        
-        # B. Prioridade do Pixel: 1) Payment (salvo do tracking data), 2) Pool, 3) BotUser.campaign_code (sticky)
-        pixel_source = 'Payment'
-        pixel_id = payment.meta_pixel_id if payment else None
-        if not pixel_id:
-            pixel_id = pool.meta_pixel_id if pool else None
-            pixel_source = 'Pool'
-        if not pixel_id:
-            pixel_id = getattr(bot_user, 'campaign_code', None) if bot_user else None
-            pixel_source = 'BotUser'
-        logger.info(f"[FILO_INVISIVEL] Pixel: {pixel_id}, source: {pixel_source}")
-
-        # Salvar pixel_id para CAPI ANTES do dual-mode check (server mode zera pixel_id)
-        capi_pixel_id = pixel_id
-        capi_access_token = None
-        if pool and pool.meta_access_token:
-            from utils.encryption import decrypt
-            try:
-                capi_access_token = decrypt(pool.meta_access_token)
-            except Exception as e:
-                logger.warning(f"[META DELIVERY] Falha ao descriptografar access_token: {e}")
-
-        # C. MODO REDUNDANTE: Browser Pixel + CAPI sempre ativos quando configurados
-        # Meta deduplica automaticamente via event_id (mesmo ID em ambos os lados)
-        # Recomendação oficial Meta: "redundant setup" → Pixel + CAPI simultâneos
-        pool_obj = pool_bot.pool if pool_bot else None
-        from internal_logic.services.server_tracking import is_server_mode
-        tracking_mode = 'SERVER' if is_server_mode(pool_obj) else 'HTML_ONLY'
-        logger.info(
-            f"[TRACKING_MODE={tracking_mode}] Pool {pool_obj.id}: "
-            f"Browser Pixel {'✅ ativo' if pixel_id else '❌ sem pixel_id'}  "
-            f"| CAPI {'✅ ativo' if capi_access_token else '❌ sem token'}"
-        )
-
-        # D. Validação de pixel_id
-        has_meta_pixel = bool(pixel_id)
-        if not has_meta_pixel:
-            logger.warning("[FILO_INVISIVEL] pixel_id ausente - Purchase não será disparado")
-        
-        # E. Validação de FBC sintético + fallback Redis (se houver tracking_data para verificar)
-        fbc_origin = None
-        if bot_user and bot_user.tracking_session_id:
-            temp_tracking_data = tracking_service.recover_tracking_data(bot_user.tracking_session_id) or {}
-            fbc_origin = temp_tracking_data.get('fbc_origin')
-            if fbc and fbc_origin == 'synthetic':
-                fbc = None  # Ignorar FBC sintético
-                logger.warning("[FILO_INVISIVEL] fbc IGNORADO (origem: synthetic)")
-            # ✅ FALLBACK: Se BotUser não tiver fbc/fbp (gap Redis → BotUser),
-            # tentar direto da temp_tracking_data (Redis) que tem os valores reais do navegador
-            # Meta doc: "We recommend that you always send _fbc and _fbp browser cookie values"
-            if not fbc:
-                redis_fbc = temp_tracking_data.get('fbc')
-                if redis_fbc and fbc_origin != 'synthetic':
-                    fbc = redis_fbc
-                    logger.info(f"[META] fbc recuperado do Redis (tracking_data): {fbc[:20]}...")
-            if not fbp:
-                redis_fbp = temp_tracking_data.get('fbp')
-                if redis_fbp:
-                    fbp = redis_fbp
-                    logger.info(f"[META] fbp recuperado do Redis (tracking_data): {fbp[:20]}...")
-        
-        # 🔧 FIX 3: Fallback — gerar fbc de fbclid se ainda não tem
-        # Diferente do CAPI (que rejeita synthetic), o browser Pixel aceita
-        # fbc gerado de fbclid — Meta só valida se o fbclid é um clique real
-        if not fbc and fbclid:
-            import time as _time
-            fbc = f"fb.1.{int(_time.time() * 1000)}.{fbclid}"
-            fbc_origin = 'generated_from_fbclid'
-            logger.info(f"[META FIX] fbc gerado de fbclid (fallback delivery): {fbc[:50]}...")
-        
-        # F. Valores finais para template
-        fbclid_to_use = fbclid or ''
-        fbp_value = fbp
-        fbc_value = fbc
-        external_id = fbclid
-        
-        # CRÍTICO: Validar fbc_origin (ignorar fbc sintético)
-        if fbc_value and fbc_origin == 'synthetic':
-            fbc_value = None  # Meta não atribui com fbc sintético
-            logger.warning(f"[META DELIVERY] Delivery - fbc IGNORADO (origem: synthetic) - Meta não atribui com fbc sintético")
-        
-        # LOG CRÍTICO: Verificar dados recuperados
-        logger.info(f"[META DELIVERY] Delivery - Dados recuperados: fbclid={' ' if external_id else ' '}, fbp={' ' if fbp_value else ' '}, fbc={' ' if fbc_value else ' '}, fbc_origin={fbc_origin or 'ausente'}")
-        
-        # Sanitizar valores para JavaScript
-        def sanitize_js_value(value):
-            if not value:
-                return ''
-            import re
-            value = str(value).replace("'", "\\'").replace('"', '\\"').replace('\n', '').replace('\r', '')
-            value = re.sub(r'[^a-zA-Z0-9_.-]', '', value)
-            return value[:255]
-        
-        # event_id para Purchase: usar ID exclusivo do pagamento (dedup client/server)
-        purchase_event_id = f"purchase_{payment.id}"
-        payment.meta_event_id = purchase_event_id
-        db.session.commit()
-        db.session.refresh(payment)
-
-        # ✅ CLEAN ARCHITECTURE: Injetar dados do BotUser no template
-        # Sem dependência do Payment para tracking
-        
-        # Normalizar external_id para JavaScript (SHA-256 sempre, para match com server-side)
-        external_id_normalized = None
-        if external_id:
-            try:
-                import hashlib
-                external_id_normalized = hashlib.sha256(str(external_id).encode()).hexdigest()
-            except Exception as e:
-                logger.warning(f"Erro ao normalizar external_id: {e}")
-                external_id_normalized = str(external_id)
-        
-        # Configuração do pixel para template
-        pixel_config = {
-            'pixel_id': pixel_id if has_meta_pixel else None,  # Do BotUser
-            'event_id': purchase_event_id,  # Deduplicação
-            'external_id': external_id_normalized,
-            'fbp': fbp_value,  # Do BotUser
-            'fbc': fbc_value,  # Do BotUser
-            'value': float(payment.amount),
-            'currency': 'BRL',
-            'content_id': str(pool.id) if pool else str(payment.bot_id),
-            'content_name': payment.product_name or payment.bot.name,
-        }
-
-        # CRÍTICO: DEDUPLICAÇÃO - Garantir que Purchase NÃO seja enviado duplicado
-        purchase_already_sent = payment.meta_purchase_sent
-        
-        # CRÍTICO: Renderizar template PRIMEIRO para permitir client-side disparar Purchase
-        # Meta deduplica automaticamente usando eventID, então não bloqueamos client-side mesmo se server-side já foi enviado
-        # CORREÇÃO: NÃO marcar meta_purchase_sent ANTES de renderizar - isso bloqueava client-side!
-        logger.info(f" Delivery - Renderizando página para payment {payment.id} | Pixel: {' ' if has_meta_pixel else ' '} | event_id: {pixel_config['event_id'][:30]}... | meta_purchase_sent: {payment.meta_purchase_sent}")
-        
-        # CORREÇÃO CRÍTICA: Buscar access_link personalizado do BotConfig (não do Bot)
-        # Prioridade: 1) bot.config.access_link (configurado no painel), 2) fallback para username
-        redirect_url = None
-        
-        # Tentar usar access_link personalizado primeiro (está em BotConfig, não em Bot)
-        if pool_bot and pool_bot.bot and pool_bot.bot.config and pool_bot.bot.config.access_link:
-            redirect_url = pool_bot.bot.config.access_link
-            logger.info(f" Delivery - Usando access_link personalizado: {redirect_url}")
-        # Fallback: link genérico do username do bot
-        elif pool_bot and pool_bot.bot and pool_bot.bot.username:
-            redirect_url = f"https://t.me/{pool_bot.bot.username}?start=p{payment.id}"
-            logger.info(f" Delivery - Usando fallback genérico (access_link não configurado): {redirect_url}")
-        else:
-            logger.error(f" Delivery - Nenhum redirect_url disponível para payment {payment.id}")
-        
-        # DEFENSIVO: Se redirect_url continuar None, abortar com erro (evita renderizar "None" no template)
-        if not redirect_url:
+        record = build_delivery_record(payment)
+        if not record:
             logger.critical(f" Delivery - BLOQUEADO: Nenhum redirect_url disponível para payment {payment.id}")
             return render_template('delivery_error.html', error='Link de entrega inválido. Entre em contato com o suporte.'), 500
 
-        # LOG: pixel_id veio exclusivamente da query (funil). Nenhuma inferência.
-        logger.info(f" Delivery - pixel_id via query param px: {' ' if pixel_id else ' '}")
-        
-        # ✅ CLEAN ARCHITECTURE: Injetar variáveis do BotUser no template
-        response = render_template('delivery.html',
-            payment=payment,
-            pixel_id=pixel_id,  # Do BotUser
-            redirect_url=redirect_url,
-            pageview_event_id=getattr(payment, 'pageview_event_id', None),
-            purchase_event_id=purchase_event_id,
-            fbclid=fbclid_to_use,  # Do BotUser
-            fbclid_hash=external_id_normalized or '',  # SHA-256 hash para match com server-side
-            fbc=fbc_value,  # Do BotUser
-            fbp=fbp_value,  # Do BotUser
-            fbc_origin=fbc_origin,  # Para validação no template
-            purchase_already_sent=purchase_already_sent
-        )
-        
-        # DEPOIS de renderizar template, enfileirar Purchase via Server (Conversions API)
-        # Isso garante que Purchase seja enviado mesmo se client-side falhar
-        # Meta deduplica automaticamente usando eventID/event_id
-        # Usa capi_pixel_id salvo ANTES do dual-mode check (server mode zera pixel_id)
-        if capi_pixel_id and capi_access_token and not purchase_already_sent:
-            try:
-                from tasks_async import enqueue_meta_event
-                import time, hashlib, re
-
-                # Hashear email para CAPI (ignorar emails sintéticos do sistema)
-                customer_email_hash = None
-                if payment.customer_email:
-                    email_clean = payment.customer_email.strip().lower()
-                    if not any(d in email_clean for d in ['@telegram.user', '@user.telegram', '@example.com']):
-                        customer_email_hash = hashlib.sha256(email_clean.encode('utf-8')).hexdigest()
-
-                # Hashear phone para CAPI
-                customer_phone_hash = None
-                if payment.customer_phone:
-                    phone_clean = re.sub(r'[^\d]', '', payment.customer_phone)
-                    if phone_clean:
-                        phone_clean = phone_clean.lstrip('0')
-                        if not phone_clean.startswith('55'):
-                            phone_clean = '55' + phone_clean
-                        customer_phone_hash = hashlib.sha256(phone_clean.encode('utf-8')).hexdigest()
-
-                purchase_event = {
-                    'event_name': 'Purchase',
-                    'event_time': int(payment.paid_at.timestamp()) if payment.paid_at else int(time.time()),
-                    'event_id': purchase_event_id,
-                    'action_source': 'website',
-                    'event_source_url': redirect_url,
-                    'user_data': {
-                        'fbp': fbp_value,
-                        'fbc': fbc_value,
-                        'external_id': [external_id_normalized] if external_id_normalized else [],
-                        'client_ip_address': request.remote_addr or '',
-                        'client_user_agent': request.headers.get('User-Agent', ''),
-                        'ct': payment.customer_city or None,
-                        'st': payment.customer_state or None,
-                        'country': payment.customer_country or 'BR',
-                        'ge': payment.customer_gender or None,
-                    },
-                    'custom_data': {
-                        'value': float(payment.amount),
-                        'currency': 'BRL',
-                        'content_id': str(pool.id) if pool else str(payment.bot_id),
-                        'content_name': payment.product_name or payment.bot.name,
-                    }
-                }
-
-                # Incluir email/phone hash se disponíveis
-                if customer_email_hash:
-                    purchase_event['user_data']['em'] = [customer_email_hash]
-                if customer_phone_hash:
-                    purchase_event['user_data']['ph'] = [customer_phone_hash]
-
-                # Remover campos None/vazios do user_data (Meta rejeita nulls)
-                purchase_event['user_data'] = {k: v for k, v in purchase_event['user_data'].items() if v not in (None, '')}
-
-                enqueue_meta_event(
-                    pixel_id=capi_pixel_id,
-                    access_token=capi_access_token,
-                    event_data=purchase_event,
-                    test_code=pool.meta_test_event_code if pool else None
-                )
-                test_mode = 'SIM' if (pool and pool.meta_test_event_code) else 'NÃO'
-                logger.info(f" [META DELIVERY] Purchase CAPI enfileirado | payment {payment.id} | event_id {purchase_event_id} | pixel={capi_pixel_id} | test_mode={test_mode}")
-            except Exception as e:
-                logger.error(f" [META DELIVERY] Erro ao enfileirar Purchase CAPI: {e}", exc_info=True)
+        # event_id para Purchase: usar ID exclusivo do pagamento (dedup client/server)
+        if payment.meta_event_id != record['purchase_event_id']:
+            payment.meta_event_id = record['purchase_event_id']
+            db.session.commit()
+        save_delivery_record(token, record)
 
-        return response
+        return _render_delivery(record)
         
     except Exception as e:
         import traceback
@@ -467,6 +191,66 @@ def delivery_page(token):
         return f"<div style='padding:20px; font-family:monospace; color:red;'><h2>🚨 ERRO FATAL DE DEBUG:</h2><pre>{error_trace}</pre></div>", 500
 
 
+def _render_delivery(record):
+    """
+    Renderiza a página a partir do registro de entrega (Redis ou recém-montado)
+    e enfileira o Purchase CAPI quando o pool tem access_token.
+
+    MODO REDUNDANTE: Browser Pixel + CAPI; a Meta deduplica pelo event_id.
+    """
+    from types import SimpleNamespace
+
+    payment = SimpleNamespace(**record['payment'])
+    purchase_already_sent = record.get('purchase_sent', False)
+    logger.info(
+        f" Delivery - Renderizando página para payment {payment.id} | Pixel: {'✅' if record['pixel_id'] else '❌'} "
+        f"| event_id: {record['purchase_event_id']} | meta_purchase_sent: {purchase_already_sent}"
+    )
+
+    # CRÍTICO: Renderizar template PRIMEIRO para permitir client-side disparar Purchase
+    response = render_template('delivery.html',
+        payment=payment,
+        pixel_id=record['pixel_id'],
+        redirect_url=record['redirect_url'],
+        pageview_event_id=record.get('pageview_event_id'),
+        purchase_event_id=record['purchase_event_id'],
+        fbclid=record['fbclid'],
+        fbclid_hash=record['fbclid_hash'],  # SHA-256 hash para match com server-side
+        fbc=record['fbc'],
+        fbp=record['fbp'],
+        fbc_origin=record.get('fbc_origin'),  # Para validação no template
+        purchase_already_sent=purchase_already_sent
+    )
+
+    # DEPOIS de renderizar, enfileirar Purchase via Server (Conversions API)
+    capi = record.get('capi')
+    if capi and not purchase_already_sent:
+        try:
+            from tasks_async import enqueue_meta_event
+            from utils.encryption import decrypt
+
+            access_token = decrypt(capi['access_token_encrypted'])
+            purchase_event = dict(capi['event'])
+            user_data = dict(purchase_event['user_data'])
+            user_data['client_ip_address'] = request.remote_addr or ''
+            user_data['client_user_agent'] = request.headers.get('User-Agent', '')
+            # Remover campos None/vazios do user_data (Meta rejeita nulls)
+            purchase_event['user_data'] = {k: v for k, v in user_data.items() if v not in (None, '', [])}
+
+            enqueue_meta_event(
+                pixel_id=capi['pixel_id'],
+                access_token=access_token,
+                event_data=purchase_event,
+                test_code=capi.get('test_code')
+            )
+            test_mode = 'SIM' if capi.get('test_code') else 'NÃO'
+            logger.info(f" [META DELIVERY] Purchase CAPI enfileirado | payment {payment.id} | event_id {record['purchase_event_id']} | pixel={capi['pixel_id']} | test_mode={test_mode}")
+        except Exception as e:
+            logger.error(f" [META DELIVERY] Erro ao enfileirar Purchase CAPI: {e}", exc_info=True)
+
+    return response
+
+
 @delivery_bp.route('/api/tracking/mark-purchase-sent', methods=['POST'])
 def mark_purchase_sent():
     """
@@ -501,6 +285,9 @@ def mark_purchase_sent():
         
         db.session.commit()
         
+        from internal_logic.services.delivery_cache import mark_purchase_sent as mark_cached_purchase_sent
+        mark_cached_purchase_sent(payment.delivery_token)
+        
         logger.info(f"✅ V4.1 - Purchase marcado como enviado: payment_id={payment_id}, event_id={event_id}")
         
         return jsonify({'success': True})
@@ -232,6 +232,13 @@ def public_health_check():
         checks['queues'] = f'error: {e}'
         all_ok = False
 
+    # 4. Posse de bots por processo (agendador de liveness) - informativo
+    try:
+        from internal_logic.services.bot_liveness import get_process_ownership
+        checks['bot_ownership'] = get_process_ownership()
+    except Exception as e:
+        checks['bot_ownership'] = f'error: {e}'
+
     status = 'healthy' if all_ok else 'degraded'
     status_code = 200 if all_ok else 503
     return jsonify({
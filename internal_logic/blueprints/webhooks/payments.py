@@ -11,11 +11,15 @@ Webhooks Payment Blueprint - Versão Final (CTO Approved)
 import json
 import logging
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Tuple
 from flask import Blueprint, request, jsonify
 from sqlalchemy import or_
 from internal_logic.core.extensions import limiter, csrf, db
-from internal_logic.core.models import Payment, Gateway, Bot, get_brazil_time, WebhookEvent
+from internal_logic.core.models import Payment, Gateway, Bot
+from internal_logic.services.webhook_idempotency import (
+    CLAIM_DUPLICATE, CLAIM_IN_FLIGHT, claim_webhook, complete_webhook,
+    get_webhook_audit_writer, release_webhook,
+)
 from gateways import GatewayFactory
 
 logger = logging.getLogger(__name__)
@@ -121,20 +125,11 @@ def _find_payment_by_webhook(gateway_type: str, result: dict, data: dict) -> Opt
 
 
 def _persist_webhook_event(gateway_type: str, result: dict, raw_payload: dict) -> None:
-    """Registra evento de webhook para auditoria e deduplicação."""
+    """Registra evento de webhook para auditoria (gravação em lote, fora do request)."""
     try:
-        event = WebhookEvent(
-            gateway_type=gateway_type,
-            transaction_id=str(result.get('gateway_transaction_id') or raw_payload.get('id') or ''),
-            status=str(result.get('status', '')),
-            payload=raw_payload,
-            received_at=get_brazil_time()
-        )
-        db.session.add(event)
-        db.session.commit()
+        get_webhook_audit_writer().submit(gateway_type, result, raw_payload)
     except Exception as e:
         logger.warning(f"⚠️ Falha ao registrar webhook event: {e}")
-        db.session.rollback()
 
 
 @csrf.exempt
@@ -144,6 +139,9 @@ def payment_webhook(gateway_type):
     """
     Rota principal do Webhook.
     Recebe o sinal, processa e garante que o banco foi atualizado antes do 200 OK.
+
+    Replays (mesmo gateway + transação + status) são respondidos pelo
+    pré-check no Redis sem nenhuma query ao banco.
     """
     raw_body = request.get_data(cache=True, as_text=True)
     data = request.get_json(silent=True) or {}
@@ -154,25 +152,57 @@ def payment_webhook(gateway_type):
 
     logger.info(f"🚀 Webhook {gateway_type} recebido. Processando...")
 
+    body, status = handle_payment_webhook(gateway_type, data)
+    return jsonify(body), status
+
+
+def handle_payment_webhook(gateway_type: str, data: dict) -> Tuple[dict, int]:
+    """
+    Idempotência + processamento síncrono de um webhook já decodificado
+    (rota acima e consumidor da camada de ingestão, services/ingest_consumer.py).
+
+    Returns:
+        (corpo da resposta, status HTTP)
+    """
+    fingerprint = None
     try:
+        result = _parse_payment_webhook(gateway_type, data)
+        if not result:
+            return {'error': 'Payment not found or status not eligible'}, 404
+
+        # ⚡ Pré-check de idempotência (antes de qualquer trabalho no banco)
+        transaction_id = result.get('gateway_transaction_id') or data.get('id') or result.get('external_reference')
+        claim, fingerprint = claim_webhook(gateway_type, transaction_id, result.get('status'))
+        if claim == CLAIM_DUPLICATE:
+            logger.info(f"♻️ Webhook {gateway_type} duplicado ignorado (tx={str(transaction_id)[:20]})")
+            return {'status': 'duplicate', 'info': 'Webhook already processed'}, 200
+        if claim == CLAIM_IN_FLIGHT:
+            return {'status': 'in_progress', 'info': 'Webhook is being processed'}, 409
+
+        _persist_webhook_event(gateway_type, result, data)
+
         # Chama o processador síncrono para garantir o commit
-        success = _process_payment_webhook_sync(gateway_type, data)
+        success = _process_payment_webhook_sync(gateway_type, data, result)
         
         if success:
-            return jsonify({'status': 'processed', 'info': 'Payment updated successfully'}), 200
+            complete_webhook(fingerprint)
+            return {'status': 'processed', 'info': 'Payment updated successfully'}, 200
         else:
+            # Libera o fingerprint: o retry do gateway deve ser processado de novo
+            release_webhook(fingerprint)
             # Retorna 404 para que o Gateway saiba que o ID não foi achado no nosso banco
-            return jsonify({'error': 'Payment not found or status not eligible'}), 404
+            return {'error': 'Payment not found or status not eligible'}, 404
 
     except Exception as e:
+        release_webhook(fingerprint)
         logger.error(f"❌ Erro crítico no Webhook: {str(e)}", exc_info=True)
-        return jsonify({'error': 'Internal server error'}), 500
+        return {'error': 'Internal server error'}, 500
 
 
-def _process_payment_webhook_sync(gateway_type: str, data: dict) -> bool:
+def _parse_payment_webhook(gateway_type: str, data: dict) -> Optional[dict]:
     """
-    Lógica de Processamento com Integridade Garantida.
-    Usa busca robusta de pagamento com múltiplas estratégias de matching.
+    Traduz o payload do gateway (sem acesso ao banco).
+    Retorna o dict normalizado do adapter ou None se não suportado/inválido.
     """
     # 1. Preparação de Credenciais Dummy (Seguindo as regras de cada gateway)
     dummy_credentials = {'api_key': 'dummy', 'product_hash': 'prod_dummy'}
@@ -207,13 +237,25 @@ def _process_payment_webhook_sync(gateway_type: str, data: dict) -> bool:
     gateway_instance = GatewayFactory.create_gateway(gateway_type, dummy_credentials, use_adapter=True)
     if not gateway_instance:
         logger.error(f"[AUDIT] Erro: Gateway {gateway_type} não suportado pela Factory.")
-        return False
+        return None
 
     # 3. Tradução do Payload (Traduz 'approved' para 'paid' e extrai IDs)
     result = gateway_instance.process_webhook(data)
     if not result:
         logger.warning(f"[AUDIT] Gateway {gateway_type} retornou None no process_webhook")
-        return False
+        return None
+    return result
+
+
+def _process_payment_webhook_sync(gateway_type: str, data: dict, result: Optional[dict] = None) -> bool:
+    """
+    Lógica de Processamento com Integridade Garantida.
+    Usa busca robusta de pagamento com múltiplas estratégias de matching.
+    """
+    if result is None:
+        result = _parse_payment_webhook(gateway_type, data)
+        if not result:
+            return False
 
     # Extração de Identificadores
     status_recebido = str(result.get('status', '')).lower()
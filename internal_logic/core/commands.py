@@ -78,6 +78,29 @@ def sync_single_webhook_command(bot_id):
         click.echo(f"❌ ERRO: {e}")
 
 
+@click.command('rebuild-leaderboard')
+@click.option('--month', default=None, help='Mês no formato YYYY-MM (padrão: mês atual)')
+@with_appcontext
+def rebuild_leaderboard_command(month):
+    """
+    Reconstrói o ranking mensal pré-computado (Redis) a partir do banco.
+    
+    Uso:
+        flask rebuild-leaderboard
+        flask rebuild-leaderboard --month 2025-01
+    """
+    from internal_logic.services.leaderboard_service import rebuild_month
+    
+    try:
+        result = rebuild_month(month)
+        click.echo(f"✅ Ranking {month or 'do mês atual'} reconstruído")
+        click.echo(f"   Vendedores: {result['sellers']}")
+        click.echo(f"   Pagamentos: {result['payments']}")
+        click.echo(f"   Divergências corrigidas: {result['drift']}")
+    except Exception as e:
+        click.echo(f"❌ ERRO: {e}")
+
+
 def register_commands(app):
     """
     Registra todos os comandos CLI na aplicação Flask.
@@ -87,5 +110,6 @@ def register_commands(app):
     """
     app.cli.add_command(sync_webhooks_command)
     app.cli.add_command(sync_single_webhook_command)
+    app.cli.add_command(rebuild_leaderboard_command)
     
     # Registrar outros comandos aqui conforme necessário
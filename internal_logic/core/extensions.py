@@ -63,10 +63,20 @@ def create_app(skip_sync_thread: bool = False, rq_pool: bool = False):
     # ============================================================================
     db.init_app(app)
     socketio.init_app(app, message_queue=app.config.get('SOCKETIO_MESSAGE_QUEUE'))
+    from internal_logic.services.realtime_bus import register_socketio_handlers
+    register_socketio_handlers(socketio)
     login_manager.init_app(app)
     csrf.init_app(app)
     limiter.init_app(app)
-    
+
+    # Scripts Lua (locks/dedup) carregados no Redis antes do primeiro EVALSHA
+    try:
+        from internal_logic.core.redis_manager import get_redis_connection
+        from internal_logic.core.redis_scripts import preload_scripts
+        preload_scripts(get_redis_connection())
+    except Exception as e:
+        logger.warning(f"Não foi possível pré-carregar scripts Lua no Redis: {e}")
+
     # Configurar login_manager
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Por favor, faça login para acessar esta página.'
@@ -0,0 +1,82 @@
+"""
+Ingest App - App Mínimo da Camada de Ingestão de Webhooks
+==========================================================
+Só as rotas de webhook, sem SQLAlchemy, Login, SocketIO e BotManager:
+seguro para N workers pré-forkados (gunicorn_ingest_config.py). Cada
+requisição é um script Lua no Redis (dedup + XADD, ver
+services/webhook_ingest.py) e um 200.
+
+    200 {'status': 'queued' | 'duplicate'}
+    400 payload inválido (Telegram/gateway não devem reenviar)
+    429 limite por IP (mesmos limites das rotas do app principal)
+    503 Redis indisponível (Telegram/gateway reenviam depois)
+
+O limiter guarda os contadores no mesmo Redis (REDIS_URL), compartilhados
+entre os workers. INGEST_RATE_LIMIT=0 desliga (benchmark local).
+
+O Nginx encaminha /webhook/telegram/ e /webhook/payment/ para esta porta
+(deploy/nginx/grimbots.conf); o resto continua no app principal.
+"""
+
+import logging
+import os
+
+from flask import Flask, jsonify, request
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+
+from internal_logic.core.redis_manager import get_redis_connection
+from internal_logic.services.webhook_ingest import (
+    MAX_BODY_BYTES, InvalidPayload, ingest_payment, ingest_telegram, stream_lag,
+)
+
+logger = logging.getLogger(__name__)
+
+# swallow_errors: Redis fora do ar cai no 503 de _ingest, não em um 500 do limiter
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=os.environ.get('REDIS_URL', 'redis://localhost:6379/0'),
+    swallow_errors=True,
+)
+
+
+def create_ingest_app() -> Flask:
+    from gateways import GatewayFactory
+
+    app = Flask('grimbots_ingest')
+    app.config['MAX_CONTENT_LENGTH'] = MAX_BODY_BYTES
+    app.config['RATELIMIT_ENABLED'] = os.environ.get('INGEST_RATE_LIMIT', '1') != '0'
+    limiter.init_app(app)
+    known_gateways = frozenset(GatewayFactory.get_available_gateways())
+
+    def _ingest(func, *args):
+        try:
+            status = func(get_redis_connection(), *args)
+        except InvalidPayload as e:
+            logger.warning(f"⚠️ [INGEST] {request.path}: {e}")
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            logger.error(f"❌ [INGEST] Redis indisponível em {request.path}: {e}")
+            return jsonify({'error': 'unavailable'}), 503
+        return jsonify({'status': status}), 200
+
+    @app.route('/webhook/telegram/<int:bot_id>', methods=['POST'])
+    @limiter.limit("1000 per minute")
+    def telegram_webhook(bot_id):
+        return _ingest(ingest_telegram, bot_id, request.get_data(cache=False))
+
+    @app.route('/webhook/payment/<string:gateway_type>', methods=['POST'])
+    @limiter.limit("500 per minute")
+    def payment_webhook(gateway_type):
+        return _ingest(
+            ingest_payment, gateway_type, request.get_data(cache=False),
+            request.content_type or '', known_gateways,
+        )
+
+    @app.route('/ingest/health', methods=['GET'])
+    @limiter.exempt
+    def health():
+        lag = stream_lag(get_redis_connection())
+        return jsonify({'status': 'ok' if lag is not None else 'degraded', 'streams': lag}), 200 if lag else 503
+
+    return app
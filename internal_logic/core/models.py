@@ -9,6 +9,7 @@ from datetime import datetime, timedelta, date, timezone
 import json
 import logging
 from sqlalchemy import func
+from sqlalchemy.orm import deferred, validates
 from internal_logic.core.extensions import db
 
 # Logger
@@ -22,6 +23,25 @@ def get_brazil_time():
     return datetime.utcnow() + BRAZIL_TZ_OFFSET
 
 
+def normalize_lead_id(value):
+    """
+    Identidade canônica do lead: telegram_user_id inteiro (= BotUser.telegram_user_id).
+
+    Aceita int, '123' ou 'user_123'; retorna None para valores não numéricos
+    (ex.: documentos usados como customer_user_id por alguns gateways).
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    value = str(value).strip()
+    if value.startswith('user_'):
+        value = value[len('user_'):]
+    if value.lstrip('-').isdigit():
+        return int(value)
+    return None
+
+
 class MetaTrackingSession(db.Model):
     __tablename__ = "meta_tracking_sessions"
 
@@ -1041,6 +1061,7 @@ class Payment(db.Model):
         db.Index('idx_payment_bot_downsell_status', 'bot_id', 'is_downsell', 'status'),
         db.Index('idx_payment_bot_obump_status', 'bot_id', 'order_bump_accepted', 'status'),
         db.Index('idx_payment_bot_customer', 'bot_id', 'customer_user_id'),
+        db.Index('idx_payment_bot_lead_status', 'bot_id', 'lead_id', 'status'),
     )
     
     id = db.Column(db.Integer, primary_key=True)
@@ -1060,6 +1081,8 @@ class Payment(db.Model):
     
     # Dados do cliente
     customer_user_id = db.Column(db.String(255))
+    # ✅ Identidade canônica do lead (BIGINT = BotUser.telegram_user_id), derivada de customer_user_id
+    lead_id = db.Column(db.BigInteger, nullable=True)
     customer_name = db.Column(db.String(255))
     customer_username = db.Column(db.String(255))
     # ✅ CRÍTICO: Email, phone e document do cliente (para Meta Pixel Purchase)
@@ -1149,6 +1172,12 @@ class Payment(db.Model):
     updated_at = db.Column(db.DateTime, default=get_brazil_time, onupdate=get_brazil_time)  # ✅ Campo para debounce no sync
     paid_at = db.Column(db.DateTime)
     
+    @validates('customer_user_id')
+    def _sync_lead_id(self, key, value):
+        """Dual-write: customer_user_id (legado, string) → lead_id (BIGINT)"""
+        self.lead_id = normalize_lead_id(value)
+        return value
+    
     def to_dict(self):
         """Retorna dados do pagamento em formato dict"""
         return {
@@ -1210,47 +1239,51 @@ class BotUser(db.Model):
     meta_viewcontent_sent = db.Column(db.Boolean, default=False)
     meta_viewcontent_sent_at = db.Column(db.DateTime, nullable=True)
     
+    # ✅ COLUNAS FRIAS: grupos deferred 'tracking' e 'profile' — não trafegam nos
+    # caminhos quentes (ver services/lead_lookup.py); carregadas sob demanda ou
+    # via undefer_group('tracking'/'profile') nas queries que as usam
+    
     # UTM Tracking (campos confirmados)
-    utm_source = db.Column(db.String(255), nullable=True)
-    utm_campaign = db.Column(db.String(255), nullable=True)
-    utm_content = db.Column(db.String(255), nullable=True)
-    utm_medium = db.Column(db.String(255), nullable=True)
-    utm_term = db.Column(db.String(255), nullable=True)
-    fbclid = db.Column(db.String(255), nullable=True)
-    campaign_code = db.Column(db.String(255), nullable=True, index=True)
-    external_id = db.Column(db.String(255), nullable=True)
+    utm_source = deferred(db.Column(db.String(255), nullable=True), group='tracking')
+    utm_campaign = deferred(db.Column(db.String(255), nullable=True), group='tracking')
+    utm_content = deferred(db.Column(db.String(255), nullable=True), group='tracking')
+    utm_medium = deferred(db.Column(db.String(255), nullable=True), group='tracking')
+    utm_term = deferred(db.Column(db.String(255), nullable=True), group='tracking')
+    fbclid = deferred(db.Column(db.String(255), nullable=True), group='tracking')
+    campaign_code = deferred(db.Column(db.String(255), nullable=True, index=True), group='tracking')
+    external_id = deferred(db.Column(db.String(255), nullable=True), group='tracking')
     
     # Contexto do clique (campos confirmados)
-    last_click_context_url = db.Column(db.Text, nullable=True)
-    last_fbclid = db.Column(db.String(255), nullable=True)
-    last_fbp = db.Column(db.String(255), nullable=True)
-    last_fbc = db.Column(db.String(255), nullable=True)
+    last_click_context_url = deferred(db.Column(db.Text, nullable=True), group='tracking')
+    last_fbclid = deferred(db.Column(db.String(255), nullable=True), group='tracking')
+    last_fbp = deferred(db.Column(db.String(255), nullable=True), group='tracking')
+    last_fbc = deferred(db.Column(db.String(255), nullable=True), group='tracking')
     
     # Meta Pixel Cookies (campos confirmados)
-    fbp = db.Column(db.String(255), nullable=True)
-    fbc = db.Column(db.String(255), nullable=True)
+    fbp = deferred(db.Column(db.String(255), nullable=True), group='tracking')
+    fbc = deferred(db.Column(db.String(255), nullable=True), group='tracking')
     
     # Tracking Elite (campos confirmados)
-    ip_address = db.Column(db.String(255), nullable=True)
-    user_agent = db.Column(db.Text, nullable=True)
-    tracking_session_id = db.Column(db.String(255), nullable=True, index=True)  # V4.1 - Token universal para persistência
-    click_timestamp = db.Column(db.DateTime, nullable=True)
+    ip_address = deferred(db.Column(db.String(255), nullable=True), group='tracking')
+    user_agent = deferred(db.Column(db.Text, nullable=True), group='tracking')
+    tracking_session_id = deferred(db.Column(db.String(255), nullable=True, index=True), group='tracking')  # V4.1 - Token universal para persistência
+    click_timestamp = deferred(db.Column(db.DateTime, nullable=True), group='tracking')
     
     # ✅ STICKY PIXEL V4.1 - Campos para persistência de tracking
     # pixel_id = db.Column(db.String(100), nullable=True, index=True)  # V4.1 - Pixel ID para recuperação em /delivery
     
     # Demographic Data (campos confirmados)
-    customer_age = db.Column(db.Integer, nullable=True)
-    customer_city = db.Column(db.String(100), nullable=True)
-    customer_state = db.Column(db.String(50), nullable=True)
-    customer_country = db.Column(db.String(50), nullable=True, default='BR')
-    customer_gender = db.Column(db.String(20), nullable=True)
+    customer_age = deferred(db.Column(db.Integer, nullable=True), group='profile')
+    customer_city = deferred(db.Column(db.String(100), nullable=True), group='profile')
+    customer_state = deferred(db.Column(db.String(50), nullable=True), group='profile')
+    customer_country = deferred(db.Column(db.String(50), nullable=True, default='BR'), group='profile')
+    customer_gender = deferred(db.Column(db.String(20), nullable=True), group='profile')
     
     # Device Data (campos confirmados)
-    device_type = db.Column(db.String(20), nullable=True)
-    os_type = db.Column(db.String(50), nullable=True)
-    browser = db.Column(db.String(50), nullable=True)
-    device_model = db.Column(db.String(255), nullable=True)
+    device_type = deferred(db.Column(db.String(20), nullable=True), group='profile')
+    os_type = deferred(db.Column(db.String(50), nullable=True), group='profile')
+    browser = deferred(db.Column(db.String(50), nullable=True), group='profile')
+    device_model = deferred(db.Column(db.String(255), nullable=True), group='profile')
     
     # Timestamps (campos confirmados - NÃO TEM created_at nem last_seen!)
     first_interaction = db.Column(db.DateTime, default=get_brazil_time)
@@ -1263,6 +1296,9 @@ class BotUser(db.Model):
         db.Index('idx_bot_users_archived', 'archived'),
         db.Index('idx_botuser_bot_archived', 'bot_id', 'archived'),
         db.Index('idx_botuser_bot_archived_firstint', 'bot_id', 'archived', 'first_interaction'),
+        # Cobertura da projeção enxuta (lead_lookup.find_lead_ref): index-only scan no PostgreSQL
+        db.Index('idx_bot_users_slim_lookup', 'bot_id', 'telegram_user_id',
+                 postgresql_include=['id', 'archived', 'last_interaction']),
     )
     
     def to_dict(self):
@@ -1287,6 +1323,8 @@ class BotMessage(db.Model):
     bot_id = db.Column(db.Integer, db.ForeignKey('bots.id'), nullable=False, index=True)
     bot_user_id = db.Column(db.Integer, db.ForeignKey('bot_users.id'), nullable=False, index=True)
     telegram_user_id = db.Column(db.String(255), nullable=False, index=True)
+    # ✅ Identidade canônica do lead (BIGINT = BotUser.telegram_user_id), derivada de telegram_user_id
+    lead_id = db.Column(db.BigInteger, nullable=True)
     
     # Dados da mensagem
     message_id = db.Column(db.String(100), nullable=False, index=True)  # ID da mensagem no Telegram
@@ -1308,12 +1346,21 @@ class BotMessage(db.Model):
     __table_args__ = (
         db.Index('idx_bot_messages_bot_user_created', 'bot_id', 'bot_user_id', 'created_at'),
         db.Index('idx_botmsg_bot_tg_dir_read', 'bot_id', 'telegram_user_id', 'direction', 'is_read'),
+        db.Index('idx_botmsg_bot_lead_dir_read', 'bot_id', 'lead_id', 'direction', 'is_read'),
+        # Última mensagem da conversa: varre só a partição mais recente (bot_messages particionada por mês)
+        db.Index('idx_botmsg_bot_tg_created', 'bot_id', 'telegram_user_id', 'created_at'),
     )
     
     # Relacionamentos
     bot = db.relationship('Bot', backref='messages')
     bot_user = db.relationship('BotUser', backref='messages')
     
+    @validates('telegram_user_id')
+    def _sync_lead_id(self, key, value):
+        """Dual-write: telegram_user_id (legado, string) → lead_id (BIGINT)"""
+        self.lead_id = normalize_lead_id(value)
+        return value
+    
     def to_dict(self):
         """Retorna dados da mensagem em formato dict"""
         return {
@@ -1337,7 +1384,8 @@ class WebhookEvent(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     gateway_type = db.Column(db.String(50), nullable=False, index=True)
-    dedup_key = db.Column(db.String(200), nullable=False, unique=True)
+    # Sem UNIQUE: tabela particionada por received_at (dedup via advisory lock)
+    dedup_key = db.Column(db.String(200), nullable=False, index=True)
     transaction_id = db.Column(db.String(150), index=True)
     transaction_hash = db.Column(db.String(150), index=True)
     status = db.Column(db.String(30), index=True)
@@ -1826,3 +1874,83 @@ class NotificationSettings(db.Model):
     
     def __repr__(self):
         return f'<NotificationSettings user={self.user_id} approved={self.notify_approved_sales} pending={self.notify_pending_sales}>'
+
+
+class AnalyticsDailyCount(db.Model):
+    """
+    Cubo de analytics pré-agregado: contagens por (bot, dia, dimensão, valor).
+
+    Mantido incrementalmente por internal_logic/services/analytics_cube.py
+    (novos leads e vendas pagas) e reconstruído sob demanda a partir de
+    bot_users/payments. Dimensões: device_type, os_type, browser,
+    customer_state, customer_city, utm_source, utm_campaign, campaign_code.
+    """
+    __tablename__ = 'analytics_daily_counts'
+
+    id = db.Column(db.Integer, primary_key=True)
+    bot_id = db.Column(db.Integer, db.ForeignKey('bots.id', ondelete='CASCADE'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    dimension = db.Column(db.String(30), nullable=False)
+    value = db.Column(db.String(150), nullable=False)
+    leads = db.Column(db.Integer, nullable=False, default=0)
+    sales = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        db.UniqueConstraint('bot_id', 'day', 'dimension', 'value', name='uq_analytics_daily_counts_cell'),
+        db.Index('idx_analytics_daily_counts_bot_day', 'bot_id', 'day'),
+    )
+
+    def __repr__(self):
+        return f'<AnalyticsDailyCount bot={self.bot_id} {self.day} {self.dimension}={self.value}>'
+
+
+class PurchaseOutbox(db.Model):
+    """
+    Fila (outbox) de eventos Purchase via Meta CAPI para pools em SERVER MODE.
+
+    Uma linha por payment pago. Consumida por
+    internal_logic/services/server_tracking/purchase_reconciler.py em lotes
+    (FOR UPDATE SKIP LOCKED), com backoff exponencial por tentativa e
+    dead-letter após MAX_ATTEMPTS ou erro 4xx da Meta.
+
+    Status: pending | sent | dead | skipped (pool fora de SERVER MODE)
+    """
+    __tablename__ = 'purchase_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    payment_id = db.Column(db.Integer, db.ForeignKey('payments.id', ondelete='CASCADE'), nullable=False, unique=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=get_brazil_time)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=get_brazil_time)
+    updated_at = db.Column(db.DateTime, default=get_brazil_time, onupdate=get_brazil_time)
+
+    __table_args__ = (
+        db.Index('idx_purchase_outbox_due', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f'<PurchaseOutbox payment={self.payment_id} {self.status} attempts={self.attempts}>'
+
+
+class AdminDailySummary(db.Model):
+    """
+    Resumo diário da plataforma para o painel admin: vendas, faturamento e
+    novos usuários por dia.
+
+    Mantido incrementalmente por internal_logic/services/admin_summary.py
+    (confirmação de pagamento e cadastro) e reparado toda noite a partir de
+    payments/users.
+    """
+    __tablename__ = 'admin_daily_summary'
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, unique=True)
+    sales = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    new_users = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<AdminDailySummary {self.day} sales={self.sales} users={self.new_users}>'
@@ -0,0 +1,228 @@
+"""
+Redis Scripts - Primitivas Atômicas em Lua (EVALSHA)
+=====================================================
+Verificações que eram "lê e depois escreve" em dois comandos viram um único
+script executado atomicamente no Redis — uma ida e volta, sem janela de
+corrida entre o GET e o SET:
+
+- claim_once()        → dedup com TTL: grava a marca se não existir;
+                        retorna None (reivindicado) ou o valor do dono atual
+- release_lock()      → libera o lock SÓ se o token ainda for do chamador
+                        (lock expirado e readquirido por outro não é apagado)
+- incr_with_expire()  → INCR + EXPIRE no mesmo passo (contador nunca fica
+                        sem TTL se o processo cair entre os dois comandos)
+- drain_hash()        → move o hash para a chave de processamento (somando a
+                        um lote anterior não concluído) e retorna o conteúdo
+- stream_add_once()   → dedup com TTL + XADD no mesmo passo: a entrada só
+                        entra no stream se a marca ainda não existia
+- tally_once()        → SADD do id + ZINCRBY/HINCRBY só se o id for novo;
+                        enquanto a marca de reconstrução existir, espelha nas
+                        chaves temporárias (nada se perde durante o rebuild)
+- swap_if_owner()     → RENAME das chaves temporárias sobre as definitivas e
+                        remoção da marca, SÓ se a marca ainda for do chamador
+
+Os scripts são registrados uma vez por processo e chamados via EVALSHA;
+preload_scripts() faz o SCRIPT LOAD no boot. Se o Redis reiniciar e perder
+o cache de scripts, o redis-py recarrega no NOSCRIPT automaticamente.
+"""
+
+import logging
+import threading
+import uuid
+from typing import Dict, Iterable, Mapping, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CLAIM_ONCE = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    return current
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return false
+"""
+
+RELEASE_IF_OWNER = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+INCR_WITH_EXPIRE = """
+local value = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return value
+"""
+
+DRAIN_HASH = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    local pending = redis.call('HGETALL', KEYS[1])
+    for i = 1, #pending, 2 do
+        redis.call('HINCRBY', KEYS[2], pending[i], pending[i + 1])
+    end
+    redis.call('DEL', KEYS[1])
+elseif redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('RENAME', KEYS[1], KEYS[2])
+end
+return redis.call('HGETALL', KEYS[2])
+"""
+
+STREAM_ADD_ONCE = """
+if not redis.call('SET', KEYS[1], '1', 'NX', 'EX', ARGV[1]) then
+    return false
+end
+return redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[2], '*', unpack(ARGV, 3))
+"""
+
+TALLY_ONCE = """
+local function tally(ranking, counts, seen)
+    local added = 0
+    for i = 2, #ARGV, 3 do
+        if redis.call('SADD', seen, ARGV[i]) == 1 then
+            redis.call('ZINCRBY', ranking, ARGV[i + 2], ARGV[i + 1])
+            redis.call('HINCRBY', counts, ARGV[i + 1], 1)
+            added = added + 1
+        end
+    end
+    if added > 0 then
+        redis.call('EXPIRE', ranking, ARGV[1])
+        redis.call('EXPIRE', counts, ARGV[1])
+        redis.call('EXPIRE', seen, ARGV[1])
+    end
+    return added
+end
+local added = tally(KEYS[1], KEYS[2], KEYS[3])
+if #KEYS == 7 and redis.call('EXISTS', KEYS[4]) == 1 then
+    tally(KEYS[5], KEYS[6], KEYS[7])
+end
+return added
+"""
+
+SWAP_IF_OWNER = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+for i = 2, #KEYS, 2 do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('RENAME', KEYS[i], KEYS[i + 1])
+        redis.call('EXPIRE', KEYS[i + 1], ARGV[2])
+    else
+        redis.call('DEL', KEYS[i + 1])
+    end
+end
+redis.call('DEL', KEYS[1])
+return 1
+"""
+
+_SOURCES = {
+    'claim_once': CLAIM_ONCE,
+    'release_if_owner': RELEASE_IF_OWNER,
+    'incr_with_expire': INCR_WITH_EXPIRE,
+    'drain_hash': DRAIN_HASH,
+    'stream_add_once': STREAM_ADD_ONCE,
+    'tally_once': TALLY_ONCE,
+    'swap_if_owner': SWAP_IF_OWNER,
+}
+
+_scripts = {}
+_lock = threading.Lock()
+
+
+def _script(name: str, redis_conn):
+    script = _scripts.get(name)
+    if script is None:
+        with _lock:
+            script = _scripts.get(name)
+            if script is None:
+                script = redis_conn.register_script(_SOURCES[name])
+                _scripts[name] = script
+    return script
+
+
+def preload_scripts(redis_conn) -> int:
+    """SCRIPT LOAD de todos os scripts (boot); retorna quantos foram carregados."""
+    for name, source in _SOURCES.items():
+        redis_conn.script_load(source)
+        _script(name, redis_conn)
+    return len(_SOURCES)
+
+
+def new_lock_token() -> str:
+    return uuid.uuid4().hex
+
+
+def claim_once(redis_conn, key: str, ttl: int, value: str = '1') -> Optional[str]:
+    """
+    Reivindica `key` por `ttl` segundos se ainda não existir.
+
+    Returns:
+        None se reivindicou agora; o valor atual se outro já reivindicou
+    """
+    return _script('claim_once', redis_conn)(keys=[key], args=[value, int(ttl)], client=redis_conn)
+
+
+def release_lock(redis_conn, key: str, token: str) -> bool:
+    """Apaga o lock apenas se ainda pertencer a `token`."""
+    return bool(_script('release_if_owner', redis_conn)(keys=[key], args=[token], client=redis_conn))
+
+
+def incr_with_expire(redis_conn, key: str, ttl: int) -> int:
+    """INCR e (re)define o TTL em um passo; retorna o valor após o incremento."""
+    return int(_script('incr_with_expire', redis_conn)(keys=[key], args=[int(ttl)], client=redis_conn))
+
+
+def drain_hash(redis_conn, key: str, processing_key: str) -> Dict[str, str]:
+    """
+    Move `key` para `processing_key` e retorna o lote a processar.
+
+    Se `processing_key` ainda existir (lote anterior não confirmado), os
+    valores novos são somados a ele. O chamador apaga `processing_key`
+    depois de gravar o lote.
+    """
+    flat = _script('drain_hash', redis_conn)(keys=[key, processing_key], client=redis_conn)
+    return dict(zip(flat[::2], flat[1::2]))
+
+
+def stream_add_once(redis_conn, dedup_key: str, ttl: int, stream: str,
+                    fields: Mapping[str, str], maxlen: int) -> Optional[str]:
+    """
+    XADD de `fields` em `stream` (MAXLEN ~ maxlen) se `dedup_key` ainda não existir.
+
+    Returns:
+        id da entrada; None se for duplicata (marca ainda válida)
+    """
+    flat = [item for pair in fields.items() for item in pair]
+    return _script('stream_add_once', redis_conn)(
+        keys=[dedup_key, stream], args=[int(ttl), int(maxlen), *flat], client=redis_conn
+    ) or None
+
+
+def tally_once(redis_conn, keys: Sequence[str], ttl: int, items: Iterable[Tuple[object, object, float]],
+               mirror: Optional[Sequence[str]] = None) -> int:
+    """
+    Soma cada item (id, membro, valor) no ZSET e no HASH de contagem uma única vez.
+
+    Args:
+        keys: (zset, hash de contagem, set de ids já contabilizados)
+        items: (id, membro, valor); ids já presentes no set são ignorados
+        mirror: (marca, zset, hash, set) — aplicado também ali enquanto a marca existir
+
+    Returns:
+        quantos itens foram contabilizados agora nas chaves principais
+    """
+    flat = [str(value) for item in items for value in item]
+    if not flat:
+        return 0
+    return int(_script('tally_once', redis_conn)(
+        keys=[*keys, *(mirror or ())], args=[int(ttl), *flat], client=redis_conn
+    ))
+
+
+def swap_if_owner(redis_conn, lock_key: str, token: str, pairs: Sequence[Tuple[str, str]], ttl: int) -> bool:
+    """
+    RENAME origem → destino para cada par (destino apagado se a origem não existir)
+    e remove `lock_key`, tudo atômico e só se o lock ainda pertencer a `token`.
+    """
+    keys = [lock_key, *(key for pair in pairs for key in pair)]
+    return bool(_script('swap_if_owner', redis_conn)(keys=keys, args=[token, int(ttl)], client=redis_conn))
@@ -0,0 +1,116 @@
+"""
+Service Registry - Serviços Reutilizáveis por Processo
+✅ Um BotManager por dono (user_id) por processo, reutilizado entre jobs
+✅ Sessões HTTP (Telegram) e pools permanecem aquecidos
+✅ LRU limitado + fechamento das sessões ao despejar
+✅ Fork-safe: um processo filho nunca herda instâncias do pai
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = int(os.environ.get('SERVICE_REGISTRY_MAX_ENTRIES', '256'))
+
+
+def _close_sessions(service: Any) -> None:
+    """Fecha sessões requests conhecidas do serviço (e dos seus componentes)."""
+    for owner in (service, getattr(service, 'messenger', None), getattr(service, 'runner', None)):
+        session = getattr(owner, '_telegram_session', None) if owner is not None else None
+        if session is not None:
+            try:
+                session.close()
+            except Exception:
+                pass
+
+
+class ServiceRegistry:
+    """
+    Cache LRU de serviços de longa duração, por (nome, chave).
+
+    Pensado para workers RQ sem fork por job (SimpleWorker) e processos web:
+    o primeiro job de um dono paga a construção, os seguintes reutilizam.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, Hashable], Any]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_fork(self) -> None:
+        if os.getpid() != self._pid:
+            # Sockets do pai não podem ser compartilhados com o filho
+            self._entries.clear()
+            self._pid = os.getpid()
+            self.hits = self.misses = 0
+
+    def get(self, name: str, key: Hashable, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            self._check_fork()
+            entry_key = (name, key)
+            service = self._entries.get(entry_key)
+            if service is not None:
+                self._entries.move_to_end(entry_key)
+                self.hits += 1
+                return service
+
+            self.misses += 1
+            service = factory()
+            self._entries[entry_key] = service
+            while len(self._entries) > self.max_entries:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                _close_sessions(evicted)
+                logger.debug(f"♻️ [REGISTRY] Serviço despejado: {evicted_key}")
+            return service
+
+    def clear(self) -> None:
+        with self._lock:
+            for service in self._entries.values():
+                _close_sessions(service)
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'pid': self._pid,
+            }
+
+
+_registry = ServiceRegistry()
+
+
+def get_service_registry() -> ServiceRegistry:
+    return _registry
+
+
+def get_bot_manager(user_id: Optional[int], socketio=None):
+    """
+    BotManager do dono `user_id` reutilizado no processo.
+
+    O namespace Redis (gb:{user_id}:*) é fixado na construção, por isso a
+    chave do registry é o user_id. `socketio` é anexado se ainda não houver.
+    Sem user_id, devolve um BotManager novo fora do cache (nunca o de outro dono).
+    """
+    from bot_manager import BotManager
+
+    def _build():
+        return BotManager(socketio=socketio, scheduler=None, user_id=user_id)
+
+    if not user_id:
+        logger.warning("⚠️ [REGISTRY] get_bot_manager sem user_id — BotManager não reutilizado")
+        return _build()
+
+    bot_manager = _registry.get('bot_manager', user_id, _build)
+    if socketio is not None and bot_manager.socketio is None:
+        bot_manager.socketio = socketio
+    return bot_manager
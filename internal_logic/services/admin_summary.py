@@ -0,0 +1,224 @@
+"""
+Admin Summary - Resumo Diário Materializado do Painel Admin
+============================================================
+/admin/revenue rodava um GROUP BY date(paid_at) de 30 dias e um agregado
+User ⨝ Bot ⨝ Payment de todo o histórico a cada visita; /admin/analytics
+disparava oito COUNT/SUM sobre tabelas inteiras.
+
+admin_daily_summary guarda uma linha por dia (vendas, faturamento, novos
+usuários), mantida incrementalmente e reparada toda noite:
+
+- record_sale(payment)    venda paga (dia de paid_at) — após o commit do 'paid'
+- record_signup(user)     novo usuário (dia de created_at) — após o cadastro
+- rebuild(since)          recalcula os dias a partir de payments/users
+- repair_recent(days)     reparo noturno: últimos dias + totais por usuário
+                          (users.total_sales/total_revenue, base do top 20)
+
+- get_daily_revenue(days) / get_overview() / get_top_users(limit)
+                          leituras das páginas admin (poucas dezenas de linhas)
+
+Incrementos via INSERT ... ON CONFLICT DO UPDATE (PostgreSQL/SQLite).
+Chamar record_* APÓS o commit do chamador — falhas não afetam o fluxo.
+"""
+
+import logging
+from collections import namedtuple
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, case, func
+
+from internal_logic.core.extensions import db
+from internal_logic.core.models import AdminDailySummary, Bot, Payment, User, get_brazil_time
+
+logger = logging.getLogger(__name__)
+
+DailyRevenue = namedtuple('DailyRevenue', 'date count revenue')
+
+
+def _as_date(value: Any) -> Optional[date]:
+    if value is None:
+        return None
+    if hasattr(value, 'date'):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _upsert(day: date, sales: int = 0, revenue: float = 0.0, new_users: int = 0) -> None:
+    """Soma deltas na linha do dia."""
+    table = AdminDailySummary.__table__
+    row = {'day': day, 'sales': sales, 'revenue': revenue, 'new_users': new_users}
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(row)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['day'],
+            set_={
+                'sales': table.c.sales + stmt.excluded.sales,
+                'revenue': table.c.revenue + stmt.excluded.revenue,
+                'new_users': table.c.new_users + stmt.excluded.new_users,
+            },
+        )
+        db.session.execute(stmt)
+    else:
+        summary = AdminDailySummary.query.filter_by(day=day).first()
+        if summary is None:
+            db.session.add(AdminDailySummary(**row))
+        else:
+            summary.sales += sales
+            summary.revenue += revenue
+            summary.new_users += new_users
+
+
+def record_sale(payment: Payment) -> bool:
+    """Contabiliza uma venda paga (chamar uma vez, na transição para 'paid')."""
+    try:
+        day = _as_date(payment.paid_at or payment.created_at) or get_brazil_time().date()
+        _upsert(day, sales=1, revenue=float(payment.amount or 0))
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"⚠️ [ADMIN SUMMARY] Falha ao contabilizar venda {payment.id}: {e}")
+        return False
+
+
+def record_signup(user: User) -> bool:
+    """Contabiliza um usuário recém-cadastrado."""
+    try:
+        day = _as_date(user.created_at) or get_brazil_time().date()
+        _upsert(day, new_users=1)
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"⚠️ [ADMIN SUMMARY] Falha ao contabilizar cadastro {user.id}: {e}")
+        return False
+
+
+def rebuild(since: Optional[date] = None) -> int:
+    """
+    Recalcula as linhas (opcionalmente a partir de `since`) a partir de
+    payments e users. Usado pela migration (backfill) e pelo reparo noturno.
+
+    Returns:
+        int: dias gravados
+    """
+    paid_moment = func.coalesce(Payment.paid_at, Payment.created_at)
+    sale_day = func.date(paid_moment)
+    signup_day = func.date(User.created_at)
+
+    days: Dict[date, Dict[str, Any]] = {}
+
+    def _day(value):
+        day = _as_date(value)
+        if day not in days:
+            days[day] = {'day': day, 'sales': 0, 'revenue': 0.0, 'new_users': 0}
+        return days[day]
+
+    sale_query = db.session.query(sale_day, func.count(Payment.id), func.sum(Payment.amount)).filter(
+        Payment.status == 'paid'
+    )
+    if since:
+        sale_query = sale_query.filter(paid_moment >= since)
+    for day, count, revenue in sale_query.group_by(sale_day):
+        if day:
+            row = _day(day)
+            row['sales'] = int(count or 0)
+            row['revenue'] = float(revenue or 0)
+
+    signup_query = db.session.query(signup_day, func.count(User.id)).filter(User.created_at.isnot(None))
+    if since:
+        signup_query = signup_query.filter(User.created_at >= since)
+    for day, count in signup_query.group_by(signup_day):
+        if day:
+            _day(day)['new_users'] = int(count or 0)
+
+    delete_query = AdminDailySummary.query
+    if since:
+        delete_query = delete_query.filter(AdminDailySummary.day >= since)
+    delete_query.delete(synchronize_session=False)
+
+    rows = list(days.values())
+    for start in range(0, len(rows), 1000):
+        db.session.bulk_insert_mappings(AdminDailySummary, rows[start:start + 1000])
+    db.session.commit()
+    logger.info(f"📊 [ADMIN SUMMARY] {len(rows)} dia(s) reconstruído(s)" + (f" desde {since}" if since else ''))
+    return len(rows)
+
+
+def repair_user_totals() -> int:
+    """Recalcula users.total_sales/total_revenue (vendas pagas dos bots do usuário)."""
+    totals = db.session.query(
+        Bot.user_id.label('user_id'),
+        func.count(Payment.id).label('sales'),
+        func.coalesce(func.sum(Payment.amount), 0).label('revenue'),
+    ).join(Payment, Payment.bot_id == Bot.id).filter(Payment.status == 'paid').group_by(Bot.user_id).subquery()
+
+    sales = db.session.query(totals.c.sales).filter(totals.c.user_id == User.id).scalar_subquery()
+    revenue = db.session.query(totals.c.revenue).filter(totals.c.user_id == User.id).scalar_subquery()
+    updated = User.query.update(
+        {User.total_sales: func.coalesce(sales, 0), User.total_revenue: func.coalesce(revenue, 0)},
+        synchronize_session=False,
+    )
+    db.session.commit()
+    return updated
+
+
+def repair_recent(days: int = 2) -> int:
+    """Reparo noturno: recalcula os últimos `days` dias e os totais por usuário."""
+    since = get_brazil_time().date() - timedelta(days=days)
+    rebuilt = rebuild(since=since)
+    repair_user_totals()
+    return rebuilt
+
+
+def get_daily_revenue(days: int = 30) -> List[DailyRevenue]:
+    """Vendas/faturamento por dia (mais recente primeiro), só dias com vendas."""
+    since = get_brazil_time().date() - timedelta(days=days)
+    rows = AdminDailySummary.query.filter(
+        AdminDailySummary.day >= since,
+        AdminDailySummary.sales > 0,
+    ).order_by(AdminDailySummary.day.desc()).all()
+    return [DailyRevenue(row.day, row.sales, row.revenue) for row in rows]
+
+
+def get_overview() -> Dict[str, Any]:
+    """Totais do histórico e novos usuários das últimas duas semanas em uma query."""
+    today = get_brazil_time().date()
+    last_7d_start = today - timedelta(days=7)
+    prev_7d_start = today - timedelta(days=14)
+    day = AdminDailySummary.day
+    row = db.session.query(
+        func.coalesce(func.sum(AdminDailySummary.sales), 0),
+        func.coalesce(func.sum(AdminDailySummary.revenue), 0),
+        func.coalesce(func.sum(AdminDailySummary.new_users), 0),
+        func.coalesce(func.sum(case((day > last_7d_start, AdminDailySummary.new_users), else_=0)), 0),
+        func.coalesce(func.sum(case(
+            (and_(day > prev_7d_start, day <= last_7d_start), AdminDailySummary.new_users), else_=0,
+        )), 0),
+    ).one()
+    return {
+        'total_payments': int(row[0]),
+        'total_revenue': float(row[1]),
+        'total_users': int(row[2]),
+        'new_users_last_7d': int(row[3]),
+        'new_users_prev_7d': int(row[4]),
+    }
+
+
+def get_top_users(limit: int = 20):
+    """Usuários com mais faturamento (users.total_revenue, mantido pelos pagamentos e reparado à noite)."""
+    return db.session.query(
+        User.id,
+        User.username,
+        User.email,
+        User.total_revenue,
+        User.total_sales,
+    ).filter(User.total_sales > 0).order_by(User.total_revenue.desc()).limit(limit).all()
@@ -0,0 +1,290 @@
+"""
+Analytics Cube - Contagens Pré-Agregadas por Dimensão
+======================================================
+Mantém analytics_daily_counts (bot, dia, dimensão, valor) → leads, vendas,
+faturamento, para que /api/bots/<id>/analytics-v2 responda breakdowns reais
+em UMA query sobre poucas linhas, mesmo em bots com milhões de leads.
+
+- record_lead(bot_user)   novo lead (dia de first_interaction); aceita o id
+- record_sale(payment)    venda paga (dia de paid_at); dimensões do payment
+                          com fallback para o BotUser de origem (lead_id)
+- rebuild_bot(bot_id)     reconstrução a partir de bot_users/payments
+- get_breakdowns(bot_id)  leitura agregada por dimensão
+
+Incrementos via INSERT ... ON CONFLICT DO UPDATE (PostgreSQL/SQLite).
+Chamar record_* APÓS o commit do chamador — falhas não afetam o fluxo.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, func, literal_column
+from sqlalchemy.orm import undefer_group
+
+from internal_logic.core.extensions import db
+from internal_logic.core.models import AnalyticsDailyCount, BotUser, Payment, get_brazil_time
+
+logger = logging.getLogger(__name__)
+
+# dimensão → coluna (mesmo nome em BotUser e Payment)
+DIMENSIONS = (
+    'device_type',
+    'os_type',
+    'browser',
+    'customer_state',
+    'customer_city',
+    'utm_source',
+    'utm_campaign',
+    'campaign_code',
+)
+UNKNOWN_VALUE = 'unknown'
+VALUE_MAX_LENGTH = 150
+
+
+def _normalize(value: Any) -> str:
+    value = str(value).strip() if value is not None else ''
+    return value[:VALUE_MAX_LENGTH] if value else UNKNOWN_VALUE
+
+
+def _as_date(value: Any) -> Optional[date]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _upsert(rows: List[Dict[str, Any]]) -> None:
+    """Soma deltas nas células (bot, dia, dimensão, valor)."""
+    if not rows:
+        return
+    table = AnalyticsDailyCount.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['bot_id', 'day', 'dimension', 'value'],
+            set_={
+                'leads': table.c.leads + stmt.excluded.leads,
+                'sales': table.c.sales + stmt.excluded.sales,
+                'revenue': table.c.revenue + stmt.excluded.revenue,
+            },
+        )
+        db.session.execute(stmt)
+    else:
+        for row in rows:
+            cell = AnalyticsDailyCount.query.filter_by(
+                bot_id=row['bot_id'], day=row['day'], dimension=row['dimension'], value=row['value']
+            ).first()
+            if cell is None:
+                db.session.add(AnalyticsDailyCount(**row))
+            else:
+                cell.leads += row['leads']
+                cell.sales += row['sales']
+                cell.revenue += row['revenue']
+
+
+def _cells(bot_id: int, day: date, values: Dict[str, str], leads: int = 0,
+           sales: int = 0, revenue: float = 0.0) -> List[Dict[str, Any]]:
+    return [
+        {
+            'bot_id': bot_id, 'day': day, 'dimension': dimension, 'value': value,
+            'leads': leads, 'sales': sales, 'revenue': revenue,
+        }
+        for dimension, value in values.items()
+    ]
+
+
+def record_lead(bot_user: BotUser, commit: bool = True) -> bool:
+    """
+    Contabiliza um lead NOVO no cubo (chamar uma vez, após a criação).
+
+    commit=False: grava em SAVEPOINT na transação do chamador (lead e contagem
+    saem no mesmo commit; falha aqui não desfaz o lead).
+    """
+    lead_id = getattr(bot_user, 'id', bot_user)
+    try:
+        if not commit:
+            with db.session.begin_nested():
+                _upsert(_lead_cells(lead_id))
+            return True
+        _upsert(_lead_cells(lead_id))
+        db.session.commit()
+        return True
+    except Exception as e:
+        if commit:
+            db.session.rollback()
+        logger.warning(f"⚠️ [ANALYTICS CUBE] Falha ao contabilizar lead {lead_id}: {e}")
+        return False
+
+
+def _lead_cells(lead_id: int) -> List[Dict[str, Any]]:
+    # Dimensões ficam nos grupos deferred: uma projeção em vez de recarregar a entidade
+    row = db.session.query(
+        BotUser.bot_id, BotUser.first_interaction, *[getattr(BotUser, dimension) for dimension in DIMENSIONS]
+    ).filter(BotUser.id == lead_id).one()
+    day = _as_date(row.first_interaction) or get_brazil_time().date()
+    values = {dimension: _normalize(getattr(row, dimension)) for dimension in DIMENSIONS}
+    return _cells(row.bot_id, day, values, leads=1)
+
+
+def _lead_for_payment(payment: Payment) -> Optional[BotUser]:
+    if payment.lead_id is None:
+        return None
+    return BotUser.query.options(undefer_group('tracking'), undefer_group('profile')).filter_by(
+        bot_id=payment.bot_id, telegram_user_id=payment.lead_id
+    ).first()
+
+
+def record_sale(payment: Payment) -> bool:
+    """Contabiliza uma venda paga (chamar uma vez, na transição para 'paid')."""
+    try:
+        day = _as_date(payment.paid_at or payment.created_at) or get_brazil_time().date()
+        lead = None
+        values = {}
+        for dimension in DIMENSIONS:
+            value = getattr(payment, dimension, None)
+            if not value:
+                if lead is None:
+                    lead = _lead_for_payment(payment) or False
+                value = getattr(lead, dimension, None) if lead else None
+            values[dimension] = _normalize(value)
+        _upsert(_cells(payment.bot_id, day, values, sales=1, revenue=float(payment.amount or 0)))
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"⚠️ [ANALYTICS CUBE] Falha ao contabilizar venda {payment.id}: {e}")
+        return False
+
+
+def get_breakdowns(bot_id: int, period_days: Optional[int] = 30,
+                   top: int = 10) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Breakdown por dimensão no período (uma única query agrupada).
+
+    Returns:
+        {dimensão: [{value, leads, sales, revenue, conversion_rate}, ...]}
+        ordenado por leads; valores além do `top` somados em 'Outros'.
+    """
+    query = db.session.query(
+        AnalyticsDailyCount.dimension,
+        AnalyticsDailyCount.value,
+        func.sum(AnalyticsDailyCount.leads),
+        func.sum(AnalyticsDailyCount.sales),
+        func.sum(AnalyticsDailyCount.revenue),
+    ).filter(AnalyticsDailyCount.bot_id == bot_id)
+    if period_days:
+        query = query.filter(AnalyticsDailyCount.day >= get_brazil_time().date() - timedelta(days=int(period_days) - 1))
+    rows = query.group_by(AnalyticsDailyCount.dimension, AnalyticsDailyCount.value).all()
+
+    grouped: Dict[str, List[Tuple[str, int, int, float]]] = defaultdict(list)
+    for dimension, value, leads, sales, revenue in rows:
+        grouped[dimension].append((value, int(leads or 0), int(sales or 0), float(revenue or 0)))
+
+    def _item(value, leads, sales, revenue):
+        return {
+            'value': value,
+            'leads': leads,
+            'sales': sales,
+            'revenue': round(revenue, 2),
+            'conversion_rate': round(sales / leads * 100, 2) if leads else 0.0,
+        }
+
+    breakdowns = {}
+    for dimension in DIMENSIONS:
+        cells = sorted(grouped.get(dimension, []), key=lambda c: (c[1], c[2]), reverse=True)
+        items = [_item(*cell) for cell in cells[:top]]
+        rest = cells[top:]
+        if rest:
+            items.append(_item('Outros', *(sum(c[i] for c in rest) for i in (1, 2, 3))))
+        breakdowns[dimension] = items
+    return breakdowns
+
+
+def _aggregate(query) -> Iterable[Tuple[date, str, int, float]]:
+    for day, value, count, revenue in query:
+        yield _as_date(day), _normalize(value), int(count or 0), float(revenue or 0)
+
+
+def rebuild_bot(bot_id: int, since: Optional[date] = None) -> int:
+    """
+    Recalcula as células do bot (opcionalmente a partir de `since`) a partir
+    de bot_users e payments. Usado pela migration (backfill) e para reparo.
+
+    Returns:
+        int: células gravadas
+    """
+    lead_day = func.date(BotUser.first_interaction)
+    sale_day = func.date(func.coalesce(Payment.paid_at, Payment.created_at))
+
+    cells: Dict[Tuple[date, str, str], Dict[str, Any]] = {}
+
+    def _cell(day, dimension, value):
+        key = (day, dimension, value)
+        if key not in cells:
+            cells[key] = {
+                'bot_id': bot_id, 'day': day, 'dimension': dimension, 'value': value,
+                'leads': 0, 'sales': 0, 'revenue': 0.0,
+            }
+        return cells[key]
+
+    for dimension in DIMENSIONS:
+        lead_query = db.session.query(
+            lead_day, getattr(BotUser, dimension), func.count(BotUser.id), literal_column('0'),
+        ).filter(BotUser.bot_id == bot_id)
+        if since:
+            lead_query = lead_query.filter(BotUser.first_interaction >= since)
+        for day, value, count, _ in _aggregate(lead_query.group_by(lead_day, getattr(BotUser, dimension))):
+            if day:
+                _cell(day, dimension, value)['leads'] += count
+
+        value_expr = func.coalesce(getattr(Payment, dimension), getattr(BotUser, dimension))
+        sale_query = db.session.query(
+            sale_day, value_expr, func.count(Payment.id), func.sum(Payment.amount),
+        ).outerjoin(
+            BotUser,
+            and_(BotUser.bot_id == Payment.bot_id, BotUser.telegram_user_id == Payment.lead_id),
+        ).filter(Payment.bot_id == bot_id, Payment.status == 'paid')
+        if since:
+            sale_query = sale_query.filter(func.coalesce(Payment.paid_at, Payment.created_at) >= since)
+        for day, value, count, revenue in _aggregate(sale_query.group_by(sale_day, value_expr)):
+            if day:
+                cell = _cell(day, dimension, value)
+                cell['sales'] += count
+                cell['revenue'] += revenue
+
+    delete_query = AnalyticsDailyCount.query.filter(AnalyticsDailyCount.bot_id == bot_id)
+    if since:
+        delete_query = delete_query.filter(AnalyticsDailyCount.day >= since)
+    delete_query.delete(synchronize_session=False)
+
+    rows = list(cells.values())
+    for start in range(0, len(rows), 1000):
+        db.session.bulk_insert_mappings(AnalyticsDailyCount, rows[start:start + 1000])
+    db.session.commit()
+    logger.info(f"📊 [ANALYTICS CUBE] Bot {bot_id} reconstruído: {len(rows)} células")
+    return len(rows)
+
+
+def repair_recent(days: int = 2) -> int:
+    """Reparo noturno: recalcula os últimos `days` dias de todos os bots ativos."""
+    from internal_logic.core.models import Bot
+
+    since = get_brazil_time().date() - timedelta(days=days)
+    total = 0
+    for (bot_id,) in db.session.query(Bot.id).filter(Bot.is_active == True).all():
+        try:
+            total += rebuild_bot(bot_id, since=since)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"❌ [ANALYTICS CUBE] Falha no reparo do bot {bot_id}: {e}")
+    return total
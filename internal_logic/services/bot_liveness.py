@@ -0,0 +1,265 @@
+"""
+Bot Liveness Scheduler
+======================
+Um único agendador por processo para heartbeat e monitoramento dos bots
+que este processo iniciou (substitui 2 threads por bot).
+
+- Heap de próximos vencimentos (heartbeat / monitor) por bot
+- Heartbeats de TODOS os bots vencidos renovados em UM pipeline por tick
+- Monitor em lote: um pipeline de HEXISTS verifica se os bots continuam
+  registrados; bots removidos (stop em qualquer worker) saem do agendador
+  e os que seguem ativos emitem bot_heartbeat (coalescido) para o dono
+- Posse por processo publicada em gb:liveness:process:{host}:{pid} (TTL),
+  exposta em /health via get_process_ownership()
+"""
+
+import heapq
+import itertools
+import json
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL_SECONDS = 60
+MONITOR_INTERVAL_SECONDS = 30
+HEARTBEAT_TTL_SECONDS = 300
+# Vencimentos alinhados a esta grade: bots que vencem no mesmo intervalo
+# são tratados no mesmo tick (um pipeline em vez de um por bot)
+TICK_GRANULARITY_SECONDS = 1.0
+OWNERSHIP_KEY_PREFIX = 'gb:liveness:process'
+
+_HEARTBEAT = 'heartbeat'
+_MONITOR = 'monitor'
+
+BotKey = Tuple[int, int]  # (user_id, bot_id)
+
+
+def _get_redis():
+    from internal_logic.core.redis_manager import get_redis_connection
+    return get_redis_connection()
+
+
+@dataclass
+class _BotEntry:
+    user_id: int
+    bot_id: int
+    heartbeat_key: str
+    active_hash: str
+    generation: int
+
+
+class BotLivenessScheduler:
+    """
+    Agendador de heartbeat/monitor com uma thread por processo.
+
+    register() é chamado pelo BotRunner ao iniciar um bot; a thread acorda
+    apenas no próximo vencimento do heap (ou quando um bot novo entra).
+    """
+
+    def __init__(self, heartbeat_interval: int = HEARTBEAT_INTERVAL_SECONDS,
+                 monitor_interval: int = MONITOR_INTERVAL_SECONDS,
+                 heartbeat_ttl: int = HEARTBEAT_TTL_SECONDS,
+                 tick_granularity: float = TICK_GRANULARITY_SECONDS):
+        self.heartbeat_interval = heartbeat_interval
+        self.monitor_interval = monitor_interval
+        self.heartbeat_ttl = heartbeat_ttl
+        self.tick_granularity = tick_granularity
+        self._bots: Dict[BotKey, _BotEntry] = {}
+        self._heap: List[Tuple[float, int, str, BotKey, int]] = []
+        self._seq = itertools.count()
+        self._generation = itertools.count(1)
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self.process_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.ticks = 0
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    def register(self, bot_state, bot_id: int) -> None:
+        """Passa a manter heartbeat/monitor do bot neste processo."""
+        user_id = bot_state.user_id
+        namespaced = bot_state.redis
+        entry = _BotEntry(
+            user_id=user_id,
+            bot_id=bot_id,
+            heartbeat_key=namespaced._key(bot_state.BOT_HEARTBEAT_PREFIX.format(bot_id=bot_id)),
+            active_hash=namespaced._key(bot_state.ACTIVE_BOTS_HASH),
+            generation=next(self._generation),
+        )
+        now = time.monotonic()
+        with self._cond:
+            self._bots[(user_id, bot_id)] = entry
+            self._push(now + self.heartbeat_interval, _HEARTBEAT, entry)
+            self._push(now + self.monitor_interval, _MONITOR, entry)
+            self._cond.notify()
+        self._ensure_started()
+        logger.info(f"💓 Bot {bot_id} (user {user_id}) no agendador de liveness ({len(self._bots)} bots neste processo)")
+
+    def unregister(self, user_id: int, bot_id: int) -> None:
+        with self._cond:
+            # Entradas antigas no heap são descartadas pela geração (lazy delete)
+            self._bots.pop((user_id, bot_id), None)
+
+    def owned_bots(self) -> int:
+        return len(self._bots)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                'process': self.process_id,
+                'bots': len(self._bots),
+                'scheduled': len(self._heap),
+                'ticks': self.ticks,
+            }
+
+    # ------------------------------------------------------------------
+    # Loop
+    # ------------------------------------------------------------------
+    def _push(self, due: float, kind: str, entry: _BotEntry) -> None:
+        due = math.ceil(due / self.tick_granularity) * self.tick_granularity
+        heapq.heappush(self._heap, (due, next(self._seq), kind, (entry.user_id, entry.bot_id), entry.generation))
+
+    def _ensure_started(self) -> None:
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='bot-liveness', daemon=True)
+            self._thread.start()
+
+    def _pop_due(self) -> Tuple[List[_BotEntry], List[_BotEntry]]:
+        """Bloqueia até o próximo vencimento e retorna (heartbeats, monitores) vencidos."""
+        with self._cond:
+            while True:
+                if not self._heap:
+                    self._cond.wait(timeout=self.monitor_interval)
+                    if not self._heap:
+                        return [], []
+                    continue
+                wait = self._heap[0][0] - time.monotonic()
+                if wait <= 0:
+                    break
+                self._cond.wait(timeout=wait)
+
+            now = time.monotonic()
+            heartbeats, monitors = [], []
+            while self._heap and self._heap[0][0] <= now:
+                _, _, kind, key, generation = heapq.heappop(self._heap)
+                entry = self._bots.get(key)
+                if entry is None or entry.generation != generation:
+                    continue
+                (heartbeats if kind == _HEARTBEAT else monitors).append(entry)
+            return heartbeats, monitors
+
+    def _run(self) -> None:
+        while True:
+            try:
+                heartbeats, monitors = self._pop_due()
+                if not heartbeats and not monitors:
+                    self._publish_ownership()
+                    continue
+                self.tick(heartbeats, monitors)
+            except Exception as e:
+                logger.error(f"❌ [LIVENESS] Erro no tick: {e}")
+                time.sleep(5)
+
+    def tick(self, heartbeats: List[_BotEntry], monitors: List[_BotEntry]) -> None:
+        """Renova heartbeats e roda monitores vencidos (1 pipeline cada)."""
+        redis_conn = _get_redis()
+        now = time.monotonic()
+        self.ticks += 1
+
+        if heartbeats:
+            pipe = redis_conn.pipeline(transaction=False)
+            stamp = str(time.time())
+            for entry in heartbeats:
+                pipe.set(entry.heartbeat_key, stamp, ex=self.heartbeat_ttl)
+            pipe.execute()
+
+        stopped = []
+        if monitors:
+            pipe = redis_conn.pipeline(transaction=False)
+            for entry in monitors:
+                pipe.hexists(entry.active_hash, str(entry.bot_id))
+            for entry, registered in zip(monitors, pipe.execute()):
+                if not registered:
+                    stopped.append(entry)
+
+        with self._cond:
+            for entry in stopped:
+                if self._bots.get((entry.user_id, entry.bot_id)) is entry:
+                    del self._bots[(entry.user_id, entry.bot_id)]
+                    logger.info(f"🛑 Bot {entry.bot_id} (user {entry.user_id}) não está mais registrado - liveness encerrado")
+            stopped_keys = {(e.user_id, e.bot_id) for e in stopped}
+            for entry in heartbeats:
+                if (entry.user_id, entry.bot_id) not in stopped_keys:
+                    self._push(now + self.heartbeat_interval, _HEARTBEAT, entry)
+            for entry in monitors:
+                if (entry.user_id, entry.bot_id) not in stopped_keys:
+                    self._push(now + self.monitor_interval, _MONITOR, entry)
+
+        if monitors:
+            self._publish_ownership(redis_conn)
+            self._emit_heartbeats([entry for entry in monitors if entry not in stopped])
+
+    @staticmethod
+    def _emit_heartbeats(entries: List[_BotEntry]) -> None:
+        """bot_heartbeat para o dashboard do dono (coalescido por bot; nunca derruba o tick)."""
+        if not entries:
+            return
+        try:
+            from internal_logic.core.models import get_brazil_time
+            from internal_logic.services.realtime_bus import emit_coalesced
+
+            timestamp = get_brazil_time().isoformat()
+            for entry in entries:
+                emit_coalesced(entry.user_id, 'bot_heartbeat', {
+                    'bot_id': entry.bot_id,
+                    'timestamp': timestamp,
+                    'status': 'online',
+                }, key=entry.bot_id)
+        except Exception as e:
+            logger.debug(f"Falha não-crítica na UI (bot_heartbeat ignorado): {e}")
+
+    def _publish_ownership(self, redis_conn=None) -> None:
+        try:
+            (redis_conn or _get_redis()).set(
+                f"{OWNERSHIP_KEY_PREFIX}:{self.process_id}",
+                json.dumps({'bots': len(self._bots), 'updated_at': int(time.time())}),
+                ex=max(1, int(self.monitor_interval * 3)),
+            )
+        except Exception as e:
+            logger.debug(f"Falha ao publicar posse de bots: {e}")
+
+
+_scheduler: Optional[BotLivenessScheduler] = None
+_scheduler_pid: Optional[int] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_liveness_scheduler() -> BotLivenessScheduler:
+    """Agendador único do processo (recriado após fork)."""
+    global _scheduler, _scheduler_pid
+    with _scheduler_lock:
+        if _scheduler is None or _scheduler_pid != os.getpid():
+            _scheduler = BotLivenessScheduler()
+            _scheduler_pid = os.getpid()
+        return _scheduler
+
+
+def get_process_ownership() -> Dict[str, int]:
+    """Quantos bots cada processo vivo mantém: {host:pid: bots}."""
+    redis_conn = _get_redis()
+    ownership = {}
+    for key in redis_conn.scan_iter(match=f"{OWNERSHIP_KEY_PREFIX}:*", count=200):
+        raw = redis_conn.get(key)
+        if raw:
+            ownership[key[len(OWNERSHIP_KEY_PREFIX) + 1:]] = json.loads(raw).get('bots', 0)
+    return ownership
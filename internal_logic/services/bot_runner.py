@@ -6,7 +6,6 @@ Gerencia start, stop, polling e heartbeat de forma isolada.
 """
 
 import logging
-import threading
 import time
 import os
 from typing import Dict, Any, Optional, Callable
@@ -42,9 +41,6 @@ class BotRunner:
         self.webhook_url = webhook_url or os.environ.get('WEBHOOK_URL', '')
         self.on_update_received = on_update_received
         
-        # Tracking de threads por bot
-        self.bot_threads: Dict[int, threading.Thread] = {}
-        
         # Session HTTP para chamadas Telegram
         self._telegram_session = requests.Session()
         retry = Retry(
@@ -95,17 +91,13 @@ class BotRunner:
             # Registrar bot no Redis (única fonte de verdade)
             self.bot_state.register_bot(bot_id, token, config, worker_pid=os.getpid())
             
-            # Iniciar heartbeat para manter bot ativo no Redis
-            self.bot_state.start_heartbeat_thread(bot_id, interval=60)
-            
-            # Iniciar thread de monitoramento
-            thread = threading.Thread(
-                target=self._bot_monitor_thread,
-                args=(bot_id,),
-                daemon=True
-            )
-            thread.start()
-            self.bot_threads[bot_id] = thread
+            # Heartbeat + monitor pelo agendador único do processo (sem threads por bot)
+            try:
+                from internal_logic.services.bot_liveness import get_liveness_scheduler
+                get_liveness_scheduler().register(self.bot_state, bot_id)
+            except Exception as e:
+                logger.warning(f"⚠️ Agendador de liveness indisponível para bot {bot_id}, usando thread de heartbeat: {e}")
+                self.bot_state.start_heartbeat_thread(bot_id, interval=60)
             
             logger.info(f"✅ Bot {bot_id} iniciado com webhook configurado (Redis 100%)")
             return True
@@ -127,9 +119,9 @@ class BotRunner:
         # Remover do Redis (todos os workers verão imediatamente)
         self.bot_state.unregister_bot(bot_id)
         
-        # Thread será encerrada automaticamente
-        if bot_id in self.bot_threads:
-            del self.bot_threads[bot_id]
+        # Outros processos detectam a remoção no próximo monitor em lote
+        from internal_logic.services.bot_liveness import get_liveness_scheduler
+        get_liveness_scheduler().unregister(getattr(self.bot_state, 'user_id', None), bot_id)
         
         logger.info(f"✅ Bot {bot_id} parado e removido do Redis")
         return True
@@ -170,42 +162,6 @@ class BotRunner:
             logger.error(f"❌ Erro ao configurar webhook: {e}")
             return False
     
-    def _bot_monitor_thread(self, bot_id: int):
-        """
-        Thread de monitoramento de um bot (heartbeat local)
-        
-        Args:
-            bot_id: ID do bot
-        """
-        logger.info(f"📊 Monitor do bot {bot_id} iniciado")
-        
-        error_count = 0
-        max_backoff_seconds = 60
-        cycle = 0
-        
-        while True:
-            try:
-                # Verificar se bot está ativo no Redis
-                bot_info = self.bot_state.get_bot_data(bot_id)
-                if not bot_info or bot_info.get('status') != 'running':
-                    logger.info(f"📊 Monitor do bot {bot_id} encerrado (status não-running)")
-                    break
-                
-                cycle += 1
-                error_count = max(0, error_count - 1)  # Decay de erros
-                
-                # Heartbeat leve a cada 30 ciclos (~30 segundos)
-                if cycle % 30 == 0:
-                    logger.debug(f"💓 Heartbeat bot {bot_id} - ciclo {cycle}")
-                
-                time.sleep(1)
-                
-            except Exception as e:
-                error_count += 1
-                backoff = min(2 ** error_count, max_backoff_seconds)
-                logger.error(f"❌ Erro no monitor bot {bot_id}: {e} (backoff: {backoff}s)")
-                time.sleep(backoff)
-    
     def _polling_cycle(self, bot_id: int, token: str):
         """
         Ciclo de polling - chamado pelo scheduler a cada segundo
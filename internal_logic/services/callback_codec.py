@@ -0,0 +1,206 @@
+"""
+Callback Codec - callback_data Compacto e Versionado
+=====================================================
+O callback_data de cada botão era um texto livre (buy_3, rmkt_12_0,
+downsell_1_990_2, ...) interpretado por uma cadeia de startswith +
+replace().split('_') no callback_handler: o último ramo pagava todos os
+testes anteriores e downsell_bump_* só funcionava por vir antes de
+downsell_*.
+
+Formato v1 (sempre dentro dos 64 bytes do Telegram):
+
+    ~1<ação><arg>.<arg>...        ~1b3        → buy(3)
+                                  ~1r1vy.0    → rmkt(2446, 0)
+                                  ~1vBOT1_X   → verify('BOT1_X')
+
+    ~        marcador do formato compacto (nenhum formato legado começa com ~)
+    1        versão
+    <ação>   um caractere (ACTIONS)
+    <arg>    inteiros em base 36 separados por '.'; ações com argumento de
+             texto ('s', sempre o último) levam o texto cru no fim
+
+decode() também entende os formatos legados — botões já enviados em chats
+antigos continuam funcionando — e devolve Callback(action, args) com os
+argumentos já convertidos (ou None se o callback_data não for reconhecido).
+Os dois caminhos são um lookup em dict: código da ação (v1) ou primeira
+palavra antes do '_' (legado).
+
+    encode('buy', 3)                              → '~1b3'
+    decode('~1b3') == decode('buy_3')             → Callback('buy', (3,))
+"""
+
+import operator
+from collections import namedtuple
+from typing import Optional
+
+MARKER = '~'
+VERSION = '1'
+SEPARATOR = '.'
+MAX_BYTES = 64  # limite do Telegram para callback_data
+
+Callback = namedtuple('Callback', 'action args')
+
+# ação → (código de um caractere, tipos dos argumentos: i = inteiro, s = texto)
+ACTIONS = {
+    'buy': ('b', 'i'),                         # índice do botão principal
+    'bump_yes': ('y', 'i'),                    # índice do botão principal
+    'bump_no': ('n', 'i'),
+    'multi_bump_yes': ('Y', 'iii'),            # chat_id, índice do bump, total em centavos
+    'multi_bump_no': ('N', 'iii'),
+    'downsell_bump_yes': ('P', 'ii'),          # índice do downsell, total em centavos
+    'downsell_bump_no': ('Q', 'ii'),
+    'dwnsl': ('w', 'iii'),                     # índice do downsell, índice do botão, centavos
+    'downsell': ('d', 'iii'),                  # índice do downsell, centavos, botão original
+    'upsell': ('u', 'iii'),                    # índice do upsell, centavos, botão original
+    'rmkt': ('r', 'ii'),                       # campaign_id, índice do botão
+    'verify': ('v', 's'),                      # payment_id
+}
+
+_BY_CODE = {code: (action, spec) for action, (code, spec) in ACTIONS.items()}
+_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+# map(int, partes, _BASE36) converte sem chamada Python por argumento
+_BASE36 = (36,) * 8
+
+
+def _to_base36(value: int) -> str:
+    if value < 0:
+        return '-' + _to_base36(-value)
+    digits = []
+    while True:
+        value, remainder = divmod(value, 36)
+        digits.append(_DIGITS[remainder])
+        if not value:
+            return ''.join(reversed(digits))
+
+
+def encode(action: str, *args) -> str:
+    """
+    callback_data v1 da ação.
+
+    Raises:
+        ValueError: ação desconhecida, número de argumentos errado ou
+            resultado acima de 64 bytes
+        TypeError: argumento inteiro que não é int
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"Ação de callback desconhecida: {action}")
+    code, spec = ACTIONS[action]
+    if len(args) != len(spec):
+        raise ValueError(f"{action} espera {len(spec)} argumento(s), recebeu {len(args)}")
+
+    parts = [
+        _to_base36(operator.index(value)) if kind == 'i' else str(value)
+        for kind, value in zip(spec, args)
+    ]
+    data = MARKER + VERSION + code + SEPARATOR.join(parts)
+    if len(data.encode('utf-8')) > MAX_BYTES:
+        raise ValueError(f"callback_data excede {MAX_BYTES} bytes: {data!r}")
+    return data
+
+
+def _decode_compact(data: str) -> Optional[Callback]:
+    entry = _BY_CODE.get(data[2:3]) if data[1:2] == VERSION else None
+    if entry is None:
+        return None
+    action, spec = entry
+    if spec[-1] == 's':
+        *parts, text = data[3:].split(SEPARATOR, len(spec) - 1)
+        if len(parts) != len(spec) - 1:
+            return None
+        return Callback(action, (*map(int, parts, _BASE36), text))
+    parts = data[3:].split(SEPARATOR)
+    if len(parts) != len(spec):
+        return None
+    return Callback(action, tuple(map(int, parts, _BASE36)))
+
+
+# ─── formatos legados ────────────────────────────────────────────────
+# Cada parser recebe o texto após a primeira palavra ("buy_3" → "3").
+# flow/flow_step só existem no formato legado (step_id é texto livre do
+# editor de fluxo e o botão é montado pelo bot_manager/_evaluate_conditions).
+
+def _ints(text: str, count: int):
+    """Primeiros `count` inteiros de 'a_b_c' (extras são ignorados, como antes)."""
+    parts = text.split('_')
+    if len(parts) < count:
+        raise ValueError(f"esperados {count} inteiros em {text!r}")
+    return tuple(map(int, parts[:count]))
+
+
+def _offer(action: str, text: str) -> Callback:
+    # novo: INDEX_PRICE_BUTTON | antigo: INDEX_BUTTON_PRICE_BUTTON
+    parts = text.split('_')
+    if len(parts) == 3:
+        index, price_cents, button = map(int, parts)
+    elif len(parts) == 4:
+        index, button, price_cents = int(parts[0]), int(parts[1]), int(parts[2])
+    else:
+        raise ValueError(f"{action}: {len(parts)} partes em {text!r}")
+    return Callback(action, (index, price_cents, button))
+
+
+def _legacy_flow(text: str) -> Optional[Callback]:
+    if text.startswith('step_'):
+        # flow_step_{step_id}_btn_{idx} — step_id pode conter '_'
+        rest = text[5:]
+        if '_btn_' in rest:
+            step_id, index = rest.rsplit('_btn_', 1)
+            return Callback('flow_step', (step_id, 'btn_' + index))
+        step_id, _, action = rest.partition('_')
+        return Callback('flow_step', (step_id, action))
+    # flow_{stepId}_{index}
+    step_id, separator, index = text.partition('_')
+    if not separator:
+        return None
+    return Callback('flow', (step_id, int(index)))
+
+
+def _legacy_bump(text: str) -> Optional[Callback]:
+    if text.startswith('yes_'):
+        return Callback('bump_yes', (int(text[4:]),))
+    if text.startswith('no_'):
+        return Callback('bump_no', (int(text[3:]),))
+    return None
+
+
+def _legacy_multi(text: str) -> Optional[Callback]:
+    if text.startswith('bump_yes_'):
+        return Callback('multi_bump_yes', _ints(text[9:], 3))
+    if text.startswith('bump_no_'):
+        return Callback('multi_bump_no', _ints(text[8:], 3))
+    return None
+
+
+def _legacy_downsell(text: str) -> Optional[Callback]:
+    if text.startswith('bump_yes_'):
+        return Callback('downsell_bump_yes', _ints(text[9:], 2))
+    if text.startswith('bump_no_'):
+        return Callback('downsell_bump_no', _ints(text[8:], 2))
+    return _offer('downsell', text)
+
+
+_LEGACY = {
+    'flow': _legacy_flow,
+    'verify': lambda text: Callback('verify', (text,)),
+    'rmkt': lambda text: Callback('rmkt', _ints(text, 2)),
+    'bump': _legacy_bump,
+    'multi': _legacy_multi,
+    'downsell': _legacy_downsell,
+    'dwnsl': lambda text: Callback('dwnsl', _ints(text, 3)),
+    'upsell': lambda text: _offer('upsell', text),
+    'buy': lambda text: Callback('buy', (int(text),)),
+}
+
+
+def decode(data: str) -> Optional[Callback]:
+    """Callback(action, args) do callback_data (v1 ou legado); None se não reconhecido."""
+    if not data:
+        return None
+    try:
+        if data[0] == MARKER:
+            return _decode_compact(data)
+        head, separator, rest = data.partition('_')
+        parser = _LEGACY.get(head) if separator else None
+        return parser(rest) if parser else None
+    except ValueError:
+        return None
@@ -0,0 +1,182 @@
+"""
+Chat Inbox Service - Busca e Paginação de Conversas
+====================================================
+Busca de conversas do /chat escalável para bots com centenas de milhares de leads:
+
+- Busca textual por nome/username/telegram_id em UMA expressão indexada por
+  trigramas (pg_trgm, ver migrations/add_chat_search_trigram_index.py)
+- Filtros de status de pagamento como semi-joins (EXISTS) sobre
+  idx_payment_bot_lead_status, sem materializar IDs em Python
+- Paginação keyset por (last_interaction DESC, id DESC)
+- Contagem limitada: exata até COUNT_CAP, estimativa do planner acima disso
+"""
+
+import base64
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, cast, exists, func, literal, literal_column, or_, select, text
+from sqlalchemy.types import Text
+
+from internal_logic.core.extensions import db
+from internal_logic.core.models import BotUser, Payment
+
+logger = logging.getLogger(__name__)
+
+# Acima disso o total é estimado pelo planner (COUNT(*) exato fica caro)
+COUNT_CAP = 10000
+
+
+def search_document():
+    """
+    Expressão de busca por lead: lower(first_name || ' ' || username || ' ' || telegram_user_id).
+
+    ⚠️ Deve ser IDÊNTICA à expressão do índice idx_bot_users_search_trgm,
+    senão o planner não usa o índice.
+    """
+    empty, space = literal_column("''", Text), literal_column("' '", Text)
+    return func.lower(
+        func.coalesce(BotUser.first_name, empty)
+        + space
+        + func.coalesce(BotUser.username, empty)
+        + space
+        + cast(BotUser.telegram_user_id, Text)
+    )
+
+
+def _like_pattern(search_query: str) -> str:
+    escaped = search_query.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def _payments_exist(bot_id: int, status: Optional[str] = None):
+    """
+    Semi-join: existe Payment do lead neste bot (opcionalmente com status).
+
+    Casado pelo lead_id canônico (BIGINT = telegram_user_id), servido por
+    idx_payment_bot_lead_status sem CAST nem variantes 'user_'.
+    """
+    conditions = [
+        Payment.bot_id == bot_id,
+        Payment.lead_id == BotUser.telegram_user_id,
+    ]
+    if status:
+        conditions.append(Payment.status == status)
+    return exists(select(literal(1)).where(and_(*conditions)))
+
+
+def encode_cursor(bot_user: BotUser) -> str:
+    payload = {
+        'li': bot_user.last_interaction.isoformat() if bot_user.last_interaction else None,
+        'id': bot_user.id,
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[Optional[datetime], int]]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        last_interaction = datetime.fromisoformat(payload['li']) if payload.get('li') else None
+        return last_interaction, int(payload['id'])
+    except Exception:
+        logger.warning(f"⚠️ Cursor de conversas inválido: {cursor[:40]}")
+        return None
+
+
+def _after_cursor(last_interaction: Optional[datetime], bot_user_id: int):
+    """Keyset para ORDER BY last_interaction DESC NULLS LAST, id DESC."""
+    if last_interaction is None:
+        return and_(BotUser.last_interaction.is_(None), BotUser.id < bot_user_id)
+    return or_(
+        BotUser.last_interaction < last_interaction,
+        and_(BotUser.last_interaction == last_interaction, BotUser.id < bot_user_id),
+        BotUser.last_interaction.is_(None),
+    )
+
+
+def build_conversations_query(bot_id: int, search_query: str = '', filter_type: str = 'all'):
+    """Query base (sem paginação) das conversas de um bot com busca e filtro."""
+    query = BotUser.query.filter(BotUser.bot_id == bot_id, BotUser.archived == False)
+
+    if search_query:
+        query = query.filter(search_document().like(_like_pattern(search_query), escape='\\'))
+
+    if filter_type == 'paid':
+        query = query.filter(_payments_exist(bot_id, status='paid'))
+    elif filter_type == 'pix_generated':
+        query = query.filter(_payments_exist(bot_id))
+    elif filter_type == 'only_entered':
+        query = query.filter(~_payments_exist(bot_id))
+
+    return query
+
+
+def count_conversations(query) -> Tuple[int, bool]:
+    """
+    Conta conversas com custo limitado.
+
+    Returns:
+        (total, estimated): exato até COUNT_CAP; acima disso, estimativa do
+        planner (PostgreSQL) ou o próprio COUNT_CAP nos demais bancos.
+    """
+    capped = db.session.query(func.count()).select_from(
+        query.with_entities(BotUser.id).limit(COUNT_CAP + 1).subquery()
+    ).scalar() or 0
+    if capped <= COUNT_CAP:
+        return capped, False
+
+    if db.engine.dialect.name == 'postgresql':
+        try:
+            statement = query.with_entities(BotUser.id).statement.compile(
+                dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}
+            )
+            plan = db.session.execute(text(f"EXPLAIN (FORMAT JSON) {statement}")).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimate = int(plan[0]['Plan']['Plan Rows'])
+            return max(estimate, COUNT_CAP), True
+        except Exception as e:
+            logger.warning(f"⚠️ Falha ao estimar total de conversas: {e}")
+            db.session.rollback()
+    return COUNT_CAP, True
+
+
+def search_conversations(bot_id: int, search_query: str = '', filter_type: str = 'all',
+                         limit: int = 50, cursor: Optional[str] = None,
+                         offset: int = 0) -> Dict[str, Any]:
+    """
+    Página de conversas de um bot.
+
+    Args:
+        cursor: cursor keyset retornado em `next_cursor` (preferencial)
+        offset: paginação legada, usada apenas quando não há cursor
+
+    Returns:
+        dict com bot_users, next_cursor, total_count e total_count_estimated
+    """
+    query = build_conversations_query(bot_id, search_query, filter_type)
+    total_count, estimated = count_conversations(query)
+
+    page_query = query
+    decoded = decode_cursor(cursor) if cursor else None
+    if decoded:
+        page_query = page_query.filter(_after_cursor(*decoded))
+
+    page_query = page_query.order_by(BotUser.last_interaction.desc().nulls_last(), BotUser.id.desc())
+    if offset and not decoded:
+        page_query = page_query.offset(offset)
+
+    bot_users: List[BotUser] = page_query.limit(limit + 1).all()
+
+    has_more = len(bot_users) > limit
+    bot_users = bot_users[:limit]
+
+    return {
+        'bot_users': bot_users,
+        'has_more': has_more,
+        'next_cursor': encode_cursor(bot_users[-1]) if has_more and bot_users else None,
+        'total_count': total_count,
+        'total_count_estimated': estimated,
+    }
@@ -0,0 +1,190 @@
+"""
+Condition Matcher - Condições do Fluxo Compiladas por Step
+===========================================================
+Antes, cada mensagem do usuário passava condição a condição por
+_match_text_validation: `import re` e recompilação dos padrões de e-mail e
+telefone a cada chamada, e strip()/lower() da mesma entrada de novo para cada
+condição — custo proporcional ao número de condições do step.
+
+ConditionMatcher compila as condições de um step (já validadas e ordenadas)
+uma vez, junto com o grafo do fluxo (flow_graph), e avalia a entrada em uma
+única passada (match_input):
+
+    email/phone/cpf/any → regex de módulo; cada validação roda no máximo uma
+                          vez por mensagem, mesmo com várias condições iguais
+    equals              → dict valor → posições (lookup O(1))
+    contains            → palavras-chave distintas, `in` sobre a entrada já
+                          em minúsculas (uma vez por palavra, não por condição)
+    button_click        → textos dos botões do step já normalizados
+
+A ordem das condições, max_attempts e fallback_step continuam sendo tratados
+em BotManager._evaluate_conditions: o matcher só responde QUAIS posições a
+entrada satisfaz.
+"""
+
+import re
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+EMAIL_RE = re.compile(r'^[\w\.-]+@[\w\.-]+\.\w+$')
+# Telefone brasileiro: (XX) XXXXX-XXXX ou XXXXXXXXXXX
+PHONE_RE = re.compile(r'^(\+55\s?)?(\(?\d{2}\)?\s?)?\d{4,5}-?\d{4}$')
+_NON_DIGIT = re.compile(r'\D')
+
+INPUT_CONDITION_TYPES = ('text_validation', 'button_click')
+
+_NO_MATCH: FrozenSet[int] = frozenset()
+
+
+def is_valid_cpf(value: str) -> bool:
+    """CPF com dígitos verificadores (aceita formatação), sem listas intermediárias."""
+    if not value or not isinstance(value, str):
+        return False
+
+    cpf = _NON_DIGIT.sub('', value)
+    if len(cpf) != 11 or not cpf.isdigit():
+        return False
+
+    # CPFs conhecidos como inválidos (todos dígitos iguais)
+    if cpf == cpf[0] * 11:
+        return False
+
+    # Pesos 10..2 (primeiro dígito) e 11..2 (segundo) na mesma varredura
+    total_1 = total_2 = 0
+    for position in range(9):
+        digit = int(cpf[position])
+        total_1 += digit * (10 - position)
+        total_2 += digit * (11 - position)
+
+    # 11 - (total % 11), ou 0 quando o resto é < 2
+    digit_1 = total_1 * 10 % 11 % 10
+    if int(cpf[9]) != digit_1:
+        return False
+    total_2 += digit_1 * 2
+    return int(cpf[10]) == total_2 * 10 % 11 % 10
+
+
+_TEXT_TESTS = {
+    'email': lambda text: EMAIL_RE.match(text) is not None,
+    'phone': lambda text: PHONE_RE.match(text) is not None,
+    'cpf': is_valid_cpf,
+    'any': bool,
+}
+
+
+def match_text_validation(condition: Dict[str, Any], user_input: str) -> bool:
+    """Avalia uma única condição text_validation (fora do caminho compilado)."""
+    if not user_input or not user_input.strip():
+        return False
+
+    validation = condition.get('validation', 'any')
+    user_input_clean = user_input.strip()
+
+    if validation == 'contains':
+        return condition.get('value', '').lower() in user_input_clean.lower()
+    if validation == 'equals':
+        return user_input_clean.lower() == condition.get('value', '').strip().lower()
+    test = _TEXT_TESTS.get(validation)
+    return bool(test and test(user_input_clean))
+
+
+def _button_index(callback_data: str) -> Optional[int]:
+    """Índice do botão em callback flow_step_{step_id}_btn{idx} (None = match por texto)."""
+    if not callback_data.startswith('flow_step_'):
+        return None
+    parts = callback_data.replace('flow_step_', '').split('_')
+    if len(parts) < 2 or not parts[1].startswith('btn'):
+        return None
+    try:
+        return int(parts[1].replace('btn', '')) if parts[1] != 'btn' else None
+    except ValueError:
+        return None
+
+
+class ConditionMatcher:
+    """Condições de um step compiladas para avaliação em uma passada por mensagem."""
+
+    __slots__ = ('conditions', 'tracks_attempts', '_text_tests', '_equals', '_contains',
+                 '_buttons', '_button_texts')
+
+    def __init__(self, conditions: Tuple[Dict[str, Any], ...], step: Optional[Dict[str, Any]] = None):
+        self.conditions = conditions
+        self.tracks_attempts = any(
+            condition.get('type') in INPUT_CONDITION_TYPES and condition.get('max_attempts')
+            for condition in conditions
+        )
+
+        text_tests: Dict[str, list] = {}
+        equals: Dict[str, list] = {}
+        contains: Dict[str, list] = {}
+        buttons = []
+        for position, condition in enumerate(conditions):
+            condition_type = condition.get('type')
+            if condition_type == 'text_validation':
+                validation = condition.get('validation', 'any')
+                if validation == 'equals':
+                    equals.setdefault(condition.get('value', '').strip().lower(), []).append(position)
+                elif validation == 'contains':
+                    contains.setdefault(condition.get('value', '').lower(), []).append(position)
+                elif validation in _TEXT_TESTS:
+                    text_tests.setdefault(validation, []).append(position)
+            elif condition_type == 'button_click':
+                button_text = condition.get('button_text', '').strip().lower()
+                if button_text:
+                    buttons.append((position, button_text))
+
+        self._text_tests = tuple((_TEXT_TESTS[validation], tuple(positions)) for validation, positions in text_tests.items())
+        self._equals = {value: tuple(positions) for value, positions in equals.items()}
+        self._contains = tuple((keyword, tuple(positions)) for keyword, positions in contains.items())
+        self._buttons = tuple(buttons)
+
+        custom_buttons = ((step or {}).get('config') or {}).get('custom_buttons') or []
+        self._button_texts = tuple(
+            (button.get('text') or '').strip().lower() if isinstance(button, dict) else ''
+            for button in custom_buttons
+        )
+
+    def __len__(self) -> int:
+        return len(self.conditions)
+
+    def match_input(self, user_input: Optional[str]) -> FrozenSet[int]:
+        """Posições das condições text_validation/button_click satisfeitas pela entrada."""
+        if not user_input or not isinstance(user_input, str):
+            return _NO_MATCH
+
+        matched = set()
+        text = user_input.strip()
+        if text:
+            lowered = text.lower()
+            for test, positions in self._text_tests:
+                if test(text):
+                    matched.update(positions)
+            positions = self._equals.get(lowered)
+            if positions:
+                matched.update(positions)
+            for keyword, positions in self._contains:
+                if keyword in lowered:
+                    matched.update(positions)
+
+        if self._buttons:
+            self._match_buttons(user_input, matched)
+        return frozenset(matched) if matched else _NO_MATCH
+
+    def _match_buttons(self, callback_data: str, matched: set) -> None:
+        # Match exato pelo índice do botão quando o callback o identifica
+        index = _button_index(callback_data)
+        if index is not None and -len(self._button_texts) <= index < len(self._button_texts):
+            actual_text = self._button_texts[index]
+            matched.update(position for position, button_text in self._buttons if button_text == actual_text)
+            return
+
+        # Fallback: texto do botão igual a (ou contido em) callback_data, sem diferenciar caixa
+        callback_lower = callback_data.lower()
+        matched.update(position for position, button_text in self._buttons if button_text in callback_lower)
+
+
+EMPTY_MATCHER = ConditionMatcher(())
+
+
+def compile_conditions(conditions: Tuple[Dict[str, Any], ...], step: Optional[Dict[str, Any]] = None) -> ConditionMatcher:
+    """Matcher de condições já validadas e ordenadas (ver flow_graph.prepare_conditions)."""
+    return ConditionMatcher(conditions, step) if conditions else EMPTY_MATCHER
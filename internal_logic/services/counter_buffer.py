@@ -0,0 +1,143 @@
+"""
+Counter Buffer - Contadores Agregados no Redis, Gravados em Lote
+=================================================================
+Contadores quentes eram read-modify-write no ORM (`campaign.total_clicks += 1`
++ commit): SELECT da linha, UPDATE com o valor calculado em Python e lock de
+linha na campanha/gateway. Com cliques simultâneos, incrementos se perdiam
+(dois workers leem 10 e gravam 11) e todos disputavam a mesma linha.
+
+Agora cada evento é um HINCRBY no Redis e um único job (flush_counters,
+agendado a cada FLUSH_INTERVAL_SECONDS) soma os deltas no banco:
+
+    gb:counters:<tipo>   hash  entity_id → delta pendente
+
+    PostgreSQL → UPDATE t SET col = COALESCE(col, 0) + v.delta
+                 FROM (VALUES (id, delta), ...) AS v(id, delta) WHERE t.id = v.id
+    outros     → UPDATE t SET col = COALESCE(col, 0) + CASE id WHEN ... END
+                 WHERE id IN (...)
+
+Tipos (COUNTERS):
+    remarketing_clicks    → remarketing_campaigns.total_clicks (PIX do rmkt_)
+    gateway_transactions  → gateways.total_transactions (todo PIX gerado:
+                            botão principal, order bump, downsell, upsell,
+                            remarketing)
+
+O hash é drenado atomicamente (script Lua: RENAME para :flushing). Se o
+UPDATE falhar, os deltas ficam em :flushing e o próximo flush os soma aos
+novos. Um lock garante um flush por vez (dois flushes simultâneos
+gravariam o mesmo lote em :flushing duas vezes). Sem Redis, increment() cai
+no UPDATE atômico direto no banco.
+"""
+
+import logging
+from typing import Dict
+
+from sqlalchemy import Integer, case, column, func, update, values
+
+from internal_logic.core.extensions import db
+from internal_logic.core.models import Gateway, RemarketingCampaign
+from internal_logic.core.redis_manager import get_redis_connection
+from internal_logic.core.redis_scripts import claim_once, drain_hash, new_lock_token, release_lock
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'gb:counters'
+FLUSH_INTERVAL_SECONDS = 5
+FLUSH_LOCK_KEY = f"{KEY_PREFIX}:flush_lock"
+FLUSH_LOCK_TTL = 60
+
+# tipo → (tabela, coluna)
+COUNTERS = {
+    'remarketing_clicks': (RemarketingCampaign.__table__, 'total_clicks'),
+    'gateway_transactions': (Gateway.__table__, 'total_transactions'),
+}
+
+
+def _key(kind: str) -> str:
+    return f"{KEY_PREFIX}:{kind}"
+
+
+def increment(kind: str, entity_id: int, amount: int = 1, redis_conn=None) -> bool:
+    """Soma `amount` ao contador de `entity_id` (gravado no banco no próximo flush)."""
+    if kind not in COUNTERS:
+        raise ValueError(f"Contador desconhecido: {kind}")
+    if not entity_id or not amount:
+        return False
+    try:
+        redis_conn = redis_conn or get_redis_connection()
+        if redis_conn:
+            redis_conn.hincrby(_key(kind), int(entity_id), int(amount))
+            return True
+    except Exception as e:
+        logger.warning(f"⚠️ Redis indisponível para contador {kind}: {e} — gravando direto no banco")
+    return _apply_now(kind, {int(entity_id): int(amount)})
+
+
+def _apply_now(kind: str, deltas: Dict[int, int]) -> bool:
+    try:
+        _update_deltas(kind, deltas)
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"❌ Erro ao gravar contador {kind}: {e}")
+        return False
+
+
+def _update_deltas(kind: str, deltas: Dict[int, int]) -> int:
+    """Um UPDATE somando os deltas (sem commit); retorna as linhas afetadas."""
+    table, column_name = COUNTERS[kind]
+    target = table.c[column_name]
+    current = func.coalesce(target, 0)
+
+    if db.engine.dialect.name == 'postgresql':
+        pending = values(column('id', Integer), column('delta', Integer), name='v').data(list(deltas.items()))
+        stmt = update(table).values({column_name: current + pending.c.delta}).where(table.c.id == pending.c.id)
+    else:
+        delta = case(deltas, value=table.c.id, else_=0)
+        stmt = update(table).values({column_name: current + delta}).where(table.c.id.in_(list(deltas)))
+    return db.session.execute(stmt).rowcount
+
+
+def flush_counters(redis_conn=None) -> Dict[str, int]:
+    """
+    Drena os contadores do Redis e grava um UPDATE por tipo (job periódico).
+
+    Returns:
+        {tipo: total de incrementos gravados}
+    """
+    redis_conn = redis_conn or get_redis_connection()
+    token = new_lock_token()
+    if claim_once(redis_conn, FLUSH_LOCK_KEY, FLUSH_LOCK_TTL, value=token) is not None:
+        logger.debug("🔢 Flush de contadores já em andamento")
+        return {}
+    try:
+        return _flush_all(redis_conn)
+    finally:
+        release_lock(redis_conn, FLUSH_LOCK_KEY, token)
+
+
+def _flush_all(redis_conn) -> Dict[str, int]:
+    flushed = {}
+    for kind in COUNTERS:
+        key = _key(kind)
+        pending = drain_hash(redis_conn, key, f"{key}:flushing")
+        deltas = {int(entity_id): int(delta) for entity_id, delta in pending.items() if int(delta)}
+        if not deltas:
+            redis_conn.delete(f"{key}:flushing")
+            continue
+        try:
+            rows = _update_deltas(kind, deltas)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"❌ Flush de {kind} falhou ({len(deltas)} ids) — deltas mantidos para o próximo ciclo: {e}")
+            continue
+        redis_conn.delete(f"{key}:flushing")
+        flushed[kind] = sum(deltas.values())
+        if rows < len(deltas):
+            logger.warning(f"⚠️ {kind}: {len(deltas) - rows} id(s) inexistentes descartados no flush")
+    if flushed:
+        logger.info(f"🔢 Contadores gravados: {flushed}")
+    return flushed
+
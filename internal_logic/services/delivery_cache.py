@@ -0,0 +1,284 @@
+"""
+Delivery Cache - Registro Pré-Computado da Página de Entrega
+=============================================================
+O clique do comprador em /delivery/<token> acontece logo após a compra,
+quando o tráfego se concentra. Em vez de resolver Payment → Bot → Pool →
+BotUser → tracking_data (Redis) a cada clique, send_payment_delivery grava
+um registro compacto no Redis na confirmação:
+
+    gb:delivery:{token} → {paid, payment, redirect_url, pixel_id,
+                           purchase_event_id, fbclid/fbc/fbp, capi}
+
+A página renderiza com um GET. Sem registro (Redis fora, link antigo,
+pagamento ainda pendente), a rota usa o caminho do banco e grava o registro
+para os próximos cliques.
+
+O access_token do CAPI fica no registro CRIPTOGRAFADO (igual ao banco);
+a página descriptografa só na hora de enfileirar o Purchase.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import time
+from typing import Any, Dict, Optional
+
+from internal_logic.core.extensions import db
+from internal_logic.core.models import BotUser, Payment, PoolBot
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_KEY = 'gb:delivery:{token}'
+DELIVERY_TTL_SECONDS = 3 * 86400
+RECORD_VERSION = 1
+
+# E-mails sintéticos do sistema não vão para o CAPI
+SYNTHETIC_EMAIL_DOMAINS = ('@telegram.user', '@user.telegram', '@example.com')
+
+
+def _get_redis():
+    from internal_logic.core.redis_manager import get_redis_connection
+    return get_redis_connection()
+
+
+def _resolve_pool_bot(payment: Payment, bot_user: Optional[BotUser], tracking_service):
+    # Prioridade: 1) payment.pool_id, 2) pool_id do tracking_data, 3) primeiro pool do bot
+    if getattr(payment, 'pool_id', None):
+        pool_bot = PoolBot.query.filter_by(bot_id=payment.bot_id, pool_id=payment.pool_id).first()
+        if pool_bot:
+            return pool_bot
+
+    if bot_user and bot_user.tracking_session_id:
+        pool_id = (tracking_service.recover_tracking_data(bot_user.tracking_session_id) or {}).get('pool_id')
+        if pool_id:
+            pool_bot = PoolBot.query.filter_by(bot_id=payment.bot_id, pool_id=pool_id).first()
+            if pool_bot:
+                return pool_bot
+
+    pool_bot = PoolBot.query.filter_by(bot_id=payment.bot_id).first()
+    if pool_bot:
+        logger.warning(f" Delivery - Usando primeiro pool do bot (pool_id não encontrado): pool_id={pool_bot.pool_id}")
+    return pool_bot
+
+
+def _redirect_url(payment: Payment, bot) -> Optional[str]:
+    # Prioridade: 1) bot.config.access_link (configurado no painel), 2) link genérico do username
+    if bot and bot.config and bot.config.access_link:
+        return bot.config.access_link
+    if bot and bot.username:
+        return f"https://t.me/{bot.username}?start=p{payment.id}"
+    return None
+
+
+def _hash_email(email: Optional[str]) -> Optional[str]:
+    if not email:
+        return None
+    email_clean = email.strip().lower()
+    if any(domain in email_clean for domain in SYNTHETIC_EMAIL_DOMAINS):
+        return None
+    return hashlib.sha256(email_clean.encode('utf-8')).hexdigest()
+
+
+def _hash_phone(phone: Optional[str]) -> Optional[str]:
+    if not phone:
+        return None
+    phone_clean = re.sub(r'[^\d]', '', phone).lstrip('0')
+    if not phone_clean:
+        return None
+    if not phone_clean.startswith('55'):
+        phone_clean = '55' + phone_clean
+    return hashlib.sha256(phone_clean.encode('utf-8')).hexdigest()
+
+
+def build_delivery_record(payment: Payment) -> Optional[Dict[str, Any]]:
+    """
+    Resolve tudo que a página de entrega precisa (link, pixel, matching, CAPI).
+
+    Não faz commit. Returns:
+        dict serializável em JSON, ou None se não houver link de entrega
+    """
+    from utils.tracking_service import TrackingServiceV4 as TrackingService
+
+    tracking_service = TrackingService()
+    bot_user = None
+    if payment.lead_id is not None:
+        from sqlalchemy.orm import undefer_group
+        bot_user = BotUser.query.options(undefer_group('tracking')).filter_by(
+            bot_id=payment.bot_id,
+            telegram_user_id=payment.lead_id
+        ).first()
+
+    pool_bot = _resolve_pool_bot(payment, bot_user, tracking_service)
+    pool = pool_bot.pool if pool_bot else None
+    bot = pool_bot.bot if pool_bot else payment.bot
+    if not pool_bot:
+        logger.warning(f" Payment {payment.id}: Bot sem pool — usando payment.bot como fallback")
+
+    redirect_url = _redirect_url(payment, bot)
+    if not redirect_url:
+        logger.error(f" Delivery - Nenhum redirect_url disponível para payment {payment.id}")
+        return None
+
+    # Pixel: 1) Payment (salvo do tracking data), 2) Pool, 3) BotUser.campaign_code (sticky)
+    pixel_id = payment.meta_pixel_id or (pool.meta_pixel_id if pool else None) \
+        or (getattr(bot_user, 'campaign_code', None) if bot_user else None)
+
+    fbp = getattr(bot_user, 'fbp', None) if bot_user else None
+    fbc = getattr(bot_user, 'fbc', None) if bot_user else None
+    fbclid = getattr(bot_user, 'fbclid', None) if bot_user else None
+
+    fbc_origin = None
+    if bot_user and bot_user.tracking_session_id:
+        tracking_data = tracking_service.recover_tracking_data(bot_user.tracking_session_id) or {}
+        fbc_origin = tracking_data.get('fbc_origin')
+        if fbc and fbc_origin == 'synthetic':
+            fbc = None  # Meta não atribui com fbc sintético
+        # Gap Redis → BotUser: usar os cookies reais do navegador salvos no tracking_data
+        if not fbc and tracking_data.get('fbc') and fbc_origin != 'synthetic':
+            fbc = tracking_data.get('fbc')
+        if not fbp and tracking_data.get('fbp'):
+            fbp = tracking_data.get('fbp')
+
+    # O browser Pixel aceita fbc gerado de fbclid (o CAPI rejeita synthetic)
+    if not fbc and fbclid:
+        fbc = f"fb.1.{int(time.time() * 1000)}.{fbclid}"
+        fbc_origin = 'generated_from_fbclid'
+    if fbc and fbc_origin == 'synthetic':
+        fbc = None
+
+    # SHA-256 sempre, para match com server-side
+    fbclid_hash = hashlib.sha256(str(fbclid).encode()).hexdigest() if fbclid else None
+    purchase_event_id = f"purchase_{payment.id}"
+    content_id = str(pool.id) if pool else str(payment.bot_id)
+    content_name = payment.product_name or (payment.bot.name if payment.bot else None)
+
+    capi = None
+    if pixel_id and pool and pool.meta_access_token:
+        user_data = {
+            'fbp': fbp,
+            'fbc': fbc,
+            'external_id': [fbclid_hash] if fbclid_hash else [],
+            'ct': payment.customer_city or None,
+            'st': payment.customer_state or None,
+            'country': payment.customer_country or 'BR',
+            'ge': payment.customer_gender or None,
+        }
+        email_hash = _hash_email(payment.customer_email)
+        phone_hash = _hash_phone(payment.customer_phone)
+        if email_hash:
+            user_data['em'] = [email_hash]
+        if phone_hash:
+            user_data['ph'] = [phone_hash]
+        capi = {
+            'pixel_id': pixel_id,
+            'access_token_encrypted': pool.meta_access_token,
+            'test_code': pool.meta_test_event_code,
+            'event': {
+                'event_name': 'Purchase',
+                'event_time': int(payment.paid_at.timestamp()) if payment.paid_at else int(time.time()),
+                'event_id': purchase_event_id,
+                'action_source': 'website',
+                'event_source_url': redirect_url,
+                'user_data': user_data,
+                'custom_data': {
+                    'value': float(payment.amount),
+                    'currency': 'BRL',
+                    'content_id': content_id,
+                    'content_name': content_name,
+                },
+            },
+        }
+
+    return {
+        'v': RECORD_VERSION,
+        'paid': payment.status == 'paid',
+        'payment': {
+            'id': payment.id,
+            'payment_id': payment.payment_id,
+            'amount': float(payment.amount),
+            'product_name': payment.product_name,
+        },
+        'redirect_url': redirect_url,
+        'pixel_id': pixel_id,
+        'pageview_event_id': getattr(payment, 'pageview_event_id', None),
+        'purchase_event_id': purchase_event_id,
+        'fbclid': fbclid or '',
+        'fbclid_hash': fbclid_hash or '',
+        'fbc': fbc,
+        'fbp': fbp,
+        'fbc_origin': fbc_origin,
+        'purchase_sent': bool(payment.meta_purchase_sent),
+        'capi': capi,
+    }
+
+
+def get_delivery_record(token: str) -> Optional[Dict[str, Any]]:
+    """Registro pré-computado (um GET) ou None."""
+    try:
+        raw = _get_redis().get(DELIVERY_KEY.format(token=token))
+    except Exception as e:
+        logger.debug(f"Delivery cache indisponível ({e}) - usando banco")
+        return None
+    if not raw:
+        return None
+    record = json.loads(raw)
+    if record.get('v') != RECORD_VERSION or not record.get('paid'):
+        return None
+    return record
+
+
+def save_delivery_record(token: str, record: Dict[str, Any]) -> bool:
+    try:
+        _get_redis().set(DELIVERY_KEY.format(token=token), json.dumps(record, default=str), ex=DELIVERY_TTL_SECONDS)
+        return True
+    except Exception as e:
+        logger.warning(f"⚠️ [DELIVERY CACHE] Falha ao gravar registro: {e}")
+        return False
+
+
+def precompute_delivery(payment: Payment) -> bool:
+    """
+    Chamado na confirmação (send_payment_delivery): grava o registro da página
+    e fixa meta_event_id no payment (a página não precisa mais escrever no banco).
+    """
+    if not payment.delivery_token or payment.status != 'paid':
+        return False
+    try:
+        record = build_delivery_record(payment)
+        if not record:
+            return False
+        if payment.meta_event_id != record['purchase_event_id']:
+            payment.meta_event_id = record['purchase_event_id']
+            db.session.commit()
+        return save_delivery_record(payment.delivery_token, record)
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"⚠️ [DELIVERY CACHE] Falha ao pré-computar entrega do payment {payment.id}: {e}")
+        return False
+
+
+def mark_purchase_sent(token: Optional[str]) -> None:
+    """Reflete meta_purchase_sent no registro (evita novo Purchase CAPI em recarga)."""
+    if not token:
+        return
+    key = DELIVERY_KEY.format(token=token)
+    try:
+        redis_conn = _get_redis()
+        raw = redis_conn.get(key)
+        if raw:
+            record = json.loads(raw)
+            record['purchase_sent'] = True
+            redis_conn.set(key, json.dumps(record, default=str), keepttl=True)
+    except Exception:
+        pass
+
+
+def invalidate_delivery(token: Optional[str]) -> None:
+    """Remove o registro (ex.: pagamento deixou de ser 'paid' — estorno)."""
+    if not token:
+        return
+    try:
+        _get_redis().delete(DELIVERY_KEY.format(token=token))
+    except Exception:
+        pass
@@ -0,0 +1,174 @@
+"""
+Export Stream - Exportações CSV/NDJSON/JSON em Streaming
+=========================================================
+As exportações montavam tudo em memória: `.all()` → lista de dicts →
+StringIO → uma resposta (e lazy-load de payment.bot por linha). Memória
+crescia com o tamanho da base, por isso havia limite de 10.000 linhas.
+
+Aqui cada exportação é um SELECT de colunas (JOINs no próprio SQL — nada de
+lazy-load por linha), lido com yield_per (cursor server-side no PostgreSQL,
+stream_results) e serializado por um gerador em blocos de CHUNK_ROWS linhas.
+Memória constante, sem limite de linhas:
+
+    users_export()                       admin: todos os usuários
+    payments_export(user_id, bot_id)     admin (sem user_id) ou tenant: pagamentos pagos
+    leads_export(user_id, bot_id)        tenant: leads dos próprios bots
+
+    stream_export(stmt, fmt)             gerador de str (csv | ndjson | json)
+    export_response(stmt, fmt, name)     Response Flask com stream_with_context
+"""
+
+import csv
+import io
+import json
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Iterator, Optional
+
+from sqlalchemy import select
+
+from internal_logic.core.extensions import db
+from internal_logic.core.models import Bot, BotUser, Payment, User
+
+logger = logging.getLogger(__name__)
+
+CHUNK_ROWS = 1000
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'json': ('application/json', 'json'),
+}
+
+
+def users_export():
+    return select(
+        User.id,
+        User.username,
+        User.email,
+        User.full_name,
+        User.is_active,
+        User.is_admin,
+        User.created_at,
+        User.last_login.label('last_login_at'),
+        User.total_revenue,
+        User.total_sales,
+    ).order_by(User.id)
+
+
+def payments_export(user_id: Optional[int] = None, bot_id: Optional[int] = None):
+    """Pagamentos pagos; com user_id, só os dos bots do usuário (tenant)."""
+    stmt = select(
+        Payment.id,
+        Payment.payment_id,
+        Payment.bot_id,
+        Bot.user_id,
+        Payment.customer_name,
+        Payment.customer_email,
+        Payment.amount,
+        Payment.status,
+        Payment.gateway_type,
+        Payment.paid_at,
+        Payment.product_name,
+    ).join(Bot, Bot.id == Payment.bot_id).where(Payment.status == 'paid')
+    if user_id is not None:
+        stmt = stmt.where(Bot.user_id == user_id)
+    if bot_id is not None:
+        stmt = stmt.where(Payment.bot_id == bot_id)
+    return stmt.order_by(Payment.paid_at.desc(), Payment.id.desc())
+
+
+def leads_export(user_id: int, bot_id: Optional[int] = None):
+    """Leads (BotUser) dos bots do usuário."""
+    stmt = select(
+        BotUser.id,
+        BotUser.bot_id,
+        BotUser.telegram_user_id,
+        BotUser.first_name,
+        BotUser.username,
+        BotUser.first_interaction,
+        BotUser.last_interaction,
+        BotUser.utm_source,
+        BotUser.utm_campaign,
+        BotUser.campaign_code,
+        BotUser.archived,
+    ).join(Bot, Bot.id == BotUser.bot_id).where(Bot.user_id == user_id)
+    if bot_id is not None:
+        stmt = stmt.where(BotUser.bot_id == bot_id)
+    return stmt.order_by(BotUser.id)
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _csv_value(value: Any) -> Any:
+    value = _json_value(value)
+    return '' if value is None else value
+
+
+def stream_export(stmt, fmt: str = 'csv', chunk_rows: int = CHUNK_ROWS) -> Iterator[str]:
+    """
+    Serializa o SELECT em blocos de `chunk_rows` linhas.
+
+    A sessão precisa continuar aberta enquanto o gerador é consumido
+    (export_response usa stream_with_context).
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato de exportação inválido: {fmt}")
+
+    result = db.session.execute(stmt.execution_options(yield_per=chunk_rows))
+    fields = list(result.keys())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+
+    if fmt == 'csv':
+        writer.writerow(fields)
+    elif fmt == 'json':
+        buffer.write('[')
+    first = True
+
+    try:
+        for partition in result.partitions():
+            for row in partition:
+                if fmt == 'csv':
+                    writer.writerow([_csv_value(value) for value in row])
+                    continue
+                line = json.dumps(
+                    {field: _json_value(value) for field, value in zip(fields, row)},
+                    ensure_ascii=False,
+                )
+                if fmt == 'ndjson':
+                    buffer.write(line + '\n')
+                else:
+                    buffer.write(line if first else ',\n' + line)
+                first = False
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    finally:
+        result.close()
+
+    if fmt == 'json':
+        buffer.write(']')
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_response(stmt, fmt: str, filename: str):
+    """Response em streaming (Content-Disposition: attachment; filename=<filename>.<ext>)."""
+    from flask import Response, stream_with_context
+
+    mimetype, extension = FORMATS[fmt]
+    return Response(
+        stream_with_context(stream_export(stmt, fmt)),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename={filename}.{extension}',
+            'X-Accel-Buffering': 'no',
+        },
+    )
@@ -14,6 +14,8 @@ import hashlib
 from typing import Dict, Any, Optional, List, Callable
 from datetime import datetime, timedelta
 
+from internal_logic.services.callback_codec import decode as decode_callback
+
 logger = logging.getLogger(__name__)
 
 
@@ -124,8 +126,9 @@ class FlowEngine:
             from flask import current_app
             
             with current_app.app_context():
-                # Buscar ou criar BotUser
-                bot_user = BotUser.query.filter_by(
+                # Buscar ou criar BotUser (projeção enxuta: só id/last_interaction são usados)
+                from internal_logic.services.lead_lookup import slim_load
+                bot_user = BotUser.query.options(slim_load()).filter_by(
                     bot_id=bot_id,
                     telegram_user_id=telegram_user_id,
                     archived=False
@@ -311,11 +314,10 @@ class FlowEngine:
                     callback_data=callback_data
                 )
             
-            # Processar callback específico
-            if callback_data.startswith('buy_'):
-                # Extrair product_id do callback_data
-                product_id = callback_data.replace('buy_', '')
-                return self._handle_buy_callback(bot_id, token, config, chat_id, product_id)
+            # Processar callback específico (buy_{product_id} ou ~1b{product_id}: callback_codec)
+            parsed = decode_callback(callback_data)
+            if parsed and parsed.action == 'buy':
+                return self._handle_buy_callback(bot_id, token, config, chat_id, parsed.args[0])
             
             elif callback_data == 'support':
                 support_message = config.get('support_message', 'Entre em contato com o suporte.')
@@ -333,7 +335,7 @@ class FlowEngine:
         token: str,
         config: Dict[str, Any],
         chat_id: int,
-        product_id: str
+        product_id: int
     ) -> bool:
         """
         Processa callback de compra.
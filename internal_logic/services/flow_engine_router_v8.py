@@ -19,12 +19,15 @@ GARANTIAS:
 
 import logging
 import json
-import time
 from typing import Dict, Any, Optional
 from internal_logic.core.redis_manager import get_redis_connection
+from internal_logic.core.redis_scripts import new_lock_token, release_lock
 
 logger = logging.getLogger(__name__)
 
+# Token do fallback sem Redis (não há o que liberar)
+LOCAL_LOCK_TOKEN = 'local'
+
 
 class MessageRouterV8:
     """
@@ -58,7 +61,7 @@ class MessageRouterV8:
         except Exception as e:
             logger.warning(f"⚠️ Erro ao conectar Redis: {e}")
     
-    def acquire_lock(self, lock_key: str, timeout: int = 5) -> bool:
+    def acquire_lock(self, lock_key: str, timeout: int = 5) -> Optional[str]:
         """
         🔥 CRÍTICO: Adquire lock atômico via Redis
         
@@ -67,45 +70,51 @@ class MessageRouterV8:
             timeout: Timeout em segundos
             
         Returns:
-            True se lock adquirido, False caso contrário
+            Token do dono (passar para release_lock) se adquirido, None caso contrário
         """
         if not self.redis_conn:
             # Fallback: lock em memória (não é atômico, mas melhor que nada)
-            return True
+            return LOCAL_LOCK_TOKEN
         
         try:
-            lock_value = f"{int(time.time() * 1000)}"
+            lock_token = new_lock_token()
             # Tentar adquirir lock com SET NX EX (atômico)
             acquired = self.redis_conn.set(
                 f"lock:{lock_key}",
-                lock_value,
+                lock_token,
                 nx=True,
                 ex=timeout
             )
             
             if acquired:
                 logger.debug(f"✅ Lock adquirido: {lock_key}")
-                return True
+                return lock_token
             else:
                 logger.debug(f"⛔ Lock já existe: {lock_key}")
-                return False
+                return None
         except Exception as e:
             logger.error(f"❌ Erro ao adquirir lock: {e}")
-            return False
+            return None
     
-    def release_lock(self, lock_key: str):
+    def release_lock(self, lock_key: str, lock_token: Optional[str]):
         """
         🔥 CRÍTICO: Libera lock atômico
         
+        Só apaga se o lock ainda for deste token: se expirou e outro worker
+        o adquiriu, o lock do outro é preservado.
+        
         Args:
             lock_key: Chave do lock
+            lock_token: Token retornado por acquire_lock
         """
-        if not self.redis_conn:
+        if not self.redis_conn or not lock_token or lock_token == LOCAL_LOCK_TOKEN:
             return
         
         try:
-            self.redis_conn.delete(f"lock:{lock_key}")
-            logger.debug(f"✅ Lock liberado: {lock_key}")
+            if release_lock(self.redis_conn, f"lock:{lock_key}", lock_token):
+                logger.debug(f"✅ Lock liberado: {lock_key}")
+            else:
+                logger.warning(f"⚠️ Lock {lock_key} expirou antes da liberação (não apagado)")
         except Exception as e:
             logger.error(f"❌ Erro ao liberar lock: {e}")
     
@@ -226,7 +235,8 @@ class MessageRouterV8:
         lock_key = f"bot:{bot_id}:chat:{chat_id}"
         
         # ✅ PASSO 1: Obter lock atômico
-        if not self.acquire_lock(lock_key, timeout=5):
+        lock_token = self.acquire_lock(lock_key, timeout=5)
+        if not lock_token:
             logger.warning(f"⛔ Lock não adquirido para {lock_key} - mensagem será ignorada")
             return {
                 'processed': False,
@@ -262,8 +272,8 @@ class MessageRouterV8:
                 'message': 'Erro ao processar mensagem. Tente novamente.'
             }
         finally:
-            # ✅ PASSO 3: Liberar lock
-            self.release_lock(lock_key)
+            # ✅ PASSO 3: Liberar lock (só se ainda for nosso)
+            self.release_lock(lock_key, lock_token)
     
     def _process_via_flow_engine(
         self,
@@ -0,0 +1,274 @@
+"""
+Flow Graph - Fluxo Visual Compilado (lookup O(1) por step)
+===========================================================
+O fluxo de um bot (config.flow_steps) é uma lista de steps. Antes, cada salto
+de _execute_flow_recursive e cada callback flow_step_ percorriam a lista
+(str().strip() em todos os ids) e, no caminho com snapshot, faziam json.loads
+do fluxo inteiro — custo por salto proporcional ao tamanho do fluxo.
+
+compile_flow() transforma o fluxo, uma vez por versão, em um grafo imutável:
+
+    steps       → step_id normalizado → step
+    successors  → step_id → {aresta: step_id destino} (connections, botões,
+                  condições), com arestas para steps inexistentes em dangling
+    conditions  → step_id → condições válidas já ordenadas por 'order'
+    matchers    → step_id → ConditionMatcher (condições compiladas, ver
+                  condition_matcher)
+
+get_compiled_flow() guarda os grafos por worker (LRU), indexados pelo JSON do
+fluxo (conteúdo, nunca id() de lista: listas e steps podem ser alterados no
+lugar). Só o JSON em string (imutável, snapshot do Redis) resolve por
+identidade, sem reparsear. O grafo é compilado a partir de uma cópia do
+fluxo e steps_list é outra cópia, entregue aos chamadores: alterar a lista
+recebida ou a devolvida não muda o grafo em cache.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple, Union
+
+from internal_logic.services.condition_matcher import EMPTY_MATCHER, ConditionMatcher, compile_conditions
+
+logger = logging.getLogger(__name__)
+
+CACHE_SIZE = 128
+
+VALID_CONDITION_TYPES = ('text_validation', 'button_click', 'payment_status', 'time_elapsed')
+VALID_TEXT_VALIDATIONS = ('email', 'phone', 'cpf', 'contains', 'equals', 'any')
+VALID_PAYMENT_STATUSES = ('paid', 'pending', 'failed', 'expired')
+
+
+def normalize_step_id(step_id: Any) -> str:
+    """IDs chegam como número ou string: comparação sempre por str().strip()."""
+    return str(step_id).strip() if step_id is not None else ''
+
+
+def validate_condition(condition: Dict[str, Any]) -> Tuple[bool, str]:
+    """
+    Valida estrutura de uma condição.
+
+    Returns:
+        (is_valid: bool, error_message: str)
+    """
+    if not isinstance(condition, dict):
+        return False, "Condição deve ser um objeto"
+
+    condition_type = condition.get('type')
+    if not condition_type or not isinstance(condition_type, str):
+        return False, "Condição deve ter 'type' (string)"
+
+    if condition_type not in VALID_CONDITION_TYPES:
+        return False, f"Tipo de condição inválido: {condition_type}. Válidos: {list(VALID_CONDITION_TYPES)}"
+
+    target_step = condition.get('target_step')
+    if not target_step or not isinstance(target_step, str) or not target_step.strip():
+        return False, "Condição deve ter 'target_step' (string não vazia)"
+
+    # Validações específicas por tipo
+    if condition_type == 'text_validation':
+        validation = condition.get('validation', 'any')
+        if validation not in VALID_TEXT_VALIDATIONS:
+            return False, f"Validação de texto inválida: {validation}"
+
+        if validation in ('contains', 'equals'):
+            value = condition.get('value')
+            if not value or not isinstance(value, str):
+                return False, f"Validação '{validation}' requer 'value' (string)"
+
+    elif condition_type == 'button_click':
+        button_text = condition.get('button_text')
+        if not button_text or not isinstance(button_text, str):
+            return False, "Condição 'button_click' requer 'button_text' (string)"
+
+    elif condition_type == 'payment_status':
+        status = condition.get('status', 'paid')
+        if status not in VALID_PAYMENT_STATUSES:
+            return False, f"Status de pagamento inválido: {status}"
+
+    elif condition_type == 'time_elapsed':
+        minutes = condition.get('minutes', 5)
+        if not isinstance(minutes, (int, float)) or minutes < 1:
+            return False, "Condição 'time_elapsed' requer 'minutes' (número >= 1)"
+
+    # Validar max_attempts se presente
+    max_attempts = condition.get('max_attempts')
+    if max_attempts is not None:
+        if not isinstance(max_attempts, int) or max_attempts < 1 or max_attempts > 100:
+            return False, "max_attempts deve ser um inteiro entre 1 e 100"
+
+    # Validar fallback_step se presente
+    fallback_step = condition.get('fallback_step')
+    if fallback_step is not None:
+        if not isinstance(fallback_step, str) or not fallback_step.strip():
+            return False, "fallback_step deve ser uma string não vazia"
+
+    return True, ""
+
+
+def prepare_conditions(conditions: Any, step_id: Optional[str] = None) -> Tuple[Dict[str, Any], ...]:
+    """Condições válidas ordenadas por 'order' (inválidas são registradas e descartadas)."""
+    if not conditions or not isinstance(conditions, list):
+        return ()
+    valid_conditions = []
+    for idx, condition in enumerate(conditions):
+        is_valid, error_msg = validate_condition(condition)
+        if not is_valid:
+            logger.error(f"❌ Condição {idx} do step {step_id} inválida: {error_msg}")
+            logger.error(f"   Condição: {condition}")
+            continue
+        valid_conditions.append(condition)
+    return tuple(sorted(valid_conditions, key=lambda c: c.get('order', 0)))
+
+
+class CompiledFlow:
+    """Grafo imutável de um fluxo (uma instância por versão do fluxo)."""
+
+    __slots__ = ('version', 'steps', 'steps_list', 'successors', 'conditions', 'matchers', 'dangling')
+
+    def __init__(self, version: str, steps: Dict[str, Dict[str, Any]], steps_list: list,
+                 successors: Dict[str, Mapping[str, str]], conditions: Dict[str, tuple],
+                 matchers: Dict[str, ConditionMatcher], dangling: Tuple[Tuple[str, str, str], ...]):
+        self.version = version
+        self.steps = MappingProxyType(steps)
+        self.steps_list = steps_list
+        self.successors = MappingProxyType(successors)
+        self.conditions = MappingProxyType(conditions)
+        self.matchers = MappingProxyType(matchers)
+        self.dangling = dangling
+
+    def get(self, step_id: Any) -> Optional[Dict[str, Any]]:
+        return self.steps.get(normalize_step_id(step_id))
+
+    def __contains__(self, step_id: Any) -> bool:
+        return normalize_step_id(step_id) in self.steps
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def conditions_for(self, step_id: Any) -> tuple:
+        return self.conditions.get(normalize_step_id(step_id), ())
+
+    def matcher_for(self, step_id: Any) -> ConditionMatcher:
+        return self.matchers.get(normalize_step_id(step_id), EMPTY_MATCHER)
+
+    def successor(self, step_id: Any, edge: str) -> Optional[str]:
+        return self.successors.get(normalize_step_id(step_id), {}).get(edge)
+
+
+def _step_edges(step: Dict[str, Any], conditions: tuple) -> Dict[str, str]:
+    edges = {}
+    connections = step.get('connections') or {}
+    if isinstance(connections, dict):
+        for edge, target in connections.items():
+            if target:
+                edges[edge] = normalize_step_id(target)
+    custom_buttons = (step.get('config') or {}).get('custom_buttons') or []
+    for idx, button in enumerate(custom_buttons):
+        if isinstance(button, dict) and button.get('target_step'):
+            edges[f'button:{idx}'] = normalize_step_id(button['target_step'])
+    for idx, condition in enumerate(conditions):
+        edges[f"condition:{condition.get('id', idx)}"] = normalize_step_id(condition['target_step'])
+        if condition.get('fallback_step'):
+            edges[f"fallback:{condition.get('id', idx)}"] = normalize_step_id(condition['fallback_step'])
+    return edges
+
+
+def compile_flow(flow_steps: list, version: str = '') -> CompiledFlow:
+    """Compila a lista de steps (sem cache — use get_compiled_flow)."""
+    steps: Dict[str, Dict[str, Any]] = {}
+    for step in flow_steps or []:
+        if not isinstance(step, dict):
+            continue
+        step_id = normalize_step_id(step.get('id'))
+        if step_id and step_id not in steps:  # primeiro vence, como na busca linear
+            steps[step_id] = step
+
+    successors: Dict[str, Mapping[str, str]] = {}
+    conditions: Dict[str, tuple] = {}
+    matchers: Dict[str, ConditionMatcher] = {}
+    dangling = []
+    for step_id, step in steps.items():
+        prepared = prepare_conditions(step.get('conditions'), step_id)
+        if prepared:
+            conditions[step_id] = prepared
+            matchers[step_id] = compile_conditions(prepared, step)
+        edges = _step_edges(step, prepared)
+        successors[step_id] = MappingProxyType(edges)
+        dangling.extend((step_id, edge, target) for edge, target in edges.items() if target not in steps)
+
+    if dangling:
+        logger.warning(f"⚠️ Fluxo {version}: {len(dangling)} conexão(ões) para steps inexistentes: {dangling[:5]}")
+
+    return CompiledFlow(version, steps, list(flow_steps or []), successors, conditions, matchers, tuple(dangling))
+
+
+EMPTY_FLOW = compile_flow([], version='empty')
+
+_lock = threading.Lock()
+_by_content: 'OrderedDict[str, CompiledFlow]' = OrderedDict()
+_by_identity: 'OrderedDict[int, Tuple[str, CompiledFlow]]' = OrderedDict()
+
+
+def _remember(cache: OrderedDict, key, value) -> None:
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def get_compiled_flow(flow_steps: Union[str, list, None]) -> CompiledFlow:
+    """
+    Grafo compilado do fluxo (cache por worker).
+
+    Aceita a lista de steps ou o JSON (config do banco / snapshot do Redis).
+    JSON malformado ou tipo inválido → EMPTY_FLOW (erro registrado).
+    """
+    if not flow_steps:
+        return EMPTY_FLOW
+
+    if isinstance(flow_steps, str):
+        # Mesma string já vista neste worker: O(1) (a entrada mantém a string viva)
+        with _lock:
+            entry = _by_identity.get(id(flow_steps))
+            if entry and entry[0] is flow_steps:
+                return entry[1]
+        raw = flow_steps
+    elif isinstance(flow_steps, list):
+        raw = json.dumps(flow_steps, separators=(',', ':'), default=str)
+    else:
+        logger.error(f"❌ flow_steps tem tipo inválido: {type(flow_steps)}")
+        return EMPTY_FLOW
+
+    with _lock:
+        compiled = _by_content.get(raw)
+    if compiled is None:
+        # Cópia própria (também para listas): o chamador pode alterar os steps depois
+        try:
+            parsed = json.loads(raw)
+        except Exception as e:
+            logger.error(f"❌ Erro ao parsear flow_steps: {e}")
+            return EMPTY_FLOW
+        if not isinstance(parsed, list):
+            logger.error(f"❌ flow_steps tem tipo inválido: {type(parsed)}")
+            return EMPTY_FLOW
+        version = hashlib.sha1(raw.encode('utf-8')).hexdigest()[:12]
+        compiled = compile_flow(parsed, version=version)
+        # steps_list vai para config['flow_steps']: cópia separada dos steps do grafo
+        compiled.steps_list = json.loads(raw)
+        logger.debug(f"🧭 Fluxo {version} compilado: {len(compiled)} steps")
+
+    with _lock:
+        _remember(_by_content, raw, compiled)
+        if isinstance(flow_steps, str):
+            _remember(_by_identity, id(flow_steps), (flow_steps, compiled))
+    return compiled
+
+
+def clear_cache() -> None:
+    with _lock:
+        _by_content.clear()
+        _by_identity.clear()
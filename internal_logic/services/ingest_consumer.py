@@ -0,0 +1,217 @@
+"""
+Ingest Consumer - Consumidor dos Streams da Camada de Ingestão
+===============================================================
+Lê gb:ingest:telegram e gb:ingest:payment (services/webhook_ingest.py) no
+grupo CONSUMER_GROUP e executa a mesma lógica das rotas do app principal:
+
+    telegram  → process_telegram_update (bot, health do pool, enfileira RQ)
+    pagamento → handle_payment_webhook  (claim_webhook, auditoria, confirmação)
+
+Telegram passa por dois saltos no Redis (stream → fila RQ 'tasks'): o
+consumidor só faz as checagens baratas da rota e entrega o update ao mesmo
+process_telegram_message_async dos workers RQ. Rodar o handler aqui
+prenderia o consumidor nas chamadas à API do Telegram (segundos por /start)
+e atrasaria os XACK dos pagamentos no mesmo loop; o salto extra custa um
+enqueue RQ (HSET + RPUSH em um pipeline, sub-ms) e mantém o pool de
+workers RQ, os retries e o monitoramento da fila como estão.
+
+Vários consumidores (start_ingest_consumer.py, um por processo) dividem as
+entradas do grupo. Cada entrada só recebe XACK quando termina:
+
+- telegram  → sempre, exceto exceção / 5xx
+- pagamento → com 200 (processado ou duplicado). O gateway já recebeu 200
+              da ingestão e não reenvia, então um 404 não pode ficar
+              pendente até virar dead-letter:
+                payment ainda não existe → pending match (tasks_async,
+                    reaplicado quando o Payment for criado) e XACK
+                status não elegível / payload não reconhecido → XACK
+                falha ao confirmar um 'paid' → fica pendente (retry)
+              409/5xx ficam pendentes e voltam após RECLAIM_IDLE_MS
+- entradas pendentes há mais de RECLAIM_IDLE_MS são reivindicadas por
+  qualquer consumidor vivo (worker morto não perde webhook); após
+  MAX_DELIVERIES entregas vão para gb:ingest:dead com o motivo
+"""
+
+import json
+import logging
+import time
+from typing import Dict, List, Tuple
+
+from redis.exceptions import ResponseError
+
+from internal_logic.core.redis_manager import get_redis_connection
+from internal_logic.services.webhook_ingest import (
+    CONSUMER_GROUP, DEAD_STREAM, STREAM_MAXLEN, STREAMS, TELEGRAM_STREAM, parse_payment_body,
+)
+
+logger = logging.getLogger(__name__)
+
+READ_COUNT = 50
+BLOCK_MS = 5000
+RECLAIM_IDLE_MS = 60000
+RECLAIM_INTERVAL_SECONDS = 15
+MAX_DELIVERIES = 5
+
+# Status que confirmam o pagamento (mesma lista de _process_payment_webhook_sync)
+PAID_STATUSES = ('paid', 'approved', 'confirmed', 'completed')
+
+Entry = Tuple[str, Dict[str, str]]
+
+
+def ensure_groups(redis_conn) -> None:
+    """Cria o grupo em cada stream (idempotente)."""
+    for stream in STREAMS:
+        try:
+            redis_conn.xgroup_create(stream, CONSUMER_GROUP, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+
+def handle_entry(stream: str, fields: Dict[str, str]) -> bool:
+    """Processa uma entrada; True = concluída (XACK), False = tentar de novo."""
+    from internal_logic.core.extensions import db
+
+    db.session.rollback()  # 🔥 transação pendente da entrada anterior
+    if stream == TELEGRAM_STREAM:
+        from internal_logic.blueprints.webhooks.telegram import process_telegram_update
+
+        update = json.loads(fields['body'])
+        logger.info(f"📨 [INGEST] Telegram: Bot {fields['bot_id']} | Update ID: {update.get('update_id')}")
+        _, status = process_telegram_update(int(fields['bot_id']), update)
+        return status < 500
+
+    from internal_logic.blueprints.webhooks.payments import handle_payment_webhook
+
+    data = parse_payment_body(fields.get('body', ''), fields.get('content_type', ''))
+    logger.info(f"🚀 [INGEST] Webhook {fields['gateway_type']} recebido do stream. Processando...")
+    _, status = handle_payment_webhook(fields['gateway_type'], data)
+    if status == 404:
+        return _settle_unmatched_payment(fields['gateway_type'], data)
+    return status == 200
+
+
+def _settle_unmatched_payment(gateway_type: str, data: dict) -> bool:
+    """
+    Destino de um webhook de pagamento que voltou 404 (sem retry do gateway).
+
+    Returns:
+        True = concluído (XACK); False = falha ao confirmar, tentar de novo
+    """
+    from internal_logic.blueprints.webhooks.payments import _find_payment_by_webhook, _parse_payment_webhook
+    from tasks_async import _enqueue_pending_match
+
+    result = _parse_payment_webhook(gateway_type, data)
+    if not result:
+        logger.warning(f"⚠️ [INGEST] Webhook {gateway_type} não reconhecido pelo adapter — descartado")
+        return True
+
+    status = str(result.get('status', '')).lower()
+    payment = _find_payment_by_webhook(gateway_type, result, data)
+    if payment is None:
+        # Webhook chegou antes do commit do Payment: reaplicado na criação (ou pela varredura)
+        event_id = str(result.get('gateway_transaction_id') or '').strip()
+        event_tx = str(data.get('transaction_id') or result.get('transaction_id') or '').strip()
+        event_hash = str(result.get('gateway_hash') or data.get('transaction_hash') or data.get('hash') or '').strip()
+        event_ref = str(result.get('external_reference') or data.get('reference') or '').strip()
+        _enqueue_pending_match(
+            gateway_type=gateway_type,
+            transaction_id=event_id or event_tx,
+            transaction_hash=event_hash,
+            payload=data,
+            status=status,
+            references=[event_id, event_tx, event_ref],
+        )
+        logger.info(f"⏳ [INGEST] Payment do webhook {gateway_type} ainda não existe (tx={(event_id or event_tx)[:20]}) — pending match")
+        return True
+
+    if status in PAID_STATUSES and payment.status != 'paid':
+        return False
+    logger.info(f"ℹ️ [INGEST] Webhook {gateway_type} status='{status}' não elegível para payment {payment.id} — concluído")
+    return True
+
+
+def process_entries(redis_conn, stream: str, entries: List[Entry]) -> int:
+    """Processa as entradas e faz um XACK com as concluídas; retorna quantas."""
+    done = []
+    for entry_id, fields in entries:
+        try:
+            if handle_entry(stream, fields):
+                done.append(entry_id)
+        except Exception as e:
+            logger.error(f"❌ [INGEST] Erro na entrada {stream} {entry_id}: {e}", exc_info=True)
+    if done:
+        redis_conn.xack(stream, CONSUMER_GROUP, *done)
+    return len(done)
+
+
+def _dead_letter(redis_conn, stream: str, entries: List[Entry], reason: str) -> None:
+    pipe = redis_conn.pipeline(transaction=False)
+    for entry_id, fields in entries:
+        pipe.xadd(DEAD_STREAM, {**fields, 'stream': stream, 'entry_id': entry_id, 'reason': reason},
+                  maxlen=STREAM_MAXLEN, approximate=True)
+    pipe.xack(stream, CONSUMER_GROUP, *[entry_id for entry_id, _ in entries])
+    pipe.execute()
+    logger.error(f"☠️ [INGEST] {len(entries)} entrada(s) de {stream} em {DEAD_STREAM}: {reason}")
+
+
+def reclaim_stale(redis_conn, consumer: str) -> List[Tuple[str, List[Entry]]]:
+    """Reivindica entradas paradas há RECLAIM_IDLE_MS; as esgotadas vão para dead-letter."""
+    reclaimed = []
+    for stream in STREAMS:
+        pending = redis_conn.xpending_range(
+            stream, CONSUMER_GROUP, min='-', max='+', count=READ_COUNT, idle=RECLAIM_IDLE_MS,
+        )
+        if not pending:
+            continue
+        exhausted = [p['message_id'] for p in pending if p['times_delivered'] >= MAX_DELIVERIES]
+        retry = [p['message_id'] for p in pending if p['times_delivered'] < MAX_DELIVERIES]
+        if exhausted:
+            entries = redis_conn.xclaim(stream, CONSUMER_GROUP, consumer, RECLAIM_IDLE_MS, exhausted)
+            if entries:
+                _dead_letter(redis_conn, stream, entries, f'{MAX_DELIVERIES} entregas sem sucesso')
+        if retry:
+            entries = redis_conn.xclaim(stream, CONSUMER_GROUP, consumer, RECLAIM_IDLE_MS, retry)
+            if entries:
+                reclaimed.append((stream, entries))
+    return reclaimed
+
+
+def consume_once(redis_conn, consumer: str, block_ms: int = BLOCK_MS, count: int = READ_COUNT) -> int:
+    """Um XREADGROUP (bloqueante) nos dois streams; retorna entradas concluídas."""
+    batches = redis_conn.xreadgroup(
+        CONSUMER_GROUP, consumer, {stream: '>' for stream in STREAMS}, count=count, block=block_ms,
+    )
+    return sum(process_entries(redis_conn, stream, entries) for stream, entries in batches or [])
+
+
+def run(consumer: str, should_stop=lambda: False, redis_conn=None) -> int:
+    """
+    Loop do consumidor (processo dedicado: start_ingest_consumer.py).
+
+    Returns:
+        total de entradas concluídas até should_stop() retornar True
+    """
+    from tasks_async import _get_rq_app
+    from internal_logic.core.extensions import db
+
+    redis_conn = redis_conn or get_redis_connection()
+    ensure_groups(redis_conn)
+    app = _get_rq_app()
+    total = 0
+    next_reclaim = 0.0
+    logger.info(f"📥 [INGEST] Consumidor {consumer} ativo em {', '.join(STREAMS)}")
+
+    while not should_stop():
+        try:
+            with app.app_context():
+                if time.monotonic() >= next_reclaim:
+                    for stream, entries in reclaim_stale(redis_conn, consumer):
+                        total += process_entries(redis_conn, stream, entries)
+                    next_reclaim = time.monotonic() + RECLAIM_INTERVAL_SECONDS
+                total += consume_once(redis_conn, consumer)
+                db.session.remove()
+        except Exception as e:
+            logger.error(f"❌ [INGEST] Erro no loop do consumidor {consumer}: {e}", exc_info=True)
+            time.sleep(1)
+    return total
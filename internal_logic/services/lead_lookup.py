@@ -0,0 +1,64 @@
+"""
+Lead Lookup - Projeções Enxutas de BotUser para Caminhos Quentes
+=================================================================
+bot_users tem ~50 colunas, mas o caminho quente (mensagem recebida/enviada,
+upsert de lead, lotes de remarketing) só precisa de identidade e estado.
+
+- find_lead_ref()   → Row (id, bot_id, telegram_user_id, archived, last_interaction)
+                      servida pelo índice de cobertura idx_bot_users_slim_lookup
+                      (index-only scan no PostgreSQL)
+- slim_load()       → opção load_only para carregar a ENTIDADE só com essas
+                      colunas (para atualizar first_name/last_interaction sem
+                      trazer tracking/demografia)
+- broadcast_load()  → slim + first_name, para renderizar templates de campanha
+
+As colunas frias do model estão em grupos deferred ('tracking' e 'profile');
+quem realmente precisa delas usa undefer_group(...) na própria query.
+"""
+
+from typing import Optional
+
+from sqlalchemy.orm import load_only
+
+from internal_logic.core.extensions import db
+from internal_logic.core.models import BotUser
+
+SLIM_COLUMNS = (
+    BotUser.id,
+    BotUser.bot_id,
+    BotUser.telegram_user_id,
+    BotUser.archived,
+    BotUser.last_interaction,
+)
+
+
+def slim_load():
+    return load_only(*SLIM_COLUMNS)
+
+
+def broadcast_load():
+    return load_only(*SLIM_COLUMNS, BotUser.first_name)
+
+
+def find_lead_ref(bot_id: int, telegram_user_id, include_archived: bool = True):
+    """
+    Identidade do lead sem materializar a entidade.
+
+    Returns:
+        Row(id, bot_id, telegram_user_id, archived, last_interaction) ou None
+    """
+    query = db.session.query(*SLIM_COLUMNS).filter(
+        BotUser.bot_id == bot_id,
+        BotUser.telegram_user_id == int(telegram_user_id),
+    )
+    if not include_archived:
+        query = query.filter(BotUser.archived == False)
+    return query.first()
+
+
+def find_lead_for_update(bot_id: int, telegram_user_id) -> Optional[BotUser]:
+    """Entidade BotUser só com as colunas enxutas (colunas frias carregam sob demanda)."""
+    return BotUser.query.options(slim_load()).filter_by(
+        bot_id=bot_id,
+        telegram_user_id=int(telegram_user_id),
+    ).first()
@@ -0,0 +1,258 @@
+"""
+Lead Upsert - BotUser do /start em UM Comando
+==============================================
+Um /start fazia vários commits no mesmo BotUser: criação/atualização no
+worker (process_telegram_message_async), campaign_code do start_param,
+hidratação do tracking do Redis, reset de welcome_sent (duas vezes) e
+last_interaction em _reset_user_funnel — cada um com SELECT + UPDATE + commit.
+
+upsert_lead() grava tudo em um único
+INSERT ... ON CONFLICT (bot_id, telegram_user_id) DO UPDATE:
+
+    identidade        → first_name, username, last_interaction, archived=False
+    /start            → welcome_sent=False, welcome_sent_at=NULL
+    tracking (Redis)  → fbclid/fbp/fbc (+ last_*), UTMs, IP, user agent,
+                        tracking_session_id, click_timestamp — valor novo
+                        quando presente, senão mantém o atual
+    pixel do deep link → campaign_code só se ainda vazio
+
+O worker chama ingest_update_lead() e, só depois do commit, marca a mensagem
+com mark_lead_upserted() (LEAD_UPSERTED_FLAG); handle_start_command só refaz o upsert quando o update não passou pelo worker
+(polling). Depois disso, o /start tem no máximo mais um commit:
+mark_welcome_sent().
+
+PostgreSQL/SQLite usam ON CONFLICT; outros bancos caem no caminho ORM.
+"""
+
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import func
+
+from internal_logic.core.extensions import db
+from internal_logic.core.models import BotUser, get_brazil_time
+from internal_logic.core.redis_manager import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+# Chave marcada na mensagem do Telegram quando o worker já gravou o lead do /start
+LEAD_UPSERTED_FLAG = '_lead_upserted'
+
+PIXEL_SEPARATOR = '__px_'
+TRACKING_TOKEN_LENGTH = 32
+
+# coluna do BotUser → chave do payload tracking:{token} no Redis
+TRACKING_PAYLOAD_FIELDS = {
+    'fbclid': 'fbclid',
+    'fbp': 'fbp',
+    'fbc': 'fbc',
+    'last_fbclid': 'fbclid',
+    'last_fbp': 'fbp',
+    'last_fbc': 'fbc',
+    'user_agent': 'client_user_agent',
+    'ip_address': 'client_ip',
+    'utm_source': 'utm_source',
+    'utm_campaign': 'utm_campaign',
+    'utm_content': 'utm_content',
+    'utm_medium': 'utm_medium',
+    'utm_term': 'utm_term',
+}
+
+
+def parse_start_text(text: Optional[str]) -> Optional[str]:
+    """start_param de '/start <param>' (None sem parâmetro)."""
+    if not text or not isinstance(text, str):
+        return None
+    parts = text.split()
+    if len(parts) > 1 and parts[0].startswith('/start'):
+        return parts[1].strip()
+    return None
+
+
+def split_start_param(start_param: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Separa o pixel transportado no start_param (token__px_<pixel>) → (start_param, pixel_id)."""
+    pixel_id = None
+    if start_param and PIXEL_SEPARATOR in start_param:
+        parts = start_param.split(PIXEL_SEPARATOR, 1)
+        if parts[0]:
+            start_param = parts[0]
+        if len(parts) > 1 and parts[1]:
+            pixel_id = parts[1]
+    return start_param, pixel_id
+
+
+def load_start_tracking(start_param: Optional[str]) -> Dict[str, Any]:
+    """Colunas de tracking do payload tracking:{start_param} no Redis (só valores presentes)."""
+    if not start_param:
+        return {}
+    try:
+        redis_conn = get_redis_connection()
+        raw_payload = redis_conn.get(f"tracking:{start_param}") if redis_conn else None
+        if not raw_payload:
+            return {}
+        payload = json.loads(raw_payload)
+    except Exception as e:
+        logger.warning(f"⚠️ Falha ao ler tracking do start_param={start_param}: {e}")
+        return {}
+
+    tracking = {column: payload.get(key) for column, key in TRACKING_PAYLOAD_FIELDS.items() if payload.get(key)}
+    # V4.1: token universal de 32 chars e pixel do payload
+    if len(start_param) == TRACKING_TOKEN_LENGTH:
+        tracking['tracking_session_id'] = start_param
+    if payload.get('pixel_id'):
+        tracking['campaign_code'] = payload.get('pixel_id')
+    tracking['click_timestamp'] = datetime.now()
+    return tracking
+
+
+def upsert_lead(bot_id: int, telegram_user_id, first_name: str = '', username: str = '',
+                now: Optional[datetime] = None, tracking: Optional[Dict[str, Any]] = None,
+                campaign_code_fallback: Optional[str] = None,
+                reset_welcome: bool = False) -> Optional[Tuple[int, bool]]:
+    """
+    Cria ou atualiza o BotUser em um comando (sem commit — o chamador commita).
+
+    Args:
+        tracking: colunas de tracking a gravar (valores vazios são ignorados)
+        campaign_code_fallback: pixel do deep link, gravado só se campaign_code estiver vazio
+        reset_welcome: /start — libera um novo welcome (welcome_sent=False)
+
+    Returns:
+        (bot_user_id, is_new) ou None se não gravou
+    """
+    now = now or datetime.utcnow()
+    tracking = {column: value for column, value in (tracking or {}).items() if value}
+    values = {
+        'bot_id': bot_id,
+        'telegram_user_id': int(telegram_user_id),
+        'first_name': first_name,
+        'username': username,
+        'first_interaction': now,
+        'last_interaction': now,
+        'archived': False,
+        **tracking,
+    }
+    if campaign_code_fallback and 'campaign_code' not in tracking:
+        values['campaign_code'] = campaign_code_fallback
+    if reset_welcome:
+        values['welcome_sent'] = False
+        values['welcome_sent_at'] = None
+
+    dialect = db.engine.dialect.name
+    if dialect not in ('postgresql', 'sqlite'):
+        return _upsert_lead_orm(values, campaign_code_fallback and 'campaign_code' not in tracking)
+
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    table = BotUser.__table__
+    stmt = insert(table).values(values)
+    set_ = {
+        column: stmt.excluded[column]
+        for column in ('first_name', 'username', 'last_interaction', 'archived', *tracking)
+    }
+    if reset_welcome:
+        set_['welcome_sent'] = False
+        set_['welcome_sent_at'] = None
+    if 'campaign_code' in values and 'campaign_code' not in tracking:
+        set_['campaign_code'] = func.coalesce(func.nullif(table.c.campaign_code, ''), stmt.excluded.campaign_code)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['bot_id', 'telegram_user_id'],
+        set_=set_,
+    ).returning(table.c.id, table.c.first_interaction)
+
+    row = db.session.execute(stmt).first()
+    if row is None:
+        return None
+    # first_interaction não é atualizado no conflito: igual a `now` ⇒ a linha foi inserida agora
+    return row.id, row.first_interaction == now
+
+
+def _upsert_lead_orm(values: Dict[str, Any], campaign_code_if_empty: bool) -> Optional[Tuple[int, bool]]:
+    from internal_logic.services.lead_lookup import find_lead_for_update
+
+    user = find_lead_for_update(values['bot_id'], values['telegram_user_id'])
+    if user is None:
+        user = BotUser(**values)
+        db.session.add(user)
+        db.session.flush()
+        return user.id, True
+
+    for column, value in values.items():
+        if column in ('bot_id', 'telegram_user_id', 'first_interaction'):
+            continue
+        if column == 'campaign_code' and campaign_code_if_empty and user.campaign_code:
+            continue
+        setattr(user, column, value)
+    db.session.flush()
+    return user.id, False
+
+
+def ingest_update_lead(bot_id: int, update_data: Dict[str, Any]) -> Optional[Tuple[int, bool]]:
+    """
+    Grava o lead de um update do Telegram (worker), sem commit.
+
+    Em /start já inclui tracking, pixel do deep link e reset do welcome. A
+    mensagem não é marcada aqui: o chamador chama mark_lead_upserted() após o
+    commit (se o commit falhar, o handler ainda regrava o lead).
+
+    Returns:
+        (bot_user_id, is_new) ou None se o update não tem remetente
+    """
+    from_user = None
+    if 'message' in update_data:
+        from_user = update_data['message'].get('from')
+    elif 'callback_query' in update_data:
+        from_user = update_data['callback_query'].get('from')
+    elif 'edited_message' in update_data:
+        from_user = update_data['edited_message'].get('from')
+    if not from_user:
+        return None
+
+    text = (update_data.get('message') or {}).get('text')
+    is_start = isinstance(text, str) and text.startswith('/start')
+
+    tracking, pixel_id = None, None
+    if is_start:
+        start_param, pixel_id = split_start_param(parse_start_text(text))
+        tracking = load_start_tracking(start_param)
+
+    result = upsert_lead(
+        bot_id,
+        from_user.get('id'),
+        first_name=from_user.get('first_name', ''),
+        username=from_user.get('username', ''),
+        tracking=tracking,
+        campaign_code_fallback=pixel_id,
+        reset_welcome=is_start,
+    )
+    return result
+
+
+def mark_lead_upserted(update_data: Dict[str, Any]) -> None:
+    """Marca o /start como já gravado (chamar só depois do commit do ingest_update_lead)."""
+    message = update_data.get('message')
+    text = message.get('text') if isinstance(message, dict) else None
+    if isinstance(text, str) and text.startswith('/start'):
+        message[LEAD_UPSERTED_FLAG] = True
+
+
+def mark_welcome_sent(bot_id: int, telegram_user_id) -> bool:
+    """welcome_sent=True em um UPDATE (sem carregar a entidade) + commit."""
+    try:
+        updated = BotUser.query.filter_by(
+            bot_id=bot_id,
+            telegram_user_id=int(telegram_user_id),
+        ).update(
+            {'welcome_sent': True, 'welcome_sent_at': get_brazil_time()},
+            synchronize_session=False,
+        )
+        db.session.commit()
+        return bool(updated)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro ao marcar welcome_sent: {e}")
+        return False
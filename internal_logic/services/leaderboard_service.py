@@ -0,0 +1,336 @@
+"""
+Leaderboard Service - Ranking Mensal Pré-Computado
+===================================================
+Mantém o ranking mensal de vendedores em Redis para que a página /ranking
+renderize com lookups O(log n) em vez de agregações sobre `payments`:
+
+- gb:leaderboard:{YYYY-MM}            ZSET   user_id -> faturamento do mês
+- gb:leaderboard:{YYYY-MM}:sales      HASH   user_id -> vendas do mês
+- gb:leaderboard:{YYYY-MM}:payments   SET    payment ids já contabilizados (idempotência)
+- gb:leaderboard:{YYYY-MM}:rebuilding        marca (token) da reconstrução em andamento
+
+Atualização incremental em process_payment_confirmation / reconciliador
+(record_sale), reconciliação noturna contra o SQL (reconcile_leaderboard) e
+reconstrução sob demanda (`flask rebuild-leaderboard`, ou job RQ enfileirado
+pela página quando o mês ainda não tem ZSET).
+
+O mês de uma venda segue a mesma regra do ranking SQL: Payment.created_at
+(horário de Brasília). Apenas vendedores elegíveis (ativos, não admin, não
+banidos) entram no ZSET.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+
+from internal_logic.core.extensions import db
+from internal_logic.core.models import Bot, Payment, User, get_brazil_time
+from internal_logic.core.redis_scripts import claim_once, new_lock_token, swap_if_owner, tally_once
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'gb:leaderboard'
+# Mantém o mês corrente + alguns meses de histórico
+KEY_TTL_SECONDS = 100 * 24 * 3600
+REBUILD_CHUNK = 5000
+# Marca de reconstrução (e intervalo mínimo entre reconstruções enfileiradas)
+REBUILD_LOCK_SECONDS = 900
+
+
+def month_key(moment: Optional[datetime] = None) -> str:
+    """Chave do mês (YYYY-MM) em horário de Brasília."""
+    return (moment or get_brazil_time()).strftime('%Y-%m')
+
+
+def _keys(month: str) -> Tuple[str, str, str]:
+    base = f"{KEY_PREFIX}:{month}"
+    return base, f"{base}:sales", f"{base}:payments"
+
+
+def _rebuild_keys(month: str) -> Tuple[str, str, str]:
+    return tuple(f"{key}:rebuild" for key in _keys(month))
+
+
+def _rebuild_flag(month: str) -> str:
+    return f"{KEY_PREFIX}:{month}:rebuilding"
+
+
+def _month_bounds(month: str) -> Tuple[datetime, datetime]:
+    start = datetime.strptime(month, '%Y-%m')
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+def _get_redis():
+    from internal_logic.core.redis_manager import get_redis_connection
+    return get_redis_connection()
+
+
+def _is_eligible(user: Optional[User]) -> bool:
+    return bool(user and user.is_active and not user.is_admin and not user.is_banned)
+
+
+def record_sale(payment: Payment) -> bool:
+    """
+    Contabiliza uma venda paga no ranking do mês (idempotente por payment.id).
+
+    Chamar APÓS o commit da confirmação. Falhas de Redis não interrompem a
+    confirmação — a reconciliação noturna corrige o ZSET. Dedup e incremento
+    são um único script (redis_scripts.tally_once); durante uma reconstrução
+    a venda é espelhada nas chaves temporárias.
+
+    Returns:
+        bool: True se a venda foi contabilizada agora
+    """
+    try:
+        owner = payment.bot.owner if payment.bot else None
+        if not _is_eligible(owner) or not payment.created_at:
+            return False
+
+        month = month_key(payment.created_at)
+        return bool(tally_once(
+            _get_redis(), _keys(month), KEY_TTL_SECONDS,
+            [(payment.id, owner.id, float(payment.amount or 0))],
+            mirror=(_rebuild_flag(month), *_rebuild_keys(month)),
+        ))
+    except Exception as e:
+        logger.warning(f"⚠️ [LEADERBOARD] Falha ao contabilizar payment {payment.id}: {e}")
+        return False
+
+
+def get_top(month: Optional[str] = None, limit: int = 100) -> List[Tuple[int, float, int]]:
+    """Top `limit` do mês: lista de (user_id, faturamento, vendas)."""
+    ranking_key, sales_key, _ = _keys(month or month_key())
+    redis_conn = _get_redis()
+    rows = redis_conn.zrevrange(ranking_key, 0, limit - 1, withscores=True)
+    if not rows:
+        return []
+    user_ids = [int(member) for member, _ in rows]
+    sales = redis_conn.hmget(sales_key, user_ids)
+    return [
+        (user_id, float(score), int(sale_count or 0))
+        for (_, score), user_id, sale_count in zip(rows, user_ids, sales)
+    ]
+
+
+def _eligible_ids(user_ids: List[int]) -> set:
+    if not user_ids:
+        return set()
+    rows = db.session.query(User.id).filter(
+        User.id.in_(user_ids),
+        User.is_active == True,
+        User.is_admin == False,
+        User.is_banned == False,
+    ).all()
+    return {user_id for (user_id,) in rows}
+
+
+def get_standing(user_id: int, month: Optional[str] = None) -> Optional[Tuple[int, float, Optional[Tuple[int, float]]]]:
+    """
+    Posição do usuário entre os vendedores elegíveis do mês.
+
+    O ZSET pode conter quem ficou inelegível depois de vender (banido,
+    desativado); esses são descontados da posição e pulados como vizinho,
+    para bater com a lista filtrada do top.
+
+    Returns:
+        (posição 1-based, faturamento, (user_id, faturamento) do elegível
+        imediatamente acima ou None), ou None se não vendeu / inelegível
+    """
+    ranking_key, _, _ = _keys(month or month_key())
+    redis_conn = _get_redis()
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.zrevrank(ranking_key, user_id)
+    pipe.zscore(ranking_key, user_id)
+    rank, score = pipe.execute()
+    if rank is None or not score:
+        return None
+
+    above = redis_conn.zrevrange(ranking_key, 0, rank - 1, withscores=True) if rank else []
+    above_ids = [int(member) for member, _ in above]
+    eligible = _eligible_ids(above_ids + [user_id])
+    if user_id not in eligible:
+        return None
+
+    eligible_above = [(above_id, float(above_score))
+                      for above_id, (_, above_score) in zip(above_ids, above) if above_id in eligible]
+    neighbor = eligible_above[-1] if eligible_above else None
+    return len(eligible_above) + 1, float(score), neighbor
+
+
+def _enqueue_rebuild(redis_conn, month: str) -> None:
+    """Enfileira uma reconstrução do mês no RQ (no máximo uma a cada REBUILD_LOCK_SECONDS)."""
+    ranking_key, _, _ = _keys(month)
+    if not redis_conn.set(f"{ranking_key}:rebuild_queued", 1, nx=True, ex=REBUILD_LOCK_SECONDS):
+        return
+    try:
+        from tasks_async import task_queue, rebuild_leaderboard_async
+        if task_queue:
+            task_queue.enqueue(rebuild_leaderboard_async, month, job_timeout=REBUILD_LOCK_SECONDS)
+    except Exception as e:
+        logger.warning(f"⚠️ [LEADERBOARD] Falha ao enfileirar reconstrução de {month}: {e}")
+
+
+def load_ranking(current_user_id: int, limit: int = 100) -> Optional[Dict]:
+    """
+    Ranking do mês corrente pronto para a página /ranking.
+
+    Lê top `limit` + posição do usuário do ZSET e carrega os Users em UMA
+    query. Se o ZSET do mês ainda não existe, enfileira a reconstrução no
+    RQ e devolve None para o chamador usar o SQL nesta requisição.
+
+    Returns:
+        dict com sellers (mesmos atributos da query SQL do ranking),
+        my_position e neighbor_above; ou None se indisponível
+    """
+    month = month_key()
+    ranking_key, _, _ = _keys(month)
+    redis_conn = _get_redis()
+
+    if not redis_conn.exists(ranking_key):
+        _enqueue_rebuild(redis_conn, month)
+        return None
+
+    top = get_top(month, limit)
+    users = {
+        user.id: user for user in User.query.filter(
+            User.id.in_([user_id for user_id, _, _ in top])
+        ).all()
+    } if top else {}
+
+    sellers = []
+    for user_id, revenue, sales in top:
+        user = users.get(user_id)
+        if not _is_eligible(user):
+            continue
+        sellers.append(SimpleNamespace(
+            id=user.id,
+            username=user.username,
+            full_name=user.full_name,
+            ranking_display_name=user.ranking_display_name,
+            commission_percentage=user.commission_percentage,
+            total_revenue=user.total_revenue,
+            total_sales=user.total_sales,
+            monthly_revenue=revenue,
+            monthly_sales=sales,
+        ))
+
+    standing = get_standing(current_user_id, month)
+    neighbor_above = None
+    if standing and standing[2]:
+        position, revenue, above = standing
+        above_user = users.get(above[0]) or User.query.get(above[0])
+        neighbor_above = {
+            'position': position - 1,
+            'name': (above_user.ranking_display_name or above_user.username) if above_user else None,
+            'revenue': above[1],
+            'gap': above[1] - revenue,
+        }
+
+    return {
+        'sellers': sellers,
+        'my_position': standing[0] if standing else None,
+        'neighbor_above': neighbor_above,
+    }
+
+
+def _paid_month_query(month: str):
+    """Vendas pagas do mês de vendedores elegíveis: (payment_id, user_id, amount)."""
+    start, end = _month_bounds(month)
+    return db.session.query(
+        Payment.id.label('payment_id'),
+        Bot.user_id.label('user_id'),
+        func.coalesce(Payment.amount, 0).label('amount'),
+    ).join(
+        Bot, Payment.bot_id == Bot.id
+    ).join(
+        User, User.id == Bot.user_id
+    ).filter(
+        Payment.status == 'paid',
+        Payment.created_at >= start,
+        Payment.created_at < end,
+        User.is_active == True,
+        User.is_admin == False,
+        User.is_banned == False,
+    )
+
+
+def compute_month_from_sql(month: str) -> Dict[int, Tuple[float, int]]:
+    """Agregação de referência (SQL) do mês: user_id -> (faturamento, vendas)."""
+    base = _paid_month_query(month).subquery()
+    rows = db.session.query(
+        base.c.user_id,
+        func.sum(base.c.amount),
+        func.count(base.c.payment_id),
+    ).group_by(base.c.user_id).all()
+    return {user_id: (float(revenue), int(sales)) for user_id, revenue, sales in rows if revenue}
+
+
+def rebuild_month(month: Optional[str] = None) -> Dict[str, int]:
+    """
+    Reconstrói o ranking do mês a partir do SQL, com troca atômica.
+
+    1. marca de reconstrução (lock com token) e limpa as chaves temporárias;
+       a partir daqui record_sale espelha cada venda nelas
+    2. UMA query (ids + vendedor + valor) alimenta as temporárias pelo mesmo
+       script de dedup — venda que está na query E foi espelhada conta uma vez
+    3. swap_if_owner troca temporárias → definitivas e remove a marca
+
+    Returns:
+        dict: sellers, payments e drift (vendedores cujo valor no Redis divergia);
+        skipped=1 se outra reconstrução do mês estiver em andamento
+    """
+    month = month or month_key()
+    keys = _keys(month)
+    tmp_keys = _rebuild_keys(month)
+    flag = _rebuild_flag(month)
+    redis_conn = _get_redis()
+
+    token = new_lock_token()
+    if claim_once(redis_conn, flag, REBUILD_LOCK_SECONDS, token) is not None:
+        logger.info(f"🏆 [LEADERBOARD] Reconstrução de {month} já em andamento")
+        return {'sellers': 0, 'payments': 0, 'drift': 0, 'skipped': 1}
+    redis_conn.delete(*tmp_keys)
+
+    expected: Dict[int, Tuple[float, int]] = {}
+    total_payments = 0
+    chunk = []
+    for payment_id, user_id, amount in _paid_month_query(month).yield_per(REBUILD_CHUNK):
+        revenue, sales = expected.get(user_id, (0.0, 0))
+        expected[user_id] = (revenue + float(amount), sales + 1)
+        chunk.append((payment_id, user_id, float(amount)))
+        if len(chunk) >= REBUILD_CHUNK:
+            total_payments += tally_once(redis_conn, tmp_keys, KEY_TTL_SECONDS, chunk)
+            chunk = []
+    if chunk:
+        total_payments += tally_once(redis_conn, tmp_keys, KEY_TTL_SECONDS, chunk)
+    expected = {user_id: totals for user_id, totals in expected.items() if totals[0]}
+
+    current = dict(redis_conn.zrange(keys[0], 0, -1, withscores=True))
+    drift = sum(
+        1 for user_id, (revenue, _) in expected.items()
+        if abs(float(current.get(str(user_id), 0)) - revenue) > 0.005
+    ) + sum(1 for member in current if int(member) not in expected)
+
+    if not swap_if_owner(redis_conn, flag, token, list(zip(tmp_keys, keys)), KEY_TTL_SECONDS):
+        logger.warning(f"⚠️ [LEADERBOARD] Marca de reconstrução de {month} expirou; troca abortada")
+        return {'sellers': len(expected), 'payments': total_payments, 'drift': drift, 'skipped': 1}
+
+    result = {'sellers': len(expected), 'payments': total_payments, 'drift': drift}
+    logger.info(f"🏆 [LEADERBOARD] Ranking {month} reconstruído: {result}")
+    return result
+
+
+def reconcile_leaderboard() -> Dict[str, Dict[str, int]]:
+    """
+    Reconciliação noturna: reconstrói o mês corrente (e o anterior nos
+    primeiros dias do mês, para absorver confirmações tardias).
+    """
+    now = get_brazil_time()
+    months = [month_key(now)]
+    if now.day <= 3:
+        months.append(month_key(now.replace(day=1) - timedelta(days=1)))
+    return {month: rebuild_month(month) for month in months}
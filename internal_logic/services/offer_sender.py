@@ -15,6 +15,8 @@ import re
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List, Callable
 
+from internal_logic.services.callback_codec import encode as encode_callback
+
 logger = logging.getLogger(__name__)
 
 
@@ -52,7 +54,6 @@ def send_offer(
     mode_label = 'downsell' if is_downsell else 'upsell'
     status_expected = 'pending' if is_downsell else 'paid'
     config_enabled_key = 'downsells_enabled' if is_downsell else 'upsells_enabled'
-    callback_prefix = 'downsell_' if is_downsell else 'upsell_'
 
     logger.info(f"SEND_{mode_label.upper()} EXECUTADO")
     logger.info(f"   Timestamp: {datetime.now()}")
@@ -103,7 +104,6 @@ def send_offer(
             index=index,
             original_price=original_price,
             original_button_index=original_button_index,
-            callback_prefix=callback_prefix,
             mode_label=mode_label,
         )
         if buttons is None:
@@ -225,7 +225,6 @@ def _build_offer_buttons(
     index: int,
     original_price: float = 0,
     original_button_index: int = -1,
-    callback_prefix: str = 'downsell_',
     mode_label: str = 'downsell',
 ) -> Optional[List[Dict[str, Any]]]:
     """Constroi botoes para a oferta (modo fixo ou percentual)"""
@@ -270,7 +269,7 @@ def _build_offer_buttons(
 
                 buttons.append({
                     'text': btn_text,
-                    'callback_data': f'{callback_prefix}{index}_{int(discounted_price * 100)}_{btn_index}',
+                    'callback_data': encode_callback(mode_label, index, int(discounted_price * 100), btn_index),
                 })
 
             if not buttons:
@@ -313,7 +312,7 @@ def _build_offer_buttons(
 
             buttons = [{
                 'text': button_text,
-                'callback_data': f'{callback_prefix}{index}_{int(price * 100)}_{0}',
+                'callback_data': encode_callback(mode_label, index, int(price * 100), 0),
             }]
     else:
         price = float(offer_config.get('price', 0))
@@ -329,7 +328,7 @@ def _build_offer_buttons(
 
         buttons = [{
             'text': button_text,
-            'callback_data': f'{callback_prefix}{index}_{int(price * 100)}_{original_button_index if original_button_index >= 0 else 0}',
+            'callback_data': encode_callback(mode_label, index, int(price * 100), max(original_button_index, 0)),
         }]
 
     # Um botao por linha para ofertas (texto longo fica ileivel lado a lado)
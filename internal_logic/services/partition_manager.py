@@ -0,0 +1,242 @@
+"""
+Partition Manager - Particionamento Mensal de Tabelas de Série Temporal
+=======================================================================
+bot_messages (created_at) e webhook_events (received_at) são particionadas
+por mês no PostgreSQL (RANGE). A conversão inicial é feita por
+migrations/partition_time_series_tables.py; a tabela original vira a
+partição {tabela}_legacy (MINVALUE → primeiro mês particionado).
+
+Manutenção diária (archive_old_data / cron maintain_partitions):
+- ensure_future_partitions() → cria as partições dos próximos meses
+- retire_old_partitions()    → partições inteiramente fora da retenção são
+                               DESTACADAS (O(1), sem DELETE nem dead tuples)
+                               e renomeadas para {archive}_pYYYYMM, ou
+                               removidas com drop=True
+- archive_rows_batch()       → para tabela ainda não particionada (ou a
+                               partição legacy): move linhas antigas em
+                               lote com DELETE ... RETURNING → INSERT
+                               (atômico, sem a janela de "1 minuto")
+
+Colunas de tempo guardam horário de Brasília (get_brazil_time), então os
+limites das partições também.
+"""
+
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from internal_logic.core.extensions import db
+from internal_logic.core.models import get_brazil_time
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES: Dict[str, Dict] = {
+    'bot_messages': {
+        'column': 'created_at',
+        'retention_days': 90,
+        'archive_table': 'bot_messages_archive',
+        'batch_size': 50000,
+    },
+    'webhook_events': {
+        'column': 'received_at',
+        'retention_days': 30,
+        'archive_table': 'webhook_events_archive',
+        'batch_size': 10000,
+    },
+}
+
+MONTHS_AHEAD = 3
+LEGACY_SUFFIX = '_legacy'
+
+_BOUND_PATTERN = re.compile(r"TO \((MAXVALUE|'([^']+)')\)")
+_LOWER_PATTERN = re.compile(r"FROM \((MINVALUE|'([^']+)')\)")
+
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(value: datetime, months: int) -> datetime:
+    index = value.year * 12 + (value.month - 1) + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def hot_window_start(table: str, now: Optional[datetime] = None) -> datetime:
+    """Início da janela de retenção da tabela (linhas anteriores vão para o archive)."""
+    return (now or get_brazil_time()) - timedelta(days=PARTITIONED_TABLES[table]['retention_days'])
+
+
+def is_postgresql() -> bool:
+    return db.engine.dialect.name == 'postgresql'
+
+
+def is_partitioned(table: str) -> bool:
+    if not is_postgresql():
+        return False
+    return bool(db.session.execute(text("""
+        SELECT 1 FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = :table AND c.relnamespace = to_regnamespace(current_schema())::oid
+    """), {'table': table}).scalar())
+
+
+def _parse_bound(pattern, expression: str) -> Optional[datetime]:
+    match = pattern.search(expression or '')
+    if not match or not match.group(2):
+        return None  # MINVALUE/MAXVALUE
+    return datetime.fromisoformat(match.group(2))
+
+
+def list_partitions(table: str) -> List[Tuple[str, Optional[datetime], Optional[datetime]]]:
+    """[(nome, limite inferior, limite superior)] — None = MINVALUE/MAXVALUE."""
+    rows = db.session.execute(text("""
+        SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+        FROM pg_inherits i
+        JOIN pg_class parent ON parent.oid = i.inhparent
+        JOIN pg_class child ON child.oid = i.inhrelid
+        WHERE parent.relname = :table AND parent.relnamespace = to_regnamespace(current_schema())::oid
+    """), {'table': table}).fetchall()
+    partitions = [
+        (name, _parse_bound(_LOWER_PATTERN, bound), _parse_bound(_BOUND_PATTERN, bound))
+        for name, bound in rows
+    ]
+    return sorted(partitions, key=lambda p: p[1] or datetime.min)
+
+
+def _covered(partitions, month: datetime) -> bool:
+    return any(
+        (lower is None or lower <= month) and (upper is None or month < upper)
+        for _, lower, upper in partitions
+    )
+
+
+def ensure_future_partitions(table: str, months_ahead: int = MONTHS_AHEAD,
+                             now: Optional[datetime] = None) -> List[str]:
+    """Cria as partições do mês corrente até months_ahead meses à frente."""
+    partitions = list_partitions(table)
+    current = month_start(now or get_brazil_time())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if _covered(partitions, month):
+            continue
+        name = partition_name(table, month)
+        db.session.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+        ))
+        db.session.commit()
+        partitions.append((name, month, add_months(month, 1)))
+        created.append(name)
+        logger.info(f"🧱 [PARTITIONS] {name} criada")
+    return created
+
+
+def _detach(table: str, partition: str) -> None:
+    concurrently = db.session.execute(text("SHOW server_version_num")).scalar()
+    concurrently = 'CONCURRENTLY' if int(concurrently) >= 140000 else ''
+    db.session.commit()  # DETACH CONCURRENTLY espera as transações abertas (inclusive a nossa)
+    # DETACH CONCURRENTLY não roda dentro de transação
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SET lock_timeout = '5s'"))
+        conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition} {concurrently}"))
+
+
+def retire_old_partitions(table: str, drop: bool = False, now: Optional[datetime] = None) -> List[str]:
+    """
+    Destaca as partições cujo limite superior já saiu da janela de retenção.
+    Sem drop, a partição destacada vira {archive}_pYYYYMM (dados preservados).
+    """
+    spec = PARTITIONED_TABLES[table]
+    cutoff = hot_window_start(table, now)
+    retired = []
+    for name, lower, upper in list_partitions(table):
+        if upper is None or upper > cutoff:
+            continue
+        _detach(table, name)
+        if drop:
+            db.session.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            action = 'removida'
+        else:
+            suffix = 'legacy' if lower is None else f"p{lower:%Y%m}"
+            archived_name = f"{spec['archive_table']}_{suffix}"
+            db.session.execute(text(f"ALTER TABLE {name} RENAME TO {archived_name}"))
+            action = f'arquivada como {archived_name}'
+        db.session.commit()
+        retired.append(name)
+        logger.info(f"📦 [PARTITIONS] {name} destacada e {action}")
+    return retired
+
+
+def _model_columns(table: str) -> str:
+    from internal_logic.core.models import BotMessage, WebhookEvent
+
+    model = {'bot_messages': BotMessage, 'webhook_events': WebhookEvent}[table]
+    return ', '.join(column.name for column in model.__table__.columns)
+
+
+def archive_rows_batch(table: str, source: Optional[str] = None, now: Optional[datetime] = None) -> int:
+    """
+    Move um lote de linhas fora da retenção para a tabela de archive.
+
+    DELETE ... RETURNING alimenta o INSERT na mesma instrução: só as linhas
+    efetivamente removidas vão para o archive (sem corrida com outro worker).
+    """
+    spec = PARTITIONED_TABLES[table]
+    source = source or table
+    columns = _model_columns(table)
+    result = db.session.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM {source}
+            WHERE id IN (
+                SELECT id FROM {source}
+                WHERE {spec['column']} < :cutoff
+                ORDER BY id
+                LIMIT :batch_size
+            )
+            RETURNING {columns}
+        )
+        INSERT INTO {spec['archive_table']} ({columns}, archived_at)
+        SELECT {columns}, NOW() FROM moved
+    """), {'cutoff': hot_window_start(table, now), 'batch_size': spec['batch_size']})
+    db.session.commit()
+    return result.rowcount or 0
+
+
+def maintain_table(table: str, drop: bool = False) -> Dict:
+    summary = {'partitioned': False, 'created': [], 'retired': [], 'archived_rows': 0}
+    if not is_postgresql():
+        return summary
+
+    if is_partitioned(table):
+        summary['partitioned'] = True
+        summary['created'] = ensure_future_partitions(table)
+        summary['retired'] = retire_old_partitions(table, drop=drop)
+        # A partição legacy recebe o mesmo tratamento em lote até sair inteira da retenção
+        legacy = f"{table}{LEGACY_SUFFIX}"
+        if any(name == legacy for name, _, _ in list_partitions(table)):
+            summary['archived_rows'] = archive_rows_batch(table, source=legacy)
+    else:
+        summary['archived_rows'] = archive_rows_batch(table)
+    return summary
+
+
+def maintain_all(drop: bool = False) -> Dict[str, Dict]:
+    """Manutenção diária de todas as tabelas (erros isolados por tabela)."""
+    results = {}
+    for table in PARTITIONED_TABLES:
+        try:
+            results[table] = maintain_table(table, drop=drop)
+            logger.info(f"📦 [PARTITIONS] {table}: {results[table]}")
+        except Exception as e:
+            db.session.rollback()
+            results[table] = {'error': str(e)}
+            logger.error(f"❌ [PARTITIONS] Manutenção de {table} falhou: {e}")
+    return results
@@ -496,7 +496,9 @@ def generate_pix_payment(bot_id: int, amount: float, description: str,
                     logger.info(f"PIX gerado com sucesso pelo gateway!")
 
                 from internal_logic.core.models import BotUser
-                bot_user = BotUser.query.filter_by(
+                from sqlalchemy.orm import undefer_group
+                # utm/fbclid/tracking_session_id são lidos logo abaixo: carregar o grupo junto
+                bot_user = BotUser.query.options(undefer_group('tracking')).filter_by(
                     bot_id=bot_id,
                     telegram_user_id=customer_user_id
                 ).first()
@@ -506,7 +508,7 @@ def generate_pix_payment(bot_id: int, amount: float, description: str,
                     except (TypeError, ValueError):
                         bot_user_int = None
                     if bot_user_int is not None:
-                        bot_user = BotUser.query.filter_by(
+                        bot_user = BotUser.query.options(undefer_group('tracking')).filter_by(
                             bot_id=bot_id,
                             telegram_user_id=str(bot_user_int)
                         ).first()
@@ -720,7 +722,7 @@ def generate_pix_payment(bot_id: int, amount: float, description: str,
 
                 bot_user_for_payment = None
                 if customer_user_id:
-                    bot_user_for_payment = BotUser.query.filter_by(
+                    bot_user_for_payment = BotUser.query.options(undefer_group('tracking')).filter_by(
                         bot_id=bot_id,
                         telegram_user_id=str(customer_user_id),
                         archived=False
@@ -805,11 +807,16 @@ def generate_pix_payment(bot_id: int, amount: float, description: str,
                 else:
                     logger.warning(f"[TOKEN AUSENTE] Nao salvando tracking data no Redis (tracking_token e None)")
 
-                gateway.total_transactions += 1
-
                 try:
                     db.session.commit()
                     logger.info(f"Payment {payment.id} commitado com sucesso")
+                    from internal_logic.services.counter_buffer import increment
+                    increment('gateway_transactions', gateway.id)
+                    try:
+                        from tasks_async import notify_payment_registered
+                        notify_payment_registered(payment)
+                    except Exception as pending_error:
+                        logger.warning(f"Falha ao verificar pending webhooks do payment {payment.id}: {pending_error}")
                 except IntegrityError as integrity_error:
                     db.session.rollback()
                     logger.error(f"[ERRO DE INTEGRIDADE] Erro ao commitar Payment: {integrity_error}", exc_info=True)
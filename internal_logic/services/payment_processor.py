@@ -16,9 +16,9 @@ from datetime import datetime
 
 from flask import url_for, current_app
 from internal_logic.core.extensions import db, socketio
+from internal_logic.services.realtime_bus import emit_to_user
 # Import lazy dentro das funcoes para quebrar dependencia circular
-from internal_logic.core.models import Payment, PoolBot, BotUser, Gateway, User, RemarketingCampaign, BotMessage
-from gateways import GatewayFactory
+from internal_logic.core.models import Payment, PoolBot, BotUser, User, BotMessage
 
 logger = logging.getLogger(__name__)
 
@@ -56,11 +56,11 @@ def get_pixel_id_for_payment(payment: Payment) -> Optional[str]:
         return pool.meta_pixel_id
     
     # PRIORIDADE 4: campaign_code do BotUser (sticky pixel, último recurso)
-    bot_user_for_pixel = BotUser.query.filter_by(
+    # Só campaign_code (coluna fria): projeção em vez da entidade inteira
+    pixel_from_user = db.session.query(BotUser.campaign_code).filter_by(
         bot_id=payment.bot_id, 
-        telegram_user_id=str(payment.customer_user_id)
-    ).first() if payment.customer_user_id else None
-    pixel_from_user = getattr(bot_user_for_pixel, 'campaign_code', None) if bot_user_for_pixel else None
+        telegram_user_id=payment.lead_id
+    ).scalar() if payment.lead_id is not None else None
     return pixel_from_user
 
 
@@ -197,8 +197,8 @@ def _send_payment_delivery_v41_unused(payment: Payment, bot_manager=None, socket
         
         # 7.5 - V4.1: Enviar mensagem via Telegram
         if not bot_manager:
-            from bot_manager import BotManager
-            bot_manager = BotManager(socketio=socketio, scheduler=None, user_id=payment.bot.user_id)
+            from internal_logic.core.service_registry import get_bot_manager
+            bot_manager = get_bot_manager(payment.bot.user_id, socketio=socketio)
         
         if link_to_send:
             message = (
@@ -237,9 +237,9 @@ def send_payment_delivery_legacy(payment: Payment, bot_manager=None, socketio=No
             logger.warning(f"⚠️ Payment ou bot inválido para envio de entregável: payment={payment}")
             return False
         
-        # ✅ ISOLAMENTO: Criar BotManager localmente com user_id do payment
-        from bot_manager import BotManager
-        local_bot_manager = BotManager(socketio=socketio, scheduler=None, user_id=payment.bot.user_id)
+        # ✅ ISOLAMENTO: BotManager do dono do payment (reutilizado no processo)
+        from internal_logic.core.service_registry import get_bot_manager
+        local_bot_manager = get_bot_manager(payment.bot.user_id, socketio=socketio)
         
         # ✅ CRÍTICO: Não enviar entregável se pagamento não estiver 'paid'
         allowed_status = ['paid']
@@ -287,11 +287,10 @@ def send_payment_delivery_legacy(payment: Payment, bot_manager=None, socketio=No
         if not pixel_id_to_use:
             pixel_id_to_use = pool.meta_pixel_id if pool else None
         if not pixel_id_to_use:
-            bot_user_for_pixel = BotUser.query.filter_by(
+            pixel_id_to_use = db.session.query(BotUser.campaign_code).filter_by(
                 bot_id=payment.bot_id, 
-                telegram_user_id=str(payment.customer_user_id)
-            ).first() if payment.customer_user_id else None
-            pixel_id_to_use = getattr(bot_user_for_pixel, 'campaign_code', None) if bot_user_for_pixel else None
+                telegram_user_id=payment.lead_id
+            ).scalar() if payment.lead_id is not None else None
 
         has_meta_pixel = bool(pool and pool.meta_tracking_enabled and pixel_id_to_use)
         
@@ -388,6 +387,128 @@ Aproveite! 🚀
         return False
 
 
+def apply_paid_statistics(payment: Payment) -> None:
+    """
+    Aplica os efeitos contábeis de um pagamento recém-confirmado (SEM COMMIT).
+
+    Atualiza estatísticas de bot, dono, gateway e remarketing, registra a
+    comissão da plataforma e a gamificação. Compartilhado entre o webhook
+    (process_payment_confirmation) e o motor de reconciliação.
+    """
+    from internal_logic.core.models import get_brazil_time, Gateway, Commission, RemarketingCampaign
+    
+    # ✅ ATUALIZAR ESTATÍSTICAS DO BOT
+    payment.bot.total_sales += 1
+    payment.bot.total_revenue += payment.amount
+    
+    # ✅ ATUALIZAR ESTATÍSTICAS DO USUÁRIO (owner)
+    payment.bot.owner.total_sales += 1
+    payment.bot.owner.total_revenue += payment.amount
+    
+    # ✅ ATUALIZAR ESTATÍSTICAS DO GATEWAY
+    if payment.gateway_type:
+        gateway = Gateway.query.filter_by(
+            user_id=payment.bot.user_id,
+            gateway_type=payment.gateway_type
+        ).first()
+        if gateway:
+            gateway.total_transactions += 1
+            gateway.successful_transactions += 1
+            logger.info(f"✅ Estatísticas do gateway {gateway.gateway_type} atualizadas: {gateway.total_transactions} transações, {gateway.successful_transactions} bem-sucedidas")
+    
+    # ✅ ATUALIZAR ESTATÍSTICAS DE REMARKETING
+    if hasattr(payment, 'is_remarketing') and payment.is_remarketing and hasattr(payment, 'remarketing_campaign_id') and payment.remarketing_campaign_id:
+        campaign = RemarketingCampaign.query.get(payment.remarketing_campaign_id)
+        if campaign:
+            campaign.total_sales += 1
+            campaign.revenue_generated += float(payment.amount)
+            logger.info(f"✅ Estatísticas de remarketing atualizadas: Campanha {campaign.id} | Vendas: {campaign.total_sales} | Receita: R$ {campaign.revenue_generated:.2f}")
+        else:
+            logger.warning(f"⚠️ Campanha de remarketing {payment.remarketing_campaign_id} não encontrada para payment {payment.id}")
+    
+    # ✅ OUTBOX DO PURCHASE (Meta CAPI server-side) — mesma transação do 'paid'
+    try:
+        from internal_logic.services.server_tracking.purchase_reconciler import enqueue_purchase
+        with db.session.begin_nested():
+            enqueue_purchase(payment)
+    except Exception as e:
+        logger.warning(f"⚠️ Purchase do payment {payment.id} não entrou no outbox (varredura do reconciler cobre): {e}")
+    
+    # ============================================================================
+    # REGISTRAR COMISSÃO
+    # ============================================================================
+    # Verificar se já existe comissão para este pagamento
+    existing_commission = Commission.query.filter_by(payment_id=payment.id).first()
+    
+    if not existing_commission:
+        # Calcular e registrar receita da plataforma (split payment automático)
+        commission_amount = payment.bot.owner.add_commission(payment.amount)
+        
+        commission = Commission(
+            user_id=payment.bot.owner.id,
+            payment_id=payment.id,
+            bot_id=payment.bot.id,
+            sale_amount=payment.amount,
+            commission_amount=commission_amount,
+            commission_rate=payment.bot.owner.commission_percentage,
+            status='paid',  # Split payment cai automaticamente
+            paid_at=get_brazil_time()  # Pago no mesmo momento da venda
+        )
+        db.session.add(commission)
+        
+        # Atualizar receita já paga (split automático via SyncPay)
+        payment.bot.owner.total_commission_paid += commission_amount
+        
+        logger.info(f"💰 Receita da plataforma: R$ {commission_amount:.2f} (split automático) - Usuário: {payment.bot.owner.email}")
+    
+    # ============================================================================
+    # GAMIFICAÇÃO V2.0 - ATUALIZAR STREAK, RANKING E CONQUISTAS
+    # ============================================================================
+    try:
+        # FIXME: Descomentar quando módulos de gamificação forem migrados
+        # from gamification import GAMIFICATION_V2_ENABLED, RankingEngine, AchievementChecker, check_and_unlock_achievements
+        # from gamification_websocket import notify_achievement_unlocked
+        
+        GAMIFICATION_V2_ENABLED = False  # Temporariamente desabilitado
+        
+        if GAMIFICATION_V2_ENABLED:
+            # Atualizar streak
+            payment.bot.owner.update_streak(payment.created_at)
+            
+            # Recalcular ranking com algoritmo V2
+            old_points = payment.bot.owner.ranking_points or 0
+            payment.bot.owner.ranking_points = RankingEngine.calculate_points(payment.bot.owner)
+            new_points = payment.bot.owner.ranking_points
+            
+            # Verificar conquistas V2
+            new_achievements = AchievementChecker.check_all_achievements(payment.bot.owner)
+            
+            if new_achievements:
+                logger.info(f"🎉 {len(new_achievements)} conquista(s) V2 desbloqueada(s)!")
+                
+                # Notificar via WebSocket
+                if socketio:
+                    for ach in new_achievements:
+                        notify_achievement_unlocked(socketio, payment.bot.owner.id, ach)
+            
+            # Atualizar ligas (pode ser async em produção)
+            RankingEngine.update_leagues()
+            
+            logger.info(f"📊 Gamificação V2: {old_points:,} → {new_points:,} pts")
+            
+        else:
+            # Fallback para sistema V1 (antigo)
+            payment.bot.owner.update_streak(payment.created_at)
+            payment.bot.owner.ranking_points = payment.bot.owner.calculate_ranking_points()
+            # new_badges = check_and_unlock_achievements(payment.bot.owner)
+            
+            # if new_badges:
+            #     logger.info(f"🎉 {len(new_badges)} nova(s) conquista(s) desbloqueada(s)!")
+                
+    except Exception as e:
+        logger.error(f"❌ Erro na gamificação: {e}")
+
+
 def process_payment_confirmation(payment: Payment, gateway_type: str, bot_manager=None, socketio=None) -> dict:
     """
     Processa a confirmação de pagamento e executa ações pós-venda.
@@ -403,8 +524,7 @@ def process_payment_confirmation(payment: Payment, gateway_type: str, bot_manage
     Returns:
         dict: Status do processamento
     """
-    from internal_logic.core.models import get_brazil_time, Gateway, Commission, Subscription, User, RemarketingCampaign
-    from bot_manager import BotManager
+    from internal_logic.core.models import get_brazil_time, Subscription
     
     status = 'paid'  # Webhook sempre confirma como 'paid'
     
@@ -532,109 +652,7 @@ def process_payment_confirmation(payment: Payment, gateway_type: str, bot_manage
         logger.info(f"✅ Processando pagamento confirmado (era pending): {payment.payment_id}")
         
         payment.paid_at = get_brazil_time()
-        
-        # ✅ ATUALIZAR ESTATÍSTICAS DO BOT
-        payment.bot.total_sales += 1
-        payment.bot.total_revenue += payment.amount
-        
-        # ✅ ATUALIZAR ESTATÍSTICAS DO USUÁRIO (owner)
-        payment.bot.owner.total_sales += 1
-        payment.bot.owner.total_revenue += payment.amount
-        
-        # ✅ ATUALIZAR ESTATÍSTICAS DO GATEWAY
-        if payment.gateway_type:
-            gateway = Gateway.query.filter_by(
-                user_id=payment.bot.user_id,
-                gateway_type=payment.gateway_type
-            ).first()
-            if gateway:
-                gateway.total_transactions += 1
-                gateway.successful_transactions += 1
-                logger.info(f"✅ Estatísticas do gateway {gateway.gateway_type} atualizadas: {gateway.total_transactions} transações, {gateway.successful_transactions} bem-sucedidas")
-        
-        # ✅ ATUALIZAR ESTATÍSTICAS DE REMARKETING
-        if hasattr(payment, 'is_remarketing') and payment.is_remarketing and hasattr(payment, 'remarketing_campaign_id') and payment.remarketing_campaign_id:
-            campaign = RemarketingCampaign.query.get(payment.remarketing_campaign_id)
-            if campaign:
-                campaign.total_sales += 1
-                campaign.revenue_generated += float(payment.amount)
-                logger.info(f"✅ Estatísticas de remarketing atualizadas: Campanha {campaign.id} | Vendas: {campaign.total_sales} | Receita: R$ {campaign.revenue_generated:.2f}")
-            else:
-                logger.warning(f"⚠️ Campanha de remarketing {payment.remarketing_campaign_id} não encontrada para payment {payment.id}")
-        
-        # ============================================================================
-        # REGISTRAR COMISSÃO
-        # ============================================================================
-        # Verificar se já existe comissão para este pagamento
-        existing_commission = Commission.query.filter_by(payment_id=payment.id).first()
-        
-        if not existing_commission:
-            # Calcular e registrar receita da plataforma (split payment automático)
-            commission_amount = payment.bot.owner.add_commission(payment.amount)
-            
-            commission = Commission(
-                user_id=payment.bot.owner.id,
-                payment_id=payment.id,
-                bot_id=payment.bot.id,
-                sale_amount=payment.amount,
-                commission_amount=commission_amount,
-                commission_rate=payment.bot.owner.commission_percentage,
-                status='paid',  # Split payment cai automaticamente
-                paid_at=get_brazil_time()  # Pago no mesmo momento da venda
-            )
-            db.session.add(commission)
-            
-            # Atualizar receita já paga (split automático via SyncPay)
-            payment.bot.owner.total_commission_paid += commission_amount
-            
-            logger.info(f"💰 Receita da plataforma: R$ {commission_amount:.2f} (split automático) - Usuário: {payment.bot.owner.email}")
-        
-        # ============================================================================
-        # GAMIFICAÇÃO V2.0 - ATUALIZAR STREAK, RANKING E CONQUISTAS
-        # ============================================================================
-        try:
-            # FIXME: Descomentar quando módulos de gamificação forem migrados
-            # from gamification import GAMIFICATION_V2_ENABLED, RankingEngine, AchievementChecker, check_and_unlock_achievements
-            # from gamification_websocket import notify_achievement_unlocked
-            
-            GAMIFICATION_V2_ENABLED = False  # Temporariamente desabilitado
-            
-            if GAMIFICATION_V2_ENABLED:
-                # Atualizar streak
-                payment.bot.owner.update_streak(payment.created_at)
-                
-                # Recalcular ranking com algoritmo V2
-                old_points = payment.bot.owner.ranking_points or 0
-                payment.bot.owner.ranking_points = RankingEngine.calculate_points(payment.bot.owner)
-                new_points = payment.bot.owner.ranking_points
-                
-                # Verificar conquistas V2
-                new_achievements = AchievementChecker.check_all_achievements(payment.bot.owner)
-                
-                if new_achievements:
-                    logger.info(f"🎉 {len(new_achievements)} conquista(s) V2 desbloqueada(s)!")
-                    
-                    # Notificar via WebSocket
-                    if socketio:
-                        for ach in new_achievements:
-                            notify_achievement_unlocked(socketio, payment.bot.owner.id, ach)
-                
-                # Atualizar ligas (pode ser async em produção)
-                RankingEngine.update_leagues()
-                
-                logger.info(f"📊 Gamificação V2: {old_points:,} → {new_points:,} pts")
-                
-            else:
-                # Fallback para sistema V1 (antigo)
-                payment.bot.owner.update_streak(payment.created_at)
-                payment.bot.owner.ranking_points = payment.bot.owner.calculate_ranking_points()
-                # new_badges = check_and_unlock_achievements(payment.bot.owner)
-                
-                # if new_badges:
-                #     logger.info(f"🎉 {len(new_badges)} nova(s) conquista(s) desbloqueada(s)!")
-                    
-        except Exception as e:
-            logger.error(f"❌ Erro na gamificação: {e}")
+        apply_paid_statistics(payment)
     
     # ============================================================================
     # ✅ CORREÇÃO CRÍTICA: COMMIT ANTES DE ENVIAR ENTREGÁVEL E META PIXEL
@@ -642,6 +660,14 @@ def process_payment_confirmation(payment: Payment, gateway_type: str, bot_manage
     db.session.commit()
     logger.info(f"🔔 Webhook -> payment {payment.payment_id} atualizado para paid e commitado")
     
+    # 🏆 Ranking mensal (idempotente por payment.id) + 📊 cubo de analytics + resumo admin
+    if deve_processar_estatisticas:
+        from internal_logic.services.leaderboard_service import record_sale
+        from internal_logic.services import admin_summary, analytics_cube
+        record_sale(payment)
+        analytics_cube.record_sale(payment)
+        admin_summary.record_sale(payment)
+    
     # ============================================================================
     # ✅ SISTEMA DE ASSINATURAS - Criar subscription quando payment confirmado
     # ============================================================================
@@ -709,13 +735,13 @@ def process_payment_confirmation(payment: Payment, gateway_type: str, bot_manage
             # ✅ EMITIR WEBSOCKET para atualizar dashboard em tempo real
             try:
                 if payment.bot and payment.bot.user_id:
-                    socketio.emit('payment_update', {
+                    emit_to_user(payment.bot.user_id, 'payment_update', {
                         'payment_id': payment.id,
                         'status': 'paid',
                         'amount': float(payment.amount),
                         'bot_id': payment.bot_id,
-                    }, room=f'user_{payment.bot.user_id}')
-                    logger.info(f"✅ WebSocket emitido para user_{payment.bot.user_id}")
+                    })
+                    logger.info(f"✅ WebSocket emitido para user:{payment.bot.user_id}")
             except Exception as ws_error:
                 logger.error(f"❌ Erro ao emitir WebSocket: {ws_error}")
         else:
@@ -747,754 +773,49 @@ def process_payment_confirmation(payment: Payment, gateway_type: str, bot_manage
 # ==================== RECONCILIADORES (LAZARUS RECOVERY - 2026-04-06) ====================
 
 
+# Os reconciliadores por gateway delegam ao motor único (payment_reconciler),
+# mantidos com os nomes antigos para cron/RQ já agendados.
+
 def reconcile_paradise_payments():
-    """
-    Consulta periodicamente pagamentos pendentes da Paradise (BATCH LIMITADO para evitar spam).
-    ✅ LAZARUS RECOVERY: Lógica real recuperada do app.py em 2026-04-06
-    """
-    try:
-        with current_app.app_context():
-            from internal_logic.core.models import Payment, Gateway, db, Bot, get_brazil_time, User, RemarketingCampaign
-            
-            # ✅ BATCH LIMITADO: apenas 5 por execução para evitar spam
-            # ✅ CORREÇÃO CRÍTICA: Buscar MAIS RECENTES primeiro (created_at DESC)
-            pending = Payment.query.filter_by(
-                status='pending', 
-                gateway_type='paradise'
-            ).order_by(Payment.created_at.desc()).limit(5).all()
-            
-            if not pending:
-                logger.debug("🔍 Reconciliador Paradise: Nenhum payment pendente encontrado")
-                return
-            
-            logger.info(f"🔍 Reconciliador Paradise: Consultando {len(pending)} payment(s) mais recente(s)")
-            
-            # Agrupar por user_id para reusar instância do gateway
-            gateways_by_user = {}
-            
-            for p in pending:
-                try:
-                    # Buscar gateway do dono do bot
-                    user_id = p.bot.user_id if p.bot else None
-                    if not user_id:
-                        continue
-                    
-                    if user_id not in gateways_by_user:
-                        gw = Gateway.query.filter_by(
-                            user_id=user_id, 
-                            gateway_type='paradise', 
-                            is_active=True, 
-                            is_verified=True
-                        ).first()
-                        if not gw:
-                            continue
-                        
-                        creds = {
-                            'api_key': gw.api_key,
-                            'product_hash': gw.product_hash,
-                            'offer_hash': gw.offer_hash,
-                            'store_id': gw.store_id,
-                            'split_percentage': gw.split_percentage or 2.0,
-                        }
-                        g = GatewayFactory.create_gateway('paradise', creds)
-                        if not g:
-                            continue
-                        gateways_by_user[user_id] = g
-                    
-                    gateway = gateways_by_user[user_id]
-                    
-                    # ✅ CORREÇÃO CRÍTICA: Para Paradise, hash é o campo 'id' retornado
-                    hash_or_id = p.gateway_transaction_hash or p.gateway_transaction_id
-                    if not hash_or_id:
-                        logger.warning(f"⚠️ Paradise Payment {p.id} ({p.payment_id}): sem hash ou transaction_id para consulta")
-                        continue
-                    
-                    logger.info(f"🔍 Paradise: Consultando payment {p.id} ({p.payment_id})")
-                    
-                    # ✅ Tentar primeiro com hash/id
-                    result = gateway.get_payment_status(str(hash_or_id))
-                    
-                    # ✅ Se falhar e tiver transaction_id diferente, tentar com ele também
-                    if not result and p.gateway_transaction_id and p.gateway_transaction_id != hash_or_id:
-                        result = gateway.get_payment_status(str(p.gateway_transaction_id))
-                    
-                    if result and result.get('status') == 'paid':
-                        # Atualizar pagamento e estatísticas
-                        p.status = 'paid'
-                        p.paid_at = get_brazil_time()
-                        if p.bot:
-                            p.bot.total_sales += 1
-                            p.bot.total_revenue += p.amount
-                            if p.bot.user_id:
-                                user = User.query.get(p.bot.user_id)
-                                if user:
-                                    user.total_sales += 1
-                                    user.total_revenue += p.amount
-                        
-                        # ✅ ATUALIZAR ESTATÍSTICAS DE REMARKETING
-                        if p.is_remarketing and p.remarketing_campaign_id:
-                            campaign = RemarketingCampaign.query.get(p.remarketing_campaign_id)
-                            if campaign:
-                                campaign.total_sales += 1
-                                campaign.revenue_generated += float(p.amount)
-                        
-                        db.session.commit()
-                        logger.info(f"✅ Paradise: Payment {p.id} atualizado para paid via reconciliação")
-                        
-                        # ✅ REFRESH payment após commit
-                        db.session.refresh(p)
-                        
-                        # ✅ ENVIAR ENTREGÁVEL AO CLIENTE
-                        try:
-                            payment_obj = Payment.query.get(p.id)
-                            if payment_obj:
-                                db.session.refresh(payment_obj)
-                                if payment_obj.status == 'paid':
-                                    send_payment_delivery(payment_obj)
-                        except Exception as e:
-                            logger.error(f"❌ Erro ao enviar entregável via reconciliação: {e}")
-                        
-                        # ✅ Emitir evento em tempo real
-                        try:
-                            if p.bot and p.bot.user_id:
-                                socketio.emit('payment_update', {
-                                    'payment_id': p.id,
-                                    'status': 'paid',
-                                    'amount': float(p.amount),
-                                    'bot_id': p.bot_id,
-                                }, room=f'user_{p.bot.user_id}')
-                        except Exception as e:
-                            logger.error(f"❌ Erro ao emitir WebSocket: {e}")
-                        
-                        # ✅ UPSELLS AUTOMÁTICOS
-                        if p.bot and p.bot.config and p.bot.config.upsells_enabled:
-                            try:
-                                upsells = p.bot.config.get_upsells()
-                                if upsells:
-                                    matched_upsells = [
-                                        u for u in upsells 
-                                        if not u.get('trigger_product') or u.get('trigger_product') == p.product_name
-                                    ]
-                                    if matched_upsells:
-                                        local_bot_manager = BotManager(
-                                            socketio=None, 
-                                            scheduler=None, 
-                                            user_id=p.bot.user_id
-                                        )
-                                        local_bot_manager.schedule_upsells(
-                                            bot_id=p.bot_id,
-                                            payment_id=p.payment_id,
-                                            chat_id=int(p.customer_user_id),
-                                            upsells=matched_upsells,
-                                            original_price=p.amount,
-                                            original_button_index=-1
-                                        )
-                                        logger.info(f"📅 Upsells agendados para payment {p.payment_id}")
-                            except Exception as e:
-                                logger.error(f"❌ Erro ao processar upsells: {e}", exc_info=True)
-                except Exception as e:
-                    logger.error(f"❌ Erro ao reconciliar payment {p.id}: {e}", exc_info=True)
-                    continue
-    except Exception as e:
-        logger.error(f"❌ Reconciliador Paradise: erro: {e}", exc_info=True)
+    """Reconciliação Paradise via motor único."""
+    from internal_logic.services.payment_reconciler import reconcile_pending_payments
+    return reconcile_pending_payments(['paradise'])
 
 
 def reconcile_pushynpay_payments():
-    """
-    Consulta periodicamente pagamentos pendentes da PushynPay (BATCH LIMITADO para evitar spam).
-    ✅ LAZARUS RECOVERY: Lógica real recuperada do app.py em 2026-04-06
-    """
-    try:
-        with current_app.app_context():
-            from internal_logic.core.models import Payment, Gateway, db, Bot, get_brazil_time, User, RemarketingCampaign
-            
-            # ✅ BATCH LIMITADO: apenas 5 por execução
-            pending = Payment.query.filter_by(
-                status='pending', 
-                gateway_type='pushynpay'
-            ).order_by(Payment.id.asc()).limit(5).all()
-            
-            if not pending:
-                return
-            
-            logger.info(f"🔍 PushynPay: Verificando {len(pending)} pagamento(s) pendente(s)...")
-            
-            gateways_by_user = {}
-            
-            for p in pending:
-                try:
-                    user_id = p.bot.user_id if p.bot else None
-                    if not user_id:
-                        continue
-                    
-                    if user_id not in gateways_by_user:
-                        gw = Gateway.query.filter_by(
-                            user_id=user_id, 
-                            gateway_type='pushynpay', 
-                            is_active=True, 
-                            is_verified=True
-                        ).first()
-                        if not gw:
-                            continue
-                        
-                        creds = {'api_key': gw.api_key}
-                        g = GatewayFactory.create_gateway('pushynpay', creds)
-                        if not g:
-                            continue
-                        gateways_by_user[user_id] = g
-                    
-                    gateway = gateways_by_user[user_id]
-                    transaction_id = p.gateway_transaction_id
-                    if not transaction_id:
-                        continue
-                    
-                    result = gateway.get_payment_status(str(transaction_id))
-                    
-                    if not result:
-                        continue
-                    
-                    status = result.get('status')
-                    
-                    if status == 'paid':
-                        # Atualizar pagamento e estatísticas
-                        p.status = 'paid'
-                        p.paid_at = get_brazil_time()
-                        if p.bot:
-                            p.bot.total_sales += 1
-                            p.bot.total_revenue += p.amount
-                            if p.bot.user_id:
-                                user = User.query.get(p.bot.user_id)
-                                if user:
-                                    user.total_sales += 1
-                                    user.total_revenue += p.amount
-                        
-                        # ✅ ATUALIZAR ESTATÍSTICAS DE REMARKETING
-                        if p.is_remarketing and p.remarketing_campaign_id:
-                            campaign = RemarketingCampaign.query.get(p.remarketing_campaign_id)
-                            if campaign:
-                                campaign.total_sales += 1
-                                campaign.revenue_generated += float(p.amount)
-                        
-                        db.session.commit()
-                        logger.info(f"✅ PushynPay: Payment {p.id} atualizado para paid via reconciliação")
-                        
-                        # ✅ ENVIAR ENTREGÁVEL
-                        try:
-                            payment_obj = Payment.query.get(p.id)
-                            if payment_obj:
-                                db.session.refresh(payment_obj)
-                                if payment_obj.status == 'paid':
-                                    send_payment_delivery(payment_obj)
-                        except Exception as e:
-                            logger.error(f"❌ Erro ao enviar entregável: {e}")
-                        
-                        # ✅ Emitir evento WebSocket
-                        try:
-                            if p.bot and p.bot.user_id:
-                                socketio.emit('payment_update', {
-                                    'payment_id': p.id,
-                                    'status': 'paid',
-                                    'amount': float(p.amount),
-                                    'bot_id': p.bot_id,
-                                }, room=f'user_{p.bot.user_id}')
-                        except Exception as e:
-                            logger.error(f"❌ Erro WebSocket: {e}")
-                        
-                        # ✅ UPSELLS
-                        if p.bot and p.bot.config and p.bot.config.upsells_enabled:
-                            try:
-                                upsells = p.bot.config.get_upsells()
-                                if upsells:
-                                    matched_upsells = [
-                                        u for u in upsells 
-                                        if not u.get('trigger_product') or u.get('trigger_product') == p.product_name
-                                    ]
-                                    if matched_upsells:
-                                        local_bot_manager = BotManager(
-                                            socketio=None, 
-                                            scheduler=None, 
-                                            user_id=p.bot.user_id
-                                        )
-                                        local_bot_manager.schedule_upsells(
-                                            bot_id=p.bot_id,
-                                            payment_id=p.payment_id,
-                                            chat_id=int(p.customer_user_id),
-                                            upsells=matched_upsells,
-                                            original_price=p.amount,
-                                            original_button_index=-1
-                                        )
-                            except Exception as e:
-                                logger.error(f"❌ Erro upsells: {e}")
-                except Exception as e:
-                    logger.error(f"❌ Erro ao reconciliar payment PushynPay {p.id}: {e}")
-                    continue
-    except Exception as e:
-        logger.error(f"❌ Reconciliador PushynPay: erro: {e}", exc_info=True)
+    """Reconciliação PushynPay via motor único."""
+    from internal_logic.services.payment_reconciler import reconcile_pending_payments
+    return reconcile_pending_payments(['pushynpay'])
 
 
 def reconcile_atomopay_payments():
-    """
-    Consulta periodicamente pagamentos pendentes do Atomopay (BATCH LIMITADO para evitar spam).
-    ✅ LAZARUS RECOVERY: Lógica real recuperada do app.py em 2026-04-06
-    """
-    try:
-        with current_app.app_context():
-            from internal_logic.core.models import Payment, Gateway, db, Bot, get_brazil_time, User, RemarketingCampaign
-            
-            # ✅ BATCH LIMITADO: apenas 5 por execução
-            pending = Payment.query.filter_by(
-                status='pending', 
-                gateway_type='atomopay'
-            ).order_by(Payment.created_at.desc()).limit(5).all()
-            
-            if not pending:
-                logger.debug("🔍 Reconciliador Atomopay: Nenhum payment pendente encontrado")
-                return
-            
-            logger.info(f"🔍 Reconciliador Atomopay: Consultando {len(pending)} payment(s)")
-            
-            gateways_by_user = {}
-            
-            for p in pending:
-                try:
-                    user_id = p.bot.user_id if p.bot else None
-                    if not user_id:
-                        continue
-                    
-                    if user_id not in gateways_by_user:
-                        gw = Gateway.query.filter_by(
-                            user_id=user_id, 
-                            gateway_type='atomopay', 
-                            is_active=True, 
-                            is_verified=True
-                        ).first()
-                        if not gw:
-                            continue
-                        
-                        creds = {
-                            'api_token': gw.api_key,
-                            'offer_hash': gw.offer_hash,
-                            'product_hash': gw.product_hash,
-                        }
-                        g = GatewayFactory.create_gateway('atomopay', creds)
-                        if not g:
-                            continue
-                        gateways_by_user[user_id] = g
-                    
-                    gateway = gateways_by_user[user_id]
-                    
-                    hash_or_id = p.gateway_transaction_hash or p.gateway_transaction_id
-                    if not hash_or_id:
-                        logger.warning(f"⚠️ Atomopay Payment {p.id}: sem hash ou transaction_id")
-                        continue
-                    
-                    result = gateway.get_payment_status(str(hash_or_id))
-                    
-                    if not result and p.gateway_transaction_id and p.gateway_transaction_id != hash_or_id:
-                        result = gateway.get_payment_status(str(p.gateway_transaction_id))
-                    
-                    if result and result.get('status') == 'paid':
-                        # Atualizar pagamento
-                        p.status = 'paid'
-                        p.paid_at = get_brazil_time()
-                        if p.bot:
-                            p.bot.total_sales += 1
-                            p.bot.total_revenue += p.amount
-                            if p.bot.user_id:
-                                user = User.query.get(p.bot.user_id)
-                                if user:
-                                    user.total_sales += 1
-                                    user.total_revenue += p.amount
-                        
-                        # ✅ REMARKETING
-                        if p.is_remarketing and p.remarketing_campaign_id:
-                            campaign = RemarketingCampaign.query.get(p.remarketing_campaign_id)
-                            if campaign:
-                                campaign.total_sales += 1
-                                campaign.revenue_generated += float(p.amount)
-                        
-                        db.session.commit()
-                        logger.info(f"✅ Atomopay: Payment {p.id} atualizado para paid")
-                        
-                        # ✅ ENVIAR ENTREGÁVEL
-                        try:
-                            payment_obj = Payment.query.get(p.id)
-                            if payment_obj:
-                                db.session.refresh(payment_obj)
-                                if payment_obj.status == 'paid':
-                                    send_payment_delivery(payment_obj)
-                        except Exception as e:
-                            logger.error(f"❌ Erro ao enviar entregável: {e}")
-                        
-                        # ✅ WEBSOCKET
-                        try:
-                            if p.bot and p.bot.user_id:
-                                socketio.emit('payment_update', {
-                                    'payment_id': p.id,
-                                    'status': 'paid',
-                                    'amount': float(p.amount),
-                                    'bot_id': p.bot_id,
-                                }, room=f'user_{p.bot.user_id}')
-                        except Exception as e:
-                            logger.error(f"❌ Erro WebSocket: {e}")
-                        
-                        # ✅ UPSELLS
-                        if p.bot and p.bot.config and p.bot.config.upsells_enabled:
-                            try:
-                                upsells = p.bot.config.get_upsells()
-                                if upsells:
-                                    matched_upsells = [
-                                        u for u in upsells 
-                                        if not u.get('trigger_product') or u.get('trigger_product') == p.product_name
-                                    ]
-                                    if matched_upsells:
-                                        local_bot_manager = BotManager(
-                                            socketio=None, 
-                                            scheduler=None, 
-                                            user_id=p.bot.user_id
-                                        )
-                                        local_bot_manager.schedule_upsells(
-                                            bot_id=p.bot_id,
-                                            payment_id=p.payment_id,
-                                            chat_id=int(p.customer_user_id),
-                                            upsells=matched_upsells,
-                                            original_price=p.amount,
-                                            original_button_index=-1
-                                        )
-                            except Exception as e:
-                                logger.error(f"❌ Erro upsells: {e}")
-                except Exception as e:
-                    logger.error(f"❌ Erro ao reconciliar Atomopay {p.id}: {e}")
-                    continue
-    except Exception as e:
-        logger.error(f"❌ Reconciliador Atomopay: erro: {e}", exc_info=True)
+    """Reconciliação Atomopay via motor único."""
+    from internal_logic.services.payment_reconciler import reconcile_pending_payments
+    return reconcile_pending_payments(['atomopay'])
 
 
 def reconcile_aguia_payments():
-    """
-    Consulta periodicamente pagamentos pendentes da ÁguiaPags (BATCH LIMITADO para evitar spam).
-    ✅ LAZARUS RECOVERY: Lógica real recuperada do app.py em 2026-04-06
-    """
-    try:
-        with current_app.app_context():
-            from internal_logic.core.models import Payment, Gateway, db, Bot, get_brazil_time, User, RemarketingCampaign
-            
-            # ✅ BATCH LIMITADO: apenas 5 por execução
-            pending = Payment.query.filter_by(
-                status='pending', 
-                gateway_type='aguia'
-            ).order_by(Payment.created_at.desc()).limit(5).all()
-            
-            if not pending:
-                logger.debug("🔍 Reconciliador ÁguiaPags: Nenhum payment pendente encontrado")
-                return
-            
-            logger.info(f"🔍 Reconciliador ÁguiaPags: Consultando {len(pending)} payment(s)")
-            
-            gateways_by_user = {}
-            
-            for p in pending:
-                try:
-                    user_id = p.bot.user_id if p.bot else None
-                    if not user_id:
-                        continue
-                    
-                    if user_id not in gateways_by_user:
-                        gw = Gateway.query.filter_by(
-                            user_id=user_id, 
-                            gateway_type='aguia', 
-                            is_active=True, 
-                            is_verified=True
-                        ).first()
-                        if not gw:
-                            continue
-                        
-                        creds = {'api_key': gw.api_key}
-                        g = GatewayFactory.create_gateway('aguia', creds)
-                        if not g:
-                            continue
-                        gateways_by_user[user_id] = g
-                    
-                    gateway = gateways_by_user[user_id]
-                    transaction_id = p.gateway_transaction_id
-                    if not transaction_id:
-                        logger.warning(f"⚠️ ÁguiaPags Payment {p.id}: sem transaction_id")
-                        continue
-                    
-                    result = gateway.get_payment_status(str(transaction_id))
-                    
-                    if result and result.get('status') == 'paid':
-                        # Atualizar pagamento
-                        p.status = 'paid'
-                        p.paid_at = get_brazil_time()
-                        if p.bot:
-                            p.bot.total_sales += 1
-                            p.bot.total_revenue += p.amount
-                            if p.bot.user_id:
-                                user = User.query.get(p.bot.user_id)
-                                if user:
-                                    user.total_sales += 1
-                                    user.total_revenue += p.amount
-                        
-                        # ✅ REMARKETING
-                        if p.is_remarketing and p.remarketing_campaign_id:
-                            campaign = RemarketingCampaign.query.get(p.remarketing_campaign_id)
-                            if campaign:
-                                campaign.total_sales += 1
-                                campaign.revenue_generated += float(p.amount)
-                        
-                        db.session.commit()
-                        logger.info(f"✅ ÁguiaPags: Payment {p.id} atualizado para paid")
-                        
-                        # ✅ ENVIAR ENTREGÁVEL
-                        try:
-                            payment_obj = Payment.query.get(p.id)
-                            if payment_obj:
-                                db.session.refresh(payment_obj)
-                                if payment_obj.status == 'paid':
-                                    send_payment_delivery(payment_obj)
-                        except Exception as e:
-                            logger.error(f"❌ Erro ao enviar entregável: {e}")
-                        
-                        # ✅ WEBSOCKET
-                        try:
-                            if p.bot and p.bot.user_id:
-                                socketio.emit('payment_update', {
-                                    'payment_id': p.id,
-                                    'status': 'paid',
-                                    'amount': float(p.amount),
-                                    'bot_id': p.bot_id,
-                                }, room=f'user_{p.bot.user_id}')
-                        except Exception as e:
-                            logger.error(f"❌ Erro WebSocket: {e}")
-                        
-                        # ✅ UPSELLS
-                        if p.bot and p.bot.config and p.bot.config.upsells_enabled:
-                            try:
-                                upsells = p.bot.config.get_upsells()
-                                if upsells:
-                                    matched_upsells = [
-                                        u for u in upsells 
-                                        if not u.get('trigger_product') or u.get('trigger_product') == p.product_name
-                                    ]
-                                    if matched_upsells:
-                                        local_bot_manager = BotManager(
-                                            socketio=None, 
-                                            scheduler=None, 
-                                            user_id=p.bot.user_id
-                                        )
-                                        local_bot_manager.schedule_upsells(
-                                            bot_id=p.bot_id,
-                                            payment_id=p.payment_id,
-                                            chat_id=int(p.customer_user_id),
-                                            upsells=matched_upsells,
-                                            original_price=p.amount,
-                                            original_button_index=-1
-                                        )
-                            except Exception as e:
-                                logger.error(f"❌ Erro upsells: {e}")
-                except Exception as e:
-                    logger.error(f"❌ Erro ao reconciliar ÁguiaPags {p.id}: {e}")
-                    continue
-    except Exception as e:
-        logger.error(f"❌ Reconciliador ÁguiaPags: erro: {e}", exc_info=True)
+    """Reconciliação ÁguiaPags via motor único."""
+    from internal_logic.services.payment_reconciler import reconcile_pending_payments
+    return reconcile_pending_payments(['aguia'])
 
 
 def reconcile_bolt_payments():
-    """
-    Consulta periodicamente pagamentos não pagos do Bolt (BATCH LIMITADO para evitar spam).
-    ✅ LAZARUS RECOVERY: Lógica real recuperada do app.py em 2026-04-06
-    """
-    try:
-        with current_app.app_context():
-            from internal_logic.core.models import Payment, Gateway, db, get_brazil_time
-            
-            # ✅ BATCH LIMITADO: apenas 5 por execução
-            pending = (
-                Payment.query
-                .filter(Payment.gateway_type == 'bolt', Payment.status != 'paid')
-                .order_by(Payment.created_at.asc())
-                .limit(5)
-                .all()
-            )
-            
-            if not pending:
-                logger.debug("🔍 Reconciliador Bolt: Nenhum payment não-pago encontrado")
-                return
-            
-            logger.info(f"🔍 Reconciliador Bolt: Consultando {len(pending)} payment(s)")
-            
-            gateways_by_user = {}
-            
-            for p in pending:
-                try:
-                    user_id = p.bot.user_id if p.bot else None
-                    if not user_id:
-                        logger.warning(f"⚠️ Bolt: Payment {p.id} sem user_id")
-                        continue
-                    
-                    if user_id not in gateways_by_user:
-                        gw = Gateway.query.filter_by(
-                            user_id=user_id,
-                            gateway_type='bolt',
-                            is_active=True,
-                            is_verified=True
-                        ).first()
-                        if not gw:
-                            continue
-                        
-                        creds = {
-                            'api_key': gw.api_key,
-                            'company_id': gw.client_id,
-                        }
-                        g = GatewayFactory.create_gateway('bolt', creds)
-                        if not g:
-                            continue
-                        gateways_by_user[user_id] = g
-                    
-                    gateway = gateways_by_user[user_id]
-                    
-                    if not p.gateway_transaction_id:
-                        logger.warning(f"⚠️ Bolt: Payment {p.id} sem gateway_transaction_id")
-                        continue
-                    
-                    result = gateway.get_payment_status(str(p.gateway_transaction_id))
-                    remote_status = (result or {}).get('status')
-                    
-                    # 🔐 Regra blindada: promover SOMENTE se local!=paid AND remoto==paid
-                    if p.status != 'paid' and remote_status == 'paid':
-                        p.status = 'paid'
-                        if not p.paid_at:
-                            p.paid_at = get_brazil_time()
-                        db.session.commit()
-                        logger.info(f"✅ Bolt: Payment {p.id} atualizado para paid via reconciliação")
-                        
-                        # ✅ ENVIAR ENTREGÁVEL
-                        try:
-                            payment_obj = Payment.query.get(p.id)
-                            if payment_obj:
-                                db.session.refresh(payment_obj)
-                                if payment_obj.status == 'paid':
-                                    send_payment_delivery(payment_obj)
-                        except Exception as e:
-                            logger.error(f"❌ Erro ao enviar entregável: {e}")
-                        
-                        # ✅ WEBSOCKET
-                        try:
-                            if p.bot and p.bot.user_id:
-                                socketio.emit('payment_update', {
-                                    'payment_id': p.id,
-                                    'status': 'paid',
-                                    'amount': float(p.amount),
-                                    'bot_id': p.bot_id,
-                                }, room=f'user_{p.bot.user_id}')
-                        except Exception as e:
-                            logger.error(f"❌ Erro WebSocket: {e}")
-                    else:
-                        logger.debug(f"⏳ Bolt: Payment {p.id} não promovido | local={p.status} remoto={remote_status}")
-                except Exception as e:
-                    logger.error(f"❌ Erro ao reconciliar Bolt {p.id}: {e}")
-                    continue
-    except Exception as e:
-        logger.error(f"❌ Reconciliador Bolt: erro: {e}", exc_info=True)
-
-
-# ==================== RECONCILIADOR SIGILOPAY ====================
+    """Reconciliação Bolt via motor único."""
+    from internal_logic.services.payment_reconciler import reconcile_pending_payments
+    return reconcile_pending_payments(['bolt'])
 
 
 def reconcile_sigilopay_payments():
-    """
-    Reconciliação SigiloPay — batch de 3, intervalo 5min (respeitar anti-polling).
-    Pagamentos que ficaram em pending/pending_verification são verificados.
-    """
-    try:
-        with current_app.app_context():
-            from internal_logic.core.models import Payment, Gateway, get_brazil_time, User
+    """Reconciliação SigiloPay via motor único (anti-polling: 1 execução a cada 5 min)."""
+    from internal_logic.services.payment_reconciler import reconcile_pending_payments
+    return reconcile_pending_payments(['sigilopay'])
 
-            pending = Payment.query.filter(
-                Payment.gateway_type == 'sigilopay',
-                Payment.status.in_(['pending', 'pending_verification'])
-            ).order_by(Payment.created_at.desc()).limit(3).all()
 
-            if not pending:
-                logger.debug("Reconciliador SigiloPay: Nenhum payment pendente")
-                return
-
-            logger.info(f"Reconciliador SigiloPay: {len(pending)} pendentes")
-
-            gateways_by_user = {}
-            for p in pending:
-                try:
-                    user_id = p.bot.user_id if p.bot else None
-                    if not user_id:
-                        continue
-
-                    if user_id not in gateways_by_user:
-                        gw = Gateway.query.filter_by(
-                            user_id=user_id, gateway_type='sigilopay',
-                            is_active=True, is_verified=True
-                        ).first()
-                        if not gw:
-                            continue
-                        creds = {'api_key': gw.api_key, 'client_secret': gw.client_secret}
-                        g = GatewayFactory.create_gateway('sigilopay', creds)
-                        if not g:
-                            continue
-                        gateways_by_user[user_id] = g
-
-                    gateway = gateways_by_user[user_id]
-                    txid = p.gateway_transaction_id
-                    if not txid:
-                        continue
-
-                    result = gateway.get_payment_status(str(txid))
-                    if not result:
-                        continue
-
-                    remote_status = result.get('status')
-                    if p.status != 'paid' and remote_status == 'paid':
-                        p.status = 'paid'
-                        p.paid_at = get_brazil_time()
-                        if p.bot:
-                            p.bot.total_sales += 1
-                            p.bot.total_revenue += p.amount
-                            if p.bot.user_id:
-                                user = User.query.get(p.bot.user_id)
-                                if user:
-                                    user.total_sales += 1
-                                    user.total_revenue += p.amount
-                        db.session.commit()
-
-                        try:
-                            payment_obj = Payment.query.get(p.id)
-                            if payment_obj:
-                                db.session.refresh(payment_obj)
-                                if payment_obj.status == 'paid':
-                                    send_payment_delivery(payment_obj)
-                        except Exception as e:
-                            logger.error(f"Erro entregável SigiloPay: {e}")
-
-                        try:
-                            if p.bot and p.bot.user_id:
-                                socketio.emit('payment_update', {
-                                    'payment_id': p.id,
-                                    'status': 'paid',
-                                    'amount': float(p.amount),
-                                    'bot_id': p.bot_id,
-                                }, room=f'user_{p.bot.user_id}')
-                        except Exception as e:
-                            logger.error(f"Erro WebSocket SigiloPay: {e}")
-
-                        logger.info(f"SigiloPay: Payment {p.id} pago via reconciliação")
-                    elif remote_status in ('failed', 'cancelled'):
-                        p.status = 'failed'
-                        db.session.commit()
-                        logger.info(f"SigiloPay: Payment {p.id} falhou via reconciliação")
-                except Exception as e:
-                    logger.error(f"Erro reconciliação SigiloPay {p.id}: {e}")
-                    continue
-    except Exception as e:
-        logger.error(f"Reconciliador SigiloPay erro: {e}")
+def reconcile_all_payments():
+    """Reconcilia todos os gateways em um único ciclo concorrente."""
+    from internal_logic.services.payment_reconciler import reconcile_pending_payments
+    return reconcile_pending_payments()
 
 
 # ==================== JOBS DE ASSINATURA (STUBS - IMPLEMENTAR) ====================
@@ -1621,11 +942,11 @@ def get_pixel_id_for_payment(payment: Payment) -> Optional[str]:
         return pool.meta_pixel_id
     
     # PRIORIDADE 3: campaign_code do BotUser (sticky pixel, último recurso)
-    bot_user_for_pixel = BotUser.query.filter_by(
+    # Só campaign_code (coluna fria): projeção em vez da entidade inteira
+    pixel_from_user = db.session.query(BotUser.campaign_code).filter_by(
         bot_id=payment.bot_id, 
-        telegram_user_id=str(payment.customer_user_id)
-    ).first() if payment.customer_user_id else None
-    pixel_from_user = getattr(bot_user_for_pixel, 'campaign_code', None) if bot_user_for_pixel else None
+        telegram_user_id=payment.lead_id
+    ).scalar() if payment.lead_id is not None else None
     return pixel_from_user
 
 
@@ -1729,10 +1050,10 @@ def send_payment_delivery(payment: Payment, bot_manager=None, socketio=None, enq
             logger.error(f"❌ Payment {payment.id} não tem customer_user_id válido")
             return False
         
-        # ✅ ISOLAMENTO: Criar BotManager localmente com user_id do payment
+        # ✅ ISOLAMENTO: BotManager do dono do payment (reutilizado no processo)
         if bot_manager is None:
-            from bot_manager import BotManager
-            local_bot_manager = BotManager(socketio=socketio, scheduler=None, user_id=payment.bot.user_id)
+            from internal_logic.core.service_registry import get_bot_manager
+            local_bot_manager = get_bot_manager(payment.bot.user_id, socketio=socketio)
         else:
             local_bot_manager = bot_manager
         
@@ -1758,6 +1079,11 @@ def send_payment_delivery(payment: Payment, bot_manager=None, socketio=None, enq
         # DECISÃO CRÍTICA: Qual link enviar?
         link_to_send = _decide_delivery_link(payment, pixel_config)
         
+        # Link /delivery: pré-computar a página no Redis (clique do comprador = um GET)
+        if pixel_config['has_pixel']:
+            from internal_logic.services.delivery_cache import precompute_delivery
+            precompute_delivery(payment)
+        
         if not link_to_send:
             logger.error(f" Bot {payment.bot.id} não tem link de entrega configurado")
             return False
@@ -1902,12 +1228,12 @@ Seu acesso está disponível agora.
         # Emitir evento SocketIO para notificação em tempo real
         try:
             if payment.bot and payment.bot.user_id:
-                socketio.emit('delivery_sent', {
+                emit_to_user(payment.bot.user_id, 'delivery_sent', {
                     'payment_id': payment.id,
                     'status': 'delivered',
                     'delivery_method': delivery_method,
                     'bot_id': payment.bot_id,
-                }, room=f'user_{payment.bot.user_id}')
+                })
         except Exception as e:
             logger.error(f"❌ Erro ao emitir WebSocket de entrega: {e}")
         return bool(telegram_sent)
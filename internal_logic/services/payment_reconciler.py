@@ -0,0 +1,595 @@
+"""
+Payment Reconciler - Motor Único de Reconciliação
+==================================================
+Substitui os seis reconciliadores por gateway (Paradise, PushynPay, Atomopay,
+ÁguiaPags, Bolt, SigiloPay) por um único motor que:
+
+- Busca pendentes de TODOS os gateways em uma única query, priorizados por
+  faixa de idade (recentes primeiro), valor e recência
+- Carrega credenciais de gateway em lote (1 query) e reusa a instância por
+  (user_id, gateway_type) durante a execução
+- Consulta as APIs de status em paralelo, com concorrência e rate limit
+  próprios de cada gateway
+- Confirma pagamentos em lotes (1 commit por lote) e só depois dispara
+  entregável, WebSocket e upsells
+- Registra métricas de throughput por gateway no Redis (gb:reconcile:metrics:*)
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import case, func, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from internal_logic.core.extensions import db
+from internal_logic.core.models import Bot, Gateway, Payment, get_brazil_time
+from internal_logic.services.realtime_bus import emit_to_user
+from gateways import GatewayFactory
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# ESPECIFICAÇÃO POR GATEWAY
+# ============================================================================
+
+def _ids_hash_first(p: Payment) -> List[str]:
+    """Paradise/Atomopay: consulta pelo hash e, se diferente, pelo transaction_id."""
+    ids = []
+    hash_or_id = p.gateway_transaction_hash or p.gateway_transaction_id
+    if hash_or_id:
+        ids.append(str(hash_or_id))
+    if p.gateway_transaction_id and str(p.gateway_transaction_id) not in ids:
+        ids.append(str(p.gateway_transaction_id))
+    return ids
+
+
+def _ids_transaction_only(p: Payment) -> List[str]:
+    return [str(p.gateway_transaction_id)] if p.gateway_transaction_id else []
+
+
+@dataclass(frozen=True)
+class GatewayReconcileSpec:
+    """Parâmetros de reconciliação de um gateway."""
+    gateway_type: str
+    build_credentials: Callable[[Gateway], Dict[str, Any]]
+    lookup_ids: Callable[[Payment], List[str]] = _ids_transaction_only
+    # Status locais consultados; None = qualquer status diferente de 'paid'
+    statuses: Optional[Tuple[str, ...]] = ('pending',)
+    max_per_run: int = 50
+    max_concurrency: int = 4
+    rate_per_second: float = 5.0
+    # Intervalo mínimo entre execuções (anti-polling); 0 = sem restrição
+    min_interval_seconds: int = 0
+    # Se True, status remoto failed/cancelled marca o payment como failed
+    marks_failed: bool = False
+
+
+RECONCILE_SPECS: Dict[str, GatewayReconcileSpec] = {
+    'paradise': GatewayReconcileSpec(
+        gateway_type='paradise',
+        build_credentials=lambda gw: {
+            'api_key': gw.api_key,
+            'product_hash': gw.product_hash,
+            'offer_hash': gw.offer_hash,
+            'store_id': gw.store_id,
+            'split_percentage': gw.split_percentage or 2.0,
+        },
+        lookup_ids=_ids_hash_first,
+    ),
+    'pushynpay': GatewayReconcileSpec(
+        gateway_type='pushynpay',
+        build_credentials=lambda gw: {'api_key': gw.api_key},
+    ),
+    'atomopay': GatewayReconcileSpec(
+        gateway_type='atomopay',
+        build_credentials=lambda gw: {
+            'api_token': gw.api_key,
+            'offer_hash': gw.offer_hash,
+            'product_hash': gw.product_hash,
+        },
+        lookup_ids=_ids_hash_first,
+    ),
+    'aguia': GatewayReconcileSpec(
+        gateway_type='aguia',
+        build_credentials=lambda gw: {'api_key': gw.api_key},
+    ),
+    # Bolt sempre consultou todo payment não pago (não só 'pending')
+    'bolt': GatewayReconcileSpec(
+        gateway_type='bolt',
+        build_credentials=lambda gw: {'api_key': gw.api_key, 'company_id': gw.client_id},
+        statuses=None,
+    ),
+    # ✅ SigiloPay tem anti-polling: lote pequeno, 1 req/s e no máximo 1 execução a cada 5 min
+    'sigilopay': GatewayReconcileSpec(
+        gateway_type='sigilopay',
+        build_credentials=lambda gw: {'api_key': gw.api_key, 'client_secret': gw.client_secret},
+        statuses=('pending', 'pending_verification'),
+        max_per_run=3,
+        max_concurrency=1,
+        rate_per_second=1.0,
+        min_interval_seconds=300,
+        marks_failed=True,
+    ),
+}
+
+# Faixas de idade para priorização (em minutos): recentes primeiro, pois é
+# quando o comprador está esperando o entregável
+# (pendentes mais antigos continuam elegíveis, só por último)
+AGE_BUCKETS_MINUTES = (15, 120, 24 * 60)
+COMMIT_BATCH_SIZE = 25
+METRICS_KEY_PREFIX = 'gb:reconcile:metrics'
+
+
+# ============================================================================
+# RATE LIMITER
+# ============================================================================
+
+class _RateLimiter:
+    """Token bucket thread-safe: no máximo `rate` chamadas por segundo."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+@dataclass
+class _GatewayMetrics:
+    checked: int = 0
+    paid: int = 0
+    failed: int = 0
+    errors: int = 0
+    api_seconds: float = 0.0
+    wall_seconds: float = 0.0
+    skipped: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        throughput = self.checked / self.wall_seconds if self.wall_seconds else 0.0
+        avg_latency_ms = (self.api_seconds / self.checked * 1000) if self.checked else 0.0
+        return {
+            'checked': self.checked,
+            'paid': self.paid,
+            'failed': self.failed,
+            'errors': self.errors,
+            'skipped': self.skipped,
+            'wall_seconds': round(self.wall_seconds, 3),
+            'avg_latency_ms': round(avg_latency_ms, 1),
+            'checks_per_second': round(throughput, 2),
+        }
+
+
+@dataclass
+class _StatusCheck:
+    payment_id: int
+    gateway_type: str
+    user_id: int
+    lookup_ids: List[str]
+    remote_status: Optional[str] = None
+    error: Optional[str] = None
+    latency: float = 0.0
+
+
+def _promote(p: Payment, status: str) -> bool:
+    """
+    Troca o status do payment com UPDATE ... WHERE status != 'paid' (sem commit).
+
+    Returns:
+        True se esta chamada fez a troca; False se outro caminho já confirmou
+    """
+    now = get_brazil_time()
+    values = {'status': status}
+    if status == 'paid':
+        values['paid_at'] = func.coalesce(Payment.paid_at, now)
+    rowcount = db.session.execute(
+        update(Payment)
+        .where(Payment.id == p.id, Payment.status != 'paid')
+        .values(values)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if rowcount != 1:
+        db.session.expire(p, ['status', 'paid_at'])
+        return False
+    set_committed_value(p, 'status', status)
+    if status == 'paid' and not p.paid_at:
+        set_committed_value(p, 'paid_at', now)
+    return True
+
+
+# ============================================================================
+# MOTOR
+# ============================================================================
+
+class PaymentReconciler:
+    """Reconciliação concorrente e priorizada de pagamentos pendentes."""
+
+    def __init__(self, specs: Optional[Dict[str, GatewayReconcileSpec]] = None,
+                 max_workers: int = 16, commit_batch_size: int = COMMIT_BATCH_SIZE):
+        self.specs = specs or RECONCILE_SPECS
+        self.max_workers = max_workers
+        self.commit_batch_size = commit_batch_size
+
+    # ------------------------------------------------------------------ seleção
+    def _due_gateway_types(self, gateway_types: Iterable[str]) -> List[str]:
+        """Filtra gateways cujo intervalo mínimo (anti-polling) ainda não passou."""
+        due = []
+        redis_conn = _get_redis()
+        for gateway_type in gateway_types:
+            spec = self.specs.get(gateway_type)
+            if not spec:
+                logger.warning(f"⚠️ Reconciliador: gateway sem especificação: {gateway_type}")
+                continue
+            if spec.min_interval_seconds and redis_conn is not None:
+                try:
+                    gate_key = f"gb:reconcile:{gateway_type}:gate"
+                    if not redis_conn.set(gate_key, '1', nx=True, ex=spec.min_interval_seconds):
+                        logger.debug(f"⏳ Reconciliador {gateway_type}: aguardando intervalo anti-polling")
+                        continue
+                except Exception as e:
+                    logger.warning(f"⚠️ Reconciliador {gateway_type}: gate Redis indisponível: {e}")
+            due.append(gateway_type)
+        return due
+
+    def _load_pending(self, gateway_types: List[str]) -> List[Tuple[Payment, int]]:
+        """
+        Busca pendentes de todos os gateways em UMA query.
+
+        Prioridade: faixa de idade (mais recente primeiro) → valor (maior
+        primeiro) → created_at DESC. Cada gateway é limitado a max_per_run via
+        ROW_NUMBER() particionado por gateway_type.
+        """
+        now = get_brazil_time()
+        age_bucket = case(
+            *[
+                (Payment.created_at >= now - timedelta(minutes=minutes), index)
+                for index, minutes in enumerate(AGE_BUCKETS_MINUTES)
+            ],
+            else_=len(AGE_BUCKETS_MINUTES),
+        )
+
+        status_filters = [
+            db.and_(
+                Payment.gateway_type == gt,
+                Payment.status.in_(self.specs[gt].statuses) if self.specs[gt].statuses else Payment.status != 'paid',
+            )
+            for gt in gateway_types
+        ]
+
+        ranked = (
+            db.session.query(
+                Payment.id.label('payment_id'),
+                Bot.user_id.label('user_id'),
+                func.row_number().over(
+                    partition_by=Payment.gateway_type,
+                    order_by=(age_bucket, Payment.amount.desc(), Payment.created_at.desc()),
+                ).label('rank'),
+                age_bucket.label('age_bucket'),
+            )
+            .join(Bot, Bot.id == Payment.bot_id)
+            .filter(db.or_(*status_filters))
+            .subquery()
+        )
+
+        rank_limit = case(
+            *[(Payment.gateway_type == gt, self.specs[gt].max_per_run) for gt in gateway_types],
+            else_=0,
+        )
+
+        rows = (
+            db.session.query(Payment, ranked.c.user_id)
+            .join(ranked, ranked.c.payment_id == Payment.id)
+            .filter(ranked.c.rank <= rank_limit)
+            .order_by(ranked.c.age_bucket, Payment.amount.desc(), Payment.created_at.desc())
+            .all()
+        )
+        return [(payment, user_id) for payment, user_id in rows]
+
+    def _load_gateways(self, pairs: Iterable[Tuple[int, str]]) -> Dict[Tuple[int, str], Any]:
+        """Carrega Gateways ativos em 1 query e instancia 1 cliente por (user_id, gateway_type)."""
+        pairs = set(pairs)
+        if not pairs:
+            return {}
+        user_ids = {user_id for user_id, _ in pairs}
+        gateway_types = {gateway_type for _, gateway_type in pairs}
+
+        rows = Gateway.query.filter(
+            Gateway.user_id.in_(user_ids),
+            Gateway.gateway_type.in_(gateway_types),
+            Gateway.is_active == True,
+            Gateway.is_verified == True,
+        ).all()
+
+        instances = {}
+        for gw in rows:
+            key = (gw.user_id, gw.gateway_type)
+            if key not in pairs or key in instances:
+                continue
+            try:
+                instance = GatewayFactory.create_gateway(
+                    gw.gateway_type, self.specs[gw.gateway_type].build_credentials(gw)
+                )
+                if instance:
+                    instances[key] = instance
+            except Exception as e:
+                logger.error(f"❌ Reconciliador: erro ao instanciar {gw.gateway_type} (user {gw.user_id}): {e}")
+        return instances
+
+    # ------------------------------------------------------------ consultas
+    def _check_status(self, app, check: _StatusCheck, gateway, limiter: _RateLimiter,
+                      semaphore: threading.Semaphore) -> _StatusCheck:
+        with semaphore, app.app_context():
+            try:
+                for lookup_id in check.lookup_ids:
+                    limiter.acquire()
+                    started = time.perf_counter()
+                    try:
+                        result = gateway.get_payment_status(lookup_id)
+                    finally:
+                        check.latency += time.perf_counter() - started
+                    if result:
+                        check.remote_status = result.get('status')
+                        break
+            except Exception as e:
+                check.error = str(e)
+        return check
+
+    def _query_statuses(self, checks: List[_StatusCheck],
+                        instances: Dict[Tuple[int, str], Any]) -> List[_StatusCheck]:
+        if not checks:
+            return []
+        app = current_app._get_current_object()
+        limiters = {gt: _RateLimiter(self.specs[gt].rate_per_second) for gt in {c.gateway_type for c in checks}}
+        semaphores = {gt: threading.Semaphore(self.specs[gt].max_concurrency) for gt in limiters}
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(checks))) as executor:
+            futures = [
+                executor.submit(
+                    self._check_status, app, check,
+                    instances[(check.user_id, check.gateway_type)],
+                    limiters[check.gateway_type], semaphores[check.gateway_type],
+                )
+                for check in checks
+            ]
+            return [future.result() for future in futures]
+
+    # ------------------------------------------------------------ aplicação
+    def _apply_results(self, results: List[_StatusCheck], payments: Dict[int, Payment],
+                       metrics: Dict[str, _GatewayMetrics]) -> List[Payment]:
+        """Aplica os status remotos em lotes de commit_batch_size. Retorna os recém-pagos."""
+        from internal_logic.services.payment_processor import apply_paid_statistics
+
+        newly_paid: List[Payment] = []
+        pending_batch: List[Payment] = []
+
+        def flush():
+            if not pending_batch:
+                return
+            try:
+                db.session.commit()
+                newly_paid.extend(p for p in pending_batch if p.status == 'paid')
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"❌ Reconciliador: falha ao commitar lote de {len(pending_batch)}: {e}", exc_info=True)
+                for p in pending_batch:
+                    metrics[p.gateway_type].errors += 1
+            pending_batch.clear()
+
+        for check in results:
+            gateway_metrics = metrics[check.gateway_type]
+            if check.error:
+                gateway_metrics.errors += 1
+                logger.error(f"❌ Reconciliador {check.gateway_type}: erro ao consultar payment {check.payment_id}: {check.error}")
+                continue
+
+            p = payments[check.payment_id]
+            spec = self.specs[check.gateway_type]
+
+            # 🔐 Regra blindada: promover SOMENTE se local!=paid AND remoto==paid.
+            # O payment foi carregado antes das consultas; um webhook pode tê-lo
+            # confirmado nesse meio-tempo, então a troca é um UPDATE condicional
+            # e os efeitos (estatísticas, entregável, upsells) só valem com rowcount == 1
+            if p.status != 'paid' and check.remote_status == 'paid':
+                if _promote(p, 'paid'):
+                    if p.bot:
+                        apply_paid_statistics(p)
+                    gateway_metrics.paid += 1
+                    pending_batch.append(p)
+                else:
+                    logger.info(f"♻️ {check.gateway_type}: Payment {p.id} já confirmado por outro caminho")
+            elif spec.marks_failed and check.remote_status in ('failed', 'cancelled'):
+                if _promote(p, 'failed'):
+                    gateway_metrics.failed += 1
+                    pending_batch.append(p)
+            else:
+                logger.debug(f"⏳ {check.gateway_type}: Payment {p.id} não promovido | local={p.status} remoto={check.remote_status}")
+
+            if len(pending_batch) >= self.commit_batch_size:
+                flush()
+        flush()
+        return newly_paid
+
+    def _post_confirmation(self, p: Payment) -> None:
+        """Ranking, entregável, WebSocket e upsells — sempre após o commit."""
+        from internal_logic.services import admin_summary, analytics_cube
+        from internal_logic.services.leaderboard_service import record_sale
+        from internal_logic.services.payment_processor import send_payment_delivery
+
+        try:
+            db.session.refresh(p)
+            if p.status == 'paid':
+                record_sale(p)
+                analytics_cube.record_sale(p)
+                admin_summary.record_sale(p)
+                send_payment_delivery(p)
+        except Exception as e:
+            logger.error(f"❌ Erro ao enviar entregável via reconciliação (payment {p.id}): {e}")
+
+        try:
+            if p.bot and p.bot.user_id:
+                emit_to_user(p.bot.user_id, 'payment_update', {
+                    'payment_id': p.id,
+                    'status': 'paid',
+                    'amount': float(p.amount),
+                    'bot_id': p.bot_id,
+                })
+        except Exception as e:
+            logger.error(f"❌ Erro WebSocket (payment {p.id}): {e}")
+
+        if p.bot and p.bot.config and p.bot.config.upsells_enabled:
+            try:
+                upsells = p.bot.config.get_upsells()
+                matched_upsells = [
+                    u for u in (upsells or [])
+                    if not u.get('trigger_product') or u.get('trigger_product') == p.product_name
+                ]
+                if matched_upsells:
+                    from internal_logic.core.service_registry import get_bot_manager
+                    local_bot_manager = get_bot_manager(p.bot.user_id)
+                    local_bot_manager.schedule_upsells(
+                        bot_id=p.bot_id,
+                        payment_id=p.payment_id,
+                        chat_id=int(p.customer_user_id),
+                        upsells=matched_upsells,
+                        original_price=p.amount,
+                        original_button_index=-1
+                    )
+                    logger.info(f"📅 Upsells agendados para payment {p.payment_id}")
+            except Exception as e:
+                logger.error(f"❌ Erro ao processar upsells (payment {p.id}): {e}", exc_info=True)
+
+    # ------------------------------------------------------------ execução
+    def run(self, gateway_types: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Executa um ciclo de reconciliação.
+
+        Args:
+            gateway_types: Gateways a reconciliar (default: todos os especificados)
+
+        Returns:
+            dict: Métricas por gateway (checked, paid, failed, errors, latência, throughput)
+        """
+        started = time.perf_counter()
+        due_types = self._due_gateway_types(gateway_types or list(self.specs.keys()))
+        metrics = {gt: _GatewayMetrics() for gt in due_types}
+        if not due_types:
+            return {}
+
+        rows = self._load_pending(due_types)
+        if not rows:
+            logger.debug(f"🔍 Reconciliador: nenhum pendente em {', '.join(due_types)}")
+            return {gt: m.as_dict() for gt, m in metrics.items()}
+
+        instances = self._load_gateways((user_id, p.gateway_type) for p, user_id in rows)
+
+        payments: Dict[int, Payment] = {}
+        checks: List[_StatusCheck] = []
+        for p, user_id in rows:
+            spec = self.specs[p.gateway_type]
+            lookup_ids = spec.lookup_ids(p)
+            if not lookup_ids or (user_id, p.gateway_type) not in instances:
+                metrics[p.gateway_type].skipped += 1
+                continue
+            payments[p.id] = p
+            checks.append(_StatusCheck(
+                payment_id=p.id, gateway_type=p.gateway_type,
+                user_id=user_id, lookup_ids=lookup_ids,
+            ))
+
+        logger.info(f"🔍 Reconciliador: consultando {len(checks)} payment(s) em {len(due_types)} gateway(s)")
+
+        results = self._query_statuses(checks, instances)
+        for check in results:
+            gateway_metrics = metrics[check.gateway_type]
+            gateway_metrics.checked += 1
+            gateway_metrics.api_seconds += check.latency
+
+        newly_paid = self._apply_results(results, payments, metrics)
+        for p in newly_paid:
+            logger.info(f"✅ {p.gateway_type}: Payment {p.id} atualizado para paid via reconciliação")
+            self._post_confirmation(p)
+
+        elapsed = time.perf_counter() - started
+        for gateway_metrics in metrics.values():
+            gateway_metrics.wall_seconds = elapsed
+
+        report = {gt: m.as_dict() for gt, m in metrics.items()}
+        _record_metrics(report)
+        for gt, m in report.items():
+            if m['checked'] or m['errors']:
+                logger.info(
+                    f"📊 Reconciliador {gt}: checked={m['checked']} paid={m['paid']} failed={m['failed']} "
+                    f"errors={m['errors']} avg={m['avg_latency_ms']}ms throughput={m['checks_per_second']}/s"
+                )
+        return report
+
+
+def _get_redis():
+    try:
+        from internal_logic.core.redis_manager import get_redis_connection
+        return get_redis_connection()
+    except Exception:
+        return None
+
+
+def _record_metrics(report: Dict[str, Dict[str, Any]]) -> None:
+    """Acumula contadores por gateway em gb:reconcile:metrics:{gateway} (1 pipeline)."""
+    redis_conn = _get_redis()
+    if redis_conn is None or not report:
+        return
+    try:
+        pipe = redis_conn.pipeline(transaction=False)
+        now = int(time.time())
+        for gateway_type, m in report.items():
+            key = f"{METRICS_KEY_PREFIX}:{gateway_type}"
+            pipe.hincrby(key, 'runs', 1)
+            for counter in ('checked', 'paid', 'failed', 'errors', 'skipped'):
+                if m[counter]:
+                    pipe.hincrby(key, counter, m[counter])
+            pipe.hset(key, mapping={
+                'last_run_at': now,
+                'last_avg_latency_ms': m['avg_latency_ms'],
+                'last_checks_per_second': m['checks_per_second'],
+            })
+            pipe.expire(key, 7 * 24 * 3600)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"⚠️ Reconciliador: falha ao registrar métricas: {e}")
+
+
+def get_reconcile_metrics(gateway_types: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, str]]:
+    """Lê as métricas acumuladas por gateway."""
+    redis_conn = _get_redis()
+    if redis_conn is None:
+        return {}
+    gateway_types = list(gateway_types or RECONCILE_SPECS.keys())
+    pipe = redis_conn.pipeline(transaction=False)
+    for gateway_type in gateway_types:
+        pipe.hgetall(f"{METRICS_KEY_PREFIX}:{gateway_type}")
+    return dict(zip(gateway_types, pipe.execute()))
+
+
+def reconcile_pending_payments(gateway_types: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """Ponto de entrada (cron/RQ): reconcilia os gateways informados (default: todos)."""
+    try:
+        with current_app.app_context():
+            return PaymentReconciler().run(gateway_types)
+    except Exception as e:
+        logger.error(f"❌ Reconciliador: erro: {e}", exc_info=True)
+        return {}
@@ -513,6 +513,14 @@ class PaymentService:
         except Exception as e:
             self.logger.error(f"PaymentService: Erro ao registrar transação - {e}")
             self.db.rollback()
+            return
+        
+        # Webhook que chegou antes do Payment existir: aplicar agora (não esperar a varredura)
+        try:
+            from tasks_async import notify_payment_registered
+            notify_payment_registered(payment)
+        except Exception as e:
+            self.logger.warning(f"PaymentService: Falha ao verificar pending webhooks - {e}")
     
     def check_payment_status(self, transaction_id: str, gateway_id: int) -> str:
         """Verifica status de um pagamento existente"""
@@ -10,6 +10,7 @@ import json
 from typing import Dict, Any
 
 from gateways import GatewayFactory
+from internal_logic.services.callback_codec import encode as encode_callback
 
 logger = logging.getLogger(__name__)
 
@@ -952,7 +953,7 @@ Seu pagamento ainda não foi confirmado.
                 # Reenviar botão de verificar
                 buttons = [{
                     'text': '✅ Verificar Pagamento',
-                    'callback_data': f'verify_{payment_id}'
+                    'callback_data': encode_callback('verify', payment_id)
                 }]
                 
                 bot_manager.send_telegram_message(
@@ -0,0 +1,162 @@
+"""
+Realtime Bus - Eventos Socket.IO Roteados por Tenant
+=====================================================
+Cada sessão do dashboard entra na sala user:{id} ao conectar (cookie de login
+do Flask-Login). Os serviços emitem para o DONO do bot, nunca em broadcast:
+com o message_queue (Redis), um broadcast é entregue a TODOS os dashboards
+de TODOS os clientes — custo proporcional ao número de conexões e vazamento
+de dados entre tenants.
+
+- emit_to_user()   → eventos terminais (payment_update, delivery_sent,
+                     remarketing_completed): entrega imediata
+- emit_coalesced() → eventos de alta frequência (remarketing_progress,
+                     bot_heartbeat, bot_interaction): no máximo
+                     REALTIME_MAX_EVENTS_PER_SECOND por fluxo
+                     (sala + evento + chave); o último payload vence
+
+O agrupamento é por processo: cada worker limita os seus próprios envios
+(o progresso de uma campanha sai de um único worker por vez).
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+USER_ROOM = 'user:{user_id}'
+MAX_EVENTS_PER_SECOND = float(os.environ.get('REALTIME_MAX_EVENTS_PER_SECOND', '2'))
+
+# Limite do mapa de último envio antes da limpeza de fluxos inativos
+_MAX_TRACKED_STREAMS = 10000
+
+_owner_cache: Dict[int, int] = {}
+
+
+def user_room(user_id: int) -> str:
+    return USER_ROOM.format(user_id=user_id)
+
+
+def register_socketio_handlers(socketio_instance) -> None:
+    """Registra o connect: sessão autenticada entra na sala do usuário; anônima é recusada."""
+    from flask_login import current_user
+    from flask_socketio import join_room
+
+    @socketio_instance.on('connect')
+    def _join_user_room(auth=None):
+        if not current_user.is_authenticated:
+            return False
+        join_room(user_room(current_user.id))
+
+
+def bot_owner_id(bot_id: Optional[int]) -> Optional[int]:
+    """Dono do bot (cache por processo — evita um SELECT por evento)."""
+    if not bot_id:
+        return None
+    owner = _owner_cache.get(bot_id)
+    if owner is None:
+        from internal_logic.core.extensions import db
+        from internal_logic.core.models import Bot
+
+        owner = db.session.query(Bot.user_id).filter(Bot.id == bot_id).scalar()
+        if owner is not None:
+            _owner_cache[bot_id] = owner
+    return owner
+
+
+def _emit(user_id: int, event: str, payload: Dict[str, Any]) -> bool:
+    from internal_logic.core.extensions import socketio
+
+    try:
+        socketio.emit(event, payload, to=user_room(user_id))
+        return True
+    except Exception as e:
+        # Blindagem UI: falha de WebSocket nunca interrompe o processamento
+        logger.debug(f"Falha não-crítica na UI (WebSocket ignorado): {event} → user {user_id}: {e}")
+        return False
+
+
+class EventCoalescer:
+    """
+    Limita cada fluxo (user_id, evento, chave) a max_per_second envios.
+    Dentro do intervalo, guarda só o payload mais recente e agenda um flush.
+    """
+
+    def __init__(self, emit=_emit, max_per_second: float = MAX_EVENTS_PER_SECOND):
+        self._emit = emit
+        self._interval = 1.0 / max_per_second
+        self._lock = threading.Lock()
+        self._last_sent: Dict[Tuple, float] = {}
+        self._pending: Dict[Tuple, Tuple[int, str, Dict[str, Any]]] = {}
+
+    def submit(self, user_id: int, event: str, payload: Dict[str, Any], key: Hashable = None) -> bool:
+        """Returns True se emitiu agora; False se ficou agrupado para o próximo flush."""
+        stream = (user_id, event, key)
+        now = time.monotonic()
+        with self._lock:
+            wait = self._last_sent.get(stream, 0.0) + self._interval - now
+            if wait > 0:
+                already_scheduled = stream in self._pending
+                self._pending[stream] = (user_id, event, payload)
+            else:
+                # Timer atrasado (GIL/carga): o payload novo substitui o pendente
+                self._pending.pop(stream, None)
+                self._last_sent[stream] = now
+                if len(self._last_sent) > _MAX_TRACKED_STREAMS:
+                    self._prune(now)
+
+        if wait <= 0:
+            self._emit(user_id, event, payload)
+            return True
+        if not already_scheduled:
+            timer = threading.Timer(wait, self._flush, args=(stream,))
+            timer.daemon = True
+            timer.start()
+        return False
+
+    def discard(self, user_id: int, event: str, key: Hashable = None) -> None:
+        """Descarta o pendente de um fluxo (ex.: progresso atrasado após a conclusão)."""
+        with self._lock:
+            self._pending.pop((user_id, event, key), None)
+
+    def _flush(self, stream: Tuple) -> None:
+        with self._lock:
+            item = self._pending.pop(stream, None)
+            if item:
+                self._last_sent[stream] = time.monotonic()
+        if item:
+            self._emit(*item)
+
+    def _prune(self, now: float) -> None:
+        expired = [s for s, sent in self._last_sent.items() if now - sent > self._interval and s not in self._pending]
+        for stream in expired:
+            del self._last_sent[stream]
+
+
+_coalescer = EventCoalescer()
+
+
+def emit_to_user(user_id: Optional[int], event: str, payload: Dict[str, Any],
+                 supersedes: Optional[str] = None, key: Hashable = None) -> bool:
+    """
+    Emite imediatamente para a sala do dono.
+
+    Args:
+        supersedes: evento agrupado que este substitui (o pendente de mesma
+                    chave é descartado — ex.: remarketing_completed encerra
+                    o remarketing_progress da campanha)
+    """
+    if not user_id:
+        return False
+    if supersedes:
+        _coalescer.discard(user_id, supersedes, key)
+    return _emit(user_id, event, payload)
+
+
+def emit_coalesced(user_id: Optional[int], event: str, payload: Dict[str, Any], key: Hashable = None) -> bool:
+    """Emite respeitando o limite por fluxo; o último payload do intervalo vence."""
+    if not user_id:
+        return False
+    return _coalescer.submit(user_id, event, payload, key)
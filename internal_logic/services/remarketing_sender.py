@@ -20,6 +20,8 @@ import json
 import random
 from typing import Dict, Any, Optional, List, Callable
 
+from internal_logic.services.callback_codec import encode as encode_callback
+
 logger = logging.getLogger(__name__)
 
 
@@ -49,10 +51,13 @@ class RemarketingSender:
 
     def send_remarketing_campaign(self, campaign_id: int, bot_token: str) -> None:
         """Envia campanha de remarketing em background"""
+        from internal_logic.services.realtime_bus import bot_owner_id, emit_coalesced, emit_to_user
+        from internal_logic.services.lead_lookup import broadcast_load
+
         try:
             from internal_logic.core.redis_manager import get_redis_connection
             from flask import current_app
-            from internal_logic.core.extensions import db, socketio
+            from internal_logic.core.extensions import db
             from internal_logic.core.models import (
                 RemarketingCampaign, BotUser, Payment,
                 RemarketingBlacklist, get_brazil_time, Bot
@@ -76,7 +81,8 @@ class RemarketingSender:
                     stats_key = f"remarketing:stats:{campaign.id}"
 
                     contact_limit = get_brazil_time() - timedelta(days=campaign.days_since_last_contact)
-                    query = BotUser.query.filter_by(bot_id=campaign.bot_id, archived=False)
+                    # Envio só lê id/telegram_user_id/first_name: não carregar tracking/demografia
+                    query = BotUser.query.options(broadcast_load()).filter_by(bot_id=campaign.bot_id, archived=False)
                     if campaign.days_since_last_contact > 0:
                         query = query.filter(BotUser.last_interaction <= contact_limit)
 
@@ -289,7 +295,7 @@ class RemarketingSender:
                                     if btn.get('price') and btn.get('description'):
                                         remarketing_buttons.append({
                                             'text': btn.get('text', 'Comprar'),
-                                            'callback_data': f"rmkt_{campaign.id}_{btn_idx}"
+                                            'callback_data': encode_callback('rmkt', campaign.id, btn_idx)
                                         })
                                     elif btn.get('url'):
                                         remarketing_buttons.append({
@@ -335,14 +341,14 @@ class RemarketingSender:
                     db.session.commit()
 
                     try:
-                        socketio.emit('remarketing_progress', {
+                        emit_coalesced(bot_owner_id(campaign.bot_id), 'remarketing_progress', {
                             'campaign_id': campaign.id,
                             'sent': campaign.total_sent,
                             'failed': campaign.total_failed,
                             'blocked': campaign.total_blocked,
                             'total': campaign.total_targets,
                             'percentage': 0
-                        })
+                        }, key=campaign.id)
                     except Exception:
                         pass
 
@@ -362,7 +368,7 @@ class RemarketingSender:
             logger.error(f"Falha no remarketing orchestration (fallback para modo legado): {orchestration_error}", exc_info=True)
 
         from flask import current_app
-        from internal_logic.core.extensions import db, socketio
+        from internal_logic.core.extensions import db
         from internal_logic.core.models import RemarketingCampaign, BotUser, Payment, RemarketingBlacklist
         from datetime import datetime, timedelta
         import time
@@ -386,7 +392,8 @@ class RemarketingSender:
                     from internal_logic.core.models import get_brazil_time
                     contact_limit = get_brazil_time() - timedelta(days=campaign.days_since_last_contact)
 
-                    query = BotUser.query.filter_by(bot_id=campaign.bot_id, archived=False)
+                    # Envio só lê id/telegram_user_id/first_name: não carregar tracking/demografia
+                    query = BotUser.query.options(broadcast_load()).filter_by(bot_id=campaign.bot_id, archived=False)
 
                     if campaign.days_since_last_contact > 0:
                         query = query.filter(BotUser.last_interaction <= contact_limit)
@@ -617,7 +624,7 @@ class RemarketingSender:
                                         if btn.get('price') and btn.get('description'):
                                             remarketing_buttons.append({
                                                 'text': btn.get('text', 'Comprar'),
-                                                'callback_data': f"rmkt_{campaign.id}_{btn_idx}"
+                                                'callback_data': encode_callback('rmkt', campaign.id, btn_idx)
                                             })
                                         elif btn.get('url'):
                                             remarketing_buttons.append({
@@ -807,14 +814,14 @@ class RemarketingSender:
                                 logger.warning(f"Batch {batch_number} nao foi salvo no banco, mas processamento continuara")
 
                         try:
-                            socketio.emit('remarketing_progress', {
+                            emit_coalesced(bot_owner_id(campaign.bot_id), 'remarketing_progress', {
                                 'campaign_id': campaign.id,
                                 'sent': campaign.total_sent,
                                 'failed': campaign.total_failed,
                                 'blocked': campaign.total_blocked,
                                 'total': campaign.total_targets,
                                 'percentage': round((campaign.total_sent / campaign.total_targets) * 100, 1) if campaign.total_targets > 0 else 0
-                            })
+                            }, key=campaign.id)
                         except Exception as socket_error:
                             logger.warning(f"Erro ao emitir progresso WebSocket: {socket_error}")
 
@@ -849,12 +856,12 @@ class RemarketingSender:
                             logger.error(f"Erro critico ao finalizar campanha: {retry_error}", exc_info=True)
 
                     try:
-                        socketio.emit('remarketing_completed', {
+                        emit_to_user(bot_owner_id(campaign.bot_id), 'remarketing_completed', {
                             'campaign_id': campaign.id,
                             'total_sent': campaign.total_sent,
                             'total_failed': campaign.total_failed,
                             'total_blocked': campaign.total_blocked
-                        })
+                        }, supersedes='remarketing_progress', key=campaign.id)
                     except Exception as socket_error:
                         logger.warning(f"Erro ao emitir conclusao WebSocket: {socket_error}")
                 except KeyboardInterrupt:
@@ -1049,7 +1056,8 @@ class RemarketingSender:
                     campaign_id = job.get('campaign_id')
                     try:
                         from flask import current_app
-                        from internal_logic.core.extensions import db, socketio
+                        from internal_logic.core.extensions import db
+                        from internal_logic.services.realtime_bus import bot_owner_id, emit_to_user
                         from internal_logic.core.models import RemarketingCampaign, get_brazil_time
                         with current_app.app_context():
                             campaign = db.session.get(RemarketingCampaign, int(campaign_id)) if campaign_id else None
@@ -1060,12 +1068,12 @@ class RemarketingSender:
                                 db.session.commit()
                                 logger.info(f"Campaign DONE bot_id={bot_id} sent={campaign.total_sent} failed={campaign.total_failed} blocked={campaign.total_blocked}")
                                 try:
-                                    socketio.emit('remarketing_completed', {
+                                    emit_to_user(bot_owner_id(campaign.bot_id), 'remarketing_completed', {
                                         'campaign_id': campaign.id,
                                         'total_sent': campaign.total_sent,
                                         'total_failed': campaign.total_failed,
                                         'total_blocked': campaign.total_blocked
-                                    })
+                                    }, supersedes='remarketing_progress', key=campaign.id)
                                 except Exception:
                                     pass
                                 logger.info(f"Remarketing campaign finalizada via sentinel: campaign_id={campaign.id}")
@@ -1155,7 +1163,8 @@ class RemarketingSender:
                 try:
                     if campaign_id:
                         from flask import current_app
-                        from internal_logic.core.extensions import db, socketio
+                        from internal_logic.core.extensions import db
+                        from internal_logic.services.realtime_bus import bot_owner_id, emit_coalesced
                         from internal_logic.core.models import RemarketingCampaign
                         with current_app.app_context():
                             campaign = db.session.get(RemarketingCampaign, int(campaign_id))
@@ -1166,14 +1175,14 @@ class RemarketingSender:
                                 campaign.total_blocked += blocked_inc
                                 db.session.commit()
                                 try:
-                                    socketio.emit('remarketing_progress', {
+                                    emit_coalesced(bot_owner_id(campaign.bot_id), 'remarketing_progress', {
                                         'campaign_id': campaign.id,
                                         'sent': campaign.total_sent,
                                         'failed': campaign.total_failed,
                                         'blocked': campaign.total_blocked,
                                         'total': campaign.total_targets,
                                         'percentage': round((campaign.total_sent / campaign.total_targets) * 100, 1) if campaign.total_targets > 0 else 0
-                                    })
+                                    }, key=campaign.id)
                                 except Exception:
                                     pass
                 except Exception as update_error:
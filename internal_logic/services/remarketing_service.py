@@ -225,6 +225,7 @@ class RemarketingService:
         THREAD SAFE: user_id explícito para evitar current_user em threads
         """
         from internal_logic.core.models import BotUser, Payment
+        from internal_logic.services.lead_lookup import broadcast_load
         
         try:
             # LOGS DE AUDITORIA INTERNA - RAIO-X DA QUERY
@@ -235,7 +236,7 @@ class RemarketingService:
             
             # Base query com filtro de segurança (multitenancy) e usuários não bloqueados
             # ARMADILHA DO NULL: Leads antigos têm archived=NULL, não False
-            query = BotUser.query.filter(BotUser.bot_id == campaign.bot_id).filter(
+            query = BotUser.query.options(broadcast_load()).filter(BotUser.bot_id == campaign.bot_id).filter(
                 (BotUser.archived.is_(False)) | (BotUser.archived.is_(None))
             )
             
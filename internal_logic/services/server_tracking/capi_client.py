@@ -14,6 +14,7 @@ Envia eventos para a Meta CAPI seguindo exatamente a documentação:
 """
 
 import logging
+import os
 import time
 from typing import Optional, Dict, Any
 
@@ -21,7 +22,7 @@ import requests
 
 logger = logging.getLogger(__name__)
 
-META_CAPI_BASE_URL = "https://graph.facebook.com/v19.0/{pixel_id}/events"
+META_CAPI_BASE_URL = os.environ.get('META_CAPI_BASE_URL', "https://graph.facebook.com/v19.0/{pixel_id}/events")
 REQUEST_TIMEOUT = 3  # 3s timeout padrão unificado
 MAX_RETRIES = 3
 
@@ -64,6 +65,7 @@ def send_event(
     event: Dict[str, Any],
     test_event_code: Optional[str] = None,
     validate_token: bool = False,
+    raise_on_client_error: bool = False,
 ) -> bool:
     """Envia um evento para a Meta CAPI.
 
@@ -72,6 +74,8 @@ def send_event(
         access_token: Access Token (deve estar decriptado)
         event: Payload do evento (event_name, event_time, user_data, ...)
         test_event_code: Código de teste (Events Manager)
+        raise_on_client_error: 4xx levanta CAPIClient4xxError em vez de
+            retornar False (o outbox usa para ir direto ao dead-letter)
 
     Returns:
         True se evento recebido com sucesso (events_received >= 1)
@@ -136,6 +140,9 @@ def send_event(
                     f"| event_id={event.get('event_id', '?')} "
                     f"| response={resp.text}"
                 )
+                # 429 cai aqui também: fica para o backoff do outbox, não é dead-letter
+                if raise_on_client_error and resp.status_code != 429:
+                    raise CAPIClient4xxError(f"HTTP {resp.status_code}: {resp.text[:500]}")
                 return False
 
             # ── 429: Rate limit — backoff longo ──────────────
@@ -208,6 +215,9 @@ def send_event(
                 )
                 return False
 
+        except CAPIClient4xxError:
+            raise
+
         except Exception as e:
             logger.error(
                 f"[CAPI] Erro inesperado | pixel={pixel_id} | erro={e}",
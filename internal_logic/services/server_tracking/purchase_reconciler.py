@@ -1,149 +1,313 @@
 """
 Purchase Reconciler — RQ Job Core Logic
 ========================================
-Poll payments com status='paid' e meta_purchase_sent=False,
-verifica se o pool está em SERVER MODE, e envia Purchase via Meta CAPI.
+Envia Purchase via Meta CAPI para payments pagos de pools em SERVER MODE,
+consumindo o outbox purchase_outbox (uma linha por payment):
+
+    enqueue_purchase(payment)  → apply_paid_statistics (mesma transação do 'paid')
+    sync_outbox()              → varredura set-based: payments pagos (7 dias)
+                                 ainda sem linha no outbox (outros caminhos de 'paid')
+    reconcile_purchases()      → reivindica lotes (FOR UPDATE SKIP LOCKED LIMIT n),
+                                 pré-carrega pools, bot_users e tracking do lote e
+                                 envia; token decriptado em cache por pool no tick
+
+Estados: pending → sent | dead | skipped
+- falha transitória (5xx/timeout/429) → backoff exponencial em next_attempt_at
+- 4xx da Meta ou MAX_ATTEMPTS esgotado → dead (com last_error), nunca mais retentado
+- pool fora de SERVER MODE / sem Purchase habilitado → skipped
 
 SÓ processa pools em SERVER MODE (access_token presente).
 Pools HTML-ONLY são ignorados — o browser Pixel no delivery.html assume.
 """
 
+import json
 import logging
-from typing import Optional, Dict, Any
 from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
 
+from internal_logic.core.extensions import db
+from internal_logic.core.models import PurchaseOutbox, get_brazil_time, normalize_lead_id
 from internal_logic.core.redis_manager import get_redis_connection
+from internal_logic.services.delivery_cache import mark_purchase_sent
 from . import is_server_mode
+from .capi_client import CAPIClient4xxError, send_event
 from .payload_builder import build_purchase_payload
-from .capi_client import send_event
 
 logger = logging.getLogger(__name__)
 
+BATCH_SIZE = 100
+MAX_BATCHES_PER_TICK = 5
+MAX_ATTEMPTS = 8
+BACKOFF_BASE_SECONDS = 60
+BACKOFF_MAX_SECONDS = 6 * 3600
+# linha reivindicada fica invisível a outros workers por este tempo (worker morto → volta sozinha)
+CLAIM_LEASE_SECONDS = 300
+LOOKBACK_DAYS = 7
 
-def _recover_tracking_data(tracking_token: Optional[str]) -> Optional[Dict[str, Any]]:
-    """Recupera dados de tracking do Redis.
 
-    Key: tracking:{tracking_token}
-    """
-    if not tracking_token:
+def backoff_seconds(attempts: int) -> int:
+    """Espera antes da próxima tentativa: 60s, 120s, 240s, ... (teto de 6h)."""
+    return min(BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0)), BACKOFF_MAX_SECONDS)
+
+
+def _insert_ignore():
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
         return None
+    return insert(PurchaseOutbox.__table__)
+
+
+def enqueue_purchase(payment) -> None:
+    """Coloca o Purchase do payment no outbox (sem commit; idempotente)."""
+    if not payment or not payment.id or not payment.pool_id:
+        return
+    now = get_brazil_time()
+    stmt = _insert_ignore()
+    if stmt is None:
+        if not PurchaseOutbox.query.filter_by(payment_id=payment.id).first():
+            db.session.add(PurchaseOutbox(payment_id=payment.id, next_attempt_at=now, created_at=now))
+        return
+    db.session.execute(
+        stmt.values(payment_id=payment.id, status='pending', attempts=0, next_attempt_at=now, created_at=now)
+        .on_conflict_do_nothing(index_elements=['payment_id'])
+    )
+
+
+def sync_outbox() -> int:
+    """INSERT ... SELECT dos payments pagos recentes que ainda não estão no outbox (com commit)."""
+    from sqlalchemy import exists, literal, select
+    from internal_logic.core.models import Payment
+
+    stmt = _insert_ignore()
+    if stmt is None:
+        return 0
+    now = get_brazil_time()
+    outbox = PurchaseOutbox.__table__
+    missing = select(
+        Payment.id,
+        literal('pending'),
+        literal(0),
+        literal(now),
+        literal(now),
+    ).where(
+        Payment.status == 'paid',
+        Payment.meta_purchase_sent == False,  # noqa: E712
+        Payment.pool_id.isnot(None),
+        Payment.paid_at > now - timedelta(days=LOOKBACK_DAYS),
+        ~exists().where(outbox.c.payment_id == Payment.id),
+    )
+    result = db.session.execute(
+        stmt.from_select(['payment_id', 'status', 'attempts', 'next_attempt_at', 'created_at'], missing)
+        .on_conflict_do_nothing(index_elements=['payment_id'])
+    )
+    db.session.commit()
+    return max(result.rowcount or 0, 0)
+
+
+def _claim_batch(limit: int) -> List[PurchaseOutbox]:
+    """Reivindica até `limit` linhas vencidas: attempts+1 e lease em next_attempt_at (commit)."""
+    now = get_brazil_time()
+    query = db.session.query(PurchaseOutbox.id).filter(
+        PurchaseOutbox.status == 'pending',
+        PurchaseOutbox.next_attempt_at <= now,
+    ).order_by(PurchaseOutbox.next_attempt_at).limit(limit)
+    if db.engine.dialect.name == 'postgresql':
+        query = query.with_for_update(skip_locked=True)
+    ids = [row.id for row in query]
+    if not ids:
+        db.session.commit()
+        return []
+    PurchaseOutbox.query.filter(PurchaseOutbox.id.in_(ids)).update(
+        {
+            PurchaseOutbox.attempts: PurchaseOutbox.attempts + 1,
+            PurchaseOutbox.next_attempt_at: now + timedelta(seconds=CLAIM_LEASE_SECONDS),
+        },
+        synchronize_session=False,
+    )
+    db.session.commit()
+    return PurchaseOutbox.query.filter(PurchaseOutbox.id.in_(ids)).all()
+
+
+def _recover_tracking_batch(tokens: List[str]) -> Dict[str, Dict[str, Any]]:
+    """tracking:{token} de todos os tokens do lote em um MGET."""
+    if not tokens:
+        return {}
     try:
         redis_conn = get_redis_connection(decode_responses=True)
-        key = f"tracking:{tracking_token}"
-        raw = redis_conn.get(key)
-        if raw:
-            import json
-            return json.loads(raw)
+        raws = redis_conn.mget([f"tracking:{token}" for token in tokens])
     except Exception as e:
         logger.warning(f"[RECONCILER] Erro ao ler tracking_data do Redis: {e}")
-    return None
+        return {}
+    tracking = {}
+    for token, raw in zip(tokens, raws):
+        if raw:
+            try:
+                tracking[token] = json.loads(raw)
+            except ValueError:
+                continue
+    return tracking
 
 
-def reconcile_purchases() -> int:
-    """Poll payments paid sem Purchase enviado e envia via CAPI.
+class _BatchContext:
+    """Pools, bot_users e tracking do lote, carregados em uma query/comando cada."""
 
-    Returns:
-        Número de payments processados (enviados ou ignorados).
-    """
-    from internal_logic.core.extensions import db
-    from internal_logic.core.models import Payment, BotUser, RedirectPool
+    def __init__(self, payments):
+        from sqlalchemy.orm import undefer_group
+        from internal_logic.core.models import BotUser, RedirectPool
+
+        pool_ids = {p.pool_id for p in payments if p.pool_id}
+        self.pools = {
+            pool.id: pool for pool in RedirectPool.query.filter(RedirectPool.id.in_(pool_ids))
+        } if pool_ids else {}
+
+        lead_keys = {(p.bot_id, self.lead_of(p)) for p in payments if p.bot_id and self.lead_of(p) is not None}
+        self.bot_users = {}
+        if lead_keys:
+            rows = BotUser.query.options(undefer_group('tracking'), undefer_group('profile')).filter(
+                BotUser.bot_id.in_({bot_id for bot_id, _ in lead_keys}),
+                BotUser.telegram_user_id.in_({lead for _, lead in lead_keys}),
+            )
+            self.bot_users = {
+                (user.bot_id, user.telegram_user_id): user
+                for user in rows
+                if (user.bot_id, user.telegram_user_id) in lead_keys
+            }
+
+        tokens = {token for token in (self.token_of(p) for p in payments) if token}
+        self.tracking = _recover_tracking_batch(sorted(tokens))
+
+    @staticmethod
+    def lead_of(payment) -> Optional[int]:
+        return payment.lead_id if payment.lead_id is not None else normalize_lead_id(payment.customer_user_id)
+
+    def bot_user_of(self, payment):
+        return self.bot_users.get((payment.bot_id, self.lead_of(payment)))
+
+    def token_of(self, payment) -> Optional[str]:
+        bot_user = self.bot_user_of(payment)
+        return (
+            getattr(payment, 'tracking_token', None)
+            or (getattr(bot_user, 'tracking_session_id', None) if bot_user else None)
+        )
+
+
+def _fail(row: PurchaseOutbox, error: str, now: datetime, permanent: bool = False) -> None:
+    row.last_error = error[:1000]
+    if permanent or row.attempts >= MAX_ATTEMPTS:
+        row.status = 'dead'
+        logger.error(f"[RECONCILER] ☠️ Purchase em dead-letter | payment={row.payment_id} | tentativas={row.attempts} | {error}")
+    else:
+        row.next_attempt_at = now + timedelta(seconds=backoff_seconds(row.attempts))
+        logger.warning(
+            f"[RECONCILER] ❌ Falha ao enviar Purchase | payment={row.payment_id} "
+            f"| tentativa {row.attempts}/{MAX_ATTEMPTS} | retry em {backoff_seconds(row.attempts)}s"
+        )
+
+
+def _process_batch(rows: List[PurchaseOutbox], token_cache: Dict[int, Optional[str]]) -> int:
+    from internal_logic.core.models import Payment
     from utils.encryption import decrypt
 
-    processed = 0
+    payments = {
+        p.id: p for p in Payment.query.filter(Payment.id.in_([row.payment_id for row in rows]))
+    }
+    context = _BatchContext(list(payments.values()))
+    now = get_brazil_time()
+    sent_tokens = []
 
-    try:
-        # Busca payments paid recentes sem Purchase enviado
-        payments = Payment.query.filter(
-            Payment.status == 'paid',
-            Payment.meta_purchase_sent == False,
-            Payment.pool_id.isnot(None),
-            Payment.paid_at > (datetime.utcnow() - timedelta(days=7)),
-        ).all()
+    for row in rows:
+        payment = payments.get(row.payment_id)
+        try:
+            if payment is None or payment.meta_purchase_sent:
+                row.status = 'sent' if payment is not None else 'skipped'
+                continue
+
+            # ─── GUARD: ONLY SERVER MODE ──────────────────
+            pool = context.pools.get(payment.pool_id)
+            if not is_server_mode(pool) or not pool.meta_events_purchase:
+                row.status = 'skipped'
+                continue
 
-        if not payments:
-            return 0
+            payload = build_purchase_payload(
+                payment, context.bot_user_of(payment), pool, context.tracking.get(context.token_of(payment))
+            )
+            if not payload:
+                _fail(row, 'payload vazio', now, permanent=True)
+                continue
 
-        logger.info(f"[RECONCILER] {len(payments)} payments pendentes de Purchase")
+            if pool.id not in token_cache:
+                token_cache[pool.id] = decrypt(pool.meta_access_token)
+            access_token = token_cache[pool.id]
+            if not access_token:
+                _fail(row, f'access_token inválido para pool {pool.id}', now)
+                continue
 
-        for payment in payments:
             try:
-                # ─── GUARD 1: ONLY SERVER MODE ────────────────
-                pool = RedirectPool.query.get(payment.pool_id)
-                if not is_server_mode(pool):
-                    continue
-                if not pool.meta_events_purchase:
-                    continue
-
-                # ─── Dados do bot_user ─────────────────────────
-                bot_user = None
-                if payment.bot_id and payment.customer_user_id:
-                    telegram_user_id = payment.customer_user_id
-                    if isinstance(telegram_user_id, str) and telegram_user_id.startswith('user_'):
-                        telegram_user_id = telegram_user_id.replace('user_', '')
-                    bot_user = BotUser.query.filter_by(
-                        bot_id=payment.bot_id,
-                        telegram_user_id=telegram_user_id,
-                    ).first()
-
-                # ─── Tracking data do Redis ────────────────────
-                tracking_token = (
-                    getattr(payment, 'tracking_token', None)
-                    or (getattr(bot_user, 'tracking_session_id', None) if bot_user else None)
-                )
-                tracking_data = _recover_tracking_data(tracking_token)
-
-                # ─── Monta payload Purchase ────────────────────
-                payload = build_purchase_payload(payment, bot_user, pool, tracking_data)
-                if not payload:
-                    logger.warning(
-                        f"[RECONCILER] Payload vazio para payment {payment.id}"
-                    )
-                    continue
-
-                # ─── Decrypt access_token ──────────────────────
-                access_token = decrypt(pool.meta_access_token)
-                if not access_token:
-                    logger.error(
-                        f"[RECONCILER] access_token inválido para pool {pool.id}"
-                    )
-                    continue
-
-                test_code = pool.meta_test_event_code or None
-
-                # ─── Envia via CAPI ────────────────────────────
                 success = send_event(
                     pixel_id=pool.meta_pixel_id,
                     access_token=access_token,
                     event=payload,
-                    test_event_code=test_code,
+                    test_event_code=pool.meta_test_event_code or None,
+                    raise_on_client_error=True,
                 )
+            except CAPIClient4xxError as client_error:
+                _fail(row, str(client_error), now, permanent=True)
+                continue
 
-                # ─── Marca como enviado ───────────────────────
-                if success:
-                    payment.meta_purchase_sent = True
-                    payment.meta_event_id = f"purchase_{payment.id}"
-                    payment.meta_purchase_sent_at = datetime.utcnow()
-                    db.session.commit()
-                    logger.info(
-                        f"[RECONCILER] ✅ Purchase enviado | payment={payment.id} "
-                        f"| event_id={payment.meta_event_id}"
-                    )
-                else:
-                    logger.warning(
-                        f"[RECONCILER] ❌ Falha ao enviar Purchase | payment={payment.id}"
-                    )
-                    db.session.rollback()
-
-                processed += 1
-
-            except Exception as e:
-                db.session.rollback()
-                logger.error(
-                    f"[RECONCILER] Erro processing payment {payment.id}: {e}",
-                    exc_info=True,
-                )
+            if not success:
+                _fail(row, 'envio CAPI falhou', now)
+                continue
 
+            row.status = 'sent'
+            row.last_error = None
+            payment.meta_purchase_sent = True
+            payment.meta_event_id = f"purchase_{payment.id}"
+            payment.meta_purchase_sent_at = datetime.utcnow()
+            sent_tokens.append(payment.delivery_token)
+            logger.info(f"[RECONCILER] ✅ Purchase enviado | payment={payment.id} | event_id={payment.meta_event_id}")
+        except Exception as e:
+            logger.error(f"[RECONCILER] Erro processing payment {row.payment_id}: {e}", exc_info=True)
+            _fail(row, f'erro interno: {e}', now)
+
+    db.session.commit()
+
+    # Página de entrega lê purchase_sent do registro no Redis: sem isso, cada
+    # recarga enfileiraria outro Purchase CAPI até o registro expirar
+    for token in sent_tokens:
+        mark_purchase_sent(token)
+    return len(rows)
+
+
+def reconcile_purchases(batch_size: int = BATCH_SIZE, max_batches: int = MAX_BATCHES_PER_TICK) -> int:
+    """Um tick do outbox: sincroniza pendências e processa até max_batches lotes.
+
+    Returns:
+        Número de linhas do outbox processadas (enviadas, falhas ou ignoradas).
+    """
+    processed = 0
+    token_cache: Dict[int, Optional[str]] = {}
+
+    try:
+        queued = sync_outbox()
+        if queued:
+            logger.info(f"[RECONCILER] {queued} payments adicionados ao outbox de Purchase")
     except Exception as e:
-        logger.error(f"[RECONCILER] Erro na query de payments: {e}", exc_info=True)
+        db.session.rollback()
+        logger.error(f"[RECONCILER] Erro ao sincronizar outbox: {e}", exc_info=True)
+
+    for _ in range(max_batches):
+        try:
+            rows = _claim_batch(batch_size)
+            if not rows:
+                break
+            processed += _process_batch(rows, token_cache)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"[RECONCILER] Erro no lote do outbox: {e}", exc_info=True)
+            break
 
     return processed
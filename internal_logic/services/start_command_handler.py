@@ -6,11 +6,15 @@ Extraido do BotManager (Fase 9).
 """
 
 import logging
-from datetime import datetime
 from typing import Dict, Any
 
 from internal_logic.core.redis_manager import get_redis_connection
+from internal_logic.core.redis_scripts import claim_once
 from internal_logic.services.bot_messenger import checkActiveFlow
+from internal_logic.services.callback_codec import encode as encode_callback
+from internal_logic.services.lead_upsert import (
+    LEAD_UPSERTED_FLAG, load_start_tracking, mark_welcome_sent, split_start_param, upsert_lead,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -38,113 +42,58 @@ def handle_start_command(bot_manager, bot_id: int, token: str, config: Dict[str,
                 logger.warning(f"⚠️ Falha ao extrair start_param do texto: {e}")
 
         # ✅ PATCH: extrair pixel_id transportado no start_param (formato token__px_<pixel>) sem sobrescrever tracking base
-        pixel_id_from_start = None
-        if start_param and '__px_' in start_param:
-            parts = start_param.split('__px_', 1)
-            if parts and parts[0]:
-                start_param = parts[0]
-            if len(parts) > 1 and parts[1]:
-                pixel_id_from_start = parts[1]
-                logger.info(f"✅ Pixel transportado no start_param preservado: {pixel_id_from_start}")
+        start_param, pixel_id_from_start = split_start_param(start_param)
+        if pixel_id_from_start:
+            logger.info(f"✅ Pixel transportado no start_param preservado: {pixel_id_from_start}")
 
         # ============================================================================
-        # ✅ HIDRATAÇÃO DE TRACKING (PRIORIDADE MÁXIMA - ANTES DE QUALQUER RESET)
+        # ✅ LEAD DO /START EM UM COMANDO (PRIORIDADE MÁXIMA - ANTES DE QUALQUER RESET)
         # ============================================================================
-        logger.info(f"🔍 Tentando processar tracking para param: '{start_param}'")
-        try:
-            from flask import current_app
-            from internal_logic.core.extensions import db
-            from internal_logic.core.models import BotUser
-            if start_param:
+        # Tracking, UTMs, pixel do deep link, last_interaction e reset do welcome
+        # num único INSERT ... ON CONFLICT. Vindo do worker, o upsert já foi feito
+        # junto com a criação do lead; aqui só no caminho sem worker (polling).
+        if not message.get(LEAD_UPSERTED_FLAG):
+            logger.info(f"🔍 Tentando processar tracking para param: '{start_param}'")
+            try:
+                from flask import current_app
+                from internal_logic.core.extensions import db
                 with current_app.app_context():
-                    bot_user_track = BotUser.query.filter_by(
-                        bot_id=bot_id,
-                        telegram_user_id=telegram_user_id,
-                        archived=False
-                    ).first()
-                    # ✅ Preservar pixel_id transportado sem sobrescrever associação existente
-                    if bot_user_track and pixel_id_from_start and not bot_user_track.campaign_code:
-                        bot_user_track.campaign_code = pixel_id_from_start
+                    try:
+                        upsert_lead(
+                            bot_id,
+                            telegram_user_id,
+                            first_name=user_from.get('first_name', ''),
+                            username=user_from.get('username', ''),
+                            tracking=load_start_tracking(start_param),
+                            campaign_code_fallback=pixel_id_from_start,
+                            reset_welcome=True,
+                        )
                         db.session.commit()
-                        logger.info(f"✅ Pixel do funil associado ao BotUser {bot_user_track.id} via start_param (campanha não sobrescrita)")
-                    if bot_user_track:
-                        import json as _json
-                        tracking_key = f"tracking:{start_param}"
-                        redis_conn = get_redis_connection()
-                        raw_payload = redis_conn.get(tracking_key) if redis_conn else None
-                        if raw_payload:
-                            payload = _json.loads(raw_payload)
-                            
-                            # V4.1: Salvar tracking_token se tiver 32 chars
-                            if len(start_param) == 32:
-                                bot_user_track.tracking_session_id = start_param
-                                logger.info(f"?? V4.1 - tracking_token salvo: {start_param[:8]}...")
-                            
-                            # V4.1: Salvar pixel_id do payload
-                            if payload.get('pixel_id'):
-                                bot_user_track.campaign_code = payload.get('pixel_id')
-                                logger.info(f"?? V4.1 - pixel_id salvo em campaign_code: {payload.get('pixel_id')}")
-                            
-                            # Salvar dados de tracking existentes
-                            bot_user_track.fbclid = payload.get('fbclid') or bot_user_track.fbclid
-                            bot_user_track.fbp = payload.get('fbp') or bot_user_track.fbp
-                            bot_user_track.fbc = payload.get('fbc') or bot_user_track.fbc
-                            bot_user_track.last_fbclid = payload.get('fbclid') or bot_user_track.last_fbclid
-                            bot_user_track.last_fbp = payload.get('fbp') or bot_user_track.last_fbp
-                            bot_user_track.last_fbc = payload.get('fbc') or bot_user_track.last_fbc
-                            bot_user_track.user_agent = payload.get('client_user_agent') or bot_user_track.user_agent
-                            bot_user_track.ip_address = payload.get('client_ip') or bot_user_track.ip_address
-                            bot_user_track.utm_source = payload.get('utm_source') or bot_user_track.utm_source
-                            bot_user_track.utm_campaign = payload.get('utm_campaign') or bot_user_track.utm_campaign
-                            bot_user_track.utm_content = payload.get('utm_content') or bot_user_track.utm_content
-                            bot_user_track.utm_medium = payload.get('utm_medium') or bot_user_track.utm_medium
-                            bot_user_track.utm_term = payload.get('utm_term') or bot_user_track.utm_term
-                            bot_user_track.click_timestamp = datetime.now()
-                            db.session.commit()
-                            logger.info(f"?? V4.1 - TRACKING LINKED: User {bot_user_track.id} -> FBCLID: {bot_user_track.fbclid} | Token: {start_param[:8]}...")
-        except Exception as e:
-            logger.warning(f"⚠️ Falha na hidratação inicial de tracking via start_param={start_param}: {e}")
+                        message[LEAD_UPSERTED_FLAG] = True
+                    except Exception:
+                        db.session.rollback()
+                        raise
+            except Exception as e:
+                logger.warning(f"⚠️ Falha na hidratação inicial de tracking via start_param={start_param}: {e}")
         
         # ============================================================================
         # ✅ PATCH QI 900 - ANTI-REPROCESSAMENTO DE /START
         # ============================================================================
         # PATCH 1: Bloquear múltiplos /start em sequência (intervalo de 5s)
         try:
-            import redis
             import time as _time
             redis_conn = get_redis_connection()
             last_start_key = f"gb:{bot_manager.user_id}:last_start:{chat_id}"
-            last_start = redis_conn.get(last_start_key)
-            now = int(_time.time())
+            # Verifica e registra o timestamp do /start atual no mesmo script (expira em 5s)
+            last_start = claim_once(redis_conn, last_start_key, 5, value=int(_time.time()))
             
-            if last_start and now - int(last_start) < 5:
+            if last_start is not None:
                 logger.info(f"⛔ Bloqueado /start duplicado em menos de 5s: chat_id={chat_id}")
                 return  # Sair sem processar
-            
-            # Registrar timestamp do /start atual (expira em 5s)
-            redis_conn.set(last_start_key, now, ex=5)
         except Exception as e:
             logger.warning(f"⚠️ Erro ao verificar anti-duplicação de /start: {e} - continuando processamento")
         
-        # PATCH 2: Se já enviou welcome, nunca mais envia
-        try:
-            from flask import current_app
-            from internal_logic.core.extensions import db
-            from internal_logic.core.models import BotUser
-            with current_app.app_context():
-                bot_user = BotUser.query.filter_by(
-                    bot_id=bot_id,
-                    telegram_user_id=telegram_user_id,
-                    archived=False
-                ).first()
-                
-                if bot_user and bot_user.welcome_sent:
-                    logger.info(f"🔁 Flag welcome_sent resetada para permitir novo /start: chat_id={chat_id}")
-                    bot_user.welcome_sent = False
-                    bot_user.welcome_sent_at = None
-                    db.session.commit()
-        except Exception as e:
-            logger.warning(f"⚠️ Erro ao verificar/resetar welcome_sent: {e} - continuando processamento")
+        # PATCH 2: welcome_sent volta a False no próprio upsert do lead (sem commit extra)
         
         # ============================================================================
         # ✅ QI 500: Lock para evitar /start duplicado (lock adicional de segurança)
@@ -156,12 +105,13 @@ def handle_start_command(bot_manager, bot_id: int, token: str, config: Dict[str,
         # ✅ QI 200: FAST RESPONSE MODE - Buscar apenas config mínima (1 query rápida)
         from flask import current_app
         from internal_logic.core.extensions import db
-        from internal_logic.core.models import Bot, BotUser
+        from internal_logic.core.models import Bot
         
-        # Buscar config do banco e fazer reset NO MESMO CONTEXTO (rápido - apenas 1 query)
+        # Buscar config do banco (rápido - apenas 1 query)
         with current_app.app_context():
-            # ✅ QI 500: RESET ABSOLUTO NO MESMO CONTEXTO (garante commit imediato)
-            bot_manager._reset_user_funnel(bot_id, chat_id, telegram_user_id, db_session=db.session)
+            # ✅ QI 500: RESET ABSOLUTO - estado do Redis; welcome_sent/last_interaction
+            # já foram resetados no upsert do lead
+            bot_manager._reset_user_funnel(bot_id, chat_id, telegram_user_id, db_session=db.session, reset_lead=False)
             
             bot = db.session.get(Bot, bot_id)
             if bot and bot.config:
@@ -169,20 +119,6 @@ def handle_start_command(bot_manager, bot_id: int, token: str, config: Dict[str,
             else:
                 config = config or {}
             
-            # ✅ QI 500: VERIFICAR welcome_sent APÓS reset (garantir que foi resetado)
-            bot_user_check = BotUser.query.filter_by(
-                bot_id=bot_id,
-                telegram_user_id=telegram_user_id,
-                archived=False
-            ).first()
-            
-            if bot_user_check and bot_user_check.welcome_sent:
-                # Se ainda está True, forçar reset novamente (proteção extra)
-                logger.warning(f"⚠️ welcome_sent ainda True após reset - forçando reset novamente")
-                bot_user_check.welcome_sent = False
-                bot_user_check.welcome_sent_at = None
-                db.session.commit()
-            
             # ✅ ISOLAMENTO: Enfileirar processamento com user_id no payload
             try:
                 from tasks_async import task_queue, process_start_async
@@ -242,25 +178,11 @@ def handle_start_command(bot_manager, bot_id: int, token: str, config: Dict[str,
                 bot_manager._execute_flow(bot_id, token, config, chat_id, telegram_user_id)
                 logger.info(f"✅ _execute_flow concluído sem exceções")
                 
-                # Marcar welcome_sent após fluxo iniciar
+                # Marcar welcome_sent após fluxo iniciar (único commit após o upsert)
                 from flask import current_app
-                from internal_logic.core.extensions import db
-                from internal_logic.core.models import BotUser
-                
                 with current_app.app_context():
-                    try:
-                        bot_user_update = BotUser.query.filter_by(
-                            bot_id=bot_id,
-                            telegram_user_id=telegram_user_id
-                        ).first()
-                        if bot_user_update:
-                            bot_user_update.welcome_sent = True
-                            from internal_logic.core.models import get_brazil_time
-                            bot_user_update.welcome_sent_at = get_brazil_time()
-                            db.session.commit()
-                            logger.info(f"✅ Fluxo iniciado - welcome_sent=True")
-                    except Exception as e:
-                        logger.error(f"Erro ao marcar welcome_sent: {e}")
+                    if mark_welcome_sent(bot_id, telegram_user_id):
+                        logger.info(f"✅ Fluxo iniciado - welcome_sent=True")
                 
                 logger.info(f"✅ Fluxo visual executado com sucesso - should_send_welcome=False (confirmado)")
                 
@@ -302,7 +224,7 @@ def handle_start_command(bot_manager, bot_id: int, token: str, config: Dict[str,
                     button_text = bot_manager._format_button_text(btn['text'], price, btn.get('price_position'))
                     buttons.append({
                         'text': button_text,
-                        'callback_data': f"buy_{index}"  # ✅ CORREÇÃO: Usar apenas o índice (max 10 bytes)
+                        'callback_data': encode_callback('buy', index)  # ✅ CORREÇÃO: Usar apenas o índice (max 10 bytes)
                     })
             
             # Adicionar botões de redirecionamento (com URL)
@@ -339,25 +261,11 @@ def handle_start_command(bot_manager, bot_id: int, token: str, config: Dict[str,
             if result:
                 logger.info(f"✅ Mensagem /start enviada com {len(buttons)} botão(ões)")
                 
-                # ✅ MARCAR COMO ENVIADO NO BANCO
+                # ✅ MARCAR COMO ENVIADO NO BANCO (único commit após o upsert)
                 from flask import current_app
-                from internal_logic.core.extensions import db
-                from internal_logic.core.models import BotUser
-                
                 with current_app.app_context():
-                    try:
-                        bot_user_update = BotUser.query.filter_by(
-                            bot_id=bot_id,
-                            telegram_user_id=telegram_user_id
-                        ).first()
-                        if bot_user_update:
-                            bot_user_update.welcome_sent = True
-                            from internal_logic.core.models import get_brazil_time
-                            bot_user_update.welcome_sent_at = get_brazil_time()
-                            db.session.commit()
-                            logger.info(f"✅ Marcado como welcome_sent=True")
-                    except Exception as e:
-                        logger.error(f"Erro ao marcar welcome_sent: {e}")
+                    if mark_welcome_sent(bot_id, telegram_user_id):
+                        logger.info(f"✅ Marcado como welcome_sent=True")
                 
                 # ✅ Enviar áudio adicional se habilitado
                 if welcome_audio_enabled and welcome_audio_url:
@@ -382,25 +290,16 @@ def handle_start_command(bot_manager, bot_id: int, token: str, config: Dict[str,
             logger.info(f"✅ Apenas o fluxo visual será executado, sem welcome_message tradicional")
         
         # ✅ CORREÇÃO: Emitir evento via WebSocket apenas para o dono do bot
+        # (agrupado: rajada de /start vira no máximo N eventos/s por bot)
         try:
-            from flask import current_app
-            from internal_logic.core.extensions import db
-            from internal_logic.core.models import Bot
-            with current_app.app_context():
-                bot = db.session.get(Bot, bot_id)
-                if bot:
-                    # 🔥 CRÍTICO: Blindagem UI - WebSocket nunca deve abortar transação
-                    try:
-                        if bot_manager.socketio:
-                            bot_manager.socketio.emit('bot_interaction', {
-                                'bot_id': bot_id,
-                                'type': 'start',
-                                'chat_id': chat_id,
-                                'user': message.get('from', {}).get('first_name', 'Usuário')
-                            }, room=f'user_{bot.user_id}')
-                    except Exception as ws_error:
-                        logger.debug(f"Falha não-crítica na UI (WebSocket ignorado): {ws_error}")
-                        pass  # Processamento continua mesmo se UI falhar
+            from internal_logic.services.realtime_bus import bot_owner_id, emit_coalesced
+            if bot_manager.socketio:
+                emit_coalesced(bot_owner_id(bot_id), 'bot_interaction', {
+                    'bot_id': bot_id,
+                    'type': 'start',
+                    'chat_id': chat_id,
+                    'user': message.get('from', {}).get('first_name', 'Usuário')
+                }, key=bot_id)
         except Exception as db_error:
             logger.warning(f"⚠️ Erro ao buscar bot para WebSocket (não crítico): {db_error}")
         
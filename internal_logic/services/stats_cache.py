@@ -0,0 +1,133 @@
+"""
+Stats Cache - Cache com Soft-TTL e Single-Flight no Redis
+==========================================================
+Evita o "stampede" do dashboard: quando o cache expira, apenas UM processo
+recalcula cada chave; os demais continuam servindo o valor anterior.
+
+- fresco (idade < soft_ttl)      → retorna do cache
+- velho (soft_ttl ≤ idade)       → retorna o valor velho e, se pegar o lock,
+                                   recalcula em background
+- ausente                        → quem pega o lock calcula; os outros
+                                   aguardam o resultado (até wait_timeout)
+
+O valor fica no Redis por hard_ttl (bem maior que soft_ttl), então um
+refresh lento nunca deixa o dashboard sem dados. Sem Redis, calcula direto.
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from flask import current_app, has_app_context
+
+from internal_logic.core.redis_scripts import new_lock_token, release_lock
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOFT_TTL = 30
+DEFAULT_HARD_TTL = 600
+LOCK_TTL_SECONDS = 30
+WAIT_TIMEOUT_SECONDS = 5.0
+WAIT_STEP_SECONDS = 0.05
+
+# Contadores do processo (expostos ao benchmark)
+stats: Dict[str, int] = {'hits': 0, 'stale': 0, 'computes': 0, 'waits': 0}
+
+
+def _get_redis():
+    from internal_logic.core.redis_manager import get_redis_connection
+    return get_redis_connection()
+
+
+def _lock_key(key: str) -> str:
+    return f"{key}:lock"
+
+
+def _store(redis_conn, key: str, data: Any, hard_ttl: int) -> None:
+    redis_conn.set(key, json.dumps({'computed_at': time.time(), 'data': data}, default=str), ex=hard_ttl)
+
+
+def _release(redis_conn, key: str, token: str) -> None:
+    try:
+        release_lock(redis_conn, _lock_key(key), token)
+    except Exception:
+        pass
+
+
+def _compute_and_store(redis_conn, key: str, compute: Callable[[], Any], hard_ttl: int, token: str) -> Any:
+    try:
+        stats['computes'] += 1
+        data = compute()
+        _store(redis_conn, key, data, hard_ttl)
+        return data
+    finally:
+        _release(redis_conn, key, token)
+
+
+def _refresh_in_background(redis_conn, key: str, compute: Callable[[], Any], hard_ttl: int, token: str) -> None:
+    app = current_app._get_current_object() if has_app_context() else None
+
+    def _run():
+        try:
+            if app is None:
+                _compute_and_store(redis_conn, key, compute, hard_ttl, token)
+                return
+            with app.app_context():
+                try:
+                    _compute_and_store(redis_conn, key, compute, hard_ttl, token)
+                finally:
+                    from internal_logic.core.extensions import db
+                    db.session.remove()
+        except Exception as e:
+            logger.warning(f"⚠️ [STATS CACHE] Refresh em background falhou para {key}: {e}")
+
+    threading.Thread(target=_run, name=f'stats-refresh:{key}', daemon=True).start()
+
+
+def get_or_compute(key: str, compute: Callable[[], Any], soft_ttl: int = DEFAULT_SOFT_TTL,
+                   hard_ttl: int = DEFAULT_HARD_TTL, wait_timeout: float = WAIT_TIMEOUT_SECONDS) -> Any:
+    """
+    Retorna o valor da chave, recalculando no máximo uma vez por vez (single-flight).
+
+    Args:
+        key: chave Redis (ex.: gb:stats:{bot_id}:{period})
+        compute: função sem argumentos que devolve dados serializáveis em JSON
+        soft_ttl: idade (s) a partir da qual o valor é recalculado em background
+        hard_ttl: tempo (s) que o valor permanece no Redis
+        wait_timeout: espera máxima (s) pelo cálculo de outro processo
+    """
+    try:
+        redis_conn = _get_redis()
+        raw = redis_conn.get(key)
+    except Exception as e:
+        logger.debug(f"Stats cache indisponível ({e}) - calculando direto")
+        return compute()
+
+    token = new_lock_token()
+    if raw:
+        cached = json.loads(raw)
+        if time.time() - cached.get('computed_at', 0) < soft_ttl:
+            stats['hits'] += 1
+            return cached['data']
+        stats['stale'] += 1
+        if redis_conn.set(_lock_key(key), token, nx=True, ex=LOCK_TTL_SECONDS):
+            _refresh_in_background(redis_conn, key, compute, hard_ttl, token)
+        return cached['data']
+
+    if redis_conn.set(_lock_key(key), token, nx=True, ex=LOCK_TTL_SECONDS):
+        return _compute_and_store(redis_conn, key, compute, hard_ttl, token)
+
+    # Outro processo está calculando: aguardar o resultado
+    stats['waits'] += 1
+    deadline = time.monotonic() + wait_timeout
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP_SECONDS)
+        raw = redis_conn.get(key)
+        if raw:
+            return json.loads(raw)['data']
+    logger.warning(f"⚠️ [STATS CACHE] Timeout aguardando {key} - calculando localmente")
+    stats['computes'] += 1
+    return compute()
+
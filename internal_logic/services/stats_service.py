@@ -6,7 +6,7 @@ Implementação performática com queries SQL diretas para evitar problemas de s
 
 import logging
 from datetime import datetime, timedelta
-from sqlalchemy import text, extract, func
+from sqlalchemy import and_, extract, func, or_, text
 from internal_logic.core.extensions import db
 from internal_logic.core.models import Payment, BotUser, get_brazil_time
 
@@ -28,10 +28,16 @@ class StatsService:
         except (ValueError, TypeError):
             return get_brazil_time() - timedelta(days=30)  # Default: 30 dias
     
+    @staticmethod
+    def _paid_sum(condition):
+        """SUM(amount) FILTER (WHERE condition), zero quando não há linhas"""
+        return func.coalesce(func.sum(Payment.amount).filter(condition), 0)
+    
     @staticmethod
     def get_bot_metrics(bot_id, period_days=30):
         """
-        Calcula métricas principais do bot usando SQL direto
+        Calcula métricas principais do bot em uma única varredura de payments
+        (agregações com FILTER) e uma de bot_users
         
         Args:
             bot_id: ID do bot
@@ -40,128 +46,65 @@ class StatsService:
         Returns:
             dict: Métricas calculadas
         """
-        # REMOVIDO: try/except temporariamente para expor erros SQL
-        # Filtro de período
+        in_period = period_days != 'all'
         date_filter = StatsService.get_period_filter(period_days)
-        date_filter_str = date_filter.strftime('%Y-%m-%d %H:%M:%S') if period_days != 'all' else None
-        
-        # Usar SQL direto via session (compatível SQLAlchemy 2.0)
-        # Total de vendas pagas
-        if date_filter_str:
-            sales_query = text("""
-                SELECT COUNT(*) as count 
-                FROM payments 
-                WHERE bot_id = :bot_id AND status = 'paid' AND paid_at >= :date_filter
-            """)
-            total_sales = db.session.execute(sales_query, {"bot_id": bot_id, "date_filter": date_filter_str}).scalar()
-        else:
-            sales_query = text("SELECT COUNT(*) FROM payments WHERE bot_id = :bot_id AND status = 'paid'")
-            total_sales = db.session.execute(sales_query, {"bot_id": bot_id}).scalar()
-        
-        # Receita total
-        if date_filter_str:
-            revenue_query = text("""
-                SELECT COALESCE(SUM(amount), 0) as revenue 
-                FROM payments 
-                WHERE bot_id = :bot_id AND status = 'paid' AND paid_at >= :date_filter
-            """)
-            total_revenue = db.session.execute(revenue_query, {"bot_id": bot_id, "date_filter": date_filter_str}).scalar()
-        else:
-            revenue_query = text("SELECT COALESCE(SUM(amount), 0) FROM payments WHERE bot_id = :bot_id AND status = 'paid'")
-            total_revenue = db.session.execute(revenue_query, {"bot_id": bot_id}).scalar()
-        
-        # Total de checkouts iniciados (todos os status)
-        if date_filter_str:
-            checkout_query = text("""
-                SELECT COUNT(*) as count 
-                FROM payments 
-                WHERE bot_id = :bot_id AND created_at >= :date_filter
-            """)
-            total_checkouts = db.session.execute(checkout_query, {"bot_id": bot_id, "date_filter": date_filter_str}).scalar()
-        else:
-            checkout_query = text("SELECT COUNT(*) FROM payments WHERE bot_id = :bot_id")
-            total_checkouts = db.session.execute(checkout_query, {"bot_id": bot_id}).scalar()
-        
-        # Taxa de conversão
-        conversion_rate = (total_sales / total_checkouts * 100) if total_checkouts > 0 else 0.0
-        
-        # Ticket médio
-        avg_ticket = (total_revenue / total_sales) if total_sales > 0 else 0.0
         
         # ✅ SENIOR: Calcular "Hoje" baseado no Horário de Brasília
-        today_now = get_brazil_time()
-        today_start = today_now.replace(hour=0, minute=0, second=0, microsecond=0)
-        today_start_str = today_start.strftime('%Y-%m-%d %H:%M:%S')
-        today_end_str = (today_start + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
-        
-        today_sales = db.session.execute(
-            text("""SELECT COUNT(*) FROM payments 
-               WHERE bot_id = :bot_id AND status = 'paid' 
-               AND paid_at >= :start_date AND paid_at < :end_date"""),
-            {"bot_id": bot_id, "start_date": today_start_str, "end_date": today_end_str}
-        ).scalar()
+        today_start = get_brazil_time().replace(hour=0, minute=0, second=0, microsecond=0)
+        tomorrow_start = today_start + timedelta(days=1)
+        yesterday_start = today_start - timedelta(days=1)
         
-        today_revenue = db.session.execute(
-            text("""SELECT COALESCE(SUM(amount), 0) FROM payments 
-               WHERE bot_id = :bot_id AND status = 'paid' 
-               AND paid_at >= :start_date AND paid_at < :end_date"""),
-            {"bot_id": bot_id, "start_date": today_start_str, "end_date": today_end_str}
-        ).scalar()
+        paid = Payment.status == 'paid'
+        paid_in_period = and_(paid, Payment.paid_at >= date_filter) if in_period else paid
+        paid_today = and_(paid, Payment.paid_at >= today_start, Payment.paid_at < tomorrow_start)
+        paid_yesterday = and_(paid, Payment.paid_at >= yesterday_start, Payment.paid_at < today_start)
         
-        # Métricas de ontem
-        yesterday_start_str = (today_start - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+        payments = db.session.query(
+            func.count(Payment.id).filter(paid_in_period).label('total_sales'),
+            StatsService._paid_sum(paid_in_period).label('total_revenue'),
+            (func.count(Payment.id).filter(Payment.created_at >= date_filter) if in_period
+             else func.count(Payment.id)).label('total_checkouts'),
+            func.count(Payment.id).filter(paid_today).label('today_sales'),
+            StatsService._paid_sum(paid_today).label('today_revenue'),
+            func.count(Payment.id).filter(paid_yesterday).label('yesterday_sales'),
+            StatsService._paid_sum(paid_yesterday).label('yesterday_revenue'),
+        ).filter(Payment.bot_id == bot_id)
+        if in_period:
+            # Limita a varredura à janela (período ou ontem, o que for mais antigo)
+            lower = min(date_filter, yesterday_start)
+            payments = payments.filter(or_(Payment.created_at >= lower, Payment.paid_at >= lower))
+        row = payments.one()
         
-        yesterday_sales = db.session.execute(
-            text("""SELECT COUNT(*) FROM payments 
-               WHERE bot_id = :bot_id AND status = 'paid' 
-               AND paid_at >= :start_date AND paid_at < :end_date"""),
-            {"bot_id": bot_id, "start_date": yesterday_start_str, "end_date": today_start_str}
-        ).scalar()
+        total_sales = row.total_sales or 0
+        total_revenue = float(row.total_revenue or 0.0)
+        total_checkouts = row.total_checkouts or 0
         
-        yesterday_revenue = db.session.execute(
-            text("""SELECT COALESCE(SUM(amount), 0) FROM payments 
-               WHERE bot_id = :bot_id AND status = 'paid' 
-               AND paid_at >= :start_date AND paid_at < :end_date"""),
-            {"bot_id": bot_id, "start_date": yesterday_start_str, "end_date": today_start_str}
-        ).scalar()
+        # Taxa de conversão e ticket médio
+        conversion_rate = (total_sales / total_checkouts * 100) if total_checkouts > 0 else 0.0
+        avg_ticket = (total_revenue / total_sales) if total_sales > 0 else 0.0
         
         # Variação percentual
-        revenue_change = StatsService._calculate_percentage_change(today_revenue, yesterday_revenue)
-        sales_change = StatsService._calculate_percentage_change(today_sales, yesterday_sales)
-        
-        # Métricas de usuários
-        total_users = db.session.execute(
-            text("SELECT COUNT(*) FROM bot_users WHERE bot_id = :bot_id"), 
-            {"bot_id": bot_id}
-        ).scalar()
+        revenue_change = StatsService._calculate_percentage_change(float(row.today_revenue or 0), float(row.yesterday_revenue or 0))
+        sales_change = StatsService._calculate_percentage_change(row.today_sales or 0, row.yesterday_sales or 0)
         
-        # Usuários ativos (com interação no período)
-        if date_filter_str:
-            active_users = db.session.execute(
-                text("""SELECT COUNT(*) FROM bot_users 
-                   WHERE bot_id = :bot_id AND last_interaction >= :date_filter"""),
-                {"bot_id": bot_id, "date_filter": date_filter_str}
-            ).scalar()
+        # Métricas de usuários (total, ativos e novos no período)
+        if in_period:
+            users = db.session.query(
+                func.count(BotUser.id),
+                func.count(BotUser.id).filter(BotUser.last_interaction >= date_filter),
+                func.count(BotUser.id).filter(BotUser.first_interaction >= date_filter),
+            ).filter(BotUser.bot_id == bot_id).one()
         else:
-            active_users = 0
-        
-        # Novos usuários no período
-        if date_filter_str:
-            new_users = db.session.execute(
-                text("""SELECT COUNT(*) FROM bot_users 
-                   WHERE bot_id = :bot_id AND first_interaction >= :date_filter"""),
-                {"bot_id": bot_id, "date_filter": date_filter_str}
-            ).scalar()
-        else:
-            new_users = 0
+            users = (db.session.query(func.count(BotUser.id)).filter(BotUser.bot_id == bot_id).scalar(), 0, 0)
+        total_users, active_users, new_users = users
         
         return {
-            'total_sales': total_sales or 0,
-            'total_revenue': float(total_revenue or 0.0),
+            'total_sales': total_sales,
+            'total_revenue': total_revenue,
             'avg_ticket': round(float(avg_ticket), 2),
             'conversion_rate': round(float(conversion_rate), 2),
-            'today_sales': today_sales or 0,
-            'today_revenue': float(today_revenue or 0.0),
+            'today_sales': row.today_sales or 0,
+            'today_revenue': float(row.today_revenue or 0.0),
             'revenue_change': round(float(revenue_change), 1),
             'sales_change': round(float(sales_change), 1),
             'total_users': total_users or 0,
@@ -169,6 +112,85 @@ class StatsService:
             'new_users': new_users or 0
         }
     
+    @staticmethod
+    def get_dashboard_aggregates(bot_id, date_filter=None, today_start=None):
+        """
+        Contadores do dashboard (/api/bots/<id>/stats) em UMA varredura de payments,
+        todos sobre created_at: resumo, hoje/ontem, remarketing e funis
+        
+        Args:
+            bot_id: ID do bot
+            date_filter: início do período (None = todo o período)
+            today_start: início do dia corrente (referência para hoje/ontem)
+            
+        Returns:
+            dict: contagens (int) e somas (float) por métrica
+        """
+        tomorrow_start = today_start + timedelta(days=1)
+        yesterday_start = today_start - timedelta(days=1)
+        
+        in_period = Payment.created_at >= date_filter if date_filter else None
+        paid = and_(Payment.status == 'paid', in_period) if in_period is not None else Payment.status == 'paid'
+        pending = and_(Payment.status == 'pending', in_period) if in_period is not None else Payment.status == 'pending'
+        today = and_(Payment.status == 'paid', Payment.created_at >= today_start, Payment.created_at < tomorrow_start)
+        yesterday = and_(Payment.status == 'paid', Payment.created_at >= yesterday_start, Payment.created_at < today_start)
+        
+        segments = {
+            'total': paid,
+            'today': today,
+            'yesterday': yesterday,
+            'remarketing': and_(paid, Payment.is_remarketing == True),
+            'downsell': and_(paid, Payment.is_downsell == True),
+            'upsell': and_(paid, Payment.is_upsell == True),
+            'order_bump': and_(paid, Payment.order_bump_accepted == True),
+        }
+        columns = [func.count(Payment.id).filter(pending).label('pending')]
+        for name, condition in segments.items():
+            columns.append(func.count(Payment.id).filter(condition).label(f'{name}_sales'))
+            columns.append(StatsService._paid_sum(condition).label(f'{name}_revenue'))
+        
+        query = db.session.query(*columns).filter(Payment.bot_id == bot_id)
+        if date_filter:
+            query = query.filter(Payment.created_at >= min(date_filter, yesterday_start))
+        row = query.one()
+        
+        return {
+            key: (float(value or 0) if key.endswith('_revenue') else int(value or 0))
+            for key, value in row._mapping.items()
+        }
+    
+    @staticmethod
+    def get_daily_totals(bot_id, first_day, days):
+        """
+        Vendas pagas por dia (created_at) em um único GROUP BY, com dias sem
+        venda preenchidos com zero
+        
+        Returns:
+            list: [{date, day, sales, revenue}] do mais antigo para o mais recente
+        """
+        day_expr = func.date(Payment.created_at)
+        rows = db.session.query(
+            day_expr.label('date'),
+            func.count(Payment.id).label('sales'),
+            func.coalesce(func.sum(Payment.amount), 0).label('revenue')
+        ).filter(
+            Payment.bot_id == bot_id, Payment.status == 'paid',
+            Payment.created_at >= first_day, Payment.created_at < first_day + timedelta(days=days)
+        ).group_by(day_expr).all()
+        by_date = {str(row.date)[:10]: row for row in rows}
+        
+        series = []
+        for i in range(days):
+            day_start = first_day + timedelta(days=i)
+            row = by_date.get(day_start.strftime('%Y-%m-%d'))
+            series.append({
+                'date': day_start.strftime('%Y-%m-%d'),
+                'day': day_start.strftime('%d/%m'),
+                'sales': int(row.sales) if row else 0,
+                'revenue': float(row.revenue) if row else 0.0
+            })
+        return series
+    
     @staticmethod
     def get_sales_chart_data(bot_id, period_days=30):
         """
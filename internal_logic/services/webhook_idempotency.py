@@ -0,0 +1,313 @@
+"""
+Webhook Idempotency - Pré-check de Replays e Auditoria em Lote
+===============================================================
+Gateways reenviam o mesmo webhook agressivamente (timeouts, 404, retries
+automáticos). Antes de qualquer trabalho no banco, cada entrega é
+identificada por (gateway_type, transaction_id, status) e reivindicada no
+Redis com SET NX + TTL:
+
+- NEW        primeira entrega → processa normalmente
+- DUPLICATE  já processada com sucesso → 200 imediato, sem tocar no banco
+- IN_FLIGHT  outra requisição está processando → 409 (gateway tenta depois)
+
+O fingerprint só vira 'done' após sucesso; falhas (payment não encontrado,
+exceção) liberam a chave para que o retry do gateway seja processado.
+
+Linhas de auditoria (WebhookEvent) são gravadas por WebhookAuditWriter:
+fila em memória + thread que faz upsert em lote por dedup_key. Lote que
+falha é regravado linha a linha; as linhas que ainda falham voltam para a
+fila (com backoff) até MAX_WRITE_ATTEMPTS.
+"""
+
+import atexit
+import hashlib
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from internal_logic.core.extensions import db
+
+logger = logging.getLogger(__name__)
+
+CLAIM_NEW = 'new'
+CLAIM_DUPLICATE = 'duplicate'
+CLAIM_IN_FLIGHT = 'in_flight'
+
+FINGERPRINT_PREFIX = 'gb:webhook:fp'
+# Janela de processamento (se o worker morrer, a chave expira e o retry passa)
+PROCESSING_TTL_SECONDS = 60
+# Janela de deduplicação após sucesso (gateways param de reenviar bem antes)
+DONE_TTL_SECONDS = 24 * 3600
+
+VALID_AUDIT_STATUSES = ('paid', 'pending', 'failed', 'cancelled', 'refunded')
+
+# Tentativas por linha de auditoria antes de descartar (erro transitório do banco)
+MAX_WRITE_ATTEMPTS = 5
+RETRY_BACKOFF_MAX_SECONDS = 30
+
+
+def _get_redis():
+    from internal_logic.core.redis_manager import get_redis_connection
+    return get_redis_connection()
+
+
+def fingerprint_key(gateway_type: str, transaction_id: str, status: str) -> str:
+    digest = hashlib.sha1(f"{transaction_id}|{status}".lower().encode()).hexdigest()[:24]
+    return f"{FINGERPRINT_PREFIX}:{gateway_type.lower()}:{digest}"
+
+
+def claim_webhook(gateway_type: str, transaction_id: Optional[str],
+                  status: Optional[str]) -> Tuple[str, Optional[str]]:
+    """
+    Reivindica uma entrega de webhook (SET NX + GET em um único round-trip).
+
+    Sem transaction_id não há como deduplicar; Redis indisponível = fail-open.
+
+    Returns:
+        (estado, chave): estado em CLAIM_NEW / CLAIM_DUPLICATE / CLAIM_IN_FLIGHT
+    """
+    transaction_id = str(transaction_id or '').strip()
+    if not transaction_id:
+        return CLAIM_NEW, None
+
+    key = fingerprint_key(gateway_type, transaction_id, str(status or ''))
+    try:
+        pipe = _get_redis().pipeline(transaction=False)
+        pipe.set(key, 'processing', nx=True, ex=PROCESSING_TTL_SECONDS)
+        pipe.get(key)
+        acquired, state = pipe.execute()
+    except Exception as e:
+        logger.warning(f"⚠️ [WEBHOOK IDEMPOTENCY] Redis indisponível, processando sem pré-check: {e}")
+        return CLAIM_NEW, None
+
+    if acquired:
+        return CLAIM_NEW, key
+    if state == 'done':
+        return CLAIM_DUPLICATE, key
+    return CLAIM_IN_FLIGHT, key
+
+
+def complete_webhook(key: Optional[str]) -> None:
+    """Marca a entrega como processada (replays viram DUPLICATE)."""
+    if not key:
+        return
+    try:
+        _get_redis().set(key, 'done', ex=DONE_TTL_SECONDS)
+    except Exception as e:
+        logger.warning(f"⚠️ [WEBHOOK IDEMPOTENCY] Falha ao marcar {key} como done: {e}")
+
+
+def release_webhook(key: Optional[str]) -> None:
+    """Libera a chave após falha para que o próximo retry seja processado."""
+    if not key:
+        return
+    try:
+        _get_redis().delete(key)
+    except Exception as e:
+        logger.warning(f"⚠️ [WEBHOOK IDEMPOTENCY] Falha ao liberar {key}: {e}")
+
+
+def build_audit_row(gateway_type: str, result: Dict[str, Any],
+                    raw_payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Monta a linha de WebhookEvent (mesma regra de dedup_key do worker RQ).
+    Retorna None para status inválidos — não são auditados.
+    """
+    from internal_logic.core.models import get_brazil_time
+
+    status = result.get('status')
+    if status not in VALID_AUDIT_STATUSES:
+        return None
+
+    transaction_id = str(
+        result.get('gateway_transaction_id')
+        or raw_payload.get('id')
+        or raw_payload.get('transaction_id')
+        or ''
+    ).strip()
+    transaction_hash = str(
+        result.get('gateway_hash')
+        or raw_payload.get('hash')
+        or raw_payload.get('transaction_hash')
+        or ''
+    ).strip()
+
+    now = get_brazil_time()
+    base_key = (transaction_hash or transaction_id or raw_payload.get('event') or '').strip()
+    dedup_key = f"{gateway_type}:{base_key}".lower() if base_key else f"{gateway_type}:{now.timestamp()}"
+
+    return {
+        'gateway_type': gateway_type,
+        'dedup_key': dedup_key,
+        'transaction_id': transaction_id or None,
+        'transaction_hash': transaction_hash or None,
+        'status': status,
+        'payload': raw_payload,
+        'received_at': now,
+    }
+
+
+class WebhookAuditWriter:
+    """
+    Gravação assíncrona e em lote de WebhookEvent.
+
+    submit() apenas enfileira (O(1), sem I/O); uma thread daemon drena a fila
+    a cada `flush_interval` segundos ou `batch_size` linhas e grava o lote em
+    UMA transação (advisory lock por dedup_key + busca + UPDATE/INSERT).
+
+    Se o lote falhar, cada linha é tentada sozinha (uma linha ruim não derruba
+    as outras); as que falham voltam para a fila e são descartadas, com log,
+    só após MAX_WRITE_ATTEMPTS tentativas.
+    """
+
+    def __init__(self, batch_size: int = 200, flush_interval: float = 1.0, max_queue: int = 10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Itens da fila: (tentativas já feitas, linha)
+        self._queue: "queue.Queue[Tuple[int, Dict[str, Any]]]" = queue.Queue(maxsize=max_queue)
+        self._app = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def submit(self, gateway_type: str, result: Dict[str, Any], raw_payload: Dict[str, Any]) -> bool:
+        row = build_audit_row(gateway_type, result, raw_payload)
+        if row is None:
+            return False
+        self._ensure_started()
+        return self._enqueue(0, row)
+
+    def _enqueue(self, attempts: int, row: Dict[str, Any]) -> bool:
+        try:
+            self._queue.put_nowait((attempts, row))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"⚠️ [WEBHOOK AUDIT] Fila cheia, evento descartado: {row['dedup_key']}")
+            return False
+
+    def _ensure_started(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            from flask import current_app
+            self._app = current_app._get_current_object()
+            self._thread = threading.Thread(target=self._run, name='webhook-audit-writer', daemon=True)
+            self._thread.start()
+
+    def _drain(self, block: bool) -> List[Tuple[int, Dict[str, Any]]]:
+        rows = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(rows) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if block and timeout > 0:
+                    rows.append(self._queue.get(timeout=timeout))
+                else:
+                    rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _write(self, items: List[Tuple[int, Dict[str, Any]]]) -> int:
+        """
+        Grava o lote; se falhar, linha a linha. Retorna a maior contagem de
+        tentativas entre as linhas devolvidas à fila (0 = nada voltou).
+        """
+        if self.write_batch([row for _, row in items]):
+            return 0
+        requeued = 0
+        for attempts, row in items:
+            if self.write_batch([row]):
+                continue
+            attempts += 1
+            if attempts >= MAX_WRITE_ATTEMPTS:
+                self.dropped += 1
+                logger.error(f"❌ [WEBHOOK AUDIT] Evento descartado após {attempts} tentativas: {row['dedup_key']}")
+            elif self._enqueue(attempts, row):
+                requeued = max(requeued, attempts)
+        return requeued
+
+    def _run(self) -> None:
+        while True:
+            items = self._drain(block=True)
+            if items:
+                with self._app.app_context():
+                    requeued = self._write(items)
+                if requeued:
+                    # Banco provavelmente indisponível: espera antes de tentar de novo
+                    time.sleep(min(2 ** requeued, RETRY_BACKOFF_MAX_SECONDS))
+
+    def flush(self) -> int:
+        """Grava tudo o que estiver na fila (usado no shutdown e em testes)."""
+        total = 0
+        while True:
+            items = self._drain(block=False)
+            if not items:
+                return total
+            if self._app is not None:
+                with self._app.app_context():
+                    self._write(items)
+            else:
+                self._write(items)
+            total += len(items)
+
+    @staticmethod
+    def write_batch(rows: List[Dict[str, Any]]) -> bool:
+        """
+        Upsert do lote em uma transação; False (com rollback) se falhar.
+
+        webhook_events é particionada por received_at e não tem UNIQUE global
+        em dedup_key: no PostgreSQL cada chave é serializada com o mesmo
+        pg_advisory_xact_lock de tasks_async._persist_webhook_event, e o
+        upsert é uma busca (uma query para o lote) + UPDATE/INSERT.
+        """
+        from internal_logic.core.models import WebhookEvent
+
+        # Última entrega vence dentro do lote
+        latest = {}
+        for row in rows:
+            latest[row['dedup_key']] = row
+
+        try:
+            if db.engine.dialect.name == 'postgresql':
+                # Ordem fixa: dois writers com chaves em comum não entram em deadlock
+                for dedup_key in sorted(latest):
+                    db.session.execute(text("SELECT pg_advisory_xact_lock(hashtext(:k))"), {'k': dedup_key})
+
+            existing = {
+                event.dedup_key: event
+                for event in WebhookEvent.query.filter(WebhookEvent.dedup_key.in_(list(latest))).all()
+            }
+            for dedup_key, row in latest.items():
+                event = existing.get(dedup_key)
+                if event is None:
+                    db.session.add(WebhookEvent(**row))
+                    continue
+                for field in ('status', 'transaction_id', 'transaction_hash', 'payload', 'received_at'):
+                    setattr(event, field, row[field])
+            db.session.commit()
+            logger.debug(f"✅ [WEBHOOK AUDIT] {len(latest)} eventos gravados")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"❌ [WEBHOOK AUDIT] Falha ao gravar lote de {len(latest)} eventos: {e}")
+            return False
+
+
+_audit_writer: Optional[WebhookAuditWriter] = None
+
+
+def get_webhook_audit_writer() -> WebhookAuditWriter:
+    """Writer único por processo (flush garantido no shutdown)."""
+    global _audit_writer
+    if _audit_writer is None:
+        _audit_writer = WebhookAuditWriter()
+        atexit.register(_audit_writer.flush)
+    return _audit_writer
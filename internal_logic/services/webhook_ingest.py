@@ -0,0 +1,152 @@
+"""
+Webhook Ingest - Recebimento de Webhooks em Redis Streams
+==========================================================
+O app principal roda em um único worker eventlet (BotManager em memória):
+todo webhook do Telegram e dos gateways disputava o mesmo GIL com o parse
+de JSON, o ORM (Bot, BotConfig, PoolBot, Payment) e o resto do painel.
+
+A camada de ingestão (internal_logic/core/ingest_app.py, N workers
+pré-forkados via gunicorn_ingest_config.py) só valida, deduplica e grava
+o payload cru em um stream — sem SQLAlchemy, sem app principal:
+
+    POST /webhook/telegram/<bot_id>         → gb:ingest:telegram
+    POST /webhook/payment/<gateway_type>    → gb:ingest:payment
+
+Dedup + XADD são um único script Lua (redis_scripts.stream_add_once):
+    telegram  → (bot_id, update_id), TELEGRAM_DEDUP_TTL
+    pagamento → sha1(gateway + corpo), PAYMENT_DEDUP_TTL (replays idênticos;
+                o claim_webhook do consumidor continua deduplicando por
+                transação + status)
+
+O processamento de verdade fica no consumidor (ingest_consumer, grupo
+CONSUMER_GROUP), que chama a mesma lógica das rotas do app principal.
+Este módulo não importa nada do banco — é carregado pelos workers de ingestão.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from typing import Iterable, Optional
+
+from internal_logic.core.redis_scripts import stream_add_once
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_STREAM = 'gb:ingest:telegram'
+PAYMENT_STREAM = 'gb:ingest:payment'
+DEAD_STREAM = 'gb:ingest:dead'
+STREAMS = (TELEGRAM_STREAM, PAYMENT_STREAM)
+CONSUMER_GROUP = 'ingest'
+
+DEDUP_PREFIX = 'gb:ingest:seen'
+# Telegram reenvia o mesmo update_id enquanto não recebe 200
+TELEGRAM_DEDUP_TTL = 3600
+PAYMENT_DEDUP_TTL = 600
+# Teto aproximado por stream (MAXLEN ~): protege a memória se o consumidor parar
+STREAM_MAXLEN = 200000
+MAX_BODY_BYTES = 1024 * 1024
+
+INGESTED = 'queued'
+DUPLICATE = 'duplicate'
+
+
+class InvalidPayload(ValueError):
+    """Payload rejeitado na borda (400)."""
+
+
+def _now_ms() -> str:
+    return str(int(time.time() * 1000))
+
+
+def ingest_telegram(redis_conn, bot_id: int, body: bytes) -> str:
+    """
+    Valida o update do Telegram e enfileira no stream.
+
+    Raises:
+        InvalidPayload: corpo vazio, JSON inválido ou sem update_id
+    """
+    if not body or len(body) > MAX_BODY_BYTES:
+        raise InvalidPayload('corpo vazio ou grande demais')
+    try:
+        update = json.loads(body)
+    except ValueError:
+        raise InvalidPayload('JSON inválido')
+    update_id = update.get('update_id') if isinstance(update, dict) else None
+    if not isinstance(update_id, int) or bot_id <= 0:
+        raise InvalidPayload('update sem update_id')
+
+    entry_id = stream_add_once(
+        redis_conn,
+        f"{DEDUP_PREFIX}:tg:{bot_id}:{update_id}",
+        TELEGRAM_DEDUP_TTL,
+        TELEGRAM_STREAM,
+        {'bot_id': str(bot_id), 'body': body.decode('utf-8'), 'received_at': _now_ms()},
+        STREAM_MAXLEN,
+    )
+    return INGESTED if entry_id else DUPLICATE
+
+
+def ingest_payment(redis_conn, gateway_type: str, body: bytes, content_type: str,
+                   known_gateways: Iterable[str]) -> str:
+    """
+    Valida o gateway e enfileira o corpo cru (JSON ou form) no stream.
+
+    Raises:
+        InvalidPayload: gateway desconhecido ou corpo vazio/grande demais
+    """
+    gateway_type = (gateway_type or '').lower()
+    if gateway_type not in known_gateways:
+        raise InvalidPayload(f'gateway desconhecido: {gateway_type}')
+    if not body or len(body) > MAX_BODY_BYTES:
+        raise InvalidPayload('corpo vazio ou grande demais')
+
+    digest = hashlib.sha1(gateway_type.encode() + b'|' + body).hexdigest()[:24]
+    entry_id = stream_add_once(
+        redis_conn,
+        f"{DEDUP_PREFIX}:pay:{gateway_type}:{digest}",
+        PAYMENT_DEDUP_TTL,
+        PAYMENT_STREAM,
+        {
+            'gateway_type': gateway_type,
+            'body': body.decode('utf-8', errors='replace'),
+            'content_type': content_type or '',
+            'received_at': _now_ms(),
+        },
+        STREAM_MAXLEN,
+    )
+    return INGESTED if entry_id else DUPLICATE
+
+
+def parse_payment_body(body: str, content_type: str) -> dict:
+    """Reconstrói o `data` que a rota de pagamento montava (JSON ou form, flat)."""
+    from urllib.parse import parse_qsl
+
+    content_type = (content_type or '').lower()
+    if 'json' in content_type or body.lstrip().startswith('{'):
+        try:
+            data = json.loads(body)
+            if isinstance(data, dict):
+                return data
+        except ValueError:
+            pass
+    if 'form' in content_type:
+        data = {}
+        for key, value in parse_qsl(body, keep_blank_values=True):
+            data.setdefault(key, value)
+        return data
+    return {}
+
+
+def stream_lag(redis_conn) -> Optional[dict]:
+    """Entradas por stream e pendentes do grupo (monitoramento)."""
+    try:
+        lag = {}
+        for stream in STREAMS:
+            groups = {g['name']: g for g in redis_conn.xinfo_groups(stream)} if redis_conn.exists(stream) else {}
+            group = groups.get(CONSUMER_GROUP, {})
+            lag[stream] = {'length': redis_conn.xlen(stream), 'pending': group.get('pending', 0)}
+        return lag
+    except Exception as e:
+        logger.warning(f"⚠️ [INGEST] Falha ao ler lag dos streams: {e}")
+        return None
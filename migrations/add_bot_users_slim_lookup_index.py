@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Migration: Índice de cobertura para a projeção enxuta de bot_users
+===================================================================
+Cria idx_bot_users_slim_lookup (bot_id, telegram_user_id) INCLUDE
+(id, archived, last_interaction), usado por find_lead_ref() em
+internal_logic/services/lead_lookup.py: a busca do lead nos caminhos
+quentes (mensagem recebida/enviada) vira index-only scan e não toca o heap
+largo de bot_users (tracking/demografia).
+
+SEGURO PARA PRODUÇÃO:
+- Idempotente (IF NOT EXISTS)
+- CREATE INDEX CONCURRENTLY no PostgreSQL (sem lock de escrita)
+- Em outros bancos cria o índice simples (sem INCLUDE)
+- Uso: python migrations/add_bot_users_slim_lookup_index.py
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from internal_logic.core.extensions import db
+from sqlalchemy import text
+
+INDEX_NAME = 'idx_bot_users_slim_lookup'
+
+
+def migrate():
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name == 'postgresql':
+            sql = (
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX_NAME} "
+                "ON bot_users (bot_id, telegram_user_id) INCLUDE (id, archived, last_interaction)"
+            )
+        else:
+            sql = f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON bot_users (bot_id, telegram_user_id)"
+
+        print(f"🔄 {INDEX_NAME} — lookup de lead por índice de cobertura")
+        try:
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text(sql))
+                if engine.dialect.name == 'postgresql':
+                    conn.execute(text("ANALYZE bot_users"))
+            print(f"✅ {INDEX_NAME} — ok")
+        except Exception as e:
+            print(f"❌ {INDEX_NAME} — ERRO: {e}")
+            return False
+
+        print("✅ Migration concluída com sucesso!")
+        return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if migrate() else 1)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Migration: Busca por trigramas e keyset no inbox do Chat
+=========================================================
+Cria os índices usados por internal_logic/services/chat_inbox_service.py:
+
+- pg_trgm + índice GIN de trigramas sobre a expressão de busca do lead
+  (first_name, username e telegram_user_id em um único documento)
+- Índice keyset (bot_id, archived, last_interaction DESC, id DESC) para a
+  paginação por cursor
+
+SEGURO PARA PRODUÇÃO:
+- Usa CREATE INDEX CONCURRENTLY (não bloqueia tabelas)
+- Cada índice em transação separada (autocommit)
+- Idempotente (IF NOT EXISTS)
+- Apenas PostgreSQL (em SQLite a busca funciona sem índice)
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from internal_logic.core.extensions import db
+from sqlalchemy import text
+
+
+# ⚠️ A expressão deve ser idêntica a chat_inbox_service.search_document()
+SEARCH_DOCUMENT_SQL = (
+    "lower(((((COALESCE(first_name, '') || ' ') || COALESCE(username, '')) || ' ') "
+    "|| CAST(telegram_user_id AS TEXT)))"
+)
+
+STATEMENTS = [
+    # (nome, sql, razão)
+    ("pg_trgm",
+     "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+     "Extensão de trigramas (LIKE '%termo%' indexável)"),
+
+    ("idx_bot_users_search_trgm",
+     f"CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_bot_users_search_trgm "
+     f"ON bot_users USING gin ({SEARCH_DOCUMENT_SQL} gin_trgm_ops)",
+     "CRÍTICA: busca do inbox por nome/username/id sem seq scan"),
+
+    ("idx_bot_users_inbox_keyset",
+     "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_bot_users_inbox_keyset "
+     "ON bot_users (bot_id, archived, last_interaction DESC NULLS LAST, id DESC)",
+     "ALTA: paginação keyset do inbox (ORDER BY last_interaction DESC, id DESC)"),
+]
+
+
+def migrate():
+    """Cria extensão e índices usando CONCURRENTLY."""
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != 'postgresql':
+            print(f"⏭️  Banco {engine.dialect.name}: índices de trigramas são exclusivos do PostgreSQL")
+            return True
+
+        erros = []
+        for name, sql, reason in STATEMENTS:
+            print(f"🔄 {name} — {reason}")
+            try:
+                with engine.connect().execution_options(
+                    isolation_level="AUTOCOMMIT"
+                ) as conn:
+                    conn.execute(text(sql))
+                print(f"✅ {name} — ok")
+            except Exception as e:
+                erro_msg = f"❌ {name} — ERRO: {e}"
+                print(erro_msg)
+                erros.append(erro_msg)
+
+        if erros:
+            print(f"\n⚠️  {len(erros)} erro(s) encontrados")
+            return False
+
+        print("✅ Migration concluída com sucesso!")
+        return True
+
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Migration: Identidade canônica do lead (lead_id BIGINT)
+========================================================
+Adiciona lead_id (= BotUser.telegram_user_id) em payments e bot_messages,
+faz o backfill a partir das colunas legadas em string e cria os índices
+compostos usados pelos joins lead ↔ pagamentos/mensagens:
+
+- payments.lead_id      ← customer_user_id ('123' ou 'user_123')
+- bot_messages.lead_id  ← telegram_user_id ('123')
+- idx_payment_bot_lead_status   (bot_id, lead_id, status)
+- idx_botmsg_bot_lead_dir_read  (bot_id, lead_id, direction, is_read)
+
+Período de dual-write: os models preenchem lead_id automaticamente ao gravar
+customer_user_id/telegram_user_id (ver normalize_lead_id em models.py), então
+rodar esta migration ANTES do deploy das leituras por lead_id.
+
+SEGURO PARA PRODUÇÃO:
+- Idempotente (colunas/índices IF NOT EXISTS, backfill só onde lead_id IS NULL)
+- Backfill em lotes por faixa de id, um commit por lote
+- Índices com CREATE INDEX CONCURRENTLY no PostgreSQL
+- Uso: python migrations/add_lead_id_columns.py [--batch-size 50000]
+"""
+import sys
+import os
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from internal_logic.core.extensions import db
+from sqlalchemy import inspect, text
+
+
+# (tabela, coluna legada)
+SOURCES = [
+    ('payments', 'customer_user_id'),
+    ('bot_messages', 'telegram_user_id'),
+]
+
+INDEXES = [
+    ("idx_payment_bot_lead_status",
+     "ON payments (bot_id, lead_id, status)",
+     "CRÍTICA: compradores/não-compradores e perfil do lead sem CAST"),
+    ("idx_botmsg_bot_lead_dir_read",
+     "ON bot_messages (bot_id, lead_id, direction, is_read)",
+     "ALTA: última mensagem e não lidas do inbox por lead"),
+]
+
+# Só converte valores inteiros (com ou sem prefixo user_) que cabem em BIGINT
+PG_LEAD_PATTERN = r'^(user_)?-?[0-9]{1,18}$'
+PG_LEAD_EXTRACT = r'^(?:user_)?(-?[0-9]{1,18})$'
+
+
+def _add_columns():
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    for table in [table for table, _ in SOURCES] + ['bot_messages_archive']:
+        if table not in tables:
+            continue
+        columns = [col['name'] for col in inspector.get_columns(table)]
+        if 'lead_id' in columns:
+            print(f"✅ {table}.lead_id já existe")
+            continue
+        db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN lead_id BIGINT"))
+        db.session.commit()
+        print(f"✅ {table}.lead_id adicionado")
+
+
+def _backfill_postgresql(table, source, low, high):
+    return db.session.execute(text(f"""
+        UPDATE {table}
+        SET lead_id = CAST(substring({source} from :extract) AS BIGINT)
+        WHERE id >= :low AND id < :high
+          AND lead_id IS NULL
+          AND {source} ~ :pattern
+    """), {'extract': PG_LEAD_EXTRACT, 'pattern': PG_LEAD_PATTERN, 'low': low, 'high': high}).rowcount
+
+
+def _backfill_generic(table, source, low, high):
+    from internal_logic.core.models import normalize_lead_id
+
+    rows = db.session.execute(text(f"""
+        SELECT id, {source} FROM {table}
+        WHERE id >= :low AND id < :high AND lead_id IS NULL AND {source} IS NOT NULL
+    """), {'low': low, 'high': high}).fetchall()
+    updates = []
+    for row_id, value in rows:
+        lead_id = normalize_lead_id(value)
+        if lead_id is not None:
+            updates.append({'id': row_id, 'lead_id': lead_id})
+    if updates:
+        db.session.execute(text(f"UPDATE {table} SET lead_id = :lead_id WHERE id = :id"), updates)
+    return len(updates)
+
+
+def _backfill(batch_size):
+    backfill = _backfill_postgresql if db.engine.dialect.name == 'postgresql' else _backfill_generic
+    for table, source in SOURCES:
+        min_id, max_id = db.session.execute(text(f"SELECT MIN(id), MAX(id) FROM {table}")).first()
+        if min_id is None:
+            print(f"⏭️  {table}: vazia")
+            continue
+        total = 0
+        for low in range(min_id, max_id + 1, batch_size):
+            total += backfill(table, source, low, low + batch_size) or 0
+            db.session.commit()
+        pending = db.session.execute(text(
+            f"SELECT COUNT(*) FROM {table} WHERE lead_id IS NULL AND {source} IS NOT NULL"
+        )).scalar()
+        print(f"📊 {table}: {total} linhas preenchidas | {pending} sem lead_id (valores não numéricos)")
+
+
+def _create_indexes():
+    engine = db.engine
+    concurrently = 'CONCURRENTLY ' if engine.dialect.name == 'postgresql' else ''
+    erros = []
+    for name, target, reason in INDEXES:
+        print(f"🔄 {name} — {reason}")
+        try:
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text(f"CREATE INDEX {concurrently}IF NOT EXISTS {name} {target}"))
+            print(f"✅ {name} — ok")
+        except Exception as e:
+            erros.append(f"❌ {name} — ERRO: {e}")
+            print(erros[-1])
+    return erros
+
+
+def migrate(batch_size=50000):
+    with app.app_context():
+        try:
+            _add_columns()
+            _backfill(batch_size)
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Erro no backfill de lead_id: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+        erros = _create_indexes()
+        if erros:
+            print(f"\n⚠️  {len(erros)} erro(s) encontrados")
+            return False
+
+        print("✅ Migration concluída com sucesso!")
+        return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=50000)
+    args = parser.parse_args()
+    sys.exit(0 if migrate(args.batch_size) else 1)
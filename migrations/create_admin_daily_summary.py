@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Migration: Resumo diário do painel admin
+=========================================
+Cria admin_daily_summary (dia → vendas, faturamento, novos usuários) e faz
+o backfill de todo o histórico a partir de payments e users via
+internal_logic/services/admin_summary.rebuild(); também recalcula
+users.total_sales/total_revenue (base do top 20 de /admin/revenue).
+
+SEGURO PARA PRODUÇÃO:
+- Idempotente (checkfirst + rebuild substitui as linhas)
+- Uso: python migrations/create_admin_daily_summary.py
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from internal_logic.core.extensions import db
+
+
+def migrate():
+    with app.app_context():
+        from internal_logic.core.models import AdminDailySummary
+        from internal_logic.services.admin_summary import rebuild, repair_user_totals
+
+        AdminDailySummary.__table__.create(db.engine, checkfirst=True)
+        print("✅ Tabela admin_daily_summary pronta")
+
+        try:
+            days = rebuild()
+            users = repair_user_totals()
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Backfill do resumo — ERRO: {e}")
+            return False
+
+        print(f"📊 {days} dia(s) no resumo, totais de {users} usuário(s) recalculados")
+        print("✅ Migration concluída com sucesso!")
+        return True
+
+
+if __name__ == '__main__':
+    migrate()
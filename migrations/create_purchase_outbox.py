@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Migration: Outbox de Purchase (Meta CAPI server-side)
+======================================================
+Cria purchase_outbox (uma linha por payment pago de pool em SERVER MODE:
+status, tentativas, next_attempt_at com backoff, last_error/dead-letter) e
+enfileira os payments pagos dos últimos 7 dias ainda sem Purchase enviado,
+via internal_logic/services/server_tracking/purchase_reconciler.sync_outbox().
+
+SEGURO PARA PRODUÇÃO:
+- Idempotente (checkfirst + INSERT ... ON CONFLICT DO NOTHING)
+- Uso: python migrations/create_purchase_outbox.py
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from internal_logic.core.extensions import db
+
+
+def migrate():
+    with app.app_context():
+        from internal_logic.core.models import PurchaseOutbox
+        from internal_logic.services.server_tracking.purchase_reconciler import sync_outbox
+
+        PurchaseOutbox.__table__.create(db.engine, checkfirst=True)
+        print("✅ Tabela purchase_outbox pronta")
+
+        try:
+            queued = sync_outbox()
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Backfill do outbox — ERRO: {e}")
+            return False
+
+        print(f"📬 {queued} payment(s) enfileirado(s) para Purchase")
+        print("✅ Migration concluída com sucesso!")
+        return True
+
+
+if __name__ == '__main__':
+    migrate()
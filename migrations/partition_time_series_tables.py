@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Migration: Particionamento mensal de bot_messages e webhook_events
+===================================================================
+Converte as tabelas em PARTITION BY RANGE sobre a coluna de tempo
+(bot_messages.created_at, webhook_events.received_at) SEM copiar dados:
+a tabela atual vira a partição {tabela}_legacy (MINVALUE → início do próximo
+mês) e os meses seguintes ganham partições próprias ({tabela}_pYYYYMM).
+
+Depois disso, a retenção (internal_logic/services/partition_manager.py) passa
+a destacar partições inteiras em vez de DELETE em lote, e consultas com filtro
+de tempo (inbox, deduplicação por message_id) leem só as partições recentes.
+
+Passos por tabela:
+1. Preenche a coluna de tempo nula e valida CHECK (col < limite) NOT VALID →
+   VALIDATE (sem bloquear escrita); o ATTACH usa o CHECK e não varre a tabela
+2. Cria CONCURRENTLY o índice único (id, col) — a PK de tabela particionada
+   precisa conter a chave de partição — e gêmeos não-únicos dos índices UNIQUE
+   (ex.: dedup_key), pois UNIQUE global não existe em tabela particionada
+3. Troca em UMA transação curta (lock_timeout): renomeia tabela/índices para
+   *_legacy, cria a tabela particionada, anexa a legacy, recria os índices no
+   pai (ON ONLY + ATTACH PARTITION, sem rebuild) e cria as partições futuras
+
+payments NÃO é particionada: subscriptions e commissions têm FK para
+payments.id, e a PK de tabela particionada teria de incluir created_at.
+
+SEGURO PARA PRODUÇÃO:
+- Idempotente (tabela já particionada → só garante partições futuras)
+- Apenas PostgreSQL (outros bancos: nada a fazer)
+- Rodar antes: deploy/sql/create_archive_tables.sql (archive herda as colunas)
+- Uso: python migrations/partition_time_series_tables.py
+"""
+import re
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from internal_logic.core.extensions import db
+from internal_logic.core.models import get_brazil_time
+from internal_logic.services.partition_manager import (
+    PARTITIONED_TABLES, LEGACY_SUFFIX, MONTHS_AHEAD,
+    add_months, month_start, partition_name, is_partitioned, ensure_future_partitions,
+)
+from sqlalchemy import text
+
+# Índice novo: última mensagem da conversa por (bot, lead) com poda por created_at
+EXTRA_INDEXES = {
+    'bot_messages': [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_botmsg_bot_tg_created "
+        "ON bot_messages (bot_id, telegram_user_id, created_at)",
+    ],
+}
+
+INDEX_DEF = re.compile(r'^CREATE (UNIQUE )?INDEX (\S+) ON (?:ONLY )?\S+ (USING .*)$')
+MAX_IDENTIFIER = 63
+
+
+def _name(base, suffix):
+    return f"{base[:MAX_IDENTIFIER - len(suffix)]}{suffix}"
+
+
+def _boundary():
+    # Perto da virada do mês o limite vai para o mês seguinte: linhas novas
+    # precisam continuar abaixo do CHECK até a troca terminar
+    now = get_brazil_time()
+    boundary = add_months(month_start(now), 1)
+    if (boundary - now).days < 2:
+        boundary = add_months(boundary, 1)
+    return boundary
+
+
+def _create_index_concurrently(conn, name, sql):
+    valid = conn.execute(text("""
+        SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid
+        WHERE c.relname = :name
+    """), {'name': name}).scalar()
+    if valid is False:
+        # Tentativa anterior interrompida deixa índice inválido: IF NOT EXISTS pularia
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    conn.execute(text(sql))
+
+
+def _table_indexes(conn, table):
+    """[(nome, unique, 'USING ...')] exceto a PK e os índices auxiliares da troca."""
+    rows = conn.execute(text("""
+        SELECT c.relname, pg_get_indexdef(i.indexrelid)
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = to_regclass(:table) AND NOT i.indisprimary
+    """), {'table': table}).fetchall()
+    indexes = []
+    for name, definition in rows:
+        if name == _name(table, '_id_partkey') or name.endswith('_nu'):
+            continue  # criados por esta migration (reexecução após falha)
+        match = INDEX_DEF.match(definition)
+        if not match:
+            print(f"   ⚠️ Índice {name} ignorado (definição não reconhecida): {definition}")
+            continue
+        indexes.append((name, bool(match.group(1)), match.group(3)))
+    return indexes
+
+
+def _prepare(conn, table, column, boundary):
+    check_name = _name(table, '_partkey_chk')
+    print(f"   1/3 {table}: CHECK ({column} < {boundary:%Y-%m-%d}) + índice (id, {column})")
+    conn.execute(text(f"UPDATE {table} SET {column} = :now WHERE {column} IS NULL"), {'now': get_brazil_time()})
+    conn.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {check_name}"))
+    conn.execute(text(
+        f"ALTER TABLE {table} ADD CONSTRAINT {check_name} "
+        f"CHECK ({column} IS NOT NULL AND {column} < '{boundary:%Y-%m-%d}') NOT VALID"
+    ))
+    conn.execute(text(f"ALTER TABLE {table} VALIDATE CONSTRAINT {check_name}"))
+    # PG12+: o CHECK válido dispensa a varredura do SET NOT NULL
+    conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL"))
+
+    for sql in EXTRA_INDEXES.get(table, []):
+        _create_index_concurrently(conn, sql.split(' IF NOT EXISTS ')[1].split()[0], sql)
+    partkey = _name(table, '_id_partkey')
+    _create_index_concurrently(
+        conn, partkey, f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {partkey} ON {table} (id, {column})"
+    )
+
+    indexes = _table_indexes(conn, table)
+    for name, unique, using in indexes:
+        if unique:
+            twin = _name(name, '_nu')
+            _create_index_concurrently(conn, twin, f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {twin} ON {table} {using}")
+    return check_name, partkey, indexes
+
+
+def _swap(conn, table, column, boundary, check_name, partkey, indexes):
+    legacy = f"{table}{LEGACY_SUFFIX}"
+    print(f"   2/3 {table}: troca para tabela particionada ({legacy} = MINVALUE → {boundary:%Y-%m-%d})")
+    with conn.begin():
+        conn.execute(text("SET LOCAL lock_timeout = '10s'"))
+        foreign_keys = conn.execute(text("""
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = to_regclass(:table) AND contype = 'f'
+        """), {'table': table}).fetchall()
+        pkey = conn.execute(text("""
+            SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:table) AND contype = 'p'
+        """), {'table': table}).scalar()
+
+        for name, _, _ in indexes:
+            conn.execute(text(f"ALTER INDEX {name} RENAME TO {_name(name, LEGACY_SUFFIX)}"))
+        conn.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+        if pkey:
+            conn.execute(text(f"ALTER TABLE {legacy} DROP CONSTRAINT {pkey}"))
+        conn.execute(text(
+            f"ALTER TABLE {legacy} ADD CONSTRAINT {_name(legacy, '_pkey')} PRIMARY KEY USING INDEX {partkey}"
+        ))
+
+        conn.execute(text(
+            f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE ({column})"
+        ))
+        conn.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, {column})"))
+        for name, definition in foreign_keys:
+            conn.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}"))
+        conn.execute(text(
+            f"ALTER TABLE {table} ATTACH PARTITION {legacy} "
+            f"FOR VALUES FROM (MINVALUE) TO ('{boundary:%Y-%m-%d}')"
+        ))
+        conn.execute(text(f"ALTER TABLE {legacy} DROP CONSTRAINT {check_name}"))
+        sequence = conn.execute(text("SELECT pg_get_serial_sequence(:legacy, 'id')"), {'legacy': legacy}).scalar()
+        if sequence:
+            conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id"))
+
+        # Índices do pai: ON ONLY + ATTACH do índice já existente na legacy (sem rebuild)
+        for name, unique, using in indexes:
+            conn.execute(text(f"CREATE INDEX {name} ON ONLY {table} {using}"))
+            child = _name(name, '_nu') if unique else _name(name, LEGACY_SUFFIX)
+            conn.execute(text(f"ALTER INDEX {name} ATTACH PARTITION {child}"))
+
+        # Partições futuras na mesma transação: nenhum INSERT fica sem destino
+        month = boundary
+        while month <= add_months(month_start(get_brazil_time()), MONTHS_AHEAD):
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+            ))
+            month = add_months(month, 1)
+
+
+def migrate():
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != 'postgresql':
+            print("ℹ️ Particionamento disponível apenas no PostgreSQL — nada a fazer")
+            return True
+
+        ok = True
+        for table, spec in PARTITIONED_TABLES.items():
+            column = spec['column']
+            print(f"🔄 {table} — particionamento mensal por {column}")
+            try:
+                if is_partitioned(table):
+                    created = ensure_future_partitions(table)
+                    print(f"✅ {table} — já particionada (partições novas: {created or 'nenhuma'})")
+                    continue
+
+                boundary = _boundary()
+                with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                    check_name, partkey, indexes = _prepare(conn, table, column, boundary)
+                with engine.connect() as conn:
+                    _swap(conn, table, column, boundary, check_name, partkey, indexes)
+                with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                    print(f"   3/3 {table}: ANALYZE")
+                    conn.execute(text(f"ANALYZE {table}"))
+                print(f"✅ {table} — ok")
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ {table} — ERRO: {e}")
+                ok = False
+
+        if ok:
+            print("✅ Migration concluída com sucesso!")
+        return ok
+
+
+if __name__ == '__main__':
+    sys.exit(0 if migrate() else 1)
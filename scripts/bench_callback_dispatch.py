@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Decodificação e Despacho de callback_data
+======================================================
+Gera N cliques com a distribuição de ações de um bot de vendas (buy, verify
+e bumps dominam; downsell/upsell/rmkt no fim da cadeia antiga) e compara:
+
+    legado    → cadeia if/elif de startswith + replace().split('_') na ordem
+                em que handle_callback_query testava os prefixos
+    codec     → callback_codec.decode() + HANDLERS[action] para os mesmos
+                callback_data legados (botões já enviados)
+    v1        → decode() + dict para o formato compacto (~1<ação><args>)
+
+Antes de medir, confere que legado e codec extraem a mesma ação e os mesmos
+argumentos para todos os cliques. Com --per-action, mostra também o custo por
+ação (na cadeia antiga, buy — o clique mais comum — era o último ramo).
+
+Uso:
+    python scripts/bench_callback_dispatch.py --clicks 200000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ação → (peso, gerador de argumentos, formato legado)
+MIX = {
+    'buy': (30, lambda r: (r.randint(0, 5),), 'buy_{}'),
+    'verify': (20, lambda r: (f"BOT{r.randint(1, 999)}_{r.randint(10**9, 2 * 10**9)}",), 'verify_{}'),
+    'bump_yes': (8, lambda r: (r.randint(0, 5),), 'bump_yes_{}'),
+    'bump_no': (6, lambda r: (r.randint(0, 5),), 'bump_no_{}'),
+    'multi_bump_yes': (4, lambda r: (r.randint(10**8, 8 * 10**9), r.randint(0, 4), r.randint(990, 49700)),
+                       'multi_bump_yes_{}_{}_{}'),
+    'multi_bump_no': (3, lambda r: (r.randint(10**8, 8 * 10**9), r.randint(0, 4), r.randint(990, 49700)),
+                      'multi_bump_no_{}_{}_{}'),
+    'downsell_bump_yes': (2, lambda r: (r.randint(0, 9), r.randint(990, 49700)), 'downsell_bump_yes_{}_{}'),
+    'downsell_bump_no': (2, lambda r: (r.randint(0, 9), r.randint(990, 49700)), 'downsell_bump_no_{}_{}'),
+    'downsell': (10, lambda r: (r.randint(0, 9), r.randint(490, 19700), r.randint(0, 5)), 'downsell_{}_{}_{}'),
+    'upsell': (6, lambda r: (r.randint(0, 9), r.randint(990, 99700), r.randint(0, 5)), 'upsell_{}_{}_{}'),
+    'rmkt': (9, lambda r: (r.randint(1, 50000), r.randint(0, 5)), 'rmkt_{}_{}'),
+}
+
+
+def build_clicks(count: int, seed: int = 42) -> list:
+    from internal_logic.services.callback_codec import encode
+
+    rng = random.Random(seed)
+    actions = list(MIX)
+    weights = [MIX[action][0] for action in actions]
+    clicks = []
+    for action in rng.choices(actions, weights=weights, k=count):
+        args = MIX[action][1](rng)
+        clicks.append((MIX[action][2].format(*args), encode(action, *args)))
+    return clicks
+
+
+# --- Caminho legado (ordem e parsing de handle_callback_query antes do codec) ---
+
+def legacy_parse(data: str):
+    if data.startswith('flow_') and not data.startswith('flow_step_'):
+        return None
+    if data.startswith('flow_step_'):
+        return None
+    if data.startswith('verify_'):
+        return 'verify', (data.replace('verify_', ''),)
+    elif data.startswith('rmkt_'):
+        parts = data.replace('rmkt_', '').split('_')
+        return 'rmkt', (int(parts[0]), int(parts[1]))
+    elif data.startswith('bump_yes_'):
+        return 'bump_yes', (int(data.replace('bump_yes_', '')),)
+    elif data.startswith('bump_no_'):
+        return 'bump_no', (int(data.replace('bump_no_', '')),)
+    elif data.startswith('multi_bump_yes_'):
+        parts = data.replace('multi_bump_yes_', '').split('_')
+        return 'multi_bump_yes', (int(parts[0]), int(parts[1]), int(float(parts[2])))
+    elif data.startswith('multi_bump_no_'):
+        parts = data.replace('multi_bump_no_', '').split('_')
+        return 'multi_bump_no', (int(parts[0]), int(parts[1]), int(float(parts[2])))
+    elif data.startswith('downsell_bump_yes_'):
+        parts = data.replace('downsell_bump_yes_', '').split('_')
+        return 'downsell_bump_yes', (int(parts[0]), int(float(parts[1])))
+    elif data.startswith('downsell_bump_no_'):
+        parts = data.replace('downsell_bump_no_', '').split('_')
+        return 'downsell_bump_no', (int(parts[0]), int(float(parts[1])))
+    elif data.startswith('dwnsl_'):
+        parts = data.replace('dwnsl_', '').split('_')
+        return 'dwnsl', (int(parts[0]), int(parts[1]), int(float(parts[2])))
+    elif data.startswith('downsell_'):
+        parts = data.replace('downsell_', '').split('_')
+        if len(parts) == 4:
+            return 'downsell', (int(parts[0]), int(parts[2]), int(parts[1]))
+        return 'downsell', (int(parts[0]), int(parts[1]), int(parts[2]))
+    elif data.startswith('upsell_'):
+        parts = data.replace('upsell_', '').split('_')
+        if len(parts) == 4:
+            return 'upsell', (int(parts[0]), int(parts[2]), int(parts[1]))
+        return 'upsell', (int(parts[0]), int(parts[1]), int(parts[2]))
+    elif data.startswith('buy_'):
+        return 'buy', (int(data.replace('buy_', '')),)
+    return None
+
+
+def _best_seconds(func, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clicks', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--per-action', action='store_true', help='custo por ação (µs/clique)')
+    args = parser.parse_args()
+
+    from internal_logic.services.callback_codec import ACTIONS, decode
+
+    handlers = {action: (lambda *a: a) for action in ACTIONS}
+    clicks = build_clicks(args.clicks)
+    legacy_data = [legacy for legacy, _ in clicks]
+    compact_data = [compact for _, compact in clicks]
+
+    for legacy, compact in clicks:
+        expected = legacy_parse(legacy)
+        assert tuple(decode(legacy)) == expected, (legacy, decode(legacy), expected)
+        assert tuple(decode(compact)) == expected, (compact, decode(compact), expected)
+
+    def run_legacy(payloads):
+        def run():
+            for data in payloads:
+                action, parsed = legacy_parse(data)
+                handlers[action](*parsed)
+        return run
+
+    def run_codec(payloads):
+        def run():
+            for data in payloads:
+                callback = decode(data)
+                handlers[callback.action](*callback.args)
+        return run
+
+    legacy = _best_seconds(run_legacy(legacy_data), args.repeat)
+    codec = _best_seconds(run_codec(legacy_data), args.repeat)
+    compact = _best_seconds(run_codec(compact_data), args.repeat)
+
+    legacy_bytes = sum(len(data.encode()) for data in legacy_data) / len(clicks)
+    compact_bytes = sum(len(data.encode()) for data in compact_data) / len(clicks)
+
+    print(f"{args.clicks} cliques, {len(MIX)} ações (callback_data médio: legado {legacy_bytes:.1f}B, "
+          f"v1 {compact_bytes:.1f}B, máximo v1 {max(len(d.encode()) for d in compact_data)}B)")
+    for label, seconds in (('legado', legacy), ('codec', codec), ('v1', compact)):
+        speedup = f"  ({legacy / seconds:.1f}x)" if seconds is not legacy else ''
+        print(f"{label:<8} {seconds * 1000:>9.1f}ms  {seconds / args.clicks * 1e6:>6.2f}µs/clique"
+              f"  {args.clicks / seconds / 1000:>8.0f}k cliques/s{speedup}")
+
+    if args.per_action:
+        print(f"\n{'ação':<18} {'legado':>8} {'codec':>8} {'v1':>8}  (µs/clique)")
+        for action in MIX:
+            group = [(legacy, compact) for legacy, compact in clicks if decode(compact).action == action]
+            timings = [
+                _best_seconds(runner([pair[index] for pair in group]), args.repeat) / len(group) * 1e6
+                for runner, index in ((run_legacy, 0), (run_codec, 0), (run_codec, 1))
+            ]
+            print(f"{action:<18} {timings[0]:>8.2f} {timings[1]:>8.2f} {timings[2]:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
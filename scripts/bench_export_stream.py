@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Memória das Exportações em Streaming
+=================================================
+Semeia N pagamentos pagos em um banco descartável (SQLite em memória por
+padrão) e mede o pico de memória Python (tracemalloc) de cada caminho,
+consumindo a exportação inteira sem guardar o resultado:
+
+    legado    → .all() + lista de dicts + StringIO, como admin_export_payments
+                fazia (só com --legacy: cresce com N)
+    streaming → stream_export(payments_export(), fmt) para csv e ndjson
+                (yield_per + gerador em blocos de CHUNK_ROWS)
+
+Falha se o pico do streaming passar de --ceiling-mb ou se o número de
+linhas exportadas for diferente de N.
+
+Uso:
+    python scripts/bench_export_stream.py --rows 200000 [--legacy] [--database-url postgresql://...]
+"""
+
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SEED_BATCH = 10000
+
+
+def _build_app(database_url):
+    from flask import Flask
+    from internal_logic.core.extensions import db
+
+    app = Flask('bench_export_stream')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SECRET_KEY'] = 'bench'
+    db.init_app(app)
+    return app, db
+
+
+def _seed(db, rows):
+    from internal_logic.core.models import Bot, Payment, User, get_brazil_time
+
+    db.create_all()
+    owner = User(email='export@example.com', username='export', password_hash='x')
+    db.session.add(owner)
+    db.session.flush()
+    bot = Bot(user_id=owner.id, token='0:export', username='export_bot', name='Export')
+    db.session.add(bot)
+    db.session.commit()
+
+    now = get_brazil_time()
+    table = Payment.__table__
+    for start in range(0, rows, SEED_BATCH):
+        db.session.execute(table.insert(), [
+            {
+                'bot_id': bot.id, 'payment_id': f'export-{i}', 'amount': 19.9 + i % 100,
+                'status': 'paid', 'paid_at': now, 'customer_name': f'Cliente {i}',
+                'customer_email': f'cliente{i}@example.com', 'product_name': 'Produto',
+                'gateway_type': 'pushynpay',
+            }
+            for i in range(start, min(start + SEED_BATCH, rows))
+        ])
+    db.session.commit()
+
+
+def _measure(label, consume):
+    tracemalloc.start()
+    started = time.perf_counter()
+    count = consume()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return label, count, peak / (1024 * 1024), elapsed
+
+
+def _legacy(rows):
+    from internal_logic.core.models import Payment
+
+    def consume():
+        payments = Payment.query.filter_by(status='paid').order_by(Payment.paid_at.desc()).limit(rows).all()
+        data = [{
+            'id': p.id, 'payment_id': p.payment_id, 'bot_id': p.bot_id,
+            'user_id': p.bot.user_id if p.bot else None, 'customer_name': p.customer_name,
+            'customer_email': p.customer_email, 'amount': float(p.amount), 'status': p.status,
+            'gateway_type': p.gateway_type, 'paid_at': p.paid_at.isoformat() if p.paid_at else None,
+            'product_name': p.product_name,
+        } for p in payments]
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=data[0].keys() if data else [])
+        writer.writeheader()
+        writer.writerows(data)
+        return output.getvalue().count('\n') - 1
+    return consume
+
+
+def _streaming(fmt):
+    from internal_logic.services.export_stream import payments_export, stream_export
+
+    def consume():
+        lines = sum(chunk.count('\n') for chunk in stream_export(payments_export(), fmt))
+        return lines - 1 if fmt == 'csv' else lines
+    return consume
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--ceiling-mb', type=float, default=16.0)
+    parser.add_argument('--legacy', action='store_true', help='medir também o caminho legado (materializado)')
+    parser.add_argument('--database-url', default='sqlite://')
+    args = parser.parse_args()
+
+    app, db = _build_app(args.database_url)
+    with app.app_context():
+        _seed(db, args.rows)
+
+        runs = [('csv', _streaming('csv')), ('ndjson', _streaming('ndjson'))]
+        if args.legacy:
+            runs.insert(0, ('legado', _legacy(args.rows)))
+
+        failed = False
+        for label, consume in runs:
+            db.session.expunge_all()
+            label, count, peak_mb, elapsed = _measure(label, consume)
+            streaming = label != 'legado'
+            ok = count == args.rows and (not streaming or peak_mb <= args.ceiling_mb)
+            failed = failed or not ok
+            print(f"{'✅' if ok else '❌'} {label:<7} {count:>8} linhas  pico={peak_mb:7.1f} MB  {elapsed:6.2f}s"
+                  + (f"  (teto {args.ceiling_mb:.0f} MB)" if streaming else ''))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Custo por Salto no Fluxo Visual
+============================================
+Percorre um fluxo linear (step_0 → step_1 → ... → step_{n-1}) salto a salto,
+como _execute_flow_recursive faz com o snapshot do Redis, e compara:
+
+    linear    → json.loads do snapshot + varredura str().strip() a cada salto
+                (comportamento anterior de _find_step_by_id)
+    compilado → get_compiled_flow(snapshot).get(step_id) + aresta 'next'
+                pré-computada (flow_graph)
+
+Uso:
+    python scripts/bench_flow_graph.py --sizes 10 100 500 --repeat 5
+
+Com o grafo compilado o custo por salto fica constante; no linear cresce
+com o tamanho do fluxo.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def build_flow(size: int) -> list:
+    # ids numéricos e string misturados, como no editor
+    step_id = lambda i: i if i % 2 else f'step_{i}'
+    steps = []
+    for i in range(size):
+        step = {'id': step_id(i), 'type': 'message', 'order': i, 'config': {'message': f'Mensagem {i}'}, 'connections': {}}
+        if i + 1 < size:
+            step['connections']['next'] = step_id(i + 1)
+            step['config']['custom_buttons'] = [{'text': 'Continuar', 'target_step': str(step_id(i + 1))}]
+        if i % 10 == 0:
+            step['conditions'] = [
+                {'id': f'c{i}', 'type': 'text_validation', 'validation': 'email', 'target_step': str(step_id(i)), 'order': 2},
+                {'id': f'd{i}', 'type': 'button_click', 'button_text': 'Continuar', 'target_step': str(step_id(i)), 'order': 1},
+            ]
+        steps.append(step)
+    return steps
+
+
+def _linear_find(flow_steps: list, step_id):
+    step_id_str = str(step_id).strip()
+    for step in flow_steps:
+        if not isinstance(step, dict) or step.get('id') is None:
+            continue
+        if str(step.get('id')).strip() == step_id_str:
+            return step
+    return None
+
+
+def walk_linear(snapshot: dict, start_id) -> int:
+    hops, step_id = 0, start_id
+    while step_id is not None:
+        flow_steps = json.loads(snapshot['flow_steps'])
+        step = _linear_find(flow_steps, step_id)
+        step_id = step.get('connections', {}).get('next') if step else None
+        hops += 1
+    return hops
+
+
+def walk_compiled(snapshot: dict, start_id) -> int:
+    from internal_logic.services.flow_graph import get_compiled_flow
+
+    hops, step_id = 0, start_id
+    while step_id is not None:
+        compiled = get_compiled_flow(snapshot['flow_steps'])
+        step_id = compiled.successor(step_id, 'next') if step_id in compiled else None
+        hops += 1
+    return hops
+
+
+def _per_hop_us(walk, snapshot, start_id, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        hops = walk(snapshot, start_id)
+        best = min(best, (time.perf_counter() - started) / hops)
+    return best * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    from internal_logic.services.flow_graph import clear_cache, get_compiled_flow
+
+    print(f"{'steps':>6} {'compilação':>12} {'linear/salto':>14} {'compilado/salto':>16} {'ganho':>8}")
+    for size in args.sizes:
+        flow = build_flow(size)
+        snapshot = {'flow_steps': json.dumps(flow)}
+        start_id = flow[0]['id']
+
+        clear_cache()
+        started = time.perf_counter()
+        compiled = get_compiled_flow(snapshot['flow_steps'])
+        compile_ms = (time.perf_counter() - started) * 1000
+        assert len(compiled) == size and not compiled.dangling
+        assert walk_compiled(snapshot, start_id) == walk_linear(snapshot, start_id) == size
+
+        linear = _per_hop_us(walk_linear, snapshot, start_id, args.repeat)
+        fast = _per_hop_us(walk_compiled, snapshot, start_id, args.repeat)
+        print(f"{size:>6} {compile_ms:>10.2f}ms {linear:>12.1f}µs {fast:>14.2f}µs {linear / fast:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
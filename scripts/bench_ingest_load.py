@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Carga de Webhooks (app principal vs camada de ingestão)
+====================================================================
+Cliente HTTP/1.1 keep-alive em asyncio puro (sem dependências): abre
+--concurrency conexões por alvo e dispara POSTs de webhook durante
+--duration segundos, com update_id/transação únicos por requisição.
+
+    telegram  → POST /webhook/telegram/<bot_id>   {"update_id": N, "message": ...}
+    payment   → POST /webhook/payment/<gateway>   {"id": ..., "status": "paid", ...}
+
+Cada --url é um alvo (base URL); repetir para comparar as pilhas lado a
+lado (ex.: app principal na 5000 e ingestão na 5001). Mostra req/s,
+p50/p99 e a contagem de status HTTP por alvo.
+
+Com --local, sobe um Redis em memória (fakeredis TcpFakeServer) e o
+gunicorn da ingestão (gunicorn_ingest_config.py) apontando para ele, e
+usa esse alvo além dos --url informados.
+
+Uso:
+    python scripts/bench_ingest_load.py --local --kind telegram --duration 10
+    python scripts/bench_ingest_load.py --url http://127.0.0.1:5000 --url http://127.0.0.1:5001
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _telegram_request(bot_id: int, seq: int):
+    body = json.dumps({
+        'update_id': seq,
+        'message': {
+            'message_id': seq,
+            'from': {'id': 100000 + seq % 5000, 'is_bot': False, 'first_name': 'Bench'},
+            'chat': {'id': 100000 + seq % 5000, 'type': 'private'},
+            'date': int(time.time()),
+            'text': '/start',
+        },
+    }).encode()
+    return f'/webhook/telegram/{bot_id}', body
+
+
+def _payment_request(gateway: str, seq: int):
+    body = json.dumps({
+        'id': f'bench-{os.getpid()}-{seq}',
+        'status': 'paid',
+        'value': 1990,
+        'end_to_end_id': f'E{seq:031d}',
+    }).encode()
+    return f'/webhook/payment/{gateway}', body
+
+
+async def _worker(host, port, prefix, make_request, counter, deadline, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            seq = next(counter)
+            path, body = make_request(seq)
+            writer.write(
+                f'POST {prefix}{path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+                f'Content-Length: {len(body)}\r\nConnection: keep-alive\r\n\r\n'.encode() + body
+            )
+            started = time.perf_counter()
+            await writer.drain()
+            status_line = await reader.readline()
+            if not status_line:
+                statuses['conexão fechada'] += 1
+                break
+            length, close = 0, False
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                name = name.strip().lower()
+                if name == 'content-length':
+                    length = int(value)
+                elif name == 'connection' and value.strip().lower() == 'close':
+                    close = True
+            if length:
+                await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            statuses[status_line.split()[1].decode()] += 1
+            if close:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError) as e:
+        statuses[type(e).__name__] += 1
+    finally:
+        writer.close()
+
+
+async def _run_target(url, args, seq_start):
+    import itertools
+
+    parts = urlsplit(url)
+    if args.kind == 'telegram':
+        make_request = lambda seq: _telegram_request(args.bot_id, seq)
+    else:
+        make_request = lambda seq: _payment_request(args.gateway, seq)
+
+    latencies, statuses = [], Counter()
+    counter = itertools.count(seq_start)
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*[
+        _worker(parts.hostname, parts.port or 80, parts.path.rstrip('/'), make_request,
+                counter, deadline, latencies, statuses)
+        for _ in range(args.concurrency)
+    ], return_exceptions=True)
+    return latencies, statuses, time.perf_counter() - started
+
+
+def _percentile(values, pct):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def _start_local(args):
+    """fakeredis TCP + gunicorn da ingestão; retorna (url, cleanup)."""
+    from fakeredis import TcpFakeServer
+
+    redis_server = TcpFakeServer(('127.0.0.1', args.local_redis_port), server_type='redis')
+    threading.Thread(target=redis_server.serve_forever, daemon=True).start()
+
+    env = dict(os.environ,
+               REDIS_URL=f'redis://127.0.0.1:{args.local_redis_port}/0',
+               INGEST_BIND=f'127.0.0.1:{args.local_port}',
+               INGEST_WORKERS=str(args.local_workers),
+               INGEST_RATE_LIMIT='0')
+    gunicorn = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn_ingest_config.py', 'ingest:application'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+    )
+
+    url = f'http://127.0.0.1:{args.local_port}'
+    for _ in range(100):
+        try:
+            import urllib.request
+            urllib.request.urlopen(f'{url}/ingest/health', timeout=1)
+            break
+        except Exception:
+            time.sleep(0.1)
+
+    def cleanup():
+        gunicorn.terminate()
+        gunicorn.wait(timeout=15)
+        redis_server.shutdown()
+
+    return url, cleanup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', action='append', default=[], help='base URL de um alvo (repetível)')
+    parser.add_argument('--kind', choices=('telegram', 'payment'), default='telegram')
+    parser.add_argument('--bot-id', type=int, default=1)
+    parser.add_argument('--gateway', default='pushynpay')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--local', action='store_true', help='sobe a ingestão com fakeredis para o teste')
+    parser.add_argument('--local-port', type=int, default=5091)
+    parser.add_argument('--local-redis-port', type=int, default=6391)
+    parser.add_argument('--local-workers', type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    targets = list(args.url)
+    cleanup = None
+    if args.local:
+        local_url, cleanup = _start_local(args)
+        targets.append(local_url)
+    if not targets:
+        parser.error('informe ao menos um --url ou --local')
+
+    failed = False
+    try:
+        print(f"{args.kind}: {args.concurrency} conexões keep-alive por alvo, {args.duration:.0f}s")
+        print(f"{'alvo':<28} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}  status")
+        for index, url in enumerate(targets):
+            latencies, statuses, elapsed = asyncio.run(_run_target(url, args, (index + 1) * 10**9))
+            ok = statuses.get('200', 0)
+            failed = failed or ok == 0
+            print(f"{url:<28} {len(latencies) / elapsed:>9.0f} {_percentile(latencies, 50) * 1000:>8.2f} "
+                  f"{_percentile(latencies, 99) * 1000:>8.2f}  {dict(statuses)}")
+    finally:
+        if cleanup:
+            cleanup()
+
+    print("✅ Todos os alvos responderam 200" if not failed else "❌ Algum alvo não respondeu 200")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
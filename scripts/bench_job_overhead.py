@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Custo por Job de Update (Worker com fork x SimpleWorker)
+====================================================================
+Enfileira N jobs reais de process_telegram_message_async (o mesmo job que
+a rota /webhook/telegram enfileira) para um bot existente, numa fila
+dedicada, e processa a fila em modo burst com cada classe de worker:
+
+- Worker:       fork por job; o filho reconstrói app Flask, BotManager e
+                sessões HTTP a cada update (padrão de start_rq_worker.py)
+- SimpleWorker: jobs no próprio processo; app e BotManager do service
+                registry reaproveitados entre jobs (RQ_SIMPLE_WORKER=1)
+
+Mostra ms/job (started_at → ended_at do job, média e p95) e o tempo total
+de parede por job (inclui o fork).
+
+    python scripts/bench_job_overhead.py --bot-id 12 --jobs 200
+
+Requer Redis (REDIS_URL) e banco do app. Use um bot de teste: os updates
+são mensagens de texto de usuários sintéticos (--base-user-id) e o bot
+tenta responder a eles pelo Telegram.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUEUE_NAME = 'bench_job_overhead'
+
+
+def _update(seq: int, base_user_id: int) -> dict:
+    user = {'id': base_user_id + seq % 50, 'is_bot': False, 'first_name': 'Bench'}
+    return {
+        'update_id': seq,
+        'message': {
+            'message_id': seq,
+            'from': user,
+            'chat': {'id': user['id'], 'type': 'private'},
+            'date': int(time.time()),
+            'text': f'bench {seq}',
+        },
+    }
+
+
+def _run(worker_class, queue, args, bot, config, seq_start):
+    from tasks_async import process_telegram_message_async
+
+    jobs = [
+        queue.enqueue(process_telegram_message_async, bot.id, _update(seq_start + i, args.base_user_id),
+                      bot.token, config, result_ttl=600)
+        for i in range(args.jobs)
+    ]
+    started = time.perf_counter()
+    worker_class([queue], connection=queue.connection).work(burst=True)
+    wall = time.perf_counter() - started
+
+    timings = []
+    for job in jobs:
+        job.refresh()
+        if job.started_at and job.ended_at:
+            timings.append((job.ended_at - job.started_at).total_seconds() * 1000)
+    failed = sum(1 for job in jobs if job.is_failed)
+    if not timings:
+        print(f"{worker_class.__name__:<13} | nenhum job concluído ({failed} falharam)")
+        return
+    p95 = sorted(timings)[max(0, int(len(timings) * 0.95) - 1)]
+    print(
+        f"{worker_class.__name__:<13} | {len(timings)} jobs ({failed} falharam) | "
+        f"ms/job média={statistics.mean(timings):.1f} p95={p95:.1f} | "
+        f"parede/job={wall / len(jobs) * 1000:.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bot-id', type=int, required=True, help='bot de teste existente no banco')
+    parser.add_argument('--jobs', type=int, default=200)
+    parser.add_argument('--base-user-id', type=int, default=9_000_000_000)
+    args = parser.parse_args()
+
+    from rq import Queue, SimpleWorker, Worker
+    from internal_logic.core.models import Bot
+    from internal_logic.core.redis_manager import get_redis_connection
+    from tasks_async import _get_rq_app
+
+    queue = Queue(QUEUE_NAME, connection=get_redis_connection(decode_responses=False))
+    queue.empty()
+    with _get_rq_app().app_context():
+        bot = Bot.query.get(args.bot_id)
+        if not bot:
+            parser.error(f'bot {args.bot_id} não encontrado')
+        config = bot.config.to_dict() if bot.config else {}
+
+    print(f"{args.jobs} jobs process_telegram_message_async por classe de worker (bot {bot.id})")
+    _run(Worker, queue, args, bot, config, 0)
+    _run(SimpleWorker, queue, args, bot, config, args.jobs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Fan-out de Eventos Socket.IO com 1k Dashboards
+===========================================================
+Conecta N clientes de teste do Flask-SocketIO (em processo, sem rede), cada
+um autenticado como um dono de bot, e compara:
+
+    broadcast  → socketio.emit(evento) sem sala (comportamento antigo)
+    rooms      → emit_to_user(dono, evento) na sala user:{id}
+    coalesced  → rajada de remarketing_progress via emit_coalesced
+
+Uso:
+    python scripts/bench_realtime_fanout.py --dashboards 1000 --owners 250 --events 500
+
+Reporta emits/s no servidor, pacotes entregues aos clientes e, no modo
+coalesced, quantos eventos foram enviados de fato para os submetidos.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _BenchUser:
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, user_id):
+        self.id = user_id
+
+    def get_id(self):
+        return str(self.id)
+
+
+def _build_app():
+    from flask import Flask
+    from flask_login import LoginManager
+    from internal_logic.core.extensions import socketio
+    from internal_logic.services.realtime_bus import register_socketio_handlers
+
+    app = Flask('bench_realtime')
+    app.config['SECRET_KEY'] = 'bench'
+    login_manager = LoginManager(app)
+    # Autenticação do benchmark: cabeçalho em vez do cookie de sessão
+    login_manager.request_loader(
+        lambda request: _BenchUser(int(request.headers['X-Bench-User'])) if request.headers.get('X-Bench-User') else None
+    )
+    socketio.init_app(app, async_mode='threading')
+    register_socketio_handlers(socketio)
+    return app, socketio
+
+
+def _drain(clients):
+    return sum(len(client.get_received()) for client in clients)
+
+
+def _report(label, emits, elapsed, delivered):
+    print(f"{label:<10} emits={emits:<6} {emits / elapsed:>10,.0f} emits/s   "
+          f"entregues={delivered:<9,} {delivered / elapsed:>12,.0f} pacotes/s   ({elapsed:.3f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dashboards', type=int, default=1000)
+    parser.add_argument('--owners', type=int, default=250)
+    parser.add_argument('--events', type=int, default=500)
+    parser.add_argument('--campaigns', type=int, default=20)
+    parser.add_argument('--burst-seconds', type=float, default=2.0)
+    args = parser.parse_args()
+
+    from internal_logic.services import realtime_bus
+
+    app, socketio = _build_app()
+    owners = list(range(1, args.owners + 1))
+
+    started = time.perf_counter()
+    clients = [
+        socketio.test_client(app, headers={'X-Bench-User': str(owners[i % len(owners)])})
+        for i in range(args.dashboards)
+    ]
+    assert all(client.is_connected() for client in clients)
+    assert not socketio.test_client(app).is_connected(), 'conexão anônima deveria ser recusada'
+    print(f"{args.dashboards} dashboards conectados ({args.owners} donos) em {time.perf_counter() - started:.2f}s\n")
+
+    payload = {'payment_id': 1, 'status': 'paid', 'amount': 19.9, 'bot_id': 1}
+
+    _drain(clients)
+    started = time.perf_counter()
+    for _ in range(args.events):
+        socketio.emit('payment_update', payload)
+    _report('broadcast', args.events, time.perf_counter() - started, _drain(clients))
+
+    started = time.perf_counter()
+    for _ in range(args.events):
+        realtime_bus.emit_to_user(random.choice(owners), 'payment_update', payload)
+    _report('rooms', args.events, time.perf_counter() - started, _drain(clients))
+
+    # Rajada de progresso: todas as campanhas atualizando o mais rápido possível
+    sent = []
+    coalescer = realtime_bus.EventCoalescer(
+        emit=lambda user_id, event, data: sent.append(realtime_bus._emit(user_id, event, data))
+    )
+    submitted = 0
+    started = time.perf_counter()
+    deadline = started + args.burst_seconds
+    while time.perf_counter() < deadline:
+        for campaign_id in range(args.campaigns):
+            coalescer.submit(owners[campaign_id % len(owners)], 'remarketing_progress',
+                             {'campaign_id': campaign_id, 'sent': submitted}, key=campaign_id)
+            submitted += 1
+    time.sleep(1.0 / realtime_bus.MAX_EVENTS_PER_SECOND + 0.1)  # flush dos pendentes
+    elapsed = time.perf_counter() - started
+    _report('coalesced', len(sent), elapsed, _drain(clients))
+    print(f"{'':<10} submetidos={submitted:,} → enviados={len(sent)} "
+          f"(limite {realtime_bus.MAX_EVENTS_PER_SECOND:g}/s por campanha × {args.campaigns} campanhas)")
+
+    for client in clients:
+        client.disconnect()
+
+
+if __name__ == '__main__':
+    main()
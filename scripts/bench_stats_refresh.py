@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Custo de Banco por Refresh do Dashboard
+====================================================
+Mede, para um bot real, quantos statements SQL e quanto tempo de banco cada
+refresh de /api/bots/<id>/stats custa, e quantos recálculos acontecem
+quando N abas pedem o mesmo stats ao mesmo tempo (cache frio e expirado).
+
+    python scripts/bench_stats_refresh.py --bot-id 94 --period 30 --refreshes 20 --concurrency 50
+
+Saída:
+- refresh:   statements/refresh, ms de banco/refresh, ms total/refresh
+- metrics:   o mesmo para StatsService.get_bot_metrics (analytics-v2)
+- stampede:  recálculos para N requisições simultâneas (esperado: 1)
+
+Requer o banco e o Redis configurados (.env), como a aplicação.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _StatementMeter:
+    """Conta statements e soma o tempo gasto no banco (cursor execute)."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.statements = 0
+        self.db_seconds = 0.0
+        self._local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+
+    def _before(self, *args):
+        self._local.started = time.perf_counter()
+
+    def _after(self, *args):
+        self.statements += 1
+        self.db_seconds += time.perf_counter() - getattr(self._local, 'started', time.perf_counter())
+
+    def reset(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+
+
+def _measure(label, meter, fn, refreshes):
+    statements, db_ms, wall_ms = [], [], []
+    for _ in range(refreshes):
+        meter.reset()
+        started = time.perf_counter()
+        fn()
+        wall_ms.append((time.perf_counter() - started) * 1000)
+        statements.append(meter.statements)
+        db_ms.append(meter.db_seconds * 1000)
+    print(
+        f"{label:<8} | {refreshes} refreshes | statements/refresh={statistics.mean(statements):.0f} | "
+        f"DB ms/refresh média={statistics.mean(db_ms):.2f} | total ms/refresh média={statistics.mean(wall_ms):.2f}"
+    )
+
+
+def _stampede(app, bot_id, period, concurrency):
+    import json
+
+    from internal_logic.blueprints.api.routes import _compute_bot_stats
+    from internal_logic.core.extensions import db
+    from internal_logic.core.redis_manager import get_redis_connection
+    from internal_logic.services import stats_cache
+
+    key = f"gb:stats:bench:{bot_id}:{period}"
+    redis_conn = get_redis_connection()
+
+    def _request():
+        with app.app_context():
+            started = time.perf_counter()
+            stats_cache.get_or_compute(key, lambda: _compute_bot_stats(bot_id, period))
+            db.session.remove()
+            return (time.perf_counter() - started) * 1000
+
+    for scenario in ('frio', 'expirado'):
+        if scenario == 'frio':
+            redis_conn.delete(key, f"{key}:lock")
+        else:
+            cached = json.loads(redis_conn.get(key))
+            cached['computed_at'] = 0
+            redis_conn.set(key, json.dumps(cached), ex=stats_cache.DEFAULT_HARD_TTL)
+        computes_before = stats_cache.stats['computes']
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = sorted(pool.map(lambda _: _request(), range(concurrency)))
+        time.sleep(1)  # refresh em background termina
+        print(
+            f"stampede | cache {scenario:<8} | {concurrency} requisições | "
+            f"recálculos={stats_cache.stats['computes'] - computes_before} | "
+            f"p50={latencies[len(latencies) // 2]:.1f} ms p95={latencies[int(len(latencies) * 0.95) - 1]:.1f} ms"
+        )
+    redis_conn.delete(key)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bot-id', type=int, required=True)
+    parser.add_argument('--period', default='30')
+    parser.add_argument('--refreshes', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    from app import app
+    from internal_logic.blueprints.api.routes import _compute_bot_stats
+    from internal_logic.core.extensions import db
+    from internal_logic.services.stats_service import StatsService
+
+    with app.app_context():
+        meter = _StatementMeter(db.engine)
+        _measure('refresh', meter, lambda: _compute_bot_stats(args.bot_id, args.period), args.refreshes)
+        _measure('metrics', meter, lambda: StatsService.get_bot_metrics(args.bot_id, args.period), args.refreshes)
+
+    _stampede(app, args.bot_id, args.period, args.concurrency)
+
+
+if __name__ == '__main__':
+    main()
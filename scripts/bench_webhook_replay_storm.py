@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Replay Storm de Webhooks de Pagamento
+==================================================
+Mede o custo de replays (mesmo gateway + transação + status) após o
+pré-check de idempotência no Redis.
+
+Modos:
+    # 1) Apenas o pré-check (Redis configurado em REDIS_URL)
+    python scripts/bench_webhook_replay_storm.py precheck --replays 20000
+
+    # 2) Tempestade HTTP contra um servidor rodando
+    python scripts/bench_webhook_replay_storm.py http \\
+        --url http://127.0.0.1:5000/webhook/payment/pushynpay \\
+        --payload '{"id": "tx_123", "status": "paid"}' --replays 2000 --concurrency 50
+
+O modo http reporta req/s, distribuição de status HTTP e latência p50/p95/p99.
+Com o pré-check ativo, apenas a 1ª entrega chega ao banco; as demais
+devem responder 200 {"status": "duplicate"}.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _percentiles(samples_ms):
+    ordered = sorted(samples_ms)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+    return {
+        'p50': round(pick(0.50), 3),
+        'p95': round(pick(0.95), 3),
+        'p99': round(pick(0.99), 3),
+        'mean': round(statistics.mean(ordered), 3),
+    }
+
+
+def bench_precheck(replays: int, distinct: int) -> None:
+    from internal_logic.services.webhook_idempotency import (
+        CLAIM_NEW, claim_webhook, complete_webhook, release_webhook,
+    )
+
+    run_id = uuid.uuid4().hex[:8]
+    keys = []
+    for i in range(distinct):
+        state, key = claim_webhook('bench', f'{run_id}-{i}', 'paid')
+        assert state == CLAIM_NEW
+        complete_webhook(key)
+        keys.append(key)
+
+    samples = []
+    states = Counter()
+    started = time.perf_counter()
+    for i in range(replays):
+        t0 = time.perf_counter()
+        state, _ = claim_webhook('bench', f'{run_id}-{i % distinct}', 'paid')
+        samples.append((time.perf_counter() - t0) * 1000)
+        states[state] += 1
+    elapsed = time.perf_counter() - started
+
+    for key in keys:
+        release_webhook(key)
+
+    print(f"Pré-check: {replays} replays em {elapsed:.2f}s ({replays / elapsed:,.0f}/s)")
+    print(f"Estados: {dict(states)}")
+    print(f"Latência (ms): {_percentiles(samples)}")
+
+
+def bench_http(url: str, payload: str, replays: int, concurrency: int) -> None:
+    import requests
+
+    body = json.loads(payload)
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    def fire(_):
+        t0 = time.perf_counter()
+        try:
+            status = session.post(url, json=body, timeout=30).status_code
+        except Exception:
+            status = 'error'
+        return status, (time.perf_counter() - t0) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(fire, range(replays)))
+    elapsed = time.perf_counter() - started
+
+    print(f"HTTP: {replays} replays em {elapsed:.2f}s ({replays / elapsed:,.0f} req/s, concorrência {concurrency})")
+    print(f"Status: {dict(Counter(status for status, _ in results))}")
+    print(f"Latência (ms): {_percentiles([ms for _, ms in results])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='mode', required=True)
+
+    precheck = sub.add_parser('precheck')
+    precheck.add_argument('--replays', type=int, default=20000)
+    precheck.add_argument('--distinct', type=int, default=100)
+
+    http = sub.add_parser('http')
+    http.add_argument('--url', required=True)
+    http.add_argument('--payload', required=True)
+    http.add_argument('--replays', type=int, default=2000)
+    http.add_argument('--concurrency', type=int, default=50)
+
+    args = parser.parse_args()
+    if args.mode == 'precheck':
+        bench_precheck(args.replays, args.distinct)
+    else:
+        bench_http(args.url, args.payload, args.replays, args.concurrency)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Verificação - Resumo Diário do Admin × Consultas Ad-hoc
+========================================================
+Semeia usuários, bots e pagamentos espalhados em 40 dias em um banco
+descartável (SQLite em memória por padrão), alimenta admin_daily_summary
+pelo caminho incremental (record_signup / record_sale, como cadastro e
+confirmação de pagamento fazem) e compara com as consultas que
+/admin/revenue e /admin/analytics rodavam a cada visita:
+
+    por dia    → GROUP BY date(paid_at): vendas e faturamento; novos usuários
+    totais     → COUNT/SUM de payments pagos e users
+    top 20     → User ⨝ Bot ⨝ Payment agrupado por usuário
+    reparo     → após corromper o resumo, rebuild()/repair_recent() o
+                 deixam igual às consultas de novo
+
+Uso:
+    python scripts/check_admin_summary.py [--database-url postgresql://...] [--payments 3000]
+"""
+
+import argparse
+import os
+import random
+import sys
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DAYS = 40
+
+
+def _build_app(database_url):
+    from flask import Flask
+    from internal_logic.core.extensions import db
+
+    app = Flask('check_admin_summary')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SECRET_KEY'] = 'check'
+    db.init_app(app)
+    return app, db
+
+
+def _seed(db, payments, rng):
+    from internal_logic.core.models import Bot, Payment, User, get_brazil_time
+    from internal_logic.services import admin_summary
+
+    now = get_brazil_time()
+    users = []
+    for index in range(60):
+        user = User(email=f'admin-summary-{index}@example.com', username=f'admin_summary_{index}',
+                    password_hash='x', created_at=now - timedelta(days=rng.randrange(DAYS), hours=rng.randrange(24)))
+        db.session.add(user)
+        users.append(user)
+    db.session.commit()
+    for user in users:
+        admin_summary.record_signup(user)
+
+    bots = []
+    for index, user in enumerate(users[:40]):
+        bot = Bot(user_id=user.id, token=f'0:summary{index}', username=f'summary_{index}_bot', name=f'Bot {index}')
+        db.session.add(bot)
+        bots.append(bot)
+    db.session.commit()
+
+    for index in range(payments):
+        paid = rng.random() < 0.7
+        moment = now - timedelta(days=rng.randrange(DAYS), minutes=rng.randrange(1440))
+        payment = Payment(
+            bot_id=rng.choice(bots).id, payment_id=f'summary-{index}', amount=round(rng.uniform(5, 300), 2),
+            status='paid' if paid else 'pending', created_at=moment, paid_at=moment if paid else None,
+        )
+        db.session.add(payment)
+        db.session.commit()
+        if paid:
+            admin_summary.record_sale(payment)
+
+
+def _adhoc(db):
+    """As consultas que as páginas admin rodavam a cada visita."""
+    from sqlalchemy import func
+    from internal_logic.core.models import Bot, Payment, User
+    from internal_logic.services.admin_summary import _as_date
+
+    daily = {
+        _as_date(day): (count, round(float(revenue), 2))
+        for day, count, revenue in db.session.query(
+            func.date(Payment.paid_at), func.count(Payment.id), func.sum(Payment.amount)
+        ).filter(Payment.status == 'paid').group_by(func.date(Payment.paid_at))
+    }
+    signups = {
+        _as_date(day): count
+        for day, count in db.session.query(func.date(User.created_at), func.count(User.id)).group_by(func.date(User.created_at))
+    }
+    totals = {
+        'total_users': User.query.count(),
+        'total_payments': Payment.query.filter_by(status='paid').count(),
+        'total_revenue': round(float(db.session.query(func.sum(Payment.amount)).filter(Payment.status == 'paid').scalar() or 0), 2),
+    }
+    top = [
+        (row.id, row.total_sales, round(float(row.total_revenue), 2))
+        for row in db.session.query(
+            User.id, func.sum(Payment.amount).label('total_revenue'), func.count(Payment.id).label('total_sales')
+        ).join(Bot, Bot.user_id == User.id).join(Payment, Payment.bot_id == Bot.id).filter(
+            Payment.status == 'paid'
+        ).group_by(User.id).order_by(
+            func.sum(Payment.amount).desc()
+        ).limit(20)
+    ]
+    return daily, signups, totals, top
+
+
+def _summary(db):
+    from internal_logic.core.models import AdminDailySummary
+    from internal_logic.services.admin_summary import get_overview, get_top_users
+
+    rows = AdminDailySummary.query.all()
+    daily = {row.day: (row.sales, round(row.revenue, 2)) for row in rows if row.sales}
+    signups = {row.day: row.new_users for row in rows if row.new_users}
+    overview = get_overview()
+    totals = {
+        'total_users': overview['total_users'],
+        'total_payments': overview['total_payments'],
+        'total_revenue': round(overview['total_revenue'], 2),
+    }
+    top = [(row.id, int(row.total_sales), round(float(row.total_revenue), 2)) for row in get_top_users(20)]
+    return daily, signups, totals, top, len(rows)
+
+
+def _compare(label, db):
+    daily, signups, totals, top = _adhoc(db)
+    s_daily, s_signups, s_totals, s_top, rows = _summary(db)
+    checks = [
+        ('vendas/dia', s_daily == daily, f"{len(daily)} dias"),
+        ('cadastros/dia', s_signups == signups, f"{sum(signups.values())} usuários"),
+        ('totais', s_totals == totals, str(s_totals)),
+        ('top 20', s_top == top, f"{len(top)} usuários"),
+    ]
+    failed = False
+    for name, ok, detail in checks:
+        failed = failed or not ok
+        print(f"{'✅' if ok else '❌'} [{label}] {name:<14} {detail}")
+    print(f"ℹ️ [{label}] páginas admin leem {rows} linhas do resumo")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default='sqlite://')
+    parser.add_argument('--payments', type=int, default=3000)
+    parser.add_argument('--seed', type=int, default=48)
+    args = parser.parse_args()
+
+    app, db = _build_app(args.database_url)
+    with app.app_context():
+        from internal_logic.core.models import AdminDailySummary, get_brazil_time
+        from internal_logic.services import admin_summary
+
+        db.create_all()
+        _seed(db, args.payments, random.Random(args.seed))
+
+        # users.total_* são mantidos por apply_paid_statistics (fora deste seed): reparo noturno
+        admin_summary.repair_user_totals()
+        failed = _compare('incremental', db)
+
+        # corrompe: apaga o dia de hoje e infla um dia antigo
+        today = get_brazil_time().date()
+        AdminDailySummary.query.filter_by(day=today).delete()
+        oldest = AdminDailySummary.query.order_by(AdminDailySummary.day).first()
+        oldest.sales += 5
+        db.session.commit()
+        admin_summary.repair_recent(days=2)
+        admin_summary.rebuild(since=oldest.day)
+        failed = _compare('reparado', db) or failed
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
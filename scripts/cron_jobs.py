@@ -19,9 +19,12 @@ Jobs disponíveis:
   - check_expired_subscriptions
   - reset_error_count
   - update_ranking
+  - repair_admin_summary  (resumo diário do painel admin, 1x por noite)
   - health_check_pools
   - remarketing_campaigns
-  - reconcile_all  (roda todos os reconciliadores)
+  - maintain_partitions  (partições futuras + retenção de bot_messages/webhook_events)
+  - reconcile_all  (motor único: todos os gateways em paralelo)
+  - flush_counters  (contadores do Redis → banco; fallback do job RQ de 5s)
 """
 
 import sys
@@ -98,24 +101,9 @@ def reconcile_sigilopay():
 
 
 def reconcile_all():
-    """Executa todos os reconciliadores em sequência"""
-    jobs = [
-        reconcile_paradise,
-        reconcile_pushynpay,
-        reconcile_atomopay,
-        reconcile_aguia,
-        reconcile_bolt,
-        reconcile_sigilopay,
-    ]
-    
-    logger.info("🚀 Iniciando reconciliação completa de todos os gateways")
-    for job in jobs:
-        try:
-            job()
-        except Exception as e:
-            logger.error(f"❌ Job {job.__name__} falhou: {e}")
-            # Continua com o próximo, não interrompe
-    logger.info("✅ Reconciliação completa finalizada")
+    """Reconcilia todos os gateways em um único ciclo concorrente - executar a cada 1 minuto"""
+    from internal_logic.services.payment_processor import reconcile_all_payments
+    run_with_context(reconcile_all_payments, "reconcile_all")
 
 
 def check_expired_subscriptions():
@@ -136,6 +124,24 @@ def update_ranking():
     run_with_context(update_ranking_premium_rates, "update_ranking")
 
 
+def reconcile_leaderboard():
+    """Reconstrói o ranking mensal (Redis) a partir do SQL - executar 1x por noite"""
+    from internal_logic.services.leaderboard_service import reconcile_leaderboard as _reconcile
+    run_with_context(_reconcile, "reconcile_leaderboard")
+
+
+def repair_analytics_cube():
+    """Recalcula o cubo de analytics dos últimos 2 dias - executar 1x por noite"""
+    from internal_logic.services.analytics_cube import repair_recent
+    run_with_context(repair_recent, "repair_analytics_cube")
+
+
+def repair_admin_summary():
+    """Recalcula o resumo diário do admin (últimos 2 dias) e os totais por usuário - executar 1x por noite"""
+    from internal_logic.services.admin_summary import repair_recent
+    run_with_context(repair_recent, "repair_admin_summary")
+
+
 def health_check_pools():
     """Health check passivo de pools - baseado em last_seen_at, sem chamar Telegram API"""
     def update_pool_metrics():
@@ -159,6 +165,18 @@ def remarketing_campaigns():
     run_with_context(check_scheduled_remarketing_campaigns, "remarketing_campaigns")
 
 
+def flush_counters():
+    """Grava os contadores acumulados no Redis - fallback do job RQ (a cada 1 minuto)"""
+    from internal_logic.services.counter_buffer import flush_counters as _flush
+    run_with_context(_flush, "flush_counters")
+
+
+def maintain_partitions():
+    """Cria partições futuras e arquiva as antigas - executar 1x por dia"""
+    from internal_logic.services.partition_manager import maintain_all
+    run_with_context(maintain_all, "maintain_partitions")
+
+
 def main():
     if len(sys.argv) < 2:
         print(__doc__)
@@ -179,8 +197,13 @@ def main():
         'check_expired_subscriptions': check_expired_subscriptions,
         'reset_error_count': reset_error_count,
         'update_ranking': update_ranking,
+        'reconcile_leaderboard': reconcile_leaderboard,
+        'repair_analytics_cube': repair_analytics_cube,
+        'repair_admin_summary': repair_admin_summary,
         'health_check_pools': health_check_pools,
         'remarketing_campaigns': remarketing_campaigns,
+        'maintain_partitions': maintain_partitions,
+        'flush_counters': flush_counters,
     }
     
     if job_name not in jobs:
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Medição - Largura da Linha de bot_users e Buffers do Lookup de Lead
+====================================================================
+Mostra quanto das linhas de bot_users é "frio" (tracking/demografia) e
+compara os buffers lidos pelo lookup do upsert de lead com a entidade
+inteira vs a projeção enxuta (internal_logic/services/lead_lookup.py).
+
+    python scripts/measure_bot_users_row_width.py --bot-id 94 [--samples 200]
+
+Saída:
+- largura:   bytes médios por linha (total, colunas enxutas, grupos deferred)
+- lookup:    shared hit/read e tempo médio por lookup, full vs slim
+
+Requer PostgreSQL (usa pg_column_size e EXPLAIN (ANALYZE, BUFFERS)).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SLIM_COLUMNS = ('id', 'bot_id', 'telegram_user_id', 'archived', 'last_interaction')
+
+
+def _deferred_groups():
+    from internal_logic.core.models import BotUser
+
+    groups = {}
+    for prop in BotUser.__mapper__.column_attrs:
+        if prop.deferred and prop.group:
+            groups.setdefault(prop.group, []).append(prop.columns[0].name)
+    return groups
+
+
+def _avg_width(conn, bot_id, columns):
+    from sqlalchemy import text
+
+    expression = ' + '.join(f"COALESCE(pg_column_size(b.{col}), 0)" for col in columns)
+    return conn.execute(text(f"SELECT AVG({expression}) FROM bot_users b WHERE b.bot_id = :bot_id"),
+                        {'bot_id': bot_id}).scalar() or 0
+
+
+def _explain(conn, sql, params):
+    from sqlalchemy import text
+
+    plan = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"), params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    root = plan[0]
+    node = root['Plan']
+    scan = node
+    while scan.get('Plans'):
+        scan = scan['Plans'][0]
+    # Buffers do nó raiz já incluem os filhos; o tipo de scan vem da folha
+    return node.get('Shared Hit Blocks', 0), node.get('Shared Read Blocks', 0), root.get('Execution Time', 0.0), scan['Node Type']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bot-id', type=int, required=True)
+    parser.add_argument('--samples', type=int, default=200)
+    args = parser.parse_args()
+
+    from app import app
+    from internal_logic.core.extensions import db
+    from sqlalchemy import text
+
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            print("❌ Requer PostgreSQL")
+            sys.exit(1)
+
+        with db.engine.connect() as conn:
+            total = conn.execute(text("SELECT AVG(pg_column_size(b.*)) FROM bot_users b WHERE b.bot_id = :bot_id"),
+                                 {'bot_id': args.bot_id}).scalar() or 0
+            print(f"largura  | linha inteira média={float(total):.0f} B")
+            print(f"largura  | enxuta ({', '.join(SLIM_COLUMNS)}) média={float(_avg_width(conn, args.bot_id, SLIM_COLUMNS)):.0f} B")
+            for group, columns in sorted(_deferred_groups().items()):
+                print(f"largura  | grupo '{group}' ({len(columns)} colunas) média={float(_avg_width(conn, args.bot_id, columns)):.0f} B")
+
+            lead_ids = [row[0] for row in conn.execute(text(
+                "SELECT telegram_user_id FROM bot_users WHERE bot_id = :bot_id ORDER BY random() LIMIT :samples"
+            ), {'bot_id': args.bot_id, 'samples': args.samples})]
+            if not lead_ids:
+                print("⏭️  Bot sem leads")
+                return
+
+            variants = {
+                'full': "SELECT * FROM bot_users WHERE bot_id = :bot_id AND telegram_user_id = :lead_id LIMIT 1",
+                'slim': (f"SELECT {', '.join(SLIM_COLUMNS)} FROM bot_users "
+                         "WHERE bot_id = :bot_id AND telegram_user_id = :lead_id LIMIT 1"),
+            }
+            for label, sql in variants.items():
+                hits, reads, times, nodes = [], [], [], set()
+                for lead_id in lead_ids:
+                    hit, read, elapsed, node = _explain(conn, sql, {'bot_id': args.bot_id, 'lead_id': lead_id})
+                    hits.append(hit)
+                    reads.append(read)
+                    times.append(elapsed)
+                    nodes.add(node)
+                print(
+                    f"lookup   | {label:<4} | {len(lead_ids)} amostras | shared hit média={statistics.mean(hits):.2f} | "
+                    f"shared read média={statistics.mean(reads):.2f} | ms média={statistics.mean(times):.3f} | "
+                    f"plano={'/'.join(sorted(nodes))}"
+                )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""
+Script para iniciar consumidor da camada de ingestão de webhooks
+Lê gb:ingest:telegram e gb:ingest:payment (grupo 'ingest')
+✅ Vários processos dividem o stream: ingest-consumer@1, @2, ...
+"""
+
+import os
+import signal
+import socket
+import sys
+
+# Adicionar diretório atual ao path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    from internal_logic.core.redis_manager import get_redis_connection
+    from internal_logic.services import ingest_consumer
+except ImportError as e:
+    print(f"❌ ERRO: Módulo não encontrado: {e}")
+    sys.exit(1)
+
+# Conectar ao Redis
+try:
+    redis_conn = get_redis_connection()
+    redis_conn.ping()
+    print("✅ Redis connection pool inicializado")
+except Exception as e:
+    print(f"❌ ERRO: Não foi possível conectar ao Redis: {e}")
+    sys.exit(1)
+
+# Nome estável do consumidor (instância systemd) ou host-pid
+consumer_name = sys.argv[1] if len(sys.argv) > 1 else f"{socket.gethostname()}-{os.getpid()}"
+
+_stopping = False
+
+
+def _request_stop(signum, frame):
+    global _stopping
+    _stopping = True
+    print(f"\n⚠️ Sinal {signum} recebido - encerrando após o lote atual")
+
+
+if __name__ == '__main__':
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+    try:
+        print("="*70)
+        print(f" Ingest Consumer - {consumer_name}")
+        print("="*70)
+        total = ingest_consumer.run(consumer_name, should_stop=lambda: _stopping, redis_conn=redis_conn)
+        print(f"✅ Consumidor encerrado ({total} entradas processadas)")
+        sys.exit(0)
+    except Exception as e:
+        print(f"❌ ERRO CRÍTICO: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -12,7 +12,7 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 try:
-    from rq import Worker, Queue
+    from rq import Worker, SimpleWorker, Queue
     from redis import Redis
     from internal_logic.core.redis_manager import get_redis_connection
 except ImportError as e:
@@ -51,7 +51,12 @@ if __name__ == '__main__':
         print("="*70)
         print(" RQ Worker QI 500 - Usina de Disparos Ativa")
         print("="*70)
-        worker = Worker(queues, connection=redis_conn, default_worker_ttl=300)
+        # Padrão: fork por job (crash/vazamento de um job não afeta o worker).
+        # RQ_SIMPLE_WORKER=1 (opt-in): jobs no próprio processo, reaproveitando o app
+        # Flask, BotManagers (service registry) e sessões HTTP entre jobs.
+        worker_class = SimpleWorker if os.environ.get('RQ_SIMPLE_WORKER') == '1' else Worker
+        print(f"⚙️ Worker class: {worker_class.__name__}")
+        worker = worker_class(queues, connection=redis_conn, default_worker_ttl=300)
         worker.work(
             max_jobs=1000,    # Reiniciar worker a cada 1000 jobs (memory leak prevention)
             burst=False
@@ -9,7 +9,7 @@ Tasks Assíncronas QI 200 - Redis Queue (RQ)
 import os
 import logging
 import re
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 # 🚨 CRÍTICO: Carregar .env ANTES de qualquer import local do projeto
 # Workers RQ precisam de ENCRYPTION_KEY e outras variáveis de ambiente
@@ -21,10 +21,11 @@ load_dotenv(env_path)
 from rq import Queue, Retry
 from redis import Redis
 from typing import Dict, Any, Optional
-from sqlalchemy import or_
+from sqlalchemy import or_, text
 from sqlalchemy.exc import IntegrityError
 from internal_logic.core.redis_manager import get_redis_connection
 from internal_logic.core.extensions import db
+from internal_logic.services.callback_codec import encode as encode_callback
 
 logger = logging.getLogger(__name__)
 
@@ -184,6 +185,9 @@ def rq_send_meta_event(pixel_id, access_token, event_data, test_code=None):
                             payment.meta_purchase_sent = True
                             payment.meta_purchase_sent_at = get_brazil_time()
                             db.session.commit()
+                            # Página de entrega lê o registro do Redis: recarga não reenvia o Purchase
+                            from internal_logic.services.delivery_cache import mark_purchase_sent
+                            mark_purchase_sent(payment.delivery_token)
                             _logger.info(
                                 "✅ META PURCHASE CONFIRMADO | payment_id=%s",
                                 payment.id,
@@ -246,12 +250,12 @@ def _ensure_periodic_reconciliations_scheduled() -> None:
         return
 
     try:
-        from internal_logic.services.payment_processor import reconcile_paradise_payments, reconcile_atomopay_payments
+        from internal_logic.services.payment_processor import reconcile_all_payments
 
         schedule_specs = [
-            ('reconcile:paradise', reconcile_paradise_payments, 60, 5),
-            ('reconcile:atomopay', reconcile_atomopay_payments, 60, 5),
+            ('reconcile:all', reconcile_all_payments, 60, 5),
             ('reconcile:purchase_capi', reconcile_server_purchases, 60, 5),
+            ('counters:flush', flush_buffered_counters, 5, 1),
         ]
 
         for key, func, interval_seconds, runs_ahead in schedule_specs:
@@ -285,74 +289,17 @@ def _ensure_periodic_reconciliations_scheduled() -> None:
 # ARCHIVAL JOB — Cleanup de dados antigos (roda 1x/dia na marathon queue)
 # ============================================================================
 def archive_old_data():
-    """Move registros antigos para tabelas de archive.
+    """Manutenção diária das tabelas de série temporal (partition_manager).
 
     - bot_messages > 90 dias → bot_messages_archive
     - webhook_events > 30 dias → webhook_events_archive
-    - Processa em lotes de 50k para não travar o banco
+    - Tabelas particionadas: cria partições futuras e destaca as antigas (sem DELETE)
+    - Tabela/partição legacy: move em lotes com DELETE ... RETURNING → INSERT
     """
-    import datetime
     app = _get_rq_app()
     with app.app_context():
-        from internal_logic.core.extensions import db
-        from sqlalchemy import text
-
-        cutoff_90d = datetime.datetime.utcnow() - datetime.timedelta(days=90)
-        cutoff_30d = datetime.datetime.utcnow() - datetime.timedelta(days=30)
-
-        # 1. Archive bot_messages (> 90 dias)
-        try:
-            sql_archive = text("""
-                INSERT INTO bot_messages_archive
-                SELECT *, NOW() as archived_at FROM bot_messages
-                WHERE created_at < :cutoff
-                LIMIT 50000
-            """)
-            sql_delete = text("""
-                DELETE FROM bot_messages
-                WHERE id IN (
-                    SELECT id FROM bot_messages_archive
-                    WHERE archived_at > NOW() - INTERVAL '1 minute'
-                )
-            """)
-            result = db.session.execute(sql_archive, {'cutoff': cutoff_90d})
-            archived = result.rowcount
-            if archived > 0:
-                db.session.execute(sql_delete)
-                db.session.commit()
-                logger.info(f"📦 Archival: {archived} bot_messages movidas para archive")
-            else:
-                db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            logger.error(f"❌ Archival bot_messages falhou: {e}")
-
-        # 2. Archive webhook_events (> 30 dias)
-        try:
-            sql_archive_wh = text("""
-                INSERT INTO webhook_events_archive
-                SELECT *, NOW() as archived_at FROM webhook_events
-                WHERE received_at < :cutoff
-                LIMIT 10000
-            """)
-            sql_delete_wh = text("""
-                DELETE FROM webhook_events
-                WHERE id IN (
-                    SELECT id FROM webhook_events_archive
-                    WHERE archived_at > NOW() - INTERVAL '1 minute'
-                )
-            """)
-            result = db.session.execute(sql_archive_wh, {'cutoff': cutoff_30d})
-            archived_wh = result.rowcount
-            if archived_wh > 0:
-                db.session.execute(sql_delete_wh)
-                db.session.commit()
-                logger.info(f"📦 Archival: {archived_wh} webhook_events movidas para archive")
-            else:
-                db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            logger.error(f"❌ Archival webhook_events falhou: {e}")
+        from internal_logic.services.partition_manager import maintain_all
+        maintain_all()
 
 
 def schedule_archival_jobs():
@@ -401,6 +348,35 @@ def reconcile_server_purchases() -> int:
             pass
 
 
+def flush_buffered_counters() -> int:
+    """RQ job: grava no banco os contadores acumulados no Redis (counter_buffer).
+
+    Auto-rescheduling: agenda a próxima execução em FLUSH_INTERVAL_SECONDS via finally.
+    """
+    from internal_logic.services.counter_buffer import FLUSH_INTERVAL_SECONDS, flush_counters
+    try:
+        app = _get_rq_app()
+        with app.app_context():
+            return sum(flush_counters().values())
+    except Exception as e:
+        logger.error(f"❌ [COUNTERS] Erro no flush_buffered_counters: {e}", exc_info=True)
+        return 0
+    finally:
+        _schedule_next_job('counters:flush', flush_buffered_counters, FLUSH_INTERVAL_SECONDS)
+
+
+def rebuild_leaderboard_async(month: str) -> Dict[str, int]:
+    """RQ job: reconstrói o ranking do mês (enfileirado por leaderboard_service.load_ranking)."""
+    try:
+        app = _get_rq_app()
+        with app.app_context():
+            from internal_logic.services.leaderboard_service import rebuild_month
+            return rebuild_month(month)
+    except Exception as e:
+        logger.error(f"❌ [LEADERBOARD] Erro no rebuild_leaderboard_async({month}): {e}", exc_info=True)
+        raise
+
+
 def _schedule_next_job(key, func, interval_seconds):
     """Agenda a próxima execução de um job periódico (auto-rescheduling).
 
@@ -496,6 +472,11 @@ def _persist_webhook_event(
     else:
         dedup_key = f"{gateway_type}:{get_brazil_time().timestamp()}"
 
+    if db.engine.dialect.name == 'postgresql':
+        # webhook_events particionada (received_at) não tem UNIQUE global em dedup_key:
+        # o lock transacional serializa webhooks concorrentes da mesma transação
+        db.session.execute(text("SELECT pg_advisory_xact_lock(hashtext(:k))"), {'k': dedup_key})
+
     existing = WebhookEvent.query.filter_by(dedup_key=dedup_key).first()
     
     # ✅ CRÍTICO: Validar status antes de salvar (não sobrescrever com None)
@@ -544,16 +525,62 @@ def _persist_webhook_event(
             logger.error(f"❌ [_persist_webhook_event] Erro de integridade ao criar: {e}")
 
 
+# Índice Redis dos pending matches: identificador (id/hash/referência do webhook) → dedup_key.
+# Permite resolver o pending no momento em que o Payment é criado (notify_payment_registered)
+# em vez de esperar a varredura de process_pending_webhooks.
+PENDING_MATCH_INDEX_KEY = 'gb:webhook_pending:{gateway_type}'
+PENDING_MATCH_INDEX_TTL = 86400
+
+
+def _pending_identifiers(*values) -> list:
+    identifiers = []
+    for value in values:
+        normalized = str(value or '').strip().lower()
+        if normalized and normalized not in identifiers:
+            identifiers.append(normalized)
+    return identifiers
+
+
+def _index_pending_match(gateway_type: str, dedup_key: str, identifiers: list) -> None:
+    if not identifiers:
+        return
+    try:
+        redis = get_redis_connection()
+        key = PENDING_MATCH_INDEX_KEY.format(gateway_type=gateway_type)
+        pipe = redis.pipeline()
+        pipe.hset(key, mapping={identifier: dedup_key for identifier in identifiers})
+        pipe.expire(key, PENDING_MATCH_INDEX_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"⚠️ Falha ao indexar pending match {dedup_key} no Redis (varredura cobre): {e}")
+
+
+def _unindex_pending_match(gateway_type: str, dedup_key: str) -> None:
+    # Hash pequeno (limitado por max_pending_records): remove todos os identificadores do pending
+    try:
+        redis = get_redis_connection()
+        key = PENDING_MATCH_INDEX_KEY.format(gateway_type=gateway_type)
+        identifiers = [identifier for identifier, value in redis.hgetall(key).items() if value == dedup_key]
+        if identifiers:
+            redis.hdel(key, *identifiers)
+    except Exception:
+        pass
+
+
 def _enqueue_pending_match(
     gateway_type: str,
     transaction_id: Optional[str],
     transaction_hash: Optional[str],
     payload: Dict[str, Any],
     status: Optional[str] = None,
-    max_pending_records: int = 1000
+    max_pending_records: int = 1000,
+    references: Optional[list] = None
 ) -> None:
     """
     Registra payload para retry posterior quando payment ainda não existe.
+
+    Todos os identificadores do webhook (transaction_id, hash e references)
+    são indexados no Redis para resolução imediata na criação do Payment.
     """
     from internal_logic.core.extensions import db
     from internal_logic.core.models import WebhookPendingMatch, get_brazil_time
@@ -568,6 +595,7 @@ def _enqueue_pending_match(
     _ensure_aux_tables()
 
     dedup_key = f"{gateway_type}:{key}".lower()
+    identifiers = _pending_identifiers(transaction_id, transaction_hash, *(references or []))
 
     existing = WebhookPendingMatch.query.filter_by(dedup_key=dedup_key).first()
 
@@ -577,6 +605,7 @@ def _enqueue_pending_match(
         existing.last_attempt_at = get_brazil_time()
         existing.attempts = existing.attempts or 0
         db.session.commit()
+        _index_pending_match(gateway_type, dedup_key, identifiers)
         return
 
     total_pending = WebhookPendingMatch.query.filter_by(gateway_type=gateway_type).count()
@@ -597,6 +626,8 @@ def _enqueue_pending_match(
         db.session.commit()
     except IntegrityError:
         db.session.rollback()
+        return
+    _index_pending_match(gateway_type, dedup_key, identifiers)
 
 
 def _clear_pending_match(
@@ -622,6 +653,124 @@ def _clear_pending_match(
             db.session.commit()
         except IntegrityError:
             db.session.rollback()
+            return
+        _unindex_pending_match(gateway_type, dedup_key)
+
+
+def notify_payment_registered(payment) -> int:
+    """
+    Chamado logo após o commit de um Payment novo: se algum webhook chegou
+    antes do Payment existir (webhook_pending_matches), agenda a aplicação
+    imediata desse webhook direto no payment (sem o match completo).
+
+    Custo no caminho do PIX: um HMGET no Redis. Sem Redis, consulta as colunas
+    indexadas transaction_id/transaction_hash da tabela.
+
+    Returns:
+        Quantidade de pending matches agendados
+    """
+    from internal_logic.core.models import WebhookPendingMatch
+
+    gateway_type = (payment.gateway_type or '').strip().lower()
+    identifiers = _pending_identifiers(
+        payment.payment_id, payment.gateway_transaction_id, payment.gateway_transaction_hash
+    )
+    if not gateway_type or not identifiers:
+        return 0
+
+    try:
+        found = get_redis_connection().hmget(PENDING_MATCH_INDEX_KEY.format(gateway_type=gateway_type), identifiers)
+        dedup_keys = {dedup_key for dedup_key in found if dedup_key}
+    except Exception:
+        raw_values = [value for value in (payment.payment_id, payment.gateway_transaction_id,
+                                          payment.gateway_transaction_hash) if value]
+        dedup_keys = {
+            row.dedup_key for row in db.session.query(WebhookPendingMatch.dedup_key).filter(
+                WebhookPendingMatch.gateway_type == gateway_type,
+                or_(WebhookPendingMatch.transaction_id.in_(raw_values),
+                    WebhookPendingMatch.transaction_hash.in_(raw_values))
+            ).all()
+        }
+
+    if not dedup_keys:
+        return 0
+    if not webhook_queue:
+        logger.warning(f"⚠️ webhook_queue indisponível - pending match de {payment.payment_id} fica para a varredura")
+        return 0
+
+    for dedup_key in dedup_keys:
+        webhook_queue.enqueue(resolve_pending_match_async, dedup_key, payment.id)
+        logger.info(f"⚡ Pending webhook {dedup_key} agendado para o payment {payment.payment_id}")
+    return len(dedup_keys)
+
+
+def _apply_pending_match(pending, payment_id: Optional[int] = None, count_attempt: bool = True,
+                         max_attempts: int = 12) -> bool:
+    """
+    Reaplica o webhook de um pending match. Com payment_id, o payment é usado
+    direto (_grim_payment_id) em vez do match completo por identificadores.
+
+    Returns:
+        True se o webhook foi aplicado (pending removido)
+    """
+    from internal_logic.core.models import get_brazil_time
+
+    payload = dict(pending.payload or {})
+    payload['_skip_pending_enqueue'] = True
+    payload['_pending_replay'] = True
+    if payment_id:
+        payload['_grim_payment_id'] = payment_id
+    if count_attempt:
+        pending.attempts = (pending.attempts or 0) + 1
+    pending.last_attempt_at = get_brazil_time()
+    db.session.commit()
+
+    gateway_type = pending.gateway_type
+    dedup_key = pending.dedup_key
+    user_id = payload.get('user_id', 0)
+    result = process_webhook_async(user_id, gateway_type, payload)
+    status = (result or {}).get('status')
+
+    if status in {'success', 'already_processed'}:
+        # O webhook aplicado normalmente já limpa o pending (_clear_pending_match); garante aqui
+        type(pending).query.filter_by(id=pending.id).delete(synchronize_session=False)
+        db.session.commit()
+        _unindex_pending_match(gateway_type, dedup_key)
+        return True
+
+    if count_attempt and pending.attempts >= max_attempts:
+        logger.error(
+            "❌ Pending webhook descartado após %s tentativas | gateway=%s | transaction_id=%s | hash=%s",
+            pending.attempts,
+            pending.gateway_type,
+            pending.transaction_id,
+            pending.transaction_hash
+        )
+        db.session.delete(pending)
+        db.session.commit()
+        _unindex_pending_match(gateway_type, dedup_key)
+    return False
+
+
+def resolve_pending_match_async(dedup_key: str, payment_id: int) -> bool:
+    """Job RQ (fila webhook): aplica um pending match ao payment recém-criado."""
+    from internal_logic.core.models import WebhookPendingMatch
+
+    app = _get_rq_app()
+    with app.app_context():
+        try:
+            pending = WebhookPendingMatch.query.filter_by(dedup_key=dedup_key).first()
+            if not pending:
+                return False
+            # Não consome o orçamento de tentativas da varredura: se o webhook for
+            # rejeitado agora (ex.: 'paid' < 10s da criação), a varredura reaplica depois
+            applied = _apply_pending_match(pending, payment_id=payment_id, count_attempt=False)
+            logger.info(f"⚡ Pending webhook {dedup_key} → payment {payment_id} | aplicado={applied}")
+            return applied
+        except Exception as e:
+            logger.error(f"❌ Erro ao resolver pending webhook {dedup_key}: {e}", exc_info=True)
+            db.session.rollback()
+            return False
 
 
 def process_start_async(
@@ -1069,6 +1218,11 @@ def process_start_async(
                 
                 db.session.commit()
                 logger.info(f"✅ BotUser criado/atualizado: {first_name}")
+                
+                # 📊 Cubo de analytics (lead novo, já com device/geo/UTM)
+                if is_new_user:
+                    from internal_logic.services.analytics_cube import record_lead
+                    record_lead(bot_user)
             else:
                 bot_user.last_interaction = get_brazil_time()
                 bot_user.first_name = first_name
@@ -1240,8 +1394,8 @@ def process_telegram_message_async(bot_id: int, update_data: Dict[str, Any], tok
     """
     from datetime import datetime
     from internal_logic.core.extensions import db
-    from internal_logic.core.models import BotUser, Bot
-    from bot_manager import BotManager
+    from internal_logic.core.models import Bot
+    from internal_logic.core.service_registry import get_bot_manager
     from sqlalchemy.exc import SQLAlchemyError, OperationalError, IntegrityError
     
     # CRIAR INSTÂNCIA LOCAL DA APP USANDO FACTORY FUNCTION
@@ -1256,77 +1410,45 @@ def process_telegram_message_async(bot_id: int, update_data: Dict[str, Any], tok
             # ============================================================================
             # BLOCO CRÍTICO: CRIAÇÃO/ATUALIZAÇÃO DO BOTUSER (RESTAURAÇÃO LEGADA)
             # ============================================================================
-            utc_now = datetime.utcnow()
-            
             try:
-                # 1. Extração segura dos dados do update do Telegram
-                message = update_data.get('message') or update_data.get('callback_query', {}).get('message')
-                from_user = None
+                # 1. Upsert do BotUser em UM comando (INSERT ... ON CONFLICT)
+                # No /start já leva tracking, UTMs, pixel do deep link e reset do welcome
+                from internal_logic.services.lead_upsert import ingest_update_lead, mark_lead_upserted
+                from internal_logic.services.analytics_cube import record_lead
                 
-                if 'message' in update_data:
-                    from_user = update_data['message'].get('from')
-                elif 'callback_query' in update_data:
-                    from_user = update_data['callback_query'].get('from')
-                elif 'edited_message' in update_data:
-                    from_user = update_data['edited_message'].get('from')
+                def _ingest():
+                    result = ingest_update_lead(bot_id, update_data)
+                    if result and result[1]:
+                        # Lead novo: contagem do cubo no mesmo commit (SAVEPOINT)
+                        record_lead(result[0], commit=False)
+                    db.session.commit()
+                    if result:
+                        # Só após o commit: handle_start_command não regrava o lead
+                        mark_lead_upserted(update_data)
+                    return result
                 
-                if from_user:
-                    telegram_id = from_user.get('id')
-                    # ?? CORREÇÃO CRÍTICA: Cast para string para compatibilidade com VARCHAR(255)
-                    telegram_id_str = str(telegram_id)
-                    first_name = from_user.get('first_name', '')
-                    username = from_user.get('username', '')
-                    
-                    logger.critical(f"?? [WORKER] Processando usuário {telegram_id_str} para bot {bot_id}")
-                    
-                    # 2. Busca ou Criação do BotUser
-                    user = BotUser.query.filter_by(bot_id=bot_id, telegram_user_id=telegram_id_str).first()
-                    
-                    if not user:
-                        # É UM LEAD NOVO (Vai contar no Dashboard de Hoje!)
-                        user = BotUser(
-                            bot_id=bot_id,
-                            telegram_user_id=telegram_id_str,
-                            first_name=first_name,
-                            username=username,
-                            first_interaction=utc_now,
-                            last_interaction=utc_now,
-                            archived=False
-                        )
-                        db.session.add(user)
-                        logger.critical(f"✅ [LEAD NOVO] BotUser criado: {telegram_id} | Bot: {bot_id}")
-                    else:
-                        # LEAD ANTIGO VOLTANDO (Atualiza apenas o last_interaction)
-                        user.first_name = first_name
-                        user.username = username
-                        user.last_interaction = utc_now
-                        user.archived = False  # Desarquiva se ele estava inativo
-                        logger.critical(f"✅ [LEAD EXISTENTE] BotUser atualizado: {telegram_id} | Bot: {bot_id}")
-                    
-                    # 3. Força o commit imediato ANTES de processar o funil
+                # 2. Commit imediato ANTES de processar o funil
+                try:
+                    result = _ingest()
+                    if result:
+                        lead_id, is_new_lead = result
+                        logger.critical(f"💾 [COMMIT SUCCESS] BotUser {'criado' if is_new_lead else 'atualizado'}: {lead_id} | Bot: {bot_id}")
+                except OperationalError as oe:
+                    db.session.rollback()
+                    logger.critical(f"🚨 [OPERATIONAL ERROR] Falha de conexão DB: {oe}", exc_info=True)
+                    # Tentar reconectar e salvar novamente
                     try:
-                        db.session.commit()
-                        logger.critical(f"💾 [COMMIT SUCCESS] BotUser persistido | Telegram: {telegram_id} | Bot: {bot_id}")
-                    except OperationalError as oe:
-                        db.session.rollback()
-                        logger.critical(f"🚨 [OPERATIONAL ERROR] Falha de conexão DB: {oe}", exc_info=True)
-                        # Tentar reconectar e salvar novamente
-                        try:
-                            db.session.remove()
-                            db.session.add(user)
-                            db.session.commit()
-                            logger.critical(f"💾 [RETRY SUCCESS] BotUser persistido após reconexão")
-                        except Exception as retry_error:
-                            logger.critical(f"💀 [RETRY FAILED] Não foi possível salvar após reconexão: {retry_error}", exc_info=True)
-                    except IntegrityError as ie:
-                        db.session.rollback()
-                        logger.critical(f"🚨 [INTEGRITY ERROR] Violação de constraint: {ie}", exc_info=True)
-                    except SQLAlchemyError as se:
-                        db.session.rollback()
-                        logger.critical(f"🚨 [SQLAlchemy ERROR] Erro no banco: {se}", exc_info=True)
-                    except Exception as commit_error:
-                        db.session.rollback()
-                        logger.critical(f"💀 [COMMIT FAILED] Erro desconhecido: {commit_error}", exc_info=True)
+                        db.session.remove()
+                        _ingest()
+                        logger.critical(f"💾 [RETRY SUCCESS] BotUser persistido após reconexão")
+                    except Exception as retry_error:
+                        logger.critical(f"💀 [RETRY FAILED] Não foi possível salvar após reconexão: {retry_error}", exc_info=True)
+                except IntegrityError as ie:
+                    db.session.rollback()
+                    logger.critical(f"🚨 [INTEGRITY ERROR] Violação de constraint: {ie}", exc_info=True)
+                except SQLAlchemyError as se:
+                    db.session.rollback()
+                    logger.critical(f"🚨 [SQLAlchemy ERROR] Erro no banco: {se}", exc_info=True)
                     
             except Exception as e:
                 db.session.rollback()
@@ -1345,7 +1467,7 @@ def process_telegram_message_async(bot_id: int, update_data: Dict[str, Any], tok
                     resolved_user_id = 1
                     logger.warning(f"⚠️ Não foi possível resolver user_id para bot {bot_id}, usando fallback=1")
 
-                bot_manager = BotManager(socketio=None, scheduler=None, user_id=resolved_user_id)
+                bot_manager = get_bot_manager(resolved_user_id)
                 bot_manager._process_telegram_update(bot_id, resolved_user_id, update_data)
                 logger.critical(f"✅ [MESSAGE PROCESSED] Job: {job_id} | Bot: {bot_id}")
             except Exception as e:
@@ -1475,7 +1597,8 @@ def process_webhook_async(user_id: int, gateway_type: str, data: Dict[str, Any])
                     WebhookEvent.received_at >= cinco_minutos_atras
                 ).order_by(WebhookEvent.received_at.desc()).first()
                 
-                if webhook_recente:
+                # Replay de pending match: o evento original já foi registrado, não é duplicado
+                if webhook_recente and not data.get('_pending_replay'):
                     # ✅ Se status é o mesmo, é duplicado exato
                     if webhook_recente.status == status:
                         logger.info(f"♻️ [WEBHOOK {gateway_type.upper()}] Webhook duplicado detectado (mesmo status '{status}' nos últimos 5min)")
@@ -1628,7 +1751,8 @@ def process_webhook_async(user_id: int, gateway_type: str, data: Dict[str, Any])
                                 transaction_id=event_id or event_tx,
                                 transaction_hash=event_hash,
                                 payload=data,
-                                status=status
+                                status=status,
+                                references=[event_id, event_tx, event_ref]
                             )
                         except Exception as pending_error:
                             logger.error(f"❌ Falha ao registrar pending match: {pending_error}", exc_info=True)
@@ -1727,9 +1851,9 @@ def process_webhook_async(user_id: int, gateway_type: str, data: Dict[str, Any])
                         if payment.bot.config and payment.bot.config.upsells_enabled:
                             logger.info(f"✅ [UPSELLS ASYNC WEBHOOK DUPLICADO] Upsells habilitados - agendando via RQ")
                             try:
-                                # ✅ ISOLAMENTO: Criar BotManager localmente com user_id do payment
-                                from bot_manager import BotManager
-                                local_bot_manager = BotManager(socketio=None, scheduler=None, user_id=payment.bot.user_id)
+                                # ✅ ISOLAMENTO: BotManager do dono do payment (reutilizado no processo)
+                                from internal_logic.core.service_registry import get_bot_manager
+                                local_bot_manager = get_bot_manager(payment.bot.user_id)
                                 
                                 upsells = payment.bot.config.get_upsells()
                                 if upsells:
@@ -1758,6 +1882,10 @@ def process_webhook_async(user_id: int, gateway_type: str, data: Dict[str, Any])
                     if payment.status != status:
                         logger.info(f"🔄 [WEBHOOK {gateway_type.upper()}] Atualizando status: {status_antigo} → {status}")
                         payment.status = status
+                        if status_antigo == 'paid' and payment.delivery_token:
+                            # Estorno/chargeback: página de entrega deixa de servir o registro pré-computado
+                            from internal_logic.services.delivery_cache import invalidate_delivery
+                            invalidate_delivery(payment.delivery_token)
                     else:
                         logger.info(f"ℹ️ [WEBHOOK {gateway_type.upper()}] Status não mudou ({status}) - não atualizando")
 
@@ -1876,7 +2004,16 @@ def process_webhook_async(user_id: int, gateway_type: str, data: Dict[str, Any])
                         logger.error(f"   Payment ID: {payment.payment_id}")
                     else:
                         logger.info(f"✅ [WEBHOOK {gateway_type.upper()}] Validação pós-update: Status confirmado como '{payment.status}'")
-                    
+
+                    # 🏆 Ranking mensal (idempotente por payment.id) + 📊 cubo de analytics + resumo admin
+                    # Mesmos hooks pós-commit de process_payment_confirmation (replays do pending-match e reconciliador)
+                    if deve_processar_estatisticas and payment.status == 'paid':
+                        from internal_logic.services.leaderboard_service import record_sale
+                        from internal_logic.services import admin_summary, analytics_cube
+                        record_sale(payment)
+                        analytics_cube.record_sale(payment)
+                        admin_summary.record_sale(payment)
+
                     # ============================================================================
                     # ✅ UPSELLS AUTOMÁTICOS - APÓS COMPRA APROVADA (TASKS_ASYNC)
                     # ✅ FLAT CODE: Processamento simplificado com Guard Clauses
@@ -1893,9 +2030,9 @@ def process_webhook_async(user_id: int, gateway_type: str, data: Dict[str, Any])
                             from internal_logic.core.models import Payment as PaymentModel
                             payment_check = PaymentModel.query.filter_by(payment_id=payment.payment_id).first()
                             
-                            # ✅ ISOLAMENTO: Criar BotManager localmente com user_id do payment
-                            from bot_manager import BotManager
-                            local_bot_manager = BotManager(socketio=None, scheduler=None, user_id=payment.bot.user_id)
+                            # ✅ ISOLAMENTO: BotManager do dono do payment (reutilizado no processo)
+                            from internal_logic.core.service_registry import get_bot_manager
+                            local_bot_manager = get_bot_manager(payment.bot.user_id)
                             
                             # Obter upsells configurados
                             upsells = payment.bot.config.get_upsells()
@@ -1932,16 +2069,16 @@ def process_webhook_async(user_id: int, gateway_type: str, data: Dict[str, Any])
                     # ✅ Enviar notificação WebSocket APENAS para o dono do bot (após atualizar status para 'paid')
                     if status == 'paid' and payment and payment.bot:
                         try:
-                            from internal_logic.core.extensions import socketio
+                            from internal_logic.services.realtime_bus import emit_to_user
                             if payment.bot.user_id:
-                                socketio.emit('payment_update', {
+                                emit_to_user(payment.bot.user_id, 'payment_update', {
                                     'payment_id': payment.payment_id,
                                     'status': status,
                                     'bot_id': payment.bot_id,
-                                    'amount': payment.amount,
+                                    'amount': float(payment.amount),
                                     'customer_name': payment.customer_name
-                                }, room=f'user_{payment.bot.user_id}')
-                                logger.info(f"✅ [WEBHOOK {gateway_type.upper()}] Notificação WebSocket enviada para user_{payment.bot.user_id} (payment {payment.id})")
+                                })
+                                logger.info(f"✅ [WEBHOOK {gateway_type.upper()}] Notificação WebSocket enviada para user:{payment.bot.user_id} (payment {payment.id})")
                             else:
                                 logger.warning(f"⚠️ [WEBHOOK {gateway_type.upper()}] Payment {payment.id} não tem bot.user_id - não enviando notificação WebSocket")
                         except Exception as e:
@@ -1996,10 +2133,12 @@ def process_pending_webhooks(limit: int = 50, max_attempts: int = 12) -> int:
     """
     Reprocessa webhooks armazenados em webhook_pending_matches.
 
+    Rede de segurança: o caminho normal é notify_payment_registered() aplicar o
+    pending assim que o Payment é criado.
+
     Retorna quantidade processada com sucesso.
     """
-    from internal_logic.core.extensions import create_app
-    from internal_logic.core.models import WebhookPendingMatch, get_brazil_time
+    from internal_logic.core.models import WebhookPendingMatch
 
     processed = 0
 
@@ -2017,30 +2156,8 @@ def process_pending_webhooks(limit: int = 50, max_attempts: int = 12) -> int:
 
         for pending in pendings:
             try:
-                payload = dict(pending.payload or {})
-                payload['_skip_pending_enqueue'] = True
-                pending.attempts = (pending.attempts or 0) + 1
-                pending.last_attempt_at = get_brazil_time()
-                db.session.commit()
-
-                user_id = payload.get('user_id', 0)
-                result = process_webhook_async(user_id, pending.gateway_type, payload)
-                status = (result or {}).get('status')
-
-                if status in {'success', 'already_processed'}:
-                    db.session.delete(pending)
-                    db.session.commit()
+                if _apply_pending_match(pending, max_attempts=max_attempts):
                     processed += 1
-                elif pending.attempts >= max_attempts:
-                    logger.error(
-                        "❌ Pending webhook descartado após %s tentativas | gateway=%s | transaction_id=%s | hash=%s",
-                        pending.attempts,
-                        pending.gateway_type,
-                        pending.transaction_id,
-                        pending.transaction_hash
-                    )
-                    db.session.delete(pending)
-                    db.session.commit()
             except Exception as e:
                 logger.error(f"❌ Erro ao reprocessar pending webhook: {e}", exc_info=True)
                 db.session.rollback()
@@ -2071,7 +2188,6 @@ def generate_pix_async(
         from internal_logic.core.extensions import db
         from internal_logic.core.models import Bot, BotConfig, Payment, Gateway
         from gateways.gateway_factory import GatewayFactory
-        from bot_manager import BotManager
         import uuid
         import time
         
@@ -2179,9 +2295,9 @@ def generate_pix_async(
                 
                 if pix_code:
                     # Enviar mensagem com QR Code
-                    # ✅ ISOLAMENTO: Criar BotManager localmente com user_id do payment
-                    from bot_manager import BotManager
-                    local_bot_manager = BotManager(socketio=None, scheduler=None, user_id=payment.user_id)
+                    # ✅ ISOLAMENTO: BotManager do dono do payment (reutilizado no processo)
+                    from internal_logic.core.service_registry import get_bot_manager
+                    local_bot_manager = get_bot_manager(payment.user_id)
                     
                     message = f"💰 PIX Gerado!\n\nValor: R$ {price:.2f}\n\nEscaneie o QR Code ou copie o código PIX:"
                     qr_code = pix_code
@@ -2192,7 +2308,7 @@ def generate_pix_async(
                         message=message,
                         buttons=[{
                             'text': '✅ Verificar Pagamento',
-                            'callback_data': f'verify_{payment.id}'
+                            'callback_data': encode_callback('verify', payment.id)
                         }]
                     )
                     
@@ -2221,6 +2337,115 @@ def generate_pix_async(
         logger.error(f"Erro em generate_pix_async: {e}", exc_info=True)
 
 
+# ============================================================================
+# MARATHON ENGINE — helpers de broadcast (pré-compilados 1x por campanha)
+# ============================================================================
+
+# Segmentos de público → (status do Payment, flag extra) casados por lead_id
+_AUDIENCE_SEGMENTS = {
+    'buyers': ('paid', None),
+    'non_buyers': ('paid', None),
+    'abandoned_cart': ('pending', None),
+    'pix_generated': ('pending', None),
+    'downsell_buyers': ('paid', 'is_downsell'),
+    'order_bump_buyers': ('paid', 'order_bump_accepted'),
+    'upsell_buyers': ('paid', 'is_upsell'),
+    'remarketing_buyers': ('paid', 'is_remarketing'),
+}
+
+
+def _apply_audience_filter(query, bot_id: int, target_audience: str):
+    """
+    Filtra os leads pelo segmento da campanha com semi-join (EXISTS) em
+    payments.lead_id = bot_users.telegram_user_id (idx_payment_bot_lead_status).
+    'all_users' ou segmento desconhecido: sem filtro.
+    """
+    from sqlalchemy import and_, exists, literal, select
+    from internal_logic.core.models import BotUser, Payment
+
+    segment = _AUDIENCE_SEGMENTS.get(target_audience)
+    if segment is None:
+        return query
+    status, flag = segment
+    conditions = [
+        Payment.bot_id == bot_id,
+        Payment.lead_id == BotUser.telegram_user_id,
+        Payment.status == status,
+    ]
+    if flag:
+        conditions.append(getattr(Payment, flag) == True)
+    has_payment = exists(select(literal(1)).where(and_(*conditions)))
+    return query.filter(~has_payment if target_audience == 'non_buyers' else has_payment)
+
+
+def _compile_broadcast_template(template: str):
+    """
+    Pré-compila o template da campanha em um renderer.
+
+    Os placeholders {nome}/{primeiro_nome} são localizados uma única vez; por
+    lead resta apenas um join das partes (sem str.replace em todo o texto).
+    """
+    pattern = re.compile(r'\{(nome|primeiro_nome)\}')
+    parts = pattern.split(template or '')
+    if len(parts) == 1:
+        return lambda first_name: parts[0]
+
+    # parts alterna [texto, placeholder, texto, placeholder, ..., texto]
+    def render(first_name: Optional[str]) -> str:
+        name = first_name or 'Cliente'
+        first = name.split()[0] if name.split() else 'Cliente'
+        values = {'nome': name, 'primeiro_nome': first}
+        return ''.join(values[part] if i % 2 else part for i, part in enumerate(parts))
+
+    return render
+
+
+def _build_broadcast_buttons(buttons, campaign_id: int) -> list:
+    """Monta os botões da campanha (callback rmkt ou URL) 1x por campanha."""
+    remarketing_buttons = []
+    for btn_idx, btn in enumerate(buttons or []):
+        if btn.get('price') and btn.get('description'):
+            remarketing_buttons.append({
+                'text': btn.get('text', 'Comprar'),
+                'callback_data': encode_callback('rmkt', campaign_id, btn_idx)
+            })
+        elif btn.get('url'):
+            remarketing_buttons.append({
+                'text': btn.get('text', 'Link'),
+                'url': btn.get('url')
+            })
+    return remarketing_buttons
+
+
+def _batch_membership(redis_client, keys, members) -> list:
+    """
+    Verifica a pertinência de `members` em cada set de `keys` em UM round trip.
+
+    Usa SMISMEMBER (Redis >= 6.2) dentro de um pipeline; em servidores antigos
+    cai para um pipeline de SISMEMBER (ainda 1 round trip).
+
+    Returns:
+        list[list[bool]]: uma lista de flags por key, alinhada com `members`
+    """
+    if not members:
+        return [[] for _ in keys]
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.smismember(key, members)
+        return [[bool(flag) for flag in flags] for flags in pipe.execute()]
+    except Exception as e:
+        if 'unknown command' not in str(e).lower():
+            raise
+        pipe = redis_client.pipeline(transaction=False)
+        for key in keys:
+            for member in members:
+                pipe.sismember(key, member)
+        flat = pipe.execute()
+        n = len(members)
+        return [[bool(flag) for flag in flat[i * n:(i + 1) * n]] for i in range(len(keys))]
+
+
 def task_process_broadcast_campaign(campaign_id: int):
     """
     Worker RQ para processar campanha de remarketing (Marathon Engine).
@@ -2239,8 +2464,7 @@ def task_process_broadcast_campaign(campaign_id: int):
     from internal_logic.core.extensions import create_app
     app = _get_rq_app()
     from internal_logic.core.extensions import db
-    from internal_logic.core.models import Bot, BotUser, Payment, RemarketingBlacklist, RemarketingCampaign, get_brazil_time
-    from bot_manager import BotManager
+    from internal_logic.core.models import Bot, BotUser, RemarketingBlacklist, RemarketingCampaign, get_brazil_time
     from datetime import timedelta
     import json
     import time
@@ -2294,7 +2518,7 @@ def task_process_broadcast_campaign(campaign_id: int):
             
             # ✅# ISOLAMENTO: Evitar BotManager para quebrar ciclo de recursão infinita
             # BotManager não será instanciado para evitar maximum recursion depth exceeded
-            def send_telegram_message_direct(token, chat_id, message, media_url=None, media_type=None, audio_url=None, buttons=None):
+            def send_telegram_message_direct(token, chat_id, message, media_url=None, media_type=None, audio_url=None, buttons=None, reply_markup=None):
                 """Envio direto de mensagens Telegram sem BotManager - COM TRATAMENTO GRANULAR DE ERROS"""
                 try:
                     import requests
@@ -2317,8 +2541,10 @@ def task_process_broadcast_campaign(campaign_id: int):
                             data['caption'] = message
                             del data['text']
                     
-                    # Adicionar botões se existir
-                    if buttons:
+                    # Adicionar botões se existir (reply_markup pré-serializado por campanha)
+                    if reply_markup:
+                        data['reply_markup'] = reply_markup
+                    elif buttons:
                         keyboard = {'inline_keyboard': [[{'text': btn.get('text', ''), 'callback_data': btn.get('callback_data', '')} for btn in buttons]]}
                         data['reply_markup'] = json.dumps(keyboard)
                     
@@ -2378,7 +2604,7 @@ def task_process_broadcast_campaign(campaign_id: int):
             logger.info(f"🔍 [MARATHON SETUP] Contando leads elegíveis para campanha {campaign_id} | Bot: {bot_id}")
             
             # Contar leads elegíveis diretamente (sem BotManager para evitar recursão)
-            from internal_logic.core.models import BotUser, Payment, RemarketingBlacklist
+            from internal_logic.core.models import BotUser, RemarketingBlacklist
             from internal_logic.core.models import get_brazil_time
             from datetime import timedelta
             from sqlalchemy import or_
@@ -2400,63 +2626,8 @@ def task_process_broadcast_campaign(campaign_id: int):
             )
             query = query.filter(~BotUser.telegram_user_id.in_(blacklist_subquery))
             
-            # Filtros de segmento (usando subqueries para performance em escala)
-            if target_audience == 'all_users':
-                # Todos os usuários - sem filtro adicional
-                pass
-            elif target_audience == 'buyers':
-                # Todos que compraram (status = 'paid') - usando subquery
-                buyer_subquery = db.session.query(Payment.customer_user_id).filter(
-                    Payment.bot_id == bot_id,
-                    Payment.status == 'paid'
-                ).distinct()
-                query = query.filter(BotUser.telegram_user_id.in_(buyer_subquery))
-            elif target_audience == 'non_buyers':
-                # Excluir compradores - usando subquery com ~in_
-                buyer_subquery = db.session.query(Payment.customer_user_id).filter(
-                    Payment.bot_id == bot_id,
-                    Payment.status == 'paid'
-                ).distinct()
-                query = query.filter(~BotUser.telegram_user_id.in_(buyer_subquery))
-            elif target_audience == 'abandoned_cart' or target_audience == 'pix_generated':
-                # Usuários que geraram PIX mas não pagaram (status = 'pending') - subquery
-                pending_subquery = db.session.query(Payment.customer_user_id).filter(
-                    Payment.bot_id == bot_id,
-                    Payment.status == 'pending'
-                ).distinct()
-                query = query.filter(BotUser.telegram_user_id.in_(pending_subquery))
-            elif target_audience == 'downsell_buyers':
-                # Todos que compraram via downsell - subquery
-                downsell_subquery = db.session.query(Payment.customer_user_id).filter(
-                    Payment.bot_id == bot_id,
-                    Payment.status == 'paid',
-                    Payment.is_downsell == True
-                ).distinct()
-                query = query.filter(BotUser.telegram_user_id.in_(downsell_subquery))
-            elif target_audience == 'order_bump_buyers':
-                # Todos que compraram com order bump - subquery
-                orderbump_subquery = db.session.query(Payment.customer_user_id).filter(
-                    Payment.bot_id == bot_id,
-                    Payment.status == 'paid',
-                    Payment.order_bump_accepted == True
-                ).distinct()
-                query = query.filter(BotUser.telegram_user_id.in_(orderbump_subquery))
-            elif target_audience == 'upsell_buyers':
-                # Todos que compraram via upsell - subquery
-                upsell_subquery = db.session.query(Payment.customer_user_id).filter(
-                    Payment.bot_id == bot_id,
-                    Payment.status == 'paid',
-                    Payment.is_upsell == True
-                ).distinct()
-                query = query.filter(BotUser.telegram_user_id.in_(upsell_subquery))
-            elif target_audience == 'remarketing_buyers':
-                # Todos que compraram via remarketing - subquery
-                remarketing_subquery = db.session.query(Payment.customer_user_id).filter(
-                    Payment.bot_id == bot_id,
-                    Payment.status == 'paid',
-                    Payment.is_remarketing == True
-                ).distinct()
-                query = query.filter(BotUser.telegram_user_id.in_(remarketing_subquery))
+            # Filtro de segmento (EXISTS por lead_id — ver _apply_audience_filter)
+            query = _apply_audience_filter(query, bot_id, target_audience)
             
             # Contar total elegíveis
             total_targets = query.count()
@@ -2532,8 +2703,9 @@ def task_process_broadcast_campaign(campaign_id: int):
             skipped_count = 0
             bot_is_dead = False
             
-            # Query de leads elegíveis
-            q = db.session.query(BotUser).filter(
+            # Query de leads elegíveis (o envio só lê id/telegram_user_id/first_name)
+            from internal_logic.services.lead_lookup import broadcast_load
+            q = db.session.query(BotUser).options(broadcast_load()).filter(
                 BotUser.bot_id == bot_id,
                 BotUser.archived == False
             )
@@ -2547,131 +2719,82 @@ def task_process_broadcast_campaign(campaign_id: int):
             )
             q = q.filter(~BotUser.telegram_user_id.in_(blacklist_subquery))
             
-            # Filtros de segmento (usando subqueries para performance em escala)
-            if target_audience == 'all_users':
-                # Todos os usuários - sem filtro adicional
-                pass
-            elif target_audience == 'buyers':
-                # Todos que compraram (status = 'paid') - usando subquery
-                buyer_subquery = db.session.query(Payment.customer_user_id).filter(
-                    Payment.bot_id == bot_id,
-                    Payment.status == 'paid'
-                ).distinct()
-                q = q.filter(BotUser.telegram_user_id.in_(buyer_subquery))
-            elif target_audience == 'non_buyers':
-                # Excluir compradores - usando subquery com ~in_
-                buyer_subquery = db.session.query(Payment.customer_user_id).filter(
-                    Payment.bot_id == bot_id,
-                    Payment.status == 'paid'
-                ).distinct()
-                q = q.filter(~BotUser.telegram_user_id.in_(buyer_subquery))
-            elif target_audience == 'abandoned_cart' or target_audience == 'pix_generated':
-                # Usuários que geraram PIX mas não pagaram (status = 'pending') - subquery
-                pending_subquery = db.session.query(Payment.customer_user_id).filter(
-                    Payment.bot_id == bot_id,
-                    Payment.status == 'pending'
-                ).distinct()
-                q = q.filter(BotUser.telegram_user_id.in_(pending_subquery))
-            elif target_audience == 'downsell_buyers':
-                # Todos que compraram via downsell - subquery
-                downsell_subquery = db.session.query(Payment.customer_user_id).filter(
-                    Payment.bot_id == bot_id,
-                    Payment.status == 'paid',
-                    Payment.is_downsell == True
-                ).distinct()
-                q = q.filter(BotUser.telegram_user_id.in_(downsell_subquery))
-            elif target_audience == 'order_bump_buyers':
-                # Todos que compraram com order bump - subquery
-                orderbump_subquery = db.session.query(Payment.customer_user_id).filter(
-                    Payment.bot_id == bot_id,
-                    Payment.status == 'paid',
-                    Payment.order_bump_accepted == True
-                ).distinct()
-                q = q.filter(BotUser.telegram_user_id.in_(orderbump_subquery))
-            elif target_audience == 'upsell_buyers':
-                # Todos que compraram via upsell - subquery
-                upsell_subquery = db.session.query(Payment.customer_user_id).filter(
-                    Payment.bot_id == bot_id,
-                    Payment.status == 'paid',
-                    Payment.is_upsell == True
-                ).distinct()
-                q = q.filter(BotUser.telegram_user_id.in_(upsell_subquery))
-            elif target_audience == 'remarketing_buyers':
-                # Todos que compraram via remarketing - subquery
-                remarketing_subquery = db.session.query(Payment.customer_user_id).filter(
-                    Payment.bot_id == bot_id,
-                    Payment.status == 'paid',
-                    Payment.is_remarketing == True
-                ).distinct()
-                q = q.filter(BotUser.telegram_user_id.in_(remarketing_subquery))
+            # Filtro de segmento (EXISTS por lead_id — ver _apply_audience_filter)
+            q = _apply_audience_filter(q, bot_id, target_audience)
             
             # ✅ CONSISTÊNCIA DE PAGINAÇÃO: ORDER BY obrigatório
             q = q.order_by(BotUser.id)
             
+            # ✅ PRÉ-COMPILAÇÃO (1x por campanha): template, botões e teclado serializado
+            render_message = _compile_broadcast_template(message_template)
+            remarketing_buttons = _build_broadcast_buttons(buttons, campaign_id_int)
+            reply_markup = json.dumps({'inline_keyboard': [remarketing_buttons]}) if remarketing_buttons else None
+            
+            # ⏱️ Tempo acumulado por estágio (segundos) para diagnóstico de throughput
+            stage_timing = {
+                'db_fetch': 0.0, 'redis_filter': 0.0, 'render': 0.0, 'telegram': 0.0,
+                'redis_record': 0.0, 'checkpoint': 0.0, 'throttle': 0.0,
+            }
+            pending_sent_ids = []  # Envios confirmados aguardando SADD em lote
+            
+            def flush_checkpoint():
+                """Grava envios pendentes no sent set (1 SADD) e o progresso no banco (1 UPDATE)."""
+                stage_started = time.perf_counter()
+                if pending_sent_ids:
+                    redis_conn.sadd(sent_set_key, *pending_sent_ids)
+                    pending_sent_ids.clear()
+                stage_timing['redis_record'] += time.perf_counter() - stage_started
+                
+                stage_started = time.perf_counter()
+                db.session.query(RemarketingCampaign).filter(
+                    RemarketingCampaign.id == campaign_id
+                ).update({
+                    'total_sent': sent_count,
+                    'total_failed': failed_count
+                }, synchronize_session=False)
+                db.session.commit()
+                stage_timing['checkpoint'] += time.perf_counter() - stage_started
+            
             # Loop principal de envio
             processed_in_batch = 0  # CHECKPOINT INCREMENTAL: Contador de progresso
             CHECKPOINT_INTERVAL = 20  # Commit a cada 20 leads para heartbeat real-time
             
             while offset < total_targets and not bot_is_dead:
+                stage_started = time.perf_counter()
                 batch = q.offset(offset).limit(batch_size).all()
+                stage_timing['db_fetch'] += time.perf_counter() - stage_started
                 if not batch:
                     break
                 
+                # ✅ PRÉ-FILTRO DO LOTE: chat_id válido / opt-out em memória
+                candidates = []
                 for lead in batch:
                     try:
-                        # Validar chat_id
-                        if not lead.telegram_user_id:
-                            skipped_count += 1
-                            processed_in_batch += 1
-                            continue
-                        
-                        try:
-                            chat_int = int(str(lead.telegram_user_id))
-                            if chat_int == 0:
-                                skipped_count += 1
-                                processed_in_batch += 1
-                                continue
-                        except:
-                            skipped_count += 1
-                            processed_in_batch += 1
-                            continue
-                        
-                        # Verificar se já enviou (Redis)
-                        if redis_conn.sismember(sent_set_key, str(lead.telegram_user_id)):
-                            skipped_count += 1
-                            processed_in_batch += 1
-                            continue
-                        
-                        # Verificar blacklist (Redis)
-                        if redis_conn.sismember(blacklist_key, str(lead.telegram_user_id)):
-                            skipped_count += 1
-                            processed_in_batch += 1
-                            continue
-                        
-                        # Verificar opt-out
-                        if getattr(lead, 'opt_out', False) or getattr(lead, 'unsubscribed', False):
-                            skipped_count += 1
-                            processed_in_batch += 1
-                            continue
-                        
-                        # ✅ MONTAR MENSAGEM PERSONALIZADA
-                        personalized_message = message_template.replace('{nome}', lead.first_name or 'Cliente')
-                        personalized_message = personalized_message.replace('{primeiro_nome}', (lead.first_name or 'Cliente').split()[0])
-                        
-                        # ✅ MONTAR BOTÕES
-                        remarketing_buttons = []
-                        if buttons:
-                            for btn_idx, btn in enumerate(buttons):
-                                if btn.get('price') and btn.get('description'):
-                                    remarketing_buttons.append({
-                                        'text': btn.get('text', 'Comprar'),
-                                        'callback_data': f"rmkt_{campaign_id_int}_{btn_idx}"
-                                    })
-                                elif btn.get('url'):
-                                    remarketing_buttons.append({
-                                        'text': btn.get('text', 'Link'),
-                                        'url': btn.get('url')
-                                    })
+                        chat_int = int(str(lead.telegram_user_id)) if lead.telegram_user_id else 0
+                    except (TypeError, ValueError):
+                        chat_int = 0
+                    if chat_int == 0 or getattr(lead, 'opt_out', False) or getattr(lead, 'unsubscribed', False):
+                        skipped_count += 1
+                        continue
+                    candidates.append((lead, str(lead.telegram_user_id)))
+                
+                # ✅ sent set + blacklist do lote inteiro em 1 round trip (SMISMEMBER pipeline)
+                stage_started = time.perf_counter()
+                already_sent, blacklisted = _batch_membership(
+                    redis_conn, [sent_set_key, blacklist_key], [member for _, member in candidates]
+                )
+                stage_timing['redis_filter'] += time.perf_counter() - stage_started
+                
+                for idx, (lead, member) in enumerate(candidates):
+                    if already_sent[idx] or blacklisted[idx]:
+                        skipped_count += 1
+                        continue
+                    
+                    try:
+                        # ✅ MONTAR MENSAGEM PERSONALIZADA (template pré-compilado)
+                        stage_started = time.perf_counter()
+                        personalized_message = render_message(lead.first_name)
+                        stage_timing['render'] += time.perf_counter() - stage_started
                         
                         # ✅# MARATHON LOOP DE RETRY (com FloodWait e Network handling)
                         lead_sent = False
@@ -2680,15 +2803,17 @@ def task_process_broadcast_campaign(campaign_id: int):
                         
                         for attempt in range(3):
                             try:
+                                stage_started = time.perf_counter()
                                 result = send_telegram_message_direct(
                                     token=bot_token_str,
-                                    chat_id=str(lead.telegram_user_id),
+                                    chat_id=member,
                                     message=personalized_message,
                                     media_url=media_url,
                                     media_type=media_type if media_url else None,
                                     audio_url=audio_url if audio_enabled and audio_url else None,
-                                    buttons=remarketing_buttons if remarketing_buttons else None
+                                    reply_markup=reply_markup
                                 )
+                                stage_timing['telegram'] += time.perf_counter() - stage_started
                                 
                                 # TRATAMENTO GRANULAR DE RESPOSTAS
                                 if isinstance(result, dict):
@@ -2698,7 +2823,7 @@ def task_process_broadcast_campaign(campaign_id: int):
                                         # SUCESSO REAL
                                         sent_count += 1
                                         consecutive_sent += 1
-                                        redis_conn.sadd(sent_set_key, str(lead.telegram_user_id))
+                                        pending_sent_ids.append(member)  # SADD em lote no checkpoint
                                         lead_sent = True
                                         flood_wait_happened = False
                                         
@@ -2795,31 +2920,22 @@ def task_process_broadcast_campaign(campaign_id: int):
                             
                         # TRAVA DE SEGURANÇA SRE: Abortar lote se bot morreu
                         if bot_is_dead:
-                            break  # ← Este break sai do 'for lead in batch'
+                            break  # ← Este break sai do 'for lead in candidates'
                         
-                        # CHECKPOINT INCREMENTAL: Atualizar dashboard a cada 20 leads
-                        # ✅ CHECKPOINT INCREMENTAL: Atualizar dashboard a cada 20 leads
                         processed_in_batch += 1
-                        if not lead_sent and not bot_is_dead:
+                        if not lead_sent:
                             failed_count += 1
                         
-                        if bot_is_dead:
-                            break
-                        
                         # Rate limit apenas se não houve FloodWait já
                         if not flood_wait_happened:
+                            stage_started = time.perf_counter()
                             time.sleep(rate_limit_delay)
+                            stage_timing['throttle'] += time.perf_counter() - stage_started
                         
-                        # ✅ Commit incremental a cada 20 leads ou último do batch (Stateless SQL Update)
-                        if processed_in_batch >= CHECKPOINT_INTERVAL or lead == batch[-1]:
-                            db.session.query(RemarketingCampaign).filter(
-                                RemarketingCampaign.id == campaign_id
-                            ).update({
-                                'total_sent': sent_count,
-                                'total_failed': failed_count
-                            }, synchronize_session=False)
-                            db.session.commit()
-                            processed_in_batch = 0  # Reset contador
+                        # ✅ Checkpoint incremental a cada 20 leads (SADD em lote + UPDATE stateless)
+                        if processed_in_batch >= CHECKPOINT_INTERVAL:
+                            flush_checkpoint()
+                            processed_in_batch = 0
                             
                     except Exception as lead_error:
                         failed_count += 1
@@ -2827,20 +2943,19 @@ def task_process_broadcast_campaign(campaign_id: int):
                         logger.error(f"❌ [MARATHON] Erro processando lead {lead.id}: {lead_error}")
                         continue
                 
-                # Checkpoint a cada batch - atualizar campanha via SQL direto (Stateless)
+                # Checkpoint a cada batch
                 offset += batch_size
-                
-                db.session.query(RemarketingCampaign).filter(
-                    RemarketingCampaign.id == campaign_id
-                ).update({
-                    'total_sent': sent_count,
-                    'total_failed': failed_count
-                }, synchronize_session=False)
-                db.session.commit()
+                flush_checkpoint()
+                processed_in_batch = 0
                 
                 # Limpeza de memória
                 db.session.expunge_all()
             
+            logger.info(
+                f"⏱️ [MARATHON TIMING] Campaign {campaign_id} | "
+                + " | ".join(f"{stage}={seconds:.2f}s" for stage, seconds in stage_timing.items())
+            )
+            
             # ✅ FINALIZAR CAMPANHA (Stateless SQL Update - evita DetachedInstanceError)
             final_status = 'failed' if bot_is_dead else 'completed'
             db.session.query(RemarketingCampaign).filter(
@@ -2912,9 +3027,9 @@ def send_downsell_async(
                 logger.info(f"ℹ️ [DOWNSELL JOB] Payment {payment_id} status='{payment.status}' - downsell cancelado")
                 return False
             
-            # ✅ ISOLAMENTO: Criar BotManager localmente com user_id do payment
-            from bot_manager import BotManager
-            local_bot_manager = BotManager(socketio=None, scheduler=None, user_id=payment.bot.user_id)
+            # ✅ ISOLAMENTO: BotManager do dono do payment (reutilizado no processo)
+            from internal_logic.core.service_registry import get_bot_manager
+            local_bot_manager = get_bot_manager(payment.bot.user_id)
             
             # Executar envio do downsell
             result = local_bot_manager._send_downsell(
@@ -2967,9 +3082,9 @@ def send_downsell_job(bot_id: int, payment_id: str, chat_id: int, downsell: dict
                 logger.info(f"ℹ️ [DOWNSELL JOB] Payment {payment_id} status='{payment.status}' - downsell cancelado")
                 return False
             
-            # ✅ ISOLAMENTO: Criar BotManager localmente com user_id do payment
-            from bot_manager import BotManager
-            local_bot_manager = BotManager(socketio=None, scheduler=None, user_id=payment.bot.user_id)
+            # ✅ ISOLAMENTO: BotManager do dono do payment (reutilizado no processo)
+            from internal_logic.core.service_registry import get_bot_manager
+            local_bot_manager = get_bot_manager(payment.bot.user_id)
             
             # Executar envio do downsell
             result = local_bot_manager._send_downsell(
@@ -3022,9 +3137,9 @@ def send_upsell_job(bot_id: int, payment_id: str, chat_id: int, upsell: dict,
                 logger.info(f"ℹ️ [UPSELL JOB] Payment {payment_id} status='{payment.status}' - upsell cancelado")
                 return False
             
-            # ✅ ISOLAMENTO: Criar BotManager localmente com user_id do payment
-            from bot_manager import BotManager
-            local_bot_manager = BotManager(socketio=None, scheduler=None, user_id=payment.bot.user_id)
+            # ✅ ISOLAMENTO: BotManager do dono do payment (reutilizado no processo)
+            from internal_logic.core.service_registry import get_bot_manager
+            local_bot_manager = get_bot_manager(payment.bot.user_id)
             
             # Executar envio do upsell
             result = local_bot_manager._send_upsell(
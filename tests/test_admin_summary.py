@@ -0,0 +1,129 @@
+"""
+Resumo admin × confirmação por webhook
+======================================
+Confirma um pagamento pelo caminho do webhook (process_webhook_async, o mesmo
+dos replays do pending-match e do reconciliador) sobre SQLite em memória e
+fakeredis, e confere que admin_daily_summary / get_overview() passam a contar
+a venda — sem esperar o reparo noturno. Webhook repetido não conta de novo.
+
+Gateway, envio do entregável e o app do worker são trocados por stubs; o
+restante do caminho (match, estatísticas, commit e hooks pós-commit) é o real.
+
+    python -m pytest -q tests/test_admin_summary.py
+"""
+
+import os
+import sys
+from datetime import timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+fakeredis = pytest.importorskip('fakeredis')
+pytest.importorskip('lupa')
+
+from flask import Flask  # noqa: E402
+
+import tasks_async  # noqa: E402
+from gateways.gateway_factory import GatewayFactory  # noqa: E402
+from internal_logic.core.extensions import db  # noqa: E402
+from internal_logic.core.models import AdminDailySummary, Bot, Payment, User, get_brazil_time  # noqa: E402
+from internal_logic.services import admin_summary, leaderboard_service, payment_processor  # noqa: E402
+
+AMOUNT = 49.9
+
+
+class _StubGateway:
+    """Adapter de gateway: o payload do teste já vem normalizado."""
+
+    def process_webhook(self, data):
+        return {
+            'gateway_transaction_id': data['id'],
+            'status': data['status'],
+            'amount': AMOUNT,
+            'payment_id': data['id'],
+        }
+
+
+@pytest.fixture
+def app(monkeypatch):
+    app = Flask('test_admin_summary')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SECRET_KEY'] = 'test'
+    db.init_app(app)
+
+    conn = fakeredis.FakeStrictRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    monkeypatch.setattr(tasks_async, '_get_rq_app', lambda: app)
+    monkeypatch.setattr(GatewayFactory, 'create_gateway', staticmethod(lambda *args, **kwargs: _StubGateway()))
+    monkeypatch.setattr(payment_processor, 'send_payment_delivery', lambda payment: None)
+    monkeypatch.setattr(leaderboard_service, '_get_redis', lambda: conn)
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def payment(app):
+    now = get_brazil_time()
+    owner = User(email='summary@example.com', username='summary', password_hash='x')
+    db.session.add(owner)
+    db.session.flush()
+    bot = Bot(user_id=owner.id, token='0:summary', username='summary_bot', name='Summary')
+    db.session.add(bot)
+    db.session.flush()
+    payment = Payment(
+        bot_id=bot.id, payment_id='summary-1', amount=AMOUNT, status='pending', gateway_type='pushynpay',
+        gateway_transaction_id='tx-summary-1', customer_user_id='5001', customer_name='Lead',
+        product_name='Produto', created_at=now - timedelta(hours=1),
+    )
+    db.session.add(payment)
+    db.session.commit()
+    admin_summary.record_signup(owner)
+    return payment
+
+
+def _webhook(status='paid'):
+    return tasks_async.process_webhook_async(0, 'pushynpay', {'id': 'tx-summary-1', 'status': status})
+
+
+def test_webhook_confirmation_updates_admin_summary(payment):
+    before = admin_summary.get_overview()
+    assert before['total_payments'] == 0
+    assert before['total_revenue'] == 0
+
+    _webhook()
+
+    db.session.expire_all()
+    confirmed = db.session.get(Payment, payment.id)
+    assert confirmed.status == 'paid'
+
+    after = admin_summary.get_overview()
+    assert after['total_payments'] == before['total_payments'] + 1
+    assert after['total_revenue'] == pytest.approx(before['total_revenue'] + AMOUNT)
+    assert after['total_users'] == before['total_users']
+
+    today = AdminDailySummary.query.filter_by(day=confirmed.paid_at.date()).one()
+    assert today.sales == 1
+    assert today.revenue == pytest.approx(AMOUNT)
+    assert [row.id for row in admin_summary.get_top_users()] == [confirmed.bot.user_id]
+
+
+def test_repeated_webhook_is_counted_once(payment):
+    _webhook()
+    _webhook()
+
+    overview = admin_summary.get_overview()
+    assert overview['total_payments'] == 1
+    assert overview['total_revenue'] == pytest.approx(AMOUNT)
+
+
+def test_pending_webhook_leaves_summary_unchanged(payment):
+    before = admin_summary.get_overview()
+    _webhook(status='pending')
+
+    assert admin_summary.get_overview() == before
+    assert db.session.get(Payment, payment.id).status == 'pending'
@@ -0,0 +1,143 @@
+"""
+Codec de callback_data (internal_logic/services/callback_codec.py)
+==================================================================
+Propriedades conferidas para cada ação de ACTIONS, com argumentos gerados
+por semente fixa (CASES por ação) nos limites reais — chat_id de 52 bits,
+preço até R$ 10 milhões, payment_id de até 60 caracteres:
+
+    ida e volta   → decode(encode(ação, *args)) == (ação, args)
+    limite        → encode() nunca passa de 64 bytes e recusa o que passaria
+    legado        → o formato antigo de cada ação decodifica para os mesmos
+                    argumentos (downsell/upsell antigo de 4 partes incluso)
+    robustez      → texto aleatório e callback_data truncado nunca levantam
+                    exceção: decode() devolve Callback ou None
+
+    python -m pytest -q tests/test_callback_codec.py
+"""
+
+import os
+import random
+import string
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from internal_logic.services.callback_codec import (  # noqa: E402
+    ACTIONS, MAX_BYTES, Callback, decode, encode,
+)
+
+CASES = 500
+CHAT_ID_MAX = 2 ** 52
+PRICE_CENTS_MAX = 10 ** 9
+PAYMENT_ID_CHARS = string.ascii_letters + string.digits + '_-.~'
+
+# formato antigo de cada ação (como os geradores montavam antes do codec)
+LEGACY_FORMATS = {
+    'buy': 'buy_{}',
+    'bump_yes': 'bump_yes_{}',
+    'bump_no': 'bump_no_{}',
+    'multi_bump_yes': 'multi_bump_yes_{}_{}_{}',
+    'multi_bump_no': 'multi_bump_no_{}_{}_{}',
+    'downsell_bump_yes': 'downsell_bump_yes_{}_{}',
+    'downsell_bump_no': 'downsell_bump_no_{}_{}',
+    'dwnsl': 'dwnsl_{}_{}_{}',
+    'downsell': 'downsell_{}_{}_{}',
+    'upsell': 'upsell_{}_{}_{}',
+    'rmkt': 'rmkt_{}_{}',
+    'verify': 'verify_{}',
+}
+
+
+def random_int(rng: random.Random, position: int, action: str) -> int:
+    if action.startswith('multi_bump') and position == 0:
+        return rng.choice([-1, 1]) * rng.randint(0, CHAT_ID_MAX)
+    return rng.choice([0, 1, rng.randint(0, 99), rng.randint(0, PRICE_CENTS_MAX)])
+
+
+def random_args(rng: random.Random, action: str) -> tuple:
+    return tuple(
+        random_int(rng, position, action) if kind == 'i'
+        else ''.join(rng.choice(PAYMENT_ID_CHARS) for _ in range(rng.randint(0, 60)))
+        for position, kind in enumerate(ACTIONS[action][1])
+    )
+
+
+def boundary_args(action: str) -> tuple:
+    """Maiores argumentos aceitos: o callback_data mais longo de cada ação."""
+    return tuple(
+        (-CHAT_ID_MAX if action.startswith('multi_bump') and position == 0 else PRICE_CENTS_MAX)
+        if kind == 'i' else 'x' * 60
+        for position, kind in enumerate(ACTIONS[action][1])
+    )
+
+
+@pytest.mark.parametrize('action', sorted(ACTIONS))
+def test_round_trip(action):
+    rng = random.Random(f'round-trip-{action}')
+    for args in [boundary_args(action)] + [random_args(rng, action) for _ in range(CASES)]:
+        data = encode(action, *args)
+        assert len(data.encode('utf-8')) <= MAX_BYTES, data
+        assert decode(data) == (action, args), data
+
+
+@pytest.mark.parametrize('action', sorted(ACTIONS))
+def test_legacy_format(action):
+    assert set(LEGACY_FORMATS) == set(ACTIONS)
+    rng = random.Random(f'legacy-{action}')
+    for _ in range(CASES):
+        args = tuple(abs(a) if isinstance(a, int) else a for a in random_args(rng, action))
+        assert decode(LEGACY_FORMATS[action].format(*args)) == (action, args)
+        if action in ('downsell', 'upsell'):
+            # formato antigo de 4 partes: índice, botão, centavos, botão
+            index, price_cents, button = args
+            assert decode(f"{action}_{index}_{button}_{price_cents}_{button}") == (action, args)
+
+
+@pytest.mark.parametrize('data,expected', [
+    ('flow_s1_2', ('flow', ('s1', 2))),
+    ('flow_step_passo_a_btn_3', ('flow_step', ('passo_a', 'btn_3'))),
+    ('flow_step_s1_next', ('flow_step', ('s1', 'next'))),
+    ('downsell_bump_no_1_990', ('downsell_bump_no', (1, 990))),
+    ('downsell_1_990_2', ('downsell', (1, 990, 2))),
+    ('~1b3', ('buy', (3,))),
+    ('~1r1vy.0', ('rmkt', (2446, 0))),
+    ('~1vBOT1_X', ('verify', ('BOT1_X',))),
+])
+def test_decode_examples(data, expected):
+    assert decode(data) == expected
+
+
+def test_encode_rejects_over_limit():
+    assert encode('verify', 'x' * 61)
+    with pytest.raises(ValueError):
+        encode('verify', 'x' * 62)
+    with pytest.raises(ValueError):
+        encode('verify', 'ç' * 31)  # 62 bytes em UTF-8
+
+
+@pytest.mark.parametrize('action,args,error', [
+    ('buy', (1, 2), ValueError),
+    ('desconhecida', (1,), ValueError),
+    ('buy', (1.5,), TypeError),
+    ('buy', ('3',), TypeError),
+])
+def test_encode_rejects_invalid(action, args, error):
+    with pytest.raises(error):
+        encode(action, *args)
+
+
+def test_decode_never_raises():
+    rng = random.Random('garbage')
+    alphabet = string.ascii_letters + string.digits + '_~.-'
+    samples = [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 64))) for _ in range(CASES)]
+    samples += [f"~1{rng.choice([code for code, _ in ACTIONS.values()])}{rng.choice(alphabet)}" for _ in range(CASES)]
+    for action in ACTIONS:
+        data = encode(action, *random_args(rng, action))
+        samples += [data[:cut] for cut in range(len(data))]
+    samples += ['buy_', 'buy_x', 'rmkt_1', 'downsell_1_2', 'flow_s1_x', '~2b3', '~1b', '~1b3.4', '~1b03', '~1b+3']
+
+    for data in samples:
+        result = decode(data)
+        assert result is None or isinstance(result, Callback), data
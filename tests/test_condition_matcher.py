@@ -0,0 +1,176 @@
+"""
+Condições do fluxo: caminho compilado (ConditionMatcher) x interpretado
+=======================================================================
+Para um step com condições de e-mail, telefone, CPF, equals, contains e
+botões, confere que ConditionMatcher.match_input() escolhe a mesma condição
+que a avaliação condição a condição (como _match_text_validation fazia) e
+mede os dois caminhos (benchmark fora da suíte padrão: RUN_BENCHMARKS=1).
+
+    python -m pytest -q tests/test_condition_matcher.py
+    RUN_BENCHMARKS=1 python -m pytest -q -s tests/test_condition_matcher.py
+"""
+
+import os
+import random
+import re
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from internal_logic.services.condition_matcher import (  # noqa: E402
+    compile_conditions, is_valid_cpf, match_text_validation,
+)
+from internal_logic.services.flow_graph import prepare_conditions  # noqa: E402
+
+CONDITIONS = 50
+MESSAGES = 5000
+
+
+def build_conditions(count: int) -> list:
+    kinds = ['equals', 'contains', 'contains', 'email', 'phone', 'cpf', 'button']
+    conditions = []
+    for i in range(count):
+        kind = kinds[i % len(kinds)]
+        condition = {'id': f'c{i}', 'order': i, 'target_step': f'step_{i}'}
+        if kind == 'button':
+            condition.update(type='button_click', button_text=f'Opção {i}')
+        else:
+            condition.update(type='text_validation', validation=kind)
+            if kind in ('equals', 'contains'):
+                condition['value'] = f'Palavra{i}'
+        conditions.append(condition)
+    return conditions
+
+
+def build_messages(count: int, conditions: list, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    keywords = [c['value'] for c in conditions if c.get('value')]
+    samples = [
+        lambda: f"  {rng.choice(keywords)}  ",
+        lambda: f"quero a {rng.choice(keywords).upper()} agora",
+        lambda: f"cliente{rng.randint(1, 999)}@exemplo.com.br",
+        lambda: f"(11) 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+        lambda: "529.982.247-25",
+        lambda: f"opção {rng.randint(0, len(conditions))}",
+        lambda: "mensagem qualquer sem nenhuma palavra-chave conhecida pelo fluxo",
+    ]
+    return [rng.choice(samples)() for _ in range(count)]
+
+
+# --- Caminho interpretado (comportamento anterior, para comparação) ---
+
+def _legacy_cpf(cpf: str) -> bool:
+    if not cpf or not isinstance(cpf, str):
+        return False
+    cpf_clean = re.sub(r'\D', '', cpf)
+    if not cpf_clean.isdigit() or len(cpf_clean) != 11 or cpf_clean == cpf_clean[0] * 11:
+        return False
+
+    def calculate_digit(cpf: str, weights: list) -> int:
+        total = sum(int(cpf[i]) * weights[i] for i in range(len(weights)))
+        remainder = total % 11
+        return 0 if remainder < 2 else 11 - remainder
+
+    if int(cpf_clean[9]) != calculate_digit(cpf_clean, [10, 9, 8, 7, 6, 5, 4, 3, 2]):
+        return False
+    return int(cpf_clean[10]) == calculate_digit(cpf_clean, [11, 10, 9, 8, 7, 6, 5, 4, 3, 2])
+
+
+def _legacy_text(condition: dict, user_input: str) -> bool:
+    if not user_input or not user_input.strip():
+        return False
+    validation = condition.get('validation', 'any')
+    user_input_clean = user_input.strip()
+    if validation == 'email':
+        return bool(re.match(r'^[\w\.-]+@[\w\.-]+\.\w+$', user_input_clean))
+    elif validation == 'phone':
+        return bool(re.match(r'^(\+55\s?)?(\(?\d{2}\)?\s?)?\d{4,5}-?\d{4}$', user_input_clean))
+    elif validation == 'cpf':
+        return _legacy_cpf(user_input_clean)
+    elif validation == 'contains':
+        return condition.get('value', '').lower() in user_input_clean.lower()
+    elif validation == 'equals':
+        return user_input_clean.lower() == condition.get('value', '').strip().lower()
+    return validation == 'any' and bool(user_input_clean)
+
+
+def _legacy_button(condition: dict, callback_data: str) -> bool:
+    button_lower = condition.get('button_text', '').strip().lower()
+    return bool(button_lower) and button_lower in callback_data.lower()
+
+
+def first_legacy(conditions: tuple, message: str):
+    for condition in conditions:
+        if condition['type'] == 'text_validation' and _legacy_text(condition, message):
+            return condition['target_step']
+        if condition['type'] == 'button_click' and _legacy_button(condition, message):
+            return condition['target_step']
+    return None
+
+
+def first_compiled(matcher, message: str):
+    matched = matcher.match_input(message)
+    if not matched:
+        return None
+    return matcher.conditions[min(matched)]['target_step']
+
+
+def _best_seconds(func, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+@pytest.fixture(scope='module')
+def step():
+    step = {'id': 'bench', 'conditions': build_conditions(CONDITIONS)}
+    conditions = prepare_conditions(step['conditions'], step['id'])
+    assert len(conditions) == CONDITIONS
+    return conditions, compile_conditions(conditions, step), build_messages(MESSAGES, step['conditions'])
+
+
+def test_compiled_matches_interpreted(step):
+    conditions, matcher, messages = step
+    expected = [first_legacy(conditions, message) for message in messages]
+    assert [first_compiled(matcher, message) for message in messages] == expected
+    assert sum(1 for target in expected if target) > 0
+
+
+@pytest.mark.parametrize('value', [
+    '529.982.247-25', '52998224725', ' 529.982.247-25 ', '529.982.247-24', '111.111.111-11',
+    '123', '', 'abc.def.ghi-jk', '000.000.001-91', '390.533.447-05',
+])
+def test_cpf_matches_interpreted(value):
+    assert is_valid_cpf(value) == _legacy_cpf(value)
+
+
+@pytest.mark.parametrize('validation,value', [
+    ('email', None), ('phone', None), ('cpf', None), ('any', None),
+    ('equals', 'Palavra1'), ('contains', 'palavra'),
+])
+@pytest.mark.parametrize('user_input', [
+    'cliente@exemplo.com.br', '(11) 91234-5678', '+55 11 912345678', '529.982.247-25',
+    '  PALAVRA1  ', 'quero a palavra1 agora', '', '   ', 'qualquer coisa',
+])
+def test_text_validation_matches_interpreted(validation, value, user_input):
+    condition = {'type': 'text_validation', 'validation': validation}
+    if value is not None:
+        condition['value'] = value
+    assert match_text_validation(condition, user_input) == _legacy_text(condition, user_input)
+
+
+@pytest.mark.skipif(os.environ.get('RUN_BENCHMARKS') != '1',
+                    reason='benchmark de tempo de parede: RUN_BENCHMARKS=1 para rodar')
+def test_benchmark_compiled_faster(step):
+    conditions, matcher, messages = step
+    legacy = _best_seconds(lambda: [first_legacy(conditions, m) for m in messages], 3)
+    compiled = _best_seconds(lambda: [first_compiled(matcher, m) for m in messages], 3)
+    print(f"\n{MESSAGES} mensagens × {CONDITIONS} condições: "
+          f"legado {legacy * 1000:.1f}ms | compilado {compiled * 1000:.1f}ms ({legacy / compiled:.1f}x)")
+    assert compiled < legacy
@@ -0,0 +1,187 @@
+"""
+Contadores bufferizados (internal_logic/services/counter_buffer.py)
+===================================================================
+fakeredis (com lupa para os scripts) + SQLite em memória: cliques
+simultâneos via increment() com flush_counters() rodando em paralelo e os
+totais gravados no banco conferidos EXATOS:
+
+    remarketing_campaigns.total_clicks   == cliques por campanha
+    gateways.total_transactions          == PIX gerados por gateway
+
+Também confere 1 UPDATE por tipo de contador por flush, deltas mantidos
+em :flushing quando o UPDATE falha, o lock de flush e o fallback sem Redis.
+
+    python -m pytest -q tests/test_counter_buffer.py
+"""
+
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+fakeredis = pytest.importorskip('fakeredis')
+pytest.importorskip('lupa')
+
+from flask import Flask  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from internal_logic.core.extensions import db  # noqa: E402
+from internal_logic.core.models import Bot, Gateway, RemarketingCampaign, User  # noqa: E402
+from internal_logic.services import counter_buffer  # noqa: E402
+from internal_logic.services.counter_buffer import (  # noqa: E402
+    FLUSH_LOCK_KEY, KEY_PREFIX, flush_counters, increment,
+)
+
+CLICKS = 50
+INITIAL_TRANSACTIONS = 7
+
+
+@pytest.fixture
+def app():
+    app = Flask('test_counter_buffer')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SECRET_KEY'] = 'test'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def conn():
+    return fakeredis.FakeStrictRedis(server=fakeredis.FakeServer(), decode_responses=True)
+
+
+@pytest.fixture
+def seeded(app):
+    suffix = uuid.uuid4().hex[:8]
+    owner = User(email=f'counters-{suffix}@example.com', username=f'counters-{suffix}', password_hash='x')
+    db.session.add(owner)
+    db.session.flush()
+    bot = Bot(user_id=owner.id, token=f'0:{suffix}', username=f'counters_{suffix}_bot', name='Counters')
+    db.session.add(bot)
+    db.session.flush()
+    campaigns = [RemarketingCampaign(bot_id=bot.id, name=f'Campanha {i}', message='oi', total_clicks=0) for i in range(2)]
+    gateway = Gateway(user_id=owner.id, gateway_type='pushynpay', total_transactions=INITIAL_TRANSACTIONS)
+    db.session.add_all([*campaigns, gateway])
+    db.session.commit()
+    return [c.id for c in campaigns], gateway.id
+
+
+@pytest.fixture
+def updates(app):
+    counted = Counter()
+
+    def _count_update(connection, cursor, statement, parameters, context, executemany):
+        sql = ' '.join(statement.split()).upper()
+        for table in ('REMARKETING_CAMPAIGNS', 'GATEWAYS'):
+            if sql.startswith(f'UPDATE {table}'):
+                counted[table.lower()] += 1
+
+    event.listen(db.engine, 'before_cursor_execute', _count_update)
+    yield counted
+    event.remove(db.engine, 'before_cursor_execute', _count_update)
+
+
+def _totals(campaign_ids, gateway_id):
+    db.session.expire_all()
+    clicks = {cid: db.session.get(RemarketingCampaign, cid).total_clicks for cid in campaign_ids}
+    return clicks, db.session.get(Gateway, gateway_id).total_transactions
+
+
+def test_concurrent_clicks_with_concurrent_flush(conn, seeded):
+    campaign_ids, gateway_id = seeded
+    expected = Counter(campaign_ids[i % len(campaign_ids)] for i in range(CLICKS))
+    barrier = threading.Barrier(CLICKS)
+
+    def click(index):
+        barrier.wait()
+        increment('remarketing_clicks', campaign_ids[index % len(campaign_ids)], redis_conn=conn)
+        increment('gateway_transactions', gateway_id, redis_conn=conn)
+
+    threads = [threading.Thread(target=click, args=(i,)) for i in range(CLICKS)]
+    for thread in threads:
+        thread.start()
+    # flush concorrente com os cliques (job periódico), depois um flush final
+    while any(thread.is_alive() for thread in threads):
+        flush_counters(conn)
+        time.sleep(0.001)
+    for thread in threads:
+        thread.join()
+    flush_counters(conn)
+
+    clicks, transactions = _totals(campaign_ids, gateway_id)
+    assert clicks == dict(expected)
+    assert transactions == INITIAL_TRANSACTIONS + CLICKS
+    assert list(conn.scan_iter(f"{KEY_PREFIX}:*")) == []
+
+
+def test_one_update_per_kind(conn, seeded, updates):
+    campaign_ids, gateway_id = seeded
+    for campaign_id in campaign_ids * 3:
+        increment('remarketing_clicks', campaign_id, redis_conn=conn)
+    increment('gateway_transactions', gateway_id, amount=4, redis_conn=conn)
+
+    assert flush_counters(conn) == {'remarketing_clicks': 6, 'gateway_transactions': 4}
+    assert updates == Counter({'remarketing_campaigns': 1, 'gateways': 1})
+    assert flush_counters(conn) == {}
+
+
+def test_failed_update_keeps_deltas_for_next_flush(conn, seeded, monkeypatch):
+    campaign_ids, gateway_id = seeded
+    increment('remarketing_clicks', campaign_ids[0], redis_conn=conn)
+
+    original = counter_buffer._update_deltas
+
+    def failing(kind, deltas):
+        if kind == 'remarketing_clicks':
+            raise RuntimeError('banco indisponível')
+        return original(kind, deltas)
+
+    monkeypatch.setattr(counter_buffer, '_update_deltas', failing)
+    assert flush_counters(conn) == {}
+    assert conn.hgetall(f"{KEY_PREFIX}:remarketing_clicks:flushing") == {str(campaign_ids[0]): '1'}
+
+    # Cliques novos somados ao lote não confirmado
+    increment('remarketing_clicks', campaign_ids[0], amount=2, redis_conn=conn)
+    monkeypatch.setattr(counter_buffer, '_update_deltas', original)
+    assert flush_counters(conn) == {'remarketing_clicks': 3}
+
+    clicks, _ = _totals(campaign_ids, gateway_id)
+    assert clicks[campaign_ids[0]] == 3
+    assert list(conn.scan_iter(f"{KEY_PREFIX}:*")) == []
+
+
+def test_flush_skipped_while_locked(conn, seeded):
+    campaign_ids, gateway_id = seeded
+    increment('remarketing_clicks', campaign_ids[0], redis_conn=conn)
+    conn.set(FLUSH_LOCK_KEY, 'outro-worker', ex=60)
+
+    assert flush_counters(conn) == {}
+    assert conn.hget(f"{KEY_PREFIX}:remarketing_clicks", campaign_ids[0]) == '1'
+    assert conn.get(FLUSH_LOCK_KEY) == 'outro-worker'
+
+
+def test_increment_without_redis_writes_directly(seeded):
+    campaign_ids, gateway_id = seeded
+
+    class _DownRedis:
+        def hincrby(self, *args):
+            raise ConnectionError('redis fora')
+
+    assert increment('gateway_transactions', gateway_id, amount=2, redis_conn=_DownRedis())
+    _, transactions = _totals(campaign_ids, gateway_id)
+    assert transactions == INITIAL_TRANSACTIONS + 2
+
+
+def test_unknown_counter():
+    with pytest.raises(ValueError):
+        increment('desconhecido', 1)
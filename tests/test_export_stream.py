@@ -0,0 +1,146 @@
+"""
+Exportações em streaming x exportação antiga
+============================================
+Compara, em SQLite em memória, as linhas CSV de stream_export() com as que
+admin_export_users / admin_export_payments geravam antes do streaming
+(.all() → lista de dicts → csv.DictWriter), inclusive com a base vazia.
+
+O export antigo de usuários lia `user.last_login_at` (coluna inexistente);
+a referência abaixo lê `last_login`, como users_export() faz sob o nome antigo.
+
+    python -m pytest -q tests/test_export_stream.py
+"""
+
+import csv
+import io
+import os
+import sys
+from datetime import timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+
+from internal_logic.core.extensions import db  # noqa: E402
+from internal_logic.core.models import Bot, Payment, User, get_brazil_time  # noqa: E402
+from internal_logic.services.export_stream import payments_export, stream_export, users_export  # noqa: E402
+
+
+def _legacy_users_csv():
+    users_data = []
+    for user in User.query.all():
+        users_data.append({
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'full_name': user.full_name,
+            'is_active': user.is_active,
+            'is_admin': getattr(user, 'is_admin', False),
+            'created_at': user.created_at.isoformat() if user.created_at else None,
+            'last_login_at': user.last_login.isoformat() if user.last_login else None,
+            'total_revenue': float(user.total_revenue) if hasattr(user, 'total_revenue') else 0.0,
+            'total_sales': user.total_sales if hasattr(user, 'total_sales') else 0
+        })
+    return _legacy_csv(users_data)
+
+
+def _legacy_payments_csv():
+    payments_data = []
+    for payment in Payment.query.filter_by(status='paid').order_by(Payment.paid_at.desc()).limit(10000).all():
+        payments_data.append({
+            'id': payment.id,
+            'payment_id': payment.payment_id,
+            'bot_id': payment.bot_id,
+            'user_id': payment.bot.user_id if payment.bot else None,
+            'customer_name': payment.customer_name,
+            'customer_email': payment.customer_email,
+            'amount': float(payment.amount),
+            'status': payment.status,
+            'gateway_type': payment.gateway_type,
+            'paid_at': payment.paid_at.isoformat() if payment.paid_at else None,
+            'product_name': payment.product_name
+        })
+    return _legacy_csv(payments_data)
+
+
+def _legacy_csv(data):
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=data[0].keys() if data else [])
+    writer.writeheader()
+    writer.writerows(data)
+    return output.getvalue()
+
+
+def _rows(text):
+    return list(csv.reader(io.StringIO(text)))
+
+
+@pytest.fixture
+def app():
+    app = Flask('test_export_stream')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SECRET_KEY'] = 'test'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def _seed(payments):
+    now = get_brazil_time()
+    owner = User(email='export@example.com', username='export', password_hash='x', full_name='Dono, "Export"',
+                 last_login=now)
+    other = User(email='other@example.com', username='other', password_hash='x', is_admin=True)
+    db.session.add_all([owner, other])
+    db.session.flush()
+    bots = [Bot(user_id=user.id, token=f'0:{user.username}', username=f'{user.username}_bot', name='Export')
+            for user in (owner, other)]
+    db.session.add_all(bots)
+    db.session.flush()
+    for i in range(payments):
+        db.session.add(Payment(
+            bot_id=bots[i % 2].id, payment_id=f'export-{i}', amount=19.9 + i, gateway_type='pushynpay',
+            status='pending' if i % 5 == 4 else 'paid', paid_at=None if i == 0 else now - timedelta(minutes=i),
+            customer_name=f'Cliente {i}', customer_email=None if i % 3 else f'cliente{i}@example.com',
+            product_name='Produto; "especial"\nlinha 2' if i == 1 else 'Produto',
+        ))
+    db.session.commit()
+
+
+def _streamed(stmt, chunk_rows=3):
+    return ''.join(stream_export(stmt, 'csv', chunk_rows=chunk_rows))
+
+
+@pytest.mark.parametrize('payments', [0, 1, 12])
+def test_payments_csv_matches_legacy(app, payments):
+    _seed(payments)
+    legacy = _rows(_legacy_payments_csv())
+    streamed = _rows(_streamed(payments_export()))
+
+    assert streamed[1:] == legacy[1:]
+    assert len(streamed) - 1 == Payment.query.filter_by(status='paid').count()
+    if payments:
+        assert streamed[0] == legacy[0]
+
+
+def test_users_csv_matches_legacy(app):
+    _seed(2)
+    legacy = _rows(_legacy_users_csv())
+    streamed = _rows(_streamed(users_export()))
+
+    assert streamed == legacy
+    assert len(streamed) == 3
+
+
+def test_empty_export_keeps_header(app):
+    # o export antigo escrevia uma linha vazia sem dados; o streaming mantém o cabeçalho
+    assert _rows(_legacy_payments_csv()) == [[]]
+    assert _rows(_streamed(payments_export())) == [[
+        'id', 'payment_id', 'bot_id', 'user_id', 'customer_name', 'customer_email',
+        'amount', 'status', 'gateway_type', 'paid_at', 'product_name',
+    ]]
+    assert _rows(_streamed(users_export()))[1:] == []
@@ -0,0 +1,204 @@
+"""
+Outbox de Purchase (purchase_reconciler)
+========================================
+Roda o outbox sobre SQLite em memória e fakeredis, com send_event trocado por
+um CAPI falso que responde por order_id (payment.id):
+
+    - enqueue_purchase é idempotente (ON CONFLICT DO NOTHING)
+    - falha transitória → attempts+1 e backoff em next_attempt_at
+    - CAPIClient4xxError → 'dead' com last_error, sem nova tentativa
+    - pool fora de SERVER MODE → 'skipped', nenhum envio
+    - sync_outbox traz payments pagos que ainda não têm linha no outbox
+
+    python -m pytest -q tests/test_purchase_outbox.py
+"""
+
+import os
+import sys
+from datetime import timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+fakeredis = pytest.importorskip('fakeredis')
+
+from flask import Flask  # noqa: E402
+
+from internal_logic.core.extensions import db  # noqa: E402
+from internal_logic.core.models import (  # noqa: E402
+    Bot, BotUser, Payment, PurchaseOutbox, RedirectPool, User, get_brazil_time,
+)
+from internal_logic.services import delivery_cache  # noqa: E402
+from internal_logic.services.server_tracking import purchase_reconciler  # noqa: E402
+from internal_logic.services.server_tracking.capi_client import CAPIClient4xxError  # noqa: E402
+from utils import encryption  # noqa: E402
+
+
+class _FakeCAPI:
+    """send_event falso: aceita, rejeita (4xx) ou falha transitoriamente por order_id."""
+
+    def __init__(self):
+        self.rejected = set()
+        self.failing = set()
+        self.calls = []
+
+    def __call__(self, pixel_id, access_token, event, test_event_code=None, raise_on_client_error=False):
+        order_id = event['custom_data']['order_id']
+        self.calls.append(order_id)
+        if order_id in self.rejected:
+            raise CAPIClient4xxError('400: Invalid parameter')
+        return order_id not in self.failing
+
+
+@pytest.fixture
+def capi(monkeypatch):
+    conn = fakeredis.FakeStrictRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    monkeypatch.setattr(purchase_reconciler, 'get_redis_connection', lambda **kwargs: conn)
+    monkeypatch.setattr(delivery_cache, '_get_redis', lambda: conn)
+    monkeypatch.setattr(encryption, 'decrypt', lambda value: value)
+    fake = _FakeCAPI()
+    monkeypatch.setattr(purchase_reconciler, 'send_event', fake)
+    return fake
+
+
+@pytest.fixture
+def app():
+    app = Flask('test_purchase_outbox')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SECRET_KEY'] = 'test'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def seed(app):
+    owner = User(email='outbox@example.com', username='outbox', password_hash='x')
+    db.session.add(owner)
+    db.session.flush()
+    bot = Bot(user_id=owner.id, token='0:outbox', username='outbox_bot', name='Outbox')
+    server_pool = RedirectPool(user_id=owner.id, name='Server', slug='server', meta_tracking_enabled=True,
+                               meta_pixel_id='111', meta_access_token='EAAB-token')
+    html_pool = RedirectPool(user_id=owner.id, name='HTML', slug='html', meta_tracking_enabled=True,
+                             meta_pixel_id='222')
+    db.session.add_all([bot, server_pool, html_pool])
+    db.session.flush()
+
+    def make_payments(count, pool=server_pool):
+        now = get_brazil_time()
+        payments = []
+        for _ in range(count):
+            index = Payment.query.count() + len(payments)
+            telegram_user_id = 5000 + index
+            db.session.add(BotUser(bot_id=bot.id, telegram_user_id=telegram_user_id, first_name=f'Lead {index}'))
+            payments.append(Payment(
+                bot_id=bot.id, payment_id=f'outbox-{index}', amount=19.9, status='paid', paid_at=now,
+                customer_user_id=str(telegram_user_id), customer_name=f'Lead {index}', product_name='Produto',
+                pool_id=pool.id,
+            ))
+        db.session.add_all(payments)
+        db.session.commit()
+        return payments
+
+    make_payments.html_pool = html_pool
+    return make_payments
+
+
+def _row(payment):
+    db.session.expire_all()
+    return PurchaseOutbox.query.filter_by(payment_id=payment.id).one()
+
+
+def test_enqueue_purchase_is_idempotent(seed):
+    payment, = seed(1)
+    purchase_reconciler.enqueue_purchase(payment)
+    purchase_reconciler.enqueue_purchase(payment)
+    db.session.commit()
+
+    assert PurchaseOutbox.query.filter_by(payment_id=payment.id).count() == 1
+    assert _row(payment).status == 'pending'
+
+
+def test_sent_marks_payment(seed, capi):
+    payment, = seed(1)
+    purchase_reconciler.enqueue_purchase(payment)
+    db.session.commit()
+
+    assert purchase_reconciler.reconcile_purchases() == 1
+    assert _row(payment).status == 'sent'
+    assert db.session.get(Payment, payment.id).meta_purchase_sent
+    assert capi.calls == [str(payment.id)]
+
+
+def test_transient_failure_backs_off(seed, capi):
+    payment, = seed(1)
+    capi.failing.add(str(payment.id))
+    purchase_reconciler.enqueue_purchase(payment)
+    db.session.commit()
+
+    before = get_brazil_time()
+    purchase_reconciler.reconcile_purchases()
+    row = _row(payment)
+
+    assert row.status == 'pending'
+    assert row.attempts == 1
+    assert row.next_attempt_at >= before + timedelta(seconds=purchase_reconciler.backoff_seconds(1))
+    assert not db.session.get(Payment, payment.id).meta_purchase_sent
+
+    # ainda dentro do backoff: o tick seguinte não reenvia
+    assert purchase_reconciler.reconcile_purchases() == 0
+    assert capi.calls == [str(payment.id)]
+
+
+def test_client_error_goes_to_dead_letter(seed, capi):
+    payment, = seed(1)
+    capi.rejected.add(str(payment.id))
+    purchase_reconciler.enqueue_purchase(payment)
+    db.session.commit()
+
+    purchase_reconciler.reconcile_purchases()
+    row = _row(payment)
+    assert row.status == 'dead'
+    assert '400' in row.last_error
+
+    # dead nunca é reivindicado de novo, mesmo com next_attempt_at vencido
+    row.next_attempt_at = get_brazil_time() - timedelta(days=1)
+    db.session.commit()
+    assert purchase_reconciler.reconcile_purchases() == 0
+    assert capi.calls == [str(payment.id)]
+
+
+def test_html_only_pool_is_skipped(seed, capi):
+    payment, = seed(1, pool=seed.html_pool)
+    purchase_reconciler.enqueue_purchase(payment)
+    db.session.commit()
+
+    purchase_reconciler.reconcile_purchases()
+    assert _row(payment).status == 'skipped'
+    assert capi.calls == []
+
+
+def test_sync_outbox_picks_up_paid_payments(seed, capi):
+    queued, missing, stale = seed(3)
+    purchase_reconciler.enqueue_purchase(queued)
+    stale.paid_at = get_brazil_time() - timedelta(days=purchase_reconciler.LOOKBACK_DAYS + 1)
+    db.session.commit()
+
+    assert purchase_reconciler.sync_outbox() == 1
+    assert _row(missing).status == 'pending'
+    assert PurchaseOutbox.query.filter_by(payment_id=stale.id).count() == 0
+    assert purchase_reconciler.sync_outbox() == 0
+
+
+def test_token_decrypted_once_per_tick(seed, capi, monkeypatch):
+    payments = seed(5)
+    decrypts = []
+    monkeypatch.setattr(encryption, 'decrypt', lambda value: decrypts.append(value) or value)
+
+    assert purchase_reconciler.reconcile_purchases() == len(payments)
+    assert decrypts == ['EAAB-token']
+    assert sorted(capi.calls) == sorted(str(p.id) for p in payments)
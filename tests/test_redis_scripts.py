@@ -0,0 +1,183 @@
+"""
+Primitivas atômicas do Redis (internal_logic/core/redis_scripts.py)
+===================================================================
+Roda contra fakeredis (com lupa para EVAL) e confere a garantia de cada
+script, com várias threads disputando as mesmas chaves onde importa:
+
+    claim_once        → entre N threads, exatamente UMA reivindica a chave
+    release_lock      → dono antigo (lock expirado e readquirido) não apaga
+                        o lock do novo dono
+    incr_with_expire  → N incrementos concorrentes somam N e a chave tem TTL
+    drain_hash        → lote não confirmado recebe os valores novos
+    stream_add_once   → duplicata não entra no stream
+    tally_once        → id repetido não é somado; espelho só com a marca
+    swap_if_owner     → só o dono da marca troca as chaves
+
+    python -m pytest -q tests/test_redis_scripts.py
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+fakeredis = pytest.importorskip('fakeredis')
+pytest.importorskip('lupa')
+
+from internal_logic.core import redis_scripts  # noqa: E402
+from internal_logic.core.redis_scripts import (  # noqa: E402
+    claim_once, drain_hash, incr_with_expire, new_lock_token, preload_scripts, release_lock,
+    stream_add_once, swap_if_owner, tally_once,
+)
+
+THREADS = 32
+INCREMENTS = 200
+
+
+@pytest.fixture
+def conn():
+    return fakeredis.FakeStrictRedis(server=fakeredis.FakeServer(), decode_responses=True)
+
+
+def _run_threads(count, target):
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(index):
+        barrier.wait()
+        results[index] = target(index)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_preload_scripts(conn):
+    assert preload_scripts(conn) == len(redis_scripts._SOURCES)
+    assert all(conn.script_exists(*[s.sha for s in redis_scripts._scripts.values()]))
+
+
+def test_claim_once_single_winner(conn):
+    key = 'gb:test:claim'
+    results = _run_threads(THREADS, lambda i: claim_once(conn, key, 5, value=f'worker-{i}'))
+    winners = [i for i, holder in enumerate(results) if holder is None]
+    assert len(winners) == 1
+    holder = conn.get(key)
+    assert holder == f'worker-{winners[0]}'
+    assert all(r == holder for r in results if r is not None)
+    assert 0 < conn.ttl(key) <= 5
+
+
+def test_claim_once_is_one_roundtrip(conn):
+    commands = Counter()
+    original = conn.execute_command
+
+    def execute_command(*args, **kwargs):
+        commands[str(args[0]).upper()] += 1
+        return original(*args, **kwargs)
+
+    preload_scripts(conn)
+    conn.execute_command = execute_command
+    claim_once(conn, 'gb:test:roundtrip', 5)
+    assert commands == Counter({'EVALSHA': 1})
+
+
+def test_release_lock_keeps_new_owner(conn):
+    key = 'gb:test:lock'
+    stale = new_lock_token()
+    conn.set(key, stale, nx=True, px=50)
+    time.sleep(0.1)  # lock do primeiro dono expira
+    current = new_lock_token()
+    assert conn.set(key, current, nx=True, ex=5)
+
+    assert not release_lock(conn, key, stale)
+    assert conn.get(key) == current
+    assert release_lock(conn, key, current)
+    assert conn.get(key) is None
+
+
+def test_incr_with_expire_concurrent(conn):
+    key = 'gb:test:counter'
+
+    def work(_):
+        for _ in range(INCREMENTS):
+            incr_with_expire(conn, key, 60)
+
+    _run_threads(THREADS, work)
+    assert int(conn.get(key)) == THREADS * INCREMENTS
+    assert 0 < conn.ttl(key) <= 60
+
+
+def test_drain_hash_merges_unconfirmed_batch(conn):
+    key, processing = 'gb:test:hash', 'gb:test:hash:processing'
+    conn.hincrby(key, 'a', 2)
+    assert drain_hash(conn, key, processing) == {'a': '2'}
+    assert not conn.exists(key)
+
+    # Lote anterior não confirmado: valores novos somados a ele
+    conn.hincrby(key, 'a', 3)
+    conn.hincrby(key, 'b', 1)
+    assert drain_hash(conn, key, processing) == {'a': '5', 'b': '1'}
+
+    conn.delete(processing)
+    assert drain_hash(conn, key, processing) == {}
+
+
+def test_stream_add_once_skips_duplicate(conn):
+    dedup, stream = 'gb:test:dedup', 'gb:test:stream'
+    entry_id = stream_add_once(conn, dedup, 60, stream, {'body': 'x'}, 1000)
+    assert entry_id
+    assert stream_add_once(conn, dedup, 60, stream, {'body': 'x'}, 1000) is None
+    assert conn.xlen(stream) == 1
+    assert conn.xrange(stream)[0][1] == {'body': 'x'}
+    assert 0 < conn.ttl(dedup) <= 60
+
+
+def test_tally_once_counts_each_id_once(conn):
+    keys = ('gb:test:rank', 'gb:test:counts', 'gb:test:seen')
+    assert tally_once(conn, keys, 60, [(1, 'u1', 10.0), (2, 'u2', 5.0), (1, 'u1', 10.0)]) == 2
+    assert tally_once(conn, keys, 60, [(2, 'u2', 5.0), (3, 'u1', 1.5)]) == 1
+    assert tally_once(conn, keys, 60, []) == 0
+    assert conn.zscore(keys[0], 'u1') == 11.5
+    assert conn.hgetall(keys[1]) == {'u1': '2', 'u2': '1'}
+    assert all(0 < conn.ttl(key) <= 60 for key in keys)
+
+
+def test_tally_once_mirrors_only_while_flag_exists(conn):
+    keys = ('gb:test:rank', 'gb:test:counts', 'gb:test:seen')
+    mirror = ('gb:test:rebuild', 'gb:test:rank:tmp', 'gb:test:counts:tmp', 'gb:test:seen:tmp')
+
+    tally_once(conn, keys, 60, [(1, 'u1', 10.0)], mirror=mirror)
+    assert not conn.exists(mirror[1])
+
+    conn.set(mirror[0], 'token')
+    tally_once(conn, keys, 60, [(2, 'u1', 4.0)], mirror=mirror)
+    assert conn.zscore(mirror[1], 'u1') == 4.0
+    assert conn.zscore(keys[0], 'u1') == 14.0
+
+
+def test_swap_if_owner(conn):
+    lock = 'gb:test:rebuild'
+    pairs = [('gb:test:rank:tmp', 'gb:test:rank'), ('gb:test:counts:tmp', 'gb:test:counts')]
+    conn.zadd('gb:test:rank', {'old': 1})
+    conn.hset('gb:test:counts', 'old', 1)
+    conn.zadd('gb:test:rank:tmp', {'new': 2})
+    conn.set(lock, 'mine')
+
+    assert not swap_if_owner(conn, lock, 'other', pairs, 60)
+    assert conn.zscore('gb:test:rank', 'old') == 1
+
+    assert swap_if_owner(conn, lock, 'mine', pairs, 60)
+    assert conn.zrange('gb:test:rank', 0, -1) == ['new']
+    assert 0 < conn.ttl('gb:test:rank') <= 60
+    assert not conn.exists('gb:test:counts')  # origem vazia apaga o destino
+    assert not conn.exists(lock)
+    assert not conn.exists('gb:test:rank:tmp')
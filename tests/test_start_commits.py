@@ -0,0 +1,198 @@
+"""
+Commits e escritas em bot_users por /start
+==========================================
+Caminho de ingestão de um /start sobre SQLite em memória e fakeredis
+(payload de tracking, anti-duplicação e fila RQ):
+
+    worker  → ingest_update_lead() + commit + mark_lead_upserted() (como
+              process_telegram_message_async)
+    handler → handle_start_command() com um BotManager de medição (Telegram
+              fora do caminho; banco e Redis reais)
+
+Listeners do SQLAlchemy contam os commits da sessão e os INSERT/UPDATE em
+bot_users. Esperado por /start: 1 upsert (INSERT ... ON CONFLICT) + no
+máximo 1 commit adicional (mark_welcome_sent), com fbclid/UTM gravados.
+
+    python -m pytest -q tests/test_start_commits.py
+"""
+
+import json
+import os
+import sys
+from collections import Counter
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+fakeredis = pytest.importorskip('fakeredis')
+pytest.importorskip('lupa')
+
+from flask import Flask  # noqa: E402
+from rq import Queue  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+import tasks_async  # noqa: E402
+from internal_logic.core.extensions import db  # noqa: E402
+from internal_logic.core.models import Bot, BotUser, User  # noqa: E402
+from internal_logic.services import lead_upsert, start_command_handler  # noqa: E402
+from internal_logic.services.lead_upsert import (  # noqa: E402
+    LEAD_UPSERTED_FLAG, ingest_update_lead, mark_lead_upserted,
+)
+from internal_logic.services.start_command_handler import handle_start_command  # noqa: E402
+
+TOKEN = 'a' * 32
+PAYLOAD = {'fbclid': 'fb.measure', 'utm_source': 'facebook', 'utm_campaign': 'measure', 'pixel_id': '123'}
+RETURNING_USER_ID = 2002
+
+
+class _MeasureBotManager:
+    """Só o que handle_start_command usa; envios ao Telegram sempre 'ok'."""
+
+    socketio = None
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+
+    def _check_start_lock(self, chat_id):
+        return True
+
+    def _reset_user_funnel(self, *args, **kwargs):
+        pass
+
+    def _format_button_text(self, text, price, position=None):
+        return f"{text} R$ {price:.2f}"
+
+    def _execute_flow(self, *args, **kwargs):
+        pass
+
+    def send_funnel_step_sequential(self, **kwargs):
+        return True
+
+    def send_telegram_message(self, **kwargs):
+        return True
+
+
+class _Counters:
+    def __init__(self):
+        self.commits = 0
+        self.statements = Counter()
+
+    def reset(self):
+        self.commits = 0
+        self.statements.clear()
+
+    def on_commit(self, session):
+        self.commits += 1
+
+    def on_statement(self, conn, cursor, statement, parameters, context, executemany):
+        sql = ' '.join(statement.split()).upper()
+        for verb in ('INSERT INTO BOT_USERS', 'UPDATE BOT_USERS'):
+            if sql.startswith(verb):
+                self.statements['UPSERT' if 'ON CONFLICT' in sql else verb.split()[0]] += 1
+
+
+@pytest.fixture
+def redis_conn(monkeypatch):
+    server = fakeredis.FakeServer()
+    conn = fakeredis.FakeStrictRedis(server=server, decode_responses=True)
+    monkeypatch.setattr(lead_upsert, 'get_redis_connection', lambda: conn)
+    monkeypatch.setattr(start_command_handler, 'get_redis_connection', lambda: conn)
+    monkeypatch.setattr(tasks_async, 'task_queue',
+                        Queue('tasks', connection=fakeredis.FakeStrictRedis(server=server)))
+    conn.set(f"tracking:{TOKEN}", json.dumps(PAYLOAD), ex=300)
+    return conn
+
+
+@pytest.fixture
+def bot(redis_conn):
+    app = Flask('test_start_commits')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SECRET_KEY'] = 'test'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        owner = User(email='measure@example.com', username='measure', password_hash='x')
+        db.session.add(owner)
+        db.session.flush()
+        bot = Bot(user_id=owner.id, token='0:measure', username='measure_bot', name='Measure')
+        db.session.add(bot)
+        db.session.flush()
+        # Lead que volta: já existe e já recebeu welcome
+        db.session.add(BotUser(bot_id=bot.id, telegram_user_id=str(RETURNING_USER_ID), first_name='Lead',
+                               welcome_sent=True))
+        db.session.commit()
+        yield bot
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def counters(bot):
+    counters = _Counters()
+    event.listen(Session, 'after_commit', counters.on_commit)
+    event.listen(db.engine, 'before_cursor_execute', counters.on_statement)
+    yield counters
+    event.remove(Session, 'after_commit', counters.on_commit)
+    event.remove(db.engine, 'before_cursor_execute', counters.on_statement)
+
+
+def _start_update(update_id, telegram_user_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'chat': {'id': telegram_user_id},
+            'from': {'id': telegram_user_id, 'first_name': 'Lead', 'username': f'lead{telegram_user_id}'},
+            'text': f"/start {TOKEN}",
+        },
+    }
+
+
+def _handle(bot, telegram_user_id, update):
+    handle_start_command(_MeasureBotManager(bot.user_id), bot.id, bot.token, {'welcome_message': 'Olá!'},
+                         telegram_user_id, update['message'])
+    return BotUser.query.filter_by(bot_id=bot.id, telegram_user_id=str(telegram_user_id)).one()
+
+
+def _assert_tracked(lead):
+    assert lead.welcome_sent
+    assert lead.fbclid == PAYLOAD['fbclid']
+    assert lead.utm_source == PAYLOAD['utm_source']
+    assert lead.tracking_session_id == TOKEN
+
+
+@pytest.mark.parametrize('telegram_user_id,via_worker', [
+    (1001, True),                # lead novo, via worker
+    (RETURNING_USER_ID, True),   # lead existente (welcome_sent=True), via worker
+    (3003, False),               # polling: o handler faz o upsert
+], ids=['novo', 'retorno', 'polling'])
+def test_one_upsert_and_one_welcome_commit(bot, counters, telegram_user_id, via_worker):
+    update = _start_update(telegram_user_id, telegram_user_id)
+    counters.reset()
+    if via_worker:
+        ingest_update_lead(bot.id, update)
+        db.session.commit()
+        mark_lead_upserted(update)
+
+    lead = _handle(bot, telegram_user_id, update)
+
+    assert counters.statements['UPSERT'] == 1
+    assert counters.statements['INSERT'] == 0
+    assert counters.statements['UPDATE'] <= 1   # mark_welcome_sent
+    assert counters.commits <= 2                # upsert + mark_welcome_sent
+    _assert_tracked(lead)
+
+
+def test_failed_worker_commit_leaves_upsert_to_handler(bot, counters):
+    update = _start_update(4004, 4004)
+    ingest_update_lead(bot.id, update)
+    db.session.rollback()  # commit do worker falhou: mark_lead_upserted() não roda
+
+    assert not update['message'].get(LEAD_UPSERTED_FLAG)
+    counters.reset()
+    lead = _handle(bot, 4004, update)
+
+    assert counters.statements['UPSERT'] == 1
+    _assert_tracked(lead)